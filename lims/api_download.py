@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from lims import snapshot_codec
+
+# GET/HEAD /exports/latest, shared by the stdlib server and FastAPI.
+#
+# The artifact's identity is its sha256 from the snapshot index (lims/snapshot_index.py),
+# so no request hashes the tarball:
+#   ETag: "<sha256>"          If-None-Match -> 304 (takes precedence over If-Modified-Since)
+#   X-Content-SHA256: <hex>   for clients that compare against a manifest
+#   Last-Modified             If-Modified-Since -> 304
+#   Accept-Ranges: bytes      one "Range: bytes=a-b" / "a-" / "-n" -> 206 with Content-Range,
+#                             416 when it lies past the end; If-Range guards a resume
+#                             against the file having changed (then the full 200 is sent).
+# Multi-range requests get the full 200 (allowed by RFC 9110 and simpler for clients).
+
+CHUNK = 1024 * 1024
+
+
+def etag_of(entry: Dict[str, Any]) -> Optional[str]:
+    sha = entry.get("sha256")
+    return f'"{sha}"' if sha else None
+
+
+def _etag_matches(header: str, etag: Optional[str], *, weak: bool) -> bool:
+    if etag is None:
+        return False
+    for tag in (t.strip() for t in header.split(",")):
+        if tag == "*":
+            return True
+        if weak and tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def _http_date_secs(value: str) -> Optional[int]:
+    try:
+        return int(parsedate_to_datetime(value).timestamp())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def not_modified(headers, etag: Optional[str], mtime: float) -> bool:
+    inm = headers.get("If-None-Match")
+    if inm is not None:
+        return _etag_matches(inm, etag, weak=True)
+    ims = headers.get("If-Modified-Since")
+    if ims:
+        since = _http_date_secs(ims)
+        return since is not None and int(mtime) <= since
+    return False
+
+
+def byte_range(headers, size: int, etag: Optional[str], mtime: float) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a satisfiable single Range, None to send everything.
+
+    Raises ValueError for an unsatisfiable range (416).
+    """
+    rng = (headers.get("Range") or "").strip()
+    if not rng.startswith("bytes=") or "," in rng:
+        return None
+    if_range = (headers.get("If-Range") or "").strip()
+    if if_range:
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            if etag is None or if_range != etag:  # strong comparison only
+                return None
+        else:
+            when = _http_date_secs(if_range)
+            if when is None or int(mtime) > when:
+                return None
+    first, sep, last = rng[len("bytes="):].strip().partition("-")
+    if not sep or not (first.isdigit() or first == "") or not (last.isdigit() or last == "") or first == last == "":
+        return None  # malformed: ignore the header
+    if first == "":
+        n = int(last)
+        if n == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - n), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("range starts past the end")
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def plan(fp: Path, entry: Dict[str, Any], headers) -> Tuple[int, Dict[str, str], int, int]:
+    """(status, headers, offset, length) for serving fp; length is 0 for 304 / 416."""
+    st = fp.stat()
+    etag = etag_of(entry)
+    codec = snapshot_codec.codec_of(fp) or snapshot_codec.DEFAULT_CODEC
+    out = {
+        "Content-Type": snapshot_codec.MEDIA_TYPE[codec],
+        "Content-Disposition": f'attachment; filename="snapshot{snapshot_codec.EXTENSION[codec]}"',
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        # Stored, but revalidated each time: the ETag makes that a 304.
+        "Cache-Control": "no-cache",
+    }
+    if etag is not None:
+        out["ETag"] = etag
+        out["X-Content-SHA256"] = entry["sha256"]
+    if not_modified(headers, etag, st.st_mtime):
+        out.pop("Content-Type")
+        out.pop("Content-Disposition")
+        return 304, out, 0, 0
+    try:
+        rng = byte_range(headers, st.st_size, etag, st.st_mtime)
+    except ValueError:
+        out["Content-Range"] = f"bytes */{st.st_size}"
+        out["Content-Length"] = "0"
+        return 416, out, 0, 0
+    if rng is None:
+        out["Content-Length"] = str(st.st_size)
+        return 200, out, 0, st.st_size
+    start, end = rng
+    out["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    out["Content-Length"] = str(end - start + 1)
+    return 206, out, start, end - start + 1
+
+
+def iter_file(fp: Path, offset: int, length: int) -> Iterator[bytes]:
+    with open(fp, "rb") as f:
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(CHUNK, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def sendfile(sock, fp: Path, offset: int, length: int) -> None:
+    """Copy length bytes of fp from offset to a socket (os.sendfile: no copy through Python)."""
+    with open(fp, "rb") as f:
+        sock.sendfile(f, offset, length)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from lims import metrics as lims_metrics
+from lims import sessions as lims_sessions
+
+# Blocking DB work for the FastAPI routes (sqlite3 through the lims.db pools) runs on
+# this executor, never on the event loop, so one slow query does not stall the other
+# requests on a worker.
+#
+# It is bounded by NEXUS_API_DB_THREADS (default: NEXUS_DB_POOL_MAX_READERS + 1, i.e.
+# every pooled reader plus the writer), so a burst of slow queries queues here instead
+# of piling threads onto the pool's checkout timeout. It is separate from Starlette's
+# threadpool, which keeps serving sync routes (downloads, NDJSON streams, job waits).
+# Session checks go through lookup_session(): only a cache miss needs the executor.
+# Routes encode their JSON bodies with json_body() on the executor too, timed as the
+# route's serialize phase (nexus_http_phase_seconds).
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_LOCK = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = (os.environ.get(name, "") or "").strip()
+    try:
+        return int(raw) if raw else default
+    except ValueError:
+        return default
+
+
+def db_threads() -> int:
+    return max(1, _env_int("NEXUS_API_DB_THREADS", _env_int("NEXUS_DB_POOL_MAX_READERS", 8) + 1))
+
+
+def executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=db_threads(), thread_name_prefix="lims-api-db")
+        return _EXECUTOR
+
+
+async def run_db(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """await fn(*args, **kwargs) run on the bounded DB executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def lookup_session(sid: str) -> Optional[Dict[str, Any]]:
+    """lims.sessions.lookup() for async routes: hits answered on the loop, misses read on the executor."""
+    found, row = lims_sessions.lookup_cached(sid)
+    if found:
+        return row
+    return await run_db(lims_sessions.load, sid)
+
+
+def json_body(route: str, doc: Any) -> bytes:
+    """doc encoded as JSONResponse encodes it, timed as the route's serialize phase."""
+    with lims_metrics.phase(route, "serialize"):
+        return json.dumps(doc, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _after_fork_in_child() -> None:
+    global _EXECUTOR, _LOCK
+    # Pool threads do not survive fork(); a preloaded worker builds its own executor.
+    _EXECUTOR = None
+    _LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def shutdown() -> None:
+    global _EXECUTOR
+    with _LOCK:
+        ex, _EXECUTOR = _EXECUTOR, None
+    if ex is not None:
+        ex.shutdown(wait=True)
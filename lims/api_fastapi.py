@@ -1,41 +1,42 @@
 from __future__ import annotations
 
-import io
 import json
 import os
-import subprocess
+import re
+import shutil
 import secrets
+import tempfile
+import time
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-from types import SimpleNamespace
 from typing import Any, Optional
+from urllib.parse import parse_qs
 
 from fastapi import FastAPI, Request, Response
 from fastapi import Response
-from fastapi.responses import JSONResponse, PlainTextResponse, FileResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 # Repo roots
 REPO_ROOT = Path(__file__).resolve().parents[1]
 UI_ROOT = REPO_ROOT / "web"
 API_EXPORTS_ROOT = REPO_ROOT / "exports" / "api"
+CLI_TIMEOUT_SEC = float(os.environ.get("NEXUS_API_CLI_TIMEOUT_SEC", "30"))
+JOB_TIMEOUT_SEC = float(os.environ.get("NEXUS_API_JOB_TIMEOUT_SEC", "3600"))
+
+_SAMPLE_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._:-]{0,63}$")
 
 try:
     from lims import db as lims_db
 except Exception:
     lims_db = None
 
-# Import existing route logic (keeps parity with stdlib server)
-try:
-    from lims.api_sample_read import handle_sample_read_get
-except Exception:
-    def handle_sample_read_get(*args, **kwargs):
-        return False
-
-try:
-    from lims.api_sample_status import handle_sample_status_post
-except Exception:
-    def handle_sample_status_post(*args, **kwargs):
-        return False
+from lims import api_download, api_executor, api_jobs, export_stream, kanban_store, sample_store, snapshot_index
+from lims import jobs as lims_jobs
+from lims import metrics as lims_metrics
+from lims import sessions as lims_sessions
+from lims import snapshot as lims_snapshot
+from lims.cli import resolve_container_id
 
 # M5 write endpoints (containers + sample create/event append)
 try:
@@ -48,21 +49,6 @@ def _utc_now_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 
-def _git_rev_short() -> str:
-    try:
-        p = subprocess.run(
-            ["git", "rev-parse", "--short", "HEAD"],
-            cwd=str(REPO_ROOT),
-            text=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=False,
-        )
-        return p.stdout.strip() if p.returncode == 0 else ""
-    except Exception:
-        return ""
-
-
 def _guest_ttl_seconds() -> int:
     raw = (os.environ.get("NEXUS_GUEST_TTL_SECONDS", "") or "").strip()
     try:
@@ -126,158 +112,102 @@ def _auth_error(status: int, error: str, detail: str) -> JSONResponse:
     )
 
 
-def _require_session_request(request: Request) -> Optional[JSONResponse]:
+def _session_id(request: Request) -> tuple[Optional[str], Optional[JSONResponse]]:
     if lims_db is None:
-        return _auth_error(500, "internal_error", "lims_db import failed")
-
+        return None, _auth_error(500, "internal_error", "lims_db import failed")
     sid = _extract_session_id(request.headers)
     if not sid:
-        return _auth_error(401, "auth_required", "missing session header (X-Nexus-Session) or Authorization: Bearer")
+        return None, _auth_error(401, "auth_required", "missing session header (X-Nexus-Session) or Authorization: Bearer")
+    return sid, None
 
-    conn = lims_db.connect()
-    row = None
-    try:
-        if hasattr(lims_db, "apply_migrations"):
-            lims_db.apply_migrations(conn)
-        elif hasattr(lims_db, "init_db"):
-            lims_db.init_db(conn)
 
-        now = _utc_now_iso()
+async def _require_session_request(request: Request) -> Optional[JSONResponse]:
+    sid, err = _session_id(request)
+    if err is not None:
+        return err
 
-        # best-effort cleanup
-        try:
-            conn.execute("DELETE FROM guest_sessions WHERE expires_at <= ?", (now,))
-            conn.commit()
-        except Exception:
-            pass
-
-        row = conn.execute(
-            "SELECT id FROM guest_sessions WHERE id = ? AND expires_at > ?",
-            (sid, now),
-        ).fetchone()
-
-        if row:
-            try:
-                conn.execute("UPDATE guest_sessions SET last_seen_at = ? WHERE id = ?", (now, sid))
-                conn.commit()
-            except Exception:
-                pass
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+    # Cached (lims/sessions.py): no DB transaction per request; last_seen_at is written behind.
+    # A miss reads the DB on the executor, not on the event loop.
+    with lims_metrics.phase(_route_label(request), "auth"):
+        row = await api_executor.lookup_session(sid)
+
+    if not row:
+        return _auth_error(401, "invalid_session", "session not found or expired")
+    return None
 
+
+def _require_session_request_sync(request: Request) -> Optional[JSONResponse]:
+    # For sync routes, which already run on Starlette's threadpool.
+    sid, err = _session_id(request)
+    if err is not None:
+        return err
+    with lims_metrics.phase(_route_label(request), "auth"):
+        row = lims_sessions.lookup(sid)
     if not row:
         return _auth_error(401, "invalid_session", "session not found or expired")
     return None
 
 
-def _find_latest_api_tarball() -> Optional[Path]:
-    root = API_EXPORTS_ROOT.resolve()
-    if not root.exists():
+def _route_label(request: Request) -> str:
+    # The matched route's template (e.g. /jobs/{job_id}), so labels stay bounded.
+    return getattr(request.scope.get("route"), "path", None) or "other"
+
+
+def _find_latest_api_tarball() -> Optional[tuple[Path, dict[str, Any]]]:
+    # From the exports/api snapshot index (see lims/snapshot_index.py), not an rglob per request;
+    # the entry's sha256 is the download's ETag.
+    root = API_EXPORTS_ROOT
+    if not root.is_dir():
         return None
-    best: Optional[tuple[float, Path]] = None
-    for fp in root.rglob("*.tar.gz"):
-        if not fp.is_file():
-            continue
-        try:
-            m = fp.stat().st_mtime
-        except OSError:
-            continue
-        if best is None or m > best[0]:
-            best = (m, fp)
-    return best[1] if best else None
-
-
-def _metrics_text() -> str:
-    rev = _git_rev_short()
-    lines: list[str] = []
-    lines.append("# HELP nexus_api_up API process up (always 1 if endpoint responds)")
-    lines.append("# TYPE nexus_api_up gauge")
-    lines.append("nexus_api_up 1")
-    lines.append("# HELP nexus_build_info Build info")
-    lines.append("# TYPE nexus_build_info gauge")
-    lines.append(f'nexus_build_info{{git_rev="{rev}"}} 1')
-
-    db_up = 0
-    samples_total = 0
-    containers_total = 0
-    events_total = 0
+    return snapshot_index.latest_entry(root, nested=True)
 
-    if lims_db is not None:
+
+def _snapshot_export_job(cleaned: list[str]):
+    def _run(job: lims_jobs.Job) -> dict[str, Any]:
+        # Server-chosen dir under exports/api, as in the stdlib server; never a client path.
+        API_EXPORTS_ROOT.mkdir(parents=True, exist_ok=True)
+        exports_dir = Path(tempfile.mkdtemp(prefix="snapshot-", dir=str(API_EXPORTS_ROOT)))
         try:
-            conn = lims_db.connect()
-            try:
-                if hasattr(lims_db, "apply_migrations"):
-                    lims_db.apply_migrations(conn)
-                elif hasattr(lims_db, "init_db"):
-                    lims_db.init_db(conn)
-                try:
-                    samples_total = int((conn.execute("SELECT COUNT(1) FROM samples").fetchone() or [0])[0] or 0)
-                except Exception:
-                    samples_total = 0
-                try:
-                    containers_total = int((conn.execute("SELECT COUNT(1) FROM containers").fetchone() or [0])[0] or 0)
-                except Exception:
-                    containers_total = 0
-                try:
-                    events_total = int((conn.execute("SELECT COUNT(1) FROM sample_events").fetchone() or [0])[0] or 0)
-                except Exception:
-                    events_total = 0
-                db_up = 1
-            finally:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-        except Exception:
-            db_up = 0
-
-    lines.append("# HELP nexus_db_up 1 if DB connect+query ok")
-    lines.append("# TYPE nexus_db_up gauge")
-    lines.append(f"nexus_db_up {db_up}")
-    lines.append("# HELP nexus_samples_total Total samples")
-    lines.append("# TYPE nexus_samples_total gauge")
-    lines.append(f"nexus_samples_total {samples_total}")
-    lines.append("# HELP nexus_containers_total Total containers")
-    lines.append("# TYPE nexus_containers_total gauge")
-    lines.append(f"nexus_containers_total {containers_total}")
-    lines.append("# HELP nexus_sample_events_total Total sample events")
-    lines.append("# TYPE nexus_sample_events_total gauge")
-    lines.append(f"nexus_sample_events_total {events_total}")
-    return "\n".join(lines) + "\n"
-
-
-class _Adapter:
-    """Adapter object to satisfy h._send/h._err + (for POST) h.headers/h.rfile."""
-    def __init__(self, headers: dict[str, str], body: bytes = b""):
-        self.headers = headers
-        self.rfile = io.BytesIO(body)
-        self.status_code: int = 500
-        self.payload: dict[str, Any] = {
-            "schema": "nexus_api_error",
-            "schema_version": 1,
-            "ok": False,
-            "error": "internal_error",
-            "detail": "no response emitted",
-        }
+            return lims_snapshot.export_snapshot(exports_dir=exports_dir, include_samples=cleaned, index_dir=API_EXPORTS_ROOT, progress=job.report)
+        except lims_snapshot.SnapshotError as e:
+            shutil.rmtree(exports_dir, ignore_errors=True)
+            raise lims_jobs.JobError("command_failed", str(e), rc=2)
+        except BaseException:
+            shutil.rmtree(exports_dir, ignore_errors=True)
+            raise
+    return _run
+
+
+def _snapshot_verify_job(artifact: str):
+    def _run(job: lims_jobs.Job) -> dict[str, Any]:
+        env = os.environ.copy()
+        env["SNAPSHOT_ARTIFACT"] = artifact
+        job.phase("verify")
+        rc, out, err = lims_jobs.run_command(job, ["bash", "./scripts/snapshot_verify.sh", "--json"], cwd=str(REPO_ROOT), env=env, timeout=JOB_TIMEOUT_SEC)
+        if rc == 124:
+            raise lims_jobs.JobError("command_timeout", rc=rc, stderr=err)
+        if rc != 0:
+            raise lims_jobs.JobError("command_failed", rc=rc, stderr=err)
+        try:
+            return json.loads(out) if out.strip() else {}
+        except ValueError as e:
+            raise lims_jobs.JobError("command_failed", rc=2, stderr=f"stdout was not valid JSON: {e}\nSTDOUT:\n{out}\nSTDERR:\n{err}")
+    return _run
 
-    def _send(self, code: int, obj: dict[str, Any]) -> None:
-        self.status_code = int(code)
-        self.payload = obj
 
-    def _err(self, http_code: int, error: str, detail: str | None = None, **extra) -> None:
-        doc: dict[str, Any] = {
-            "schema": "nexus_api_error",
-            "schema_version": 1,
-            "ok": False,
-            "error": error,
-        }
-        if detail is not None:
-            doc["detail"] = detail
-        doc.update(extra)
-        self._send(int(http_code), doc)
+def _store_response(route: str, fn, arg) -> Response:
+    # Runs on the DB executor: the query and the JSON encoding both stay off the event loop,
+    # and the encoding is timed apart from the SQL as the serialize phase.
+    try:
+        doc = fn(arg)
+    except sample_store.SampleRequestError as e:
+        return _auth_error(e.status, e.error, e.detail)
+    return Response(content=api_executor.json_body(route, doc), media_type="application/json")
+
+
+def _job_response(res: tuple[int, dict[str, Any]]) -> JSONResponse:
+    status, doc = res
+    return JSONResponse(status_code=status, content=doc)
 
 
 app = FastAPI(title="Nexus LIMS API (FastAPI parity)", version="0.1")
@@ -286,6 +216,31 @@ if m5_router is not None:
     app.include_router(m5_router)
 
 
+@app.middleware("http")
+async def _http_metrics(request: Request, call_next):
+    # Per-route counts, status and latency (lims/metrics.py); streamed bodies are timed
+    # until the response starts.
+    t0 = time.perf_counter()
+    status = 500
+    lims_metrics.HTTP_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        lims_metrics.HTTP_IN_FLIGHT.dec()
+        lims_metrics.observe_request(request.method, _route_label(request), status, time.perf_counter() - t0)
+
+
+@app.on_event("startup")
+def _db_startup() -> None:
+    # Migrations run once here; request handlers rely on the user_version fast path.
+    if lims_db is not None:
+        lims_db.migrate_on_startup()
+        lims_db.start_checkpointer()
+        lims_sessions.start_sweeper()
+
+
 @app.get("/health")
 async def health() -> JSONResponse:
     return JSONResponse(
@@ -295,7 +250,7 @@ async def health() -> JSONResponse:
             "schema_version": 1,
             "ok": True,
             "db_path": os.environ.get("DB_PATH", ""),
-            "git_rev": _git_rev_short(),
+            "git_rev": lims_metrics.BUILD_INFO["git_rev"],
         },
     )
 
@@ -308,7 +263,7 @@ async def version() -> JSONResponse:
             "schema": "nexus_api_version",
             "schema_version": 1,
             "ok": True,
-            "git_rev": _git_rev_short(),
+            "git_rev": lims_metrics.BUILD_INFO["git_rev"],
         },
     )
 
@@ -316,64 +271,110 @@ async def version() -> JSONResponse:
 @app.head("/metrics", include_in_schema=False)
 async def metrics_head():
     # Explicit HEAD support (FastAPI may not auto-add it depending on routing)
-    return Response(status_code=200, media_type="text/plain; version=0.0.4; charset=utf-8")
+    return Response(status_code=200, media_type=lims_metrics.CONTENT_TYPE)
 
 @app.get("/metrics")
-async def metrics() -> PlainTextResponse:
-    return PlainTextResponse(_metrics_text(), media_type="text/plain; version=0.0.4; charset=utf-8")
+def metrics() -> PlainTextResponse:
+    # Sync route: a scrape that misses the TTL cache reads table_counts in the threadpool.
+    return PlainTextResponse(lims_metrics.render(), media_type=lims_metrics.CONTENT_TYPE)
 
 
-@app.get("/exports/latest", response_model=None)
-async def exports_latest():
-    fp = _find_latest_api_tarball()
-    if not fp:
+@app.api_route("/exports/latest", methods=["GET", "HEAD"], response_model=None)
+def exports_latest(request: Request):
+    # Conditional (ETag = index sha256) and single byte-range downloads, see lims/api_download.py.
+    hit = _find_latest_api_tarball()
+    if not hit:
         return JSONResponse(status_code=404, content={"schema": "nexus_api_error", "schema_version": 1, "ok": False, "error": "not_found"})
-    return FileResponse(path=str(fp), media_type="application/gzip", filename="snapshot.tar.gz")
+    fp, entry = hit
+    status, headers, offset, length = api_download.plan(fp, entry, request.headers)
+    if request.method == "HEAD" or not length:
+        return Response(status_code=status, headers=headers)
+    return StreamingResponse(api_download.iter_file(fp, offset, length), status_code=status, headers=headers)
 
 
-@app.post("/auth/guest")
-async def auth_guest(request: Request) -> JSONResponse:
-    if lims_db is None:
-        return _auth_error(500, "internal_error", "lims_db import failed")
+async def _json_body(request: Request) -> Optional[dict]:
     try:
         body = await request.json()
-        if body is None:
-            body = {}
-        if not isinstance(body, dict):
-            return _auth_error(400, "bad_request", "json body must be an object")
     except Exception:
-        body = {}
-
-    try:
-        display_name = _clean_text_field("display_name", body.get("display_name"), required=False, max_len=64)
-    except ValueError:
-        return _auth_error(400, "bad_request", "invalid display_name")
-
-    conn = lims_db.connect()
-    try:
-        if hasattr(lims_db, "apply_migrations"):
-            lims_db.apply_migrations(conn)
-        elif hasattr(lims_db, "init_db"):
-            lims_db.init_db(conn)
-
+        return {}
+    if body is None:
+        return {}
+    return body if isinstance(body, dict) else None
+
+
+# Snapshot export/verify run as background jobs (lims/jobs.py); see lims/api_jobs.py for
+# the sync-wait / 202 contract shared with the stdlib server.
+@app.post("/snapshot/export")
+async def snapshot_export(request: Request) -> JSONResponse:
+    body = await _json_body(request)
+    if body is None:
+        return _auth_error(400, "bad_request", "json body must be an object")
+    include_samples = body.get("include_samples", [])  # exports_dir is ignored; server chooses a safe dir
+    if include_samples is None:
+        include_samples = []
+    if not isinstance(include_samples, list) or any(not isinstance(x, str) for x in include_samples):
+        return _auth_error(400, "bad_request", "include_samples must be a list[str]")
+    cleaned = [x.strip() for x in include_samples]
+    if any(not _SAMPLE_ID_RE.match(x) for x in cleaned):
+        return _auth_error(400, "bad_request", "invalid sample id")
+    max_inc = int(os.environ.get("NEXUS_API_INCLUDE_SAMPLES_MAX", "1024") or "1024")
+    if len(cleaned) > max_inc:
+        return _auth_error(400, "bad_request", f"too many include_samples (max {max_inc})")
+
+    wait = 0 if api_jobs.wants_async(request.headers, body) else api_jobs.sync_wait_sec(CLI_TIMEOUT_SEC)
+    # submit() may wait for the job: Starlette's threadpool, not the DB executor.
+    return _job_response(await run_in_threadpool(api_jobs.submit, "snapshot_export", tuple(sorted(set(cleaned))), _snapshot_export_job(cleaned), wait_sec=wait))
+
+
+@app.post("/snapshot/verify")
+async def snapshot_verify(request: Request) -> JSONResponse:
+    body = await _json_body(request)
+    if body is None:
+        return _auth_error(400, "bad_request", "json body must be an object")
+    artifact = body.get("artifact")
+    if not artifact or not isinstance(artifact, str):
+        return _auth_error(400, "bad_request", "artifact must be a string")
+
+    wait = 0 if api_jobs.wants_async(request.headers, body) else api_jobs.sync_wait_sec(CLI_TIMEOUT_SEC)
+    return _job_response(await run_in_threadpool(api_jobs.submit, "snapshot_verify", artifact.strip(), _snapshot_verify_job(artifact), wait_sec=wait))
+
+
+# Sync routes (Starlette's threadpool): in multi-worker mode these read the job spool.
+@app.get("/jobs")
+def jobs_list() -> JSONResponse:
+    return _job_response(api_jobs.jobs_get("/jobs"))
+
+
+@app.get("/jobs/{job_id}")
+def jobs_get(job_id: str) -> JSONResponse:
+    return _job_response(api_jobs.jobs_get(f"/jobs/{job_id}"))
+
+
+@app.post("/jobs/{job_id}/cancel")
+def jobs_cancel(job_id: str) -> JSONResponse:
+    return _job_response(api_jobs.jobs_cancel(f"/jobs/{job_id}/cancel"))
+
+
+@app.on_event("shutdown")
+def _jobs_shutdown() -> None:
+    lims_jobs.runner().shutdown()
+    lims_sessions.stop()
+    api_executor.shutdown()
+
+
+def _create_guest_session(display_name: Optional[str]) -> dict[str, Any]:
+    with lims_db.writer("auth_guest") as conn:
         now_dt = datetime.now(timezone.utc).replace(microsecond=0)
         exp_dt = (now_dt + timedelta(seconds=_guest_ttl_seconds())).replace(microsecond=0)
         now = now_dt.isoformat()
         expires_at = exp_dt.isoformat()
 
-        # best-effort cleanup
-        try:
-            conn.execute("DELETE FROM guest_sessions WHERE expires_at <= ?", (now,))
-            conn.commit()
-        except Exception:
-            pass
-
+        # Expired rows are removed by the session sweeper (lims/sessions.py).
         sid = secrets.token_urlsafe(24)
         conn.execute(
             "INSERT INTO guest_sessions (id, display_name, created_at, expires_at, last_seen_at) VALUES (?, ?, ?, ?, ?)",
             (sid, display_name, now, expires_at, now),
         )
-        conn.commit()
 
         sess = {
             "id": sid,
@@ -382,12 +383,30 @@ async def auth_guest(request: Request) -> JSONResponse:
             "expires_at": expires_at,
             "last_seen_at": now,
         }
-        return JSONResponse(status_code=200, content={"schema": "nexus_auth_guest", "schema_version": 1, "ok": True, "session": sess})
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+    return sess
+
+
+@app.post("/auth/guest")
+async def auth_guest(request: Request) -> JSONResponse:
+    if lims_db is None:
+        return _auth_error(500, "internal_error", "lims_db import failed")
+    try:
+        body = await request.json()
+        if body is None:
+            body = {}
+        if not isinstance(body, dict):
+            return _auth_error(400, "bad_request", "json body must be an object")
+    except Exception:
+        body = {}
+
+    try:
+        display_name = _clean_text_field("display_name", body.get("display_name"), required=False, max_len=64)
+    except ValueError:
+        return _auth_error(400, "bad_request", "invalid display_name")
+
+    sess = await api_executor.run_db(_create_guest_session, display_name)
+    lims_sessions.remember(sess)
+    return JSONResponse(status_code=200, content={"schema": "nexus_auth_guest", "schema_version": 1, "ok": True, "session": sess})
 
 
 @app.get("/auth/me")
@@ -399,103 +418,92 @@ async def auth_me(request: Request) -> JSONResponse:
     if not sid:
         return _auth_error(401, "auth_required", "missing session header (X-Nexus-Session) or Authorization: Bearer")
 
-    conn = lims_db.connect()
-    row = None
-    try:
-        if hasattr(lims_db, "apply_migrations"):
-            lims_db.apply_migrations(conn)
-        elif hasattr(lims_db, "init_db"):
-            lims_db.init_db(conn)
-
-        now = _utc_now_iso()
-        try:
-            conn.execute("DELETE FROM guest_sessions WHERE expires_at <= ?", (now,))
-            conn.commit()
-        except Exception:
-            pass
-
-        row = conn.execute(
-            "SELECT id, display_name, created_at, expires_at, last_seen_at FROM guest_sessions WHERE id = ? AND expires_at > ?",
-            (sid, now),
-        ).fetchone()
-
-        if row:
-            try:
-                conn.execute("UPDATE guest_sessions SET last_seen_at = ? WHERE id = ?", (now, sid))
-                conn.commit()
-            except Exception:
-                pass
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
-
+    row = await api_executor.lookup_session(sid)
     if not row:
         return _auth_error(401, "invalid_session", "session not found or expired")
 
-    return JSONResponse(status_code=200, content={"schema": "nexus_auth_me", "schema_version": 1, "ok": True, "session": dict(row)})
+    return JSONResponse(status_code=200, content={"schema": "nexus_auth_me", "schema_version": 1, "ok": True, "session": row})
 
 
-# Sample read endpoints (reuse existing logic via adapter)
-@app.get("/sample/list")
-async def sample_list(request: Request):
+# Sample read endpoints: lims/sample_store.py (shared with the stdlib server), run on the
+# bounded DB executor (lims/api_executor.py).
+async def _sample_read(request: Request, fn) -> JSONResponse:
     if _samples_require_auth():
-        r = _require_session_request(request)
+        r = await _require_session_request(request)
         if r is not None:
             return r
-    h = _Adapter(headers=dict(request.headers))
-    u = SimpleNamespace(query=str(request.url.query))
-    ok = handle_sample_read_get(h, "/sample/list", u, lims_db)
-    if not ok:
-        return JSONResponse(status_code=404, content={"schema": "nexus_api_error", "schema_version": 1, "ok": False, "error": "not_found"})
-    return JSONResponse(status_code=h.status_code, content=h.payload)
+    if lims_db is None:
+        return _auth_error(500, "internal_error", "lims_db import failed")
+    return await api_executor.run_db(_store_response, _route_label(request), fn, parse_qs(str(request.url.query or "")))
+
+
+@app.get("/sample/list")
+async def sample_list(request: Request) -> JSONResponse:
+    return await _sample_read(request, sample_store.list_samples)
 
 
 @app.get("/sample/show")
-async def sample_show(request: Request):
-    if _samples_require_auth():
-        r = _require_session_request(request)
-        if r is not None:
-            return r
-    h = _Adapter(headers=dict(request.headers))
-    u = SimpleNamespace(query=str(request.url.query))
-    ok = handle_sample_read_get(h, "/sample/show", u, lims_db)
-    if not ok:
-        return JSONResponse(status_code=404, content={"schema": "nexus_api_error", "schema_version": 1, "ok": False, "error": "not_found"})
-    return JSONResponse(status_code=h.status_code, content=h.payload)
+async def sample_show(request: Request) -> JSONResponse:
+    return await _sample_read(request, sample_store.show_sample)
 
 
 @app.get("/sample/events")
-async def sample_events(request: Request):
+async def sample_events(request: Request) -> JSONResponse:
+    return await _sample_read(request, sample_store.sample_events)
+
+
+@app.get("/export/samples.ndjson", response_model=None)
+def export_samples_ndjson(request: Request):
     if _samples_require_auth():
-        r = _require_session_request(request)
+        r = _require_session_request_sync(request)
         if r is not None:
             return r
-    h = _Adapter(headers=dict(request.headers))
-    u = SimpleNamespace(query=str(request.url.query))
-    ok = handle_sample_read_get(h, "/sample/events", u, lims_db)
-    if not ok:
-        return JSONResponse(status_code=404, content={"schema": "nexus_api_error", "schema_version": 1, "ok": False, "error": "not_found"})
-    return JSONResponse(status_code=h.status_code, content=h.payload)
-
-
-# Sample status endpoint (reuse existing logic via adapter)
+    if lims_db is None:
+        return _auth_error(500, "internal_error", "lims_db import failed")
+    try:
+        f = export_stream.filters_from_query(parse_qs(str(request.url.query or "")))
+    except export_stream.ExportFilterError as e:
+        return _auth_error(400, "bad_request", str(e))
+
+    # Resolve filters before the 200 goes out; errors after that can only truncate the stream.
+    container_id = None
+    if f["container"] is not None:
+        with lims_db.reader("container_resolve") as conn:
+            container_id = resolve_container_id(conn, f["container"])
+        if container_id is None:
+            return _auth_error(400, "bad_request", "container not found")
+
+    def _body():
+        with lims_db.stream_reader() as conn:
+            lines = export_stream.iter_ndjson(
+                conn,
+                status=f["status"],
+                container_id=container_id,
+                since=f["since"],
+                until=f["until"],
+                include_events=f["include_events"],
+                batch_size=f["batch_size"],
+            )
+            yield from export_stream.iter_chunks(lines)
+
+    return StreamingResponse(_body(), media_type=export_stream.CONTENT_TYPE, headers={"Cache-Control": "no-store"})
+
+
+# Sample status endpoint (lims/sample_store.py, on the DB executor)
 @app.post("/sample/status")
-async def sample_status(request: Request):
+async def sample_status(request: Request) -> JSONResponse:
     raw = await request.body()
-    hdrs = dict(request.headers)
-    hdrs["Content-Length"] = str(len(raw))
     if _samples_require_auth():
-        r = _require_session_request(request)
+        r = await _require_session_request(request)
         if r is not None:
             return r
-    h = _Adapter(headers=hdrs, body=raw)
-    u = SimpleNamespace(query=str(request.url.query))
-    ok = handle_sample_status_post(h, "/sample/status", u, lims_db)
-    if not ok:
-        return JSONResponse(status_code=404, content={"schema": "nexus_api_error", "schema_version": 1, "ok": False, "error": "not_found"})
-    return JSONResponse(status_code=h.status_code, content=h.payload)
+    if lims_db is None:
+        return _auth_error(500, "internal_error", "lims_db import failed")
+    try:
+        body = sample_store.decode_json_object(raw)
+    except sample_store.SampleRequestError as e:
+        return _auth_error(e.status, e.error, e.detail)
+    return await api_executor.run_db(_store_response, _route_label(request), sample_store.update_status, body)
 
 
 # --- Kanban board persistence API (M4) ---
@@ -522,61 +530,14 @@ class KanbanBoardState(BaseModel):
     selectedCardId: Optional[str] = None
     updatedAt: Optional[float] = None
 
-def _kanban_store_path() -> Path:
-    env = os.environ.get("KANBAN_STORE_PATH")
-    if env:
-        return Path(env)
-    # repo_root/data/kanban.json (repo_root is parent of 'lims' dir in this repo)
-    repo_root = Path(__file__).resolve().parents[1]
-    return repo_root / "data" / "kanban.json"
-
-def _default_board() -> dict:
-    return {
-        "columnOrder": ["todo", "doing", "done"],
-        "columns": {
-            "todo":  {"id": "todo",  "title": "To Do",       "cardIds": ["c1"]},
-            "doing": {"id": "doing", "title": "In Progress", "cardIds": []},
-            "done":  {"id": "done",  "title": "Done",        "cardIds": []},
-        },
-        "cards": {
-            "c1": {"id": "c1", "title": "Example card", "subtitle": "Persisted via /api/kanban/board"},
-        },
-        "selectedCardId": None,
-        "updatedAt": time.time(),
-    }
-
-def _read_board() -> dict:
-    path = _kanban_store_path()
-    if not path.exists():
-        return _default_board()
-    try:
-        raw = path.read_text(encoding="utf-8")
-        data = json.loads(raw)
-        if not isinstance(data, dict):
-            return _default_board()
-        data["updatedAt"] = time.time()
-        return data
-    except Exception:
-        return _default_board()
-
-def _write_board(board: dict) -> None:
-    path = _kanban_store_path()
-    path.parent.mkdir(parents=True, exist_ok=True)
-    board = dict(board)
-    board["updatedAt"] = time.time()
-    tmp = path.with_suffix(path.suffix + ".tmp")
-    tmp.write_text(json.dumps(board, indent=2, sort_keys=True) + "\n", encoding="utf-8")
-    tmp.replace(path)
-
 @app.get("/api/kanban/board", response_model=KanbanBoardState)
 @app.get("/kanban/board", response_model=KanbanBoardState)
 def kanban_get_board():
-    return _read_board()
+    return kanban_store.read_board()
 
 @app.put("/api/kanban/board", response_model=KanbanBoardState)
 @app.put("/kanban/board", response_model=KanbanBoardState)
 def kanban_put_board(state: KanbanBoardState):
     if not state.columnOrder:
         raise HTTPException(status_code=400, detail="columnOrder must not be empty")
-    _write_board(state.model_dump())
-    return _read_board()
+    return kanban_store.write_board(state.model_dump())
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from lims import jobs as lims_jobs
+
+# HTTP side of lims.jobs, shared by the stdlib server and FastAPI:
+#   GET  /jobs               active and recently finished jobs
+#   GET  /jobs/{id}          one job: state, phase, progress, result or error
+#   POST /jobs/{id}/cancel   request cancellation
+# and submit() for the job-backed POST routes. The functions return (status, document);
+# the handle_* wrappers write that through a stdlib Handler's _send. Jobs of other API
+# processes (multi-worker mode) are answered from the runner's spool.
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{16}$")
+
+# API error code -> HTTP status for a failed job answered synchronously.
+_ERROR_STATUS = {"bad_request": 400, "command_failed": 400, "command_timeout": 504, "internal_error": 500}
+
+
+def sync_wait_sec(default: float) -> float:
+    """How long a synchronous POST waits for its job before answering 202 (NEXUS_API_JOB_SYNC_WAIT_SEC)."""
+    raw = (os.environ.get("NEXUS_API_JOB_SYNC_WAIT_SEC", "") or "").strip()
+    try:
+        return max(0.0, float(raw)) if raw else float(default)
+    except ValueError:
+        return float(default)
+
+
+def wants_async(headers, body: Optional[Dict[str, Any]]) -> bool:
+    """Client asked for a job id instead of the result: {"async": true} or `Prefer: respond-async`."""
+    if isinstance(body, dict) and body.get("async") is True:
+        return True
+    prefer = (headers.get("Prefer") or "").lower()
+    return "respond-async" in [p.strip() for p in prefer.split(",")]
+
+
+def _href(doc: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+    doc["href"] = f"/jobs/{doc['id']}"
+    doc.update(extra)
+    return doc
+
+
+def _job_doc(job: lims_jobs.Job, **extra: Any) -> Dict[str, Any]:
+    return _href(job.to_doc(), **extra)
+
+
+def _error(status: int, error: str, detail: Optional[str] = None, **extra: Any) -> Tuple[int, Dict[str, Any]]:
+    doc: Dict[str, Any] = {"schema": "nexus_api_error", "schema_version": 1, "ok": False, "error": error}
+    if detail is not None:
+        doc["detail"] = detail
+    doc.update(extra)
+    return status, doc
+
+
+def result(job: lims_jobs.Job) -> Tuple[int, Dict[str, Any]]:
+    """A finished job's outcome, answered as the synchronous route would have."""
+    if job.state == lims_jobs.SUCCEEDED:
+        return 200, job.result or {}
+    if job.state == lims_jobs.CANCELLED:
+        return _error(409, "cancelled", "job was cancelled", job_id=job.id)
+    err = dict(job.error or {"error": "internal_error"})
+    error = err.pop("error")
+    detail = err.pop("detail", None)
+    return _error(_ERROR_STATUS.get(error, 400), error, detail, job_id=job.id, **err)
+
+
+def submit(kind: str, key: Hashable, fn: Callable[[lims_jobs.Job], Dict[str, Any]], *, wait_sec: float) -> Tuple[int, Dict[str, Any]]:
+    """Run fn as a background job; with wait_sec > 0 answer with its result if it finishes in time.
+
+    Otherwise (async request, or a slow job) answer 202 with the job document to poll.
+    An identical active job is joined instead of started again ("deduplicated": true).
+    Blocks for up to wait_sec.
+    """
+    try:
+        job, created = lims_jobs.runner().submit(kind, key, fn)
+    except lims_jobs.QueueFull as e:
+        return _error(503, "busy", str(e))
+    if wait_sec > 0 and job.wait(wait_sec):
+        return result(job)
+    return 202, _job_doc(job, deduplicated=not created)
+
+
+def jobs_get(path: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """GET /jobs and /jobs/{id}; None for any other path."""
+    runner = lims_jobs.runner()
+    if path == "/jobs":
+        docs = [_job_doc(j) for j in runner.jobs()] + [_href(d) for d in runner.spooled_docs()]
+        docs.sort(key=lambda d: d["created_at"], reverse=True)
+        return 200, {"schema": "nexus_job_list", "schema_version": 1, "ok": True, "jobs": docs}
+    if not path.startswith("/jobs/"):
+        return None
+    job_id = path[len("/jobs/"):]
+    if not _JOB_ID_RE.match(job_id):
+        return _error(404, "not_found", "unknown job id", path=path, method="GET")
+    job = runner.get(job_id)
+    if job is not None:
+        return 200, _job_doc(job)
+    doc = runner.spooled(job_id)
+    if doc is None:
+        return _error(404, "not_found", "unknown job id", path=path, method="GET")
+    return 200, _href(doc)
+
+
+def jobs_cancel(path: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """POST /jobs/{id}/cancel; None for any other path."""
+    if not (path.startswith("/jobs/") and path.endswith("/cancel")):
+        return None
+    job_id = path[len("/jobs/"):-len("/cancel")]
+    if not _JOB_ID_RE.match(job_id):
+        return _error(404, "not_found", "unknown job id", path=path, method="POST")
+    runner = lims_jobs.runner()
+    job = runner.cancel(job_id)
+    if job is not None:
+        # 202 while a running job winds down; 200 once it is final.
+        return (200 if job.done() else 202), _job_doc(job)
+    doc = runner.cancel_spooled(job_id)
+    if doc is None:
+        return _error(404, "not_found", "unknown job id", path=path, method="POST")
+    return (202 if doc.get("state") in lims_jobs.ACTIVE_STATES else 200), _href(doc)
+
+
+def handle_jobs_get(h, path: str) -> bool:
+    res = jobs_get(path)
+    if res is None:
+        return False
+    h._send(*res)
+    return True
+
+
+def handle_jobs_post(h, path: str) -> bool:
+    res = jobs_cancel(path)
+    if res is None:
+        return False
+    h._send(*res)
+    return True
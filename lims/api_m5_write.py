@@ -7,11 +7,16 @@ from typing import Any, Optional
 from urllib.parse import parse_qs
 import logging
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Response
 from fastapi.responses import JSONResponse
 
+from lims import api_executor, sample_import
+from lims.sample_store import resolve_sample_id
+from lims.pagination import CONTAINER_KEY, CursorError, container_seek, page
+
 try:
     from lims import db as lims_db
+    from lims import metrics as lims_metrics
 except Exception:
     lims_db = None
 
@@ -36,13 +41,9 @@ def _api_error(status: int, error: str, detail: str, **extra) -> JSONResponse:
     return JSONResponse(status_code=int(status), content=doc)
 
 
-def _db_init(conn) -> None:
-    if lims_db is None:
-        return
-    if hasattr(lims_db, "apply_migrations"):
-        lims_db.apply_migrations(conn)
-    elif hasattr(lims_db, "init_db"):
-        lims_db.init_db(conn)
+def _json_ok(route: str, doc: dict[str, Any]) -> Response:
+    # Encoded on the DB executor, after the connection is released; timed as the serialize phase.
+    return Response(content=api_executor.json_body(route, doc), media_type="application/json")
 
 
 def _table_exists(conn, name: str) -> bool:
@@ -90,7 +91,7 @@ def _require_auth_for_writes() -> bool:
     return (os.environ.get("NEXUS_REQUIRE_AUTH_FOR_WRITES", "") or "").strip().lower() in ("1", "true", "yes")
 
 
-def _require_session(headers) -> Optional[JSONResponse]:
+async def _require_session(headers, route: str = "other") -> Optional[JSONResponse]:
     if not _require_auth_for_writes():
         return None
     if lims_db is None:
@@ -100,35 +101,12 @@ def _require_session(headers) -> Optional[JSONResponse]:
     if not sid:
         return _api_error(401, "auth_required", "missing session header (X-Nexus-Session) or Authorization: Bearer")
 
-    conn = lims_db.connect()
-    try:
-        _db_init(conn)
-        now = _utc_now_iso()
-
-        try:
-            conn.execute("DELETE FROM guest_sessions WHERE expires_at <= ?", (now,))
-            conn.commit()
-        except Exception:
-            pass
-
-        row = conn.execute(
-            "SELECT id FROM guest_sessions WHERE id = ? AND expires_at > ?",
-            (sid, now),
-        ).fetchone()
-        if not row:
-            return _api_error(401, "invalid_session", "session not found or expired")
-
-        try:
-            conn.execute("UPDATE guest_sessions SET last_seen_at = ? WHERE id = ?", (now, sid))
-            conn.commit()
-        except Exception:
-            pass
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
-
+    # Cached (lims/sessions.py): no DB transaction per request; last_seen_at is written behind.
+    # A miss reads the DB on the executor, not on the event loop.
+    with lims_metrics.phase(route, "auth"):
+        row = await api_executor.lookup_session(sid)
+    if row is None:
+        return _api_error(401, "invalid_session", "session not found or expired")
     return None
 
 
@@ -146,20 +124,6 @@ def _resolve_container_id(conn, ident: str) -> Optional[int]:
     return None
 
 
-def _resolve_sample_id(conn, ident: str) -> Optional[int]:
-    ident = (ident or "").strip()
-    if not ident:
-        return None
-    if ident.isdigit():
-        row = conn.execute("SELECT id FROM samples WHERE id = ? LIMIT 1", (int(ident),)).fetchone()
-        if row:
-            return int(row[0])
-    row = conn.execute("SELECT id FROM samples WHERE external_id = ? LIMIT 1", (ident,)).fetchone()
-    if row:
-        return int(row[0])
-    return None
-
-
 def _normalize_status(v: Any) -> tuple[str, Optional[JSONResponse]]:
     if v is None:
         return "received", None
@@ -193,7 +157,7 @@ def _insert_event(conn, *, sample_id: int, event_type: str, note: str | None = N
 
 @router.post("/container/add")
 async def container_add(request: Request) -> JSONResponse:
-    r = _require_session(request.headers)
+    r = await _require_session(request.headers, "/container/add")
     if r is not None:
         return r
     if lims_db is None:
@@ -219,31 +183,27 @@ async def container_add(request: Request) -> JSONResponse:
     is_exclusive_raw = body.get("is_exclusive", 0)
     is_exclusive = 1 if str(is_exclusive_raw).strip().lower() in ("1", "true", "yes", "on") else 0
 
-    conn = lims_db.connect()
-    try:
-        _db_init(conn)
-        if not _table_exists(conn, "containers"):
-            return _api_error(500, "internal_error", "containers table missing")
-
-        row = conn.execute("SELECT id FROM containers WHERE barcode = ? LIMIT 1", (barcode,)).fetchone()
-        if row:
-            return _api_error(409, "already_exists", "container barcode already exists", id=int(row[0]))
+    def _run() -> Response:
+        with lims_db.writer("container_add") as conn:
+            if not _table_exists(conn, "containers"):
+                return _api_error(500, "internal_error", "containers table missing")
 
-        now = _utc_now_iso()
-        conn.execute(
-            "INSERT INTO containers (barcode, kind, location, created_at, updated_at, is_exclusive) VALUES (?, ?, ?, ?, ?, ?)",
-            (barcode, kind, location, now, now, is_exclusive),
-        )
-        cid = int((conn.execute("SELECT last_insert_rowid()").fetchone() or [0])[0] or 0)
-        conn.commit()
+            row = conn.execute("SELECT id FROM containers WHERE barcode = ? LIMIT 1", (barcode,)).fetchone()
+            if row:
+                return _api_error(409, "already_exists", "container barcode already exists", id=int(row[0]))
+
+            now = _utc_now_iso()
+            conn.execute(
+                "INSERT INTO containers (barcode, kind, location, created_at, updated_at, is_exclusive) VALUES (?, ?, ?, ?, ?, ?)",
+                (barcode, kind, location, now, now, is_exclusive),
+            )
+            cid = int((conn.execute("SELECT last_insert_rowid()").fetchone() or [0])[0] or 0)
+            conn.commit()
 
-        row = conn.execute("SELECT * FROM containers WHERE id = ? LIMIT 1", (cid,)).fetchone()
-        return JSONResponse(status_code=200, content={"schema": "nexus_container", "schema_version": 1, "ok": True, "container": dict(row) if row else {"id": cid}})
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+            row = conn.execute("SELECT * FROM containers WHERE id = ? LIMIT 1", (cid,)).fetchone()
+            doc = {"schema": "nexus_container", "schema_version": 1, "ok": True, "container": dict(row) if row else {"id": cid}}
+        return _json_ok("/container/add", doc)
+    return await api_executor.run_db(_run)
 
 
 @router.get("/container/list")
@@ -259,20 +219,21 @@ async def container_list(request: Request) -> JSONResponse:
     if limit < 0:
         return _api_error(400, "bad_request", "limit must be >= 0")
     limit = min(limit, 500)
-
-    conn = lims_db.connect()
     try:
-        _db_init(conn)
-        if not _table_exists(conn, "containers"):
-            return _api_error(500, "internal_error", "containers table missing")
-        rows = conn.execute("SELECT * FROM containers ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
-        containers = [dict(r) for r in rows]
-        return JSONResponse(status_code=200, content={"schema": "nexus_container_list", "schema_version": 1, "ok": True, "limit": limit, "count": len(containers), "containers": containers})
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+        seek_sql, seek_params = container_seek(qs["cursor"][0] if qs.get("cursor") else None)
+    except CursorError as e:
+        return _api_error(400, "bad_request", str(e))
+
+    def _run() -> Response:
+        with lims_db.reader("container_list") as conn:
+            if not _table_exists(conn, "containers"):
+                return _api_error(500, "internal_error", "containers table missing")
+            where = f" WHERE {seek_sql}" if seek_sql else ""
+            rows = conn.execute(f"SELECT * FROM containers{where} ORDER BY id DESC LIMIT ?", (*seek_params, limit + 1)).fetchall()
+            rows, next_cursor = page(rows, limit, CONTAINER_KEY)
+            containers = [dict(r) for r in rows]
+        return _json_ok("/container/list", {"schema": "nexus_container_list", "schema_version": 1, "ok": True, "limit": limit, "count": len(containers), "containers": containers, "next_cursor": next_cursor})
+    return await api_executor.run_db(_run)
 
 
 @router.get("/container/show")
@@ -289,26 +250,21 @@ async def container_show(request: Request) -> JSONResponse:
     if not ident:
         return _api_error(400, "bad_request", "identifier must be provided (identifier|barcode|id)")
 
-    conn = lims_db.connect()
-    try:
-        _db_init(conn)
-        cid = _resolve_container_id(conn, ident)
-        if cid is None:
-            return _api_error(404, "not_found", f"container not found: '{ident}'")
-        row = conn.execute("SELECT * FROM containers WHERE id = ? LIMIT 1", (cid,)).fetchone()
-        if not row:
-            return _api_error(404, "not_found", f"container not found: '{ident}'")
-        return JSONResponse(status_code=200, content={"schema": "nexus_container", "schema_version": 1, "ok": True, "container": dict(row)})
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+    def _run() -> Response:
+        with lims_db.reader("container_show") as conn:
+            cid = _resolve_container_id(conn, ident)
+            if cid is None:
+                return _api_error(404, "not_found", f"container not found: '{ident}'")
+            row = conn.execute("SELECT * FROM containers WHERE id = ? LIMIT 1", (cid,)).fetchone()
+            if not row:
+                return _api_error(404, "not_found", f"container not found: '{ident}'")
+        return _json_ok("/container/show", {"schema": "nexus_container", "schema_version": 1, "ok": True, "container": dict(row)})
+    return await api_executor.run_db(_run)
 
 
 @router.post("/sample/add")
 async def sample_add(request: Request) -> JSONResponse:
-    r = _require_session(request.headers)
+    r = await _require_session(request.headers, "/sample/add")
     if r is not None:
         return r
     if lims_db is None:
@@ -343,52 +299,80 @@ async def sample_add(request: Request) -> JSONResponse:
             container_ident = str(v).strip()
             break
 
-    conn = lims_db.connect()
-    try:
-        _db_init(conn)
-        if not _table_exists(conn, "samples"):
-            return _api_error(500, "internal_error", "samples table missing")
+    def _run(external_id: Optional[str]) -> Response:
+        with lims_db.writer("sample_add") as conn:
+            if not _table_exists(conn, "samples"):
+                return _api_error(500, "internal_error", "samples table missing")
+
+            container_id = None
+            if container_ident is not None:
+                if not _table_exists(conn, "containers"):
+                    return _api_error(400, "bad_request", "containers table missing; cannot link container")
+                container_id = _resolve_container_id(conn, container_ident)
+                if container_id is None:
+                    return _api_error(400, "bad_request", "container not found")
+
+            if not external_id:
+                external_id = f"AUTO-{secrets.token_urlsafe(8)}"
+            else:
+                row = conn.execute("SELECT id FROM samples WHERE external_id = ? LIMIT 1", (external_id,)).fetchone()
+                if row:
+                    return _api_error(409, "already_exists", "sample external_id already exists", id=int(row[0]))
+
+            now = _utc_now_iso()
+            ra = received_at or now
+
+            conn.execute(
+                "INSERT INTO samples (external_id, specimen_type, status, notes, received_at, created_at, updated_at, container_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (external_id, specimen_type, status, notes, ra, now, now, container_id),
+            )
+            sid = int((conn.execute("SELECT last_insert_rowid()").fetchone() or [0])[0] or 0)
+
+            event_recorded = _insert_event(conn, sample_id=sid, event_type="created", note=notes, occurred_at=ra)
+            conn.commit()
 
-        container_id = None
-        if container_ident is not None:
-            if not _table_exists(conn, "containers"):
-                return _api_error(400, "bad_request", "containers table missing; cannot link container")
-            container_id = _resolve_container_id(conn, container_ident)
-            if container_id is None:
-                return _api_error(400, "bad_request", "container not found")
-
-        if not external_id:
-            external_id = f"AUTO-{secrets.token_urlsafe(8)}"
-        else:
-            row = conn.execute("SELECT id FROM samples WHERE external_id = ? LIMIT 1", (external_id,)).fetchone()
-            if row:
-                return _api_error(409, "already_exists", "sample external_id already exists", id=int(row[0]))
+            row = conn.execute("SELECT * FROM samples WHERE id = ? LIMIT 1", (sid,)).fetchone()
+            doc = {"schema": "nexus_sample_create", "schema_version": 1, "ok": True, "event_recorded": bool(event_recorded), "sample": dict(row) if row else {"id": sid}}
+        return _json_ok("/sample/add", doc)
+    return await api_executor.run_db(_run, external_id)
 
-        now = _utc_now_iso()
-        ra = received_at or now
 
-        conn.execute(
-            "INSERT INTO samples (external_id, specimen_type, status, notes, received_at, created_at, updated_at, container_id) "
-            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (external_id, specimen_type, status, notes, ra, now, now, container_id),
-        )
-        sid = int((conn.execute("SELECT last_insert_rowid()").fetchone() or [0])[0] or 0)
+@router.post("/sample/add/batch")
+async def sample_add_batch(request: Request) -> JSONResponse:
+    r = await _require_session(request.headers, "/sample/add/batch")
+    if r is not None:
+        return r
+    if lims_db is None:
+        return _api_error(500, "internal_error", "lims_db import failed")
 
-        event_recorded = _insert_event(conn, sample_id=sid, event_type="created", note=notes, occurred_at=ra)
-        conn.commit()
+    max_bytes = sample_import.max_batch_bytes()
+    raw = await request.body()
+    if len(raw) > max_bytes:
+        return _api_error(413, "payload_too_large", f"payload too large (max {max_bytes} bytes)")
 
-        row = conn.execute("SELECT * FROM samples WHERE id = ? LIMIT 1", (sid,)).fetchone()
-        return JSONResponse(status_code=200, content={"schema": "nexus_sample_create", "schema_version": 1, "ok": True, "event_recorded": bool(event_recorded), "sample": dict(row) if row else {"id": sid}})
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+    qs = parse_qs(str(request.url.query or ""))
+    fmt = (qs.get("format") or [None])[0] or sample_import.detect_format(request.headers.get("Content-Type"))
+    try:
+        rows = sample_import.parse_rows(raw, fmt)
+    except sample_import.BatchFormatError as e:
+        return _api_error(400, "bad_request", str(e))
+    if not rows:
+        return _api_error(400, "bad_request", "batch contains no rows")
+    max_rows = sample_import.max_batch_rows()
+    if len(rows) > max_rows:
+        return _api_error(413, "payload_too_large", f"too many rows (max {max_rows})")
+
+    def _run() -> Response:
+        with lims_db.writer("sample_add_batch") as conn:
+            report = sample_import.import_samples(conn, rows)
+        return _json_ok("/sample/add/batch", {"schema": "nexus_sample_batch", "schema_version": 1, "ok": True, **report})
+    return await api_executor.run_db(_run)
 
 
 @router.post("/sample/event")
 async def sample_event(request: Request) -> JSONResponse:
-    r = _require_session(request.headers)
+    r = await _require_session(request.headers, "/sample/event")
     if r is not None:
         return r
     if lims_db is None:
@@ -415,17 +399,12 @@ async def sample_event(request: Request) -> JSONResponse:
         logger.warning("Validation error while appending sample event: %s", e)
         return _api_error(400, "bad_request", "invalid event request")
 
-    conn = lims_db.connect()
-    try:
-        _db_init(conn)
-        sid = _resolve_sample_id(conn, ident)
-        if sid is None:
-            return _api_error(404, "not_found", "sample not found")
-        ok = _insert_event(conn, sample_id=sid, event_type=event_type, note=note, occurred_at=occurred_at)
-        conn.commit()
-        return JSONResponse(status_code=200, content={"schema": "nexus_sample_event_append", "schema_version": 1, "ok": True, "identifier": ident, "sample_id": sid, "event_recorded": bool(ok)})
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+    def _run() -> Response:
+        with lims_db.writer("sample_event") as conn:
+            sid = resolve_sample_id(conn, ident)
+            if sid is None:
+                return _api_error(404, "not_found", "sample not found")
+            ok = _insert_event(conn, sample_id=sid, event_type=event_type, note=note, occurred_at=occurred_at)
+            conn.commit()
+        return _json_ok("/sample/event", {"schema": "nexus_sample_event_append", "schema_version": 1, "ok": True, "identifier": ident, "sample_id": sid, "event_recorded": bool(ok)})
+    return await api_executor.run_db(_run)
@@ -6,10 +6,14 @@ import os
 import argparse
 import json
 import re
+import sys
 from datetime import datetime, timezone
 from typing import Any, List, Optional, Tuple, Union
 
 from . import db
+from . import pagination
+from . import export_stream
+from . import sample_import
 
 
 def _env_int(name: str, default: int) -> int:
@@ -26,15 +30,9 @@ def utc_now_iso() -> str:
 
 
 def ensure_db(conn) -> None:
-  # Be compatible with either style:
-  # - migration-based: db.apply_migrations(conn)
-  # - schema-based:    db.init_db(conn)
-  if hasattr(db, "apply_migrations"):
-    db.apply_migrations(conn)  # type: ignore[attr-defined]
-  elif hasattr(db, "init_db"):
-    db.init_db(conn)  # type: ignore[attr-defined]
-  else:
-    raise RuntimeError("db module missing apply_migrations/init_db")
+  # Fast path: PRAGMA user_version already matches the migrations fingerprint,
+  # so a current DB costs one header read (no CREATE/commit, no migrations glob).
+  db.ensure_schema(conn)
 
 
 def print_rows(rows) -> None:
@@ -277,8 +275,14 @@ def cmd_container_audit(args: argparse.Namespace) -> int:
     print("ERROR: --limit must be >= 0")
     return 2
 
-  include_drift = bool(getattr(args, "include_drift", False))
+  return container_audit(conn, limit=limit, include_drift=bool(getattr(args, "include_drift", False)))
+
+
+def container_audit(conn, *, limit: int = 50, include_drift: bool = False) -> int:
+  """Print the container audit for an open, migrated connection; 2 if hard issues were found.
 
+  Only reads, so snapshot tooling can run it on a read-only or in-memory DB.
+  """
   # ---- Counts (always computed) ----
   hard_count = conn.execute(
     """
@@ -687,6 +691,49 @@ def cmd_sample_add(args: argparse.Namespace) -> int:
   print("OK: sample created")
   print_rows([row])
   return 0
+
+
+def cmd_sample_import(args: argparse.Namespace) -> int:
+  src = str(getattr(args, "file", "") or "").strip()
+  if not src:
+    print("ERROR: file is required (use - for stdin)")
+    return 2
+  fmt = getattr(args, "format", None) or sample_import.detect_format(filename=src)
+  try:
+    if src == "-":
+      data = sys.stdin.buffer.read()
+    else:
+      with open(src, "rb") as f:
+        data = f.read()
+  except OSError as e:
+    print(f"ERROR: cannot read {src}: {e.strerror or e}")
+    return 2
+  try:
+    rows = sample_import.parse_rows(data, fmt)
+  except sample_import.BatchFormatError as e:
+    print(f"ERROR: {e}")
+    return 2
+
+  conn = db.connect()
+  ensure_db(conn)
+  try:
+    report = sample_import.import_samples(conn, rows)
+    conn.commit()
+  except Exception:
+    conn.rollback()
+    raise
+
+  if getattr(args, "json", False):
+    print(json.dumps({"schema": "nexus_sample_batch", "schema_version": 1, **report}, ensure_ascii=False))
+  else:
+    for r in report["results"]:
+      if not r.get("ok"):
+        # 1-based to match line/row numbers people see in their manifest.
+        print(f"ERROR: row {r['row'] + 1}: {r['error']}: {r['detail']}")
+    print(f"OK: imported {report['inserted']} sample(s), {report['failed']} failed")
+  return 0 if report["failed"] == 0 else 2
+
+
 def cmd_sample_list(args: argparse.Namespace) -> int:
   conn = db.connect()
   ensure_db(conn)
@@ -728,15 +775,27 @@ def cmd_sample_list(args: argparse.Namespace) -> int:
     where.append("container_id = ?")
     params.append(cid)
 
+  try:
+    seek_sql, seek_params = pagination.sample_seek(getattr(args, "cursor", None))
+  except pagination.CursorError as e:
+    print(f"ERROR: {e}")
+    return 2
+  if seek_sql is not None:
+    where.append(seek_sql)
+    params.extend(seek_params)
+
   sql = "SELECT * FROM samples"
   if where:
     sql += " WHERE " + " AND ".join(where)
   sql += " ORDER BY received_at DESC, id DESC"
   sql += " LIMIT ?"
-  params.append(limit)
+  params.append(limit + 1)
 
-  rows = conn.execute(sql, params).fetchall()
+  rows, next_cursor = pagination.page(conn.execute(sql, params).fetchall(), limit, pagination.SAMPLE_KEY)
   print_rows(rows)
+  if next_cursor:
+    # stderr keeps stdout a clean JSONL stream; pass this back via --cursor for the next page.
+    print(f"next_cursor: {next_cursor}", file=sys.stderr)
   return 0
 
 
@@ -942,73 +1001,11 @@ def cmd_sample_export(args: argparse.Namespace) -> int:
     print("ERROR: limit must be >= 0")
     return 2
 
-  row = conn.execute(
-    """
-    SELECT
-      s.*,
-      c.barcode AS container_barcode,
-      c.kind AS container_kind,
-      c.location AS container_location,
-      c.is_exclusive AS container_is_exclusive
-    FROM samples s
-    LEFT JOIN containers c ON c.id = s.container_id
-    WHERE s.id = ?
-    """,
-    (sid,),
-  ).fetchone()
-
-  if not row:
+  found = export_stream.sample_with_events(conn, sid, event_limit=limit)
+  if found is None:
     print("NOT FOUND")
     return 2
-
-  events = conn.execute(
-    """
-    SELECT
-      e.*,
-      fc.barcode AS from_container_barcode,
-      tc.barcode AS to_container_barcode
-    FROM sample_events e
-    LEFT JOIN containers fc ON fc.id = e.from_container_id
-    LEFT JOIN containers tc ON tc.id = e.to_container_id
-    WHERE e.sample_id = ?
-    ORDER BY e.occurred_at DESC, e.id DESC
-    LIMIT ?
-    """,
-    (sid, limit),
-  ).fetchall()
-
-  sample_obj = dict(row)
-
-  container_obj = None
-  if row["container_id"] is not None:
-    container_obj = {
-      "id": row["container_id"],
-      "barcode": row["container_barcode"],
-      "kind": row["container_kind"],
-      "location": row["container_location"],
-      "is_exclusive": row["container_is_exclusive"],
-    }
-
-  for k in ["container_barcode", "container_kind", "container_location", "container_is_exclusive"]:
-    sample_obj.pop(k, None)
-  sample_obj["container"] = container_obj
-
-  ev_objs = []
-  for e in events:
-    eo = dict(e)
-    eo["from_container"] = (
-      {"id": eo.get("from_container_id"), "barcode": eo.get("from_container_barcode")}
-      if eo.get("from_container_id") is not None
-      else None
-    )
-    eo["to_container"] = (
-      {"id": eo.get("to_container_id"), "barcode": eo.get("to_container_barcode")}
-      if eo.get("to_container_id") is not None
-      else None
-    )
-    eo.pop("from_container_barcode", None)
-    eo.pop("to_container_barcode", None)
-    ev_objs.append(eo)
+  sample_obj, ev_objs = found
 
   if fmt == "json":
     obj = {
@@ -1026,6 +1023,56 @@ def cmd_sample_export(args: argparse.Namespace) -> int:
   return 0
 
 
+def cmd_export_stream(args: argparse.Namespace) -> int:
+  try:
+    status = export_stream.normalize_status(getattr(args, "status", None))
+    since = export_stream.normalize_timestamp(getattr(args, "since", None), "--since")
+    until = export_stream.normalize_timestamp(getattr(args, "until", None), "--until")
+  except export_stream.ExportFilterError as e:
+    print(f"ERROR: {e}", file=sys.stderr)
+    return 2
+
+  conn = db.connect()
+  ensure_db(conn)
+  conn.close()
+
+  with db.stream_reader() as conn:
+    container_id = None
+    container_raw = getattr(args, "container", None)
+    if container_raw is not None:
+      ident = str(container_raw).strip()
+      if not ident:
+        print("ERROR: --container cannot be empty or whitespace", file=sys.stderr)
+        return 2
+      container_id = resolve_container_id(conn, ident)
+      if container_id is None:
+        print(f"NOT FOUND: container '{ident}'", file=sys.stderr)
+        return 2
+
+    # stdout carries the NDJSON stream, so diagnostics above go to stderr.
+    out = sys.stdout
+    try:
+      for line in export_stream.iter_ndjson(
+        conn,
+        status=status,
+        container_id=container_id,
+        since=since,
+        until=until,
+        include_events=not getattr(args, "no_events", False),
+        batch_size=int(getattr(args, "batch_size", export_stream.DEFAULT_BATCH)),
+      ):
+        out.write(line)
+      out.flush()
+    except BrokenPipeError:
+      # Downstream closed early (e.g. `| head`); not an export failure.
+      try:
+        sys.stdout = open(os.devnull, "w")
+      except OSError:
+        pass
+      return 0
+  return 0
+
+
 def cmd_sample_move(args: argparse.Namespace) -> int:
   conn = db.connect()
   ensure_db(conn)
@@ -1254,10 +1301,17 @@ def build_parser() -> argparse.ArgumentParser:
   sp_add.add_argument("--container", default=None, help="Assign to container (id or barcode)")
   sp_add.set_defaults(fn=cmd_sample_add)
 
+  sp_import = sample_sub.add_parser("import", help="Bulk-add samples from a JSON, JSONL or CSV file (one transaction)")
+  sp_import.add_argument("file", help="Input file, or - for stdin")
+  sp_import.add_argument("--format", default=None, choices=list(sample_import.FORMATS), help="Input format (default: from extension, else sniffed)")
+  sp_import.add_argument("--json", action="store_true", help="Print the full per-row report as JSON")
+  sp_import.set_defaults(fn=cmd_sample_import)
+
   sp_list = sample_sub.add_parser("list", help="List samples")
   sp_list.add_argument("--status", default=None, help="Filter by status")
   sp_list.add_argument("--container", default=None, help="Filter by container (id or barcode)")
   sp_list.add_argument("--limit", type=int, default=25, help="Max rows (default: 25)")
+  sp_list.add_argument("--cursor", default=None, help="Continue after a previous page (next_cursor, printed on stderr)")
   sp_list.set_defaults(fn=cmd_sample_list)
 
   sp_get = sample_sub.add_parser("get", help="Get a sample by ID or external_id")
@@ -1301,6 +1355,18 @@ def build_parser() -> argparse.ArgumentParser:
   sp_status.add_argument("--note", default=None, help="Optional note to attach to the status change event")
   sp_status.set_defaults(fn=cmd_sample_status)
 
+  sp_exp = sub.add_parser("export", help="Bulk exports")
+  exp_sub = sp_exp.add_subparsers(dest="export_cmd", required=True)
+
+  sp_stream = exp_sub.add_parser("stream", help="Stream all matching samples + events as NDJSON (stdout)")
+  sp_stream.add_argument("--status", default=None, help="Filter by status")
+  sp_stream.add_argument("--container", default=None, help="Filter by container (id or barcode)")
+  sp_stream.add_argument("--since", default=None, help="received_at >= this ISO8601 timestamp")
+  sp_stream.add_argument("--until", default=None, help="received_at < this ISO8601 timestamp")
+  sp_stream.add_argument("--no-events", action="store_true", help="Emit sample lines only")
+  sp_stream.add_argument("--batch-size", type=int, default=export_stream.DEFAULT_BATCH, help="Samples fetched per round trip (memory bound)")
+  sp_stream.set_defaults(fn=cmd_export_stream)
+
   return p
 
 
@@ -2,9 +2,13 @@ from __future__ import annotations
 
 import os
 import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Iterable, List, Optional, Sequence, Set, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 
 def utc_now_iso() -> str:
@@ -36,15 +40,671 @@ def db_path() -> Path:
   return Path("data") / "lims.sqlite3"
 
 
-def connect() -> sqlite3.Connection:
-  path = db_path()
+def _env_int(name: str, default: int) -> int:
+  raw = (os.environ.get(name, "") or "").strip()
+  if not raw:
+    return default
+  try:
+    return int(raw)
+  except Exception:
+    return default
+
+
+def _env_float(name: str, default: float) -> float:
+  raw = (os.environ.get(name, "") or "").strip()
+  if not raw:
+    return default
+  try:
+    return float(raw)
+  except Exception:
+    return default
+
+
+# -----------------
+# Connection profile
+# -----------------
+# PRAGMAs applied when a connection is created. "wal" is the default: readers
+# keep reading while the API writer commits, and synchronous=NORMAL is durable
+# across application crashes in WAL mode (only an OS crash/power loss can drop
+# the last commits). "compat" keeps SQLite's rollback-journal defaults.
+# Every field can be overridden with NEXUS_DB_<FIELD> (e.g. NEXUS_DB_MMAP_SIZE=0).
+_PROFILES: Dict[str, Dict[str, Any]] = {
+  "wal": {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout_ms": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16000,  # negative = KiB, i.e. ~16 MiB per connection
+    "temp_store": "memory",
+    "wal_autocheckpoint": 1000,  # pages; SQLite default
+    "journal_size_limit": 64 * 1024 * 1024,  # truncate the -wal file back to this after a checkpoint
+  },
+  "compat": {
+    "journal_mode": None,
+    "synchronous": None,
+    "busy_timeout_ms": 5000,
+    "mmap_size": None,
+    "cache_size": None,
+    "temp_store": None,
+    "wal_autocheckpoint": None,
+    "journal_size_limit": None,
+  },
+}
+
+_PRAGMA_CHOICES: Dict[str, Tuple[str, ...]] = {
+  "journal_mode": ("wal", "delete", "truncate", "persist"),
+  "synchronous": ("off", "normal", "full", "extra"),
+  "temp_store": ("default", "file", "memory"),
+}
+
+_INT_FIELDS = ("busy_timeout_ms", "mmap_size", "cache_size", "wal_autocheckpoint", "journal_size_limit")
+
+
+def connection_profile() -> Dict[str, Any]:
+  """Resolve the active profile (NEXUS_DB_PROFILE plus per-field env overrides)."""
+  name = (os.environ.get("NEXUS_DB_PROFILE", "") or "").strip().lower() or "wal"
+  if name not in _PROFILES:
+    name = "wal"
+  prof: Dict[str, Any] = dict(_PROFILES[name])
+  for key, choices in _PRAGMA_CHOICES.items():
+    raw = (os.environ.get("NEXUS_DB_" + key.upper(), "") or "").strip().lower()
+    if raw in choices:
+      prof[key] = raw
+  for key in _INT_FIELDS:
+    raw = (os.environ.get("NEXUS_DB_" + key.upper(), "") or "").strip()
+    if raw:
+      prof[key] = _env_int("NEXUS_DB_" + key.upper(), prof[key] if prof[key] is not None else 0)
+  prof["name"] = name
+  return prof
+
+
+def _apply_profile(conn: sqlite3.Connection, prof: Dict[str, Any], *, set_journal_mode: bool) -> None:
+  # busy_timeout first so the journal_mode switch below can wait out a concurrent writer.
+  if prof.get("busy_timeout_ms") is not None:
+    conn.execute(f"PRAGMA busy_timeout = {max(0, int(prof['busy_timeout_ms']))}")
+  mode = None
+  if set_journal_mode and prof.get("journal_mode"):
+    try:
+      row = conn.execute(f"PRAGMA journal_mode = {prof['journal_mode']}").fetchone()
+      mode = str(row[0]).lower() if row else None
+    except sqlite3.DatabaseError:
+      mode = None
+  if mode is None:
+    row = conn.execute("PRAGMA journal_mode").fetchone()
+    mode = str(row[0]).lower() if row else ""
+  # synchronous=NORMAL is only a safe trade-off under WAL; leave FULL otherwise.
+  if prof.get("synchronous") and (mode == "wal" or prof["synchronous"] in ("full", "extra")):
+    conn.execute(f"PRAGMA synchronous = {prof['synchronous']}")
+  if prof.get("mmap_size") is not None:
+    conn.execute(f"PRAGMA mmap_size = {max(0, int(prof['mmap_size']))}")
+  if prof.get("cache_size") is not None:
+    conn.execute(f"PRAGMA cache_size = {int(prof['cache_size'])}")
+  if prof.get("temp_store"):
+    conn.execute(f"PRAGMA temp_store = {prof['temp_store']}")
+  if mode == "wal" and prof.get("wal_autocheckpoint") is not None:
+    conn.execute(f"PRAGMA wal_autocheckpoint = {max(0, int(prof['wal_autocheckpoint']))}")
+  if prof.get("journal_size_limit") is not None:
+    conn.execute(f"PRAGMA journal_size_limit = {int(prof['journal_size_limit'])}")
+
+
+CHECKPOINT_MODES = ("passive", "full", "restart", "truncate")
+
+
+def wal_checkpoint(conn: sqlite3.Connection, mode: str = "passive") -> Dict[str, Any]:
+  """Run PRAGMA wal_checkpoint(<mode>) and return SQLite's (busy, log, checkpointed) triple.
+
+  On a non-WAL database SQLite reports log = checkpointed = -1.
+  """
+  m = (mode or "passive").strip().lower()
+  if m not in CHECKPOINT_MODES:
+    raise ValueError(f"invalid checkpoint mode: {mode!r} (expected one of: {', '.join(CHECKPOINT_MODES)})")
+  if conn.in_transaction:
+    conn.commit()
+  row = conn.execute(f"PRAGMA wal_checkpoint({m.upper()})").fetchone()
+  busy, log, done = (int(row[0]), int(row[1]), int(row[2])) if row else (0, -1, -1)
+  return {"mode": m, "busy": busy, "log_frames": log, "checkpointed_frames": done, "at": utc_now_iso()}
+
+
+def wal_path(path: Optional[Path] = None) -> Path:
+  p = Path(path) if path is not None else db_path()
+  return p.with_name(p.name + "-wal")
+
+
+def wal_size_bytes(path: Optional[Path] = None) -> int:
+  try:
+    return wal_path(path).stat().st_size
+  except OSError:
+    return 0
+
+
+def _open(
+  path: Path,
+  *,
+  check_same_thread: bool = True,
+  profile: Optional[Dict[str, Any]] = None,
+  set_journal_mode: bool = False,
+) -> sqlite3.Connection:
   path.parent.mkdir(parents=True, exist_ok=True)
-  conn = sqlite3.connect(str(path))
+  conn = sqlite3.connect(str(path), check_same_thread=check_same_thread)
   conn.row_factory = sqlite3.Row
   conn.execute("PRAGMA foreign_keys = ON;")
+  try:
+    _apply_profile(conn, profile if profile is not None else connection_profile(), set_journal_mode=set_journal_mode)
+  except Exception:
+    conn.close()
+    raise
   return conn
 
 
+def connect(path: Optional[Path] = None) -> sqlite3.Connection:
+  # journal_mode is persistent in the DB file, so only the API pool switches it;
+  # the CLI also runs against snapshot copies that should stay single-file.
+  return _open(path if path is not None else db_path())
+
+
+# -----------------
+# Connection pool (long-running API processes)
+# -----------------
+# The CLI is one process per command and keeps using connect(). The API servers
+# serve many requests per process, so they borrow connections from a pool
+# instead of paying file open + PRAGMA setup + schema load on every request:
+#   - readers: a bounded set of connections; a thread holds one for the duration
+#     of a `with reader()` block (nested blocks on the same thread reuse it)
+#   - writer: a single connection serialized by a lock, so API writes never
+#     contend with each other for the SQLite write lock
+# A writer() block is one BEGIN IMMEDIATE transaction: with several API processes on
+# one DB file (multi-worker mode) the write lock is taken up front, waiting out the
+# other processes' writers for busy_timeout, so a block that reads and then writes
+# never fails on a read-to-write upgrade and sees no concurrent change in between.
+# Connections are health-checked on checkout and discarded if the DB file was
+# replaced underneath them (e.g. snapshot restore).
+#
+# reader(name) / writer(name) label a block for telemetry: observers registered with
+# add_observer() (lims/metrics.py) get the checkout wait and the time the block held
+# the connection, per name. Unnamed blocks report as "other".
+
+# fn(event, labels, seconds): ("checkout", {"role"}, wait) and
+# ("query", {"query", "role", "outcome"}, held); outcome is ok | busy | error.
+_OBSERVERS: List[Any] = []
+
+
+def add_observer(fn) -> None:
+  if fn not in _OBSERVERS:
+    _OBSERVERS.append(fn)
+
+
+def _emit(event: str, labels: Dict[str, str], seconds: float) -> None:
+  for fn in _OBSERVERS:
+    try:
+      fn(event, labels, seconds)
+    except Exception:
+      pass
+
+
+def is_busy_error(e: BaseException) -> bool:
+  """SQLITE_BUSY / SQLITE_LOCKED that outlasted busy_timeout."""
+  if not isinstance(e, sqlite3.OperationalError):
+    return False
+  code = getattr(e, "sqlite_errorcode", None)  # Python 3.11+
+  if code is not None:
+    return (code & 0xFF) in (5, 6)
+  msg = str(e).lower()
+  return "database is locked" in msg or "database table is locked" in msg
+
+
+def _outcome(e: Optional[BaseException]) -> str:
+  if e is None:
+    return "ok"
+  return "busy" if is_busy_error(e) else "error"
+
+
+def _file_id(path: Path) -> Optional[Tuple[int, int]]:
+  try:
+    st = path.stat()
+  except OSError:
+    return None
+  return (st.st_dev, st.st_ino)
+
+
+class PoolTimeout(RuntimeError):
+  pass
+
+
+class _Slot:
+  __slots__ = ("conn", "file_id", "last_used")
+
+  def __init__(self, conn: sqlite3.Connection, file_id: Optional[Tuple[int, int]]):
+    self.conn = conn
+    self.file_id = file_id
+    self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+  def __init__(
+    self,
+    path: Path,
+    *,
+    max_readers: int = 8,
+    checkout_timeout: float = 30.0,
+    health_check_interval: float = 30.0,
+    profile: Optional[Dict[str, Any]] = None,
+  ):
+    self.path = Path(path)
+    self.profile = dict(profile) if profile is not None else connection_profile()
+    self.max_readers = max(1, int(max_readers))
+    self.checkout_timeout = float(checkout_timeout)
+    self.health_check_interval = float(health_check_interval)
+
+    self._lock = threading.Lock()
+    self._readers_sem = threading.BoundedSemaphore(self.max_readers)
+    self._idle: List[_Slot] = []
+    self._local = threading.local()
+
+    self._writer_lock = threading.RLock()
+    self._writer: Optional[_Slot] = None
+
+    self._stats: Dict[str, int] = {
+      "opened": 0,
+      "closed": 0,
+      "reader_checkouts": 0,
+      "reader_reuses": 0,
+      "reader_waits": 0,
+      "reader_in_use": 0,
+      "writer_checkouts": 0,
+      "writer_waits": 0,
+      "health_check_failures": 0,
+      "checkpoints": 0,
+    }
+    self._last_checkpoint: Optional[Dict[str, Any]] = None
+
+  # ---- internals ----
+  def _bump(self, key: str, n: int = 1) -> None:
+    with self._lock:
+      self._stats[key] = self._stats.get(key, 0) + n
+
+  def _new_slot(self) -> _Slot:
+    conn = _open(self.path, check_same_thread=False, profile=self.profile, set_journal_mode=True)
+    self._bump("opened")
+    try:
+      # Once per connection, not per request: a PRAGMA read when already current.
+      ensure_schema(conn)
+    except Exception:
+      conn.close()
+      self._bump("closed")
+      raise
+    return _Slot(conn, _file_id(self.path))
+
+  def _discard(self, slot: _Slot) -> None:
+    try:
+      slot.conn.close()
+    except Exception:
+      pass
+    self._bump("closed")
+
+  def _healthy(self, slot: _Slot) -> bool:
+    # DB file replaced or removed since this connection was opened.
+    if slot.file_id != _file_id(self.path):
+      return False
+    if time.monotonic() - slot.last_used < self.health_check_interval:
+      return True
+    try:
+      slot.conn.execute("SELECT 1").fetchone()
+      return True
+    except Exception:
+      return False
+
+  def _checkout_reader(self) -> _Slot:
+    if not self._readers_sem.acquire(blocking=False):
+      self._bump("reader_waits")
+      if not self._readers_sem.acquire(timeout=self.checkout_timeout):
+        raise PoolTimeout(f"timed out waiting for a reader connection ({self.max_readers} in use)")
+    try:
+      while True:
+        with self._lock:
+          slot = self._idle.pop() if self._idle else None
+        if slot is None:
+          slot = self._new_slot()
+          break
+        if self._healthy(slot):
+          self._bump("reader_reuses")
+          break
+        self._bump("health_check_failures")
+        self._discard(slot)
+    except Exception:
+      self._readers_sem.release()
+      raise
+    with self._lock:
+      self._stats["reader_checkouts"] += 1
+      self._stats["reader_in_use"] += 1
+    return slot
+
+  def _checkin_reader(self, slot: _Slot, *, broken: bool) -> None:
+    try:
+      if not broken and slot.conn.in_transaction:
+        slot.conn.rollback()
+    except Exception:
+      broken = True
+    slot.last_used = time.monotonic()
+    with self._lock:
+      self._stats["reader_in_use"] -= 1
+      if not broken:
+        self._idle.append(slot)
+    if broken:
+      self._discard(slot)
+    self._readers_sem.release()
+
+  # ---- public API ----
+  @contextmanager
+  def reader(self, name: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    held = getattr(self._local, "writer", None) or getattr(self._local, "reader", None)
+    if held is not None:
+      # Nested use on the same thread: reuse (keeps read-your-writes inside writer()).
+      yield held.conn
+      return
+
+    t0 = time.perf_counter()
+    slot = self._checkout_reader()
+    t1 = time.perf_counter()
+    self._local.reader = slot
+    err: Optional[BaseException] = None
+    try:
+      yield slot.conn
+    except BaseException as e:
+      err = e
+      raise
+    finally:
+      self._local.reader = None
+      self._checkin_reader(slot, broken=False)
+      if _OBSERVERS:
+        _emit("checkout", {"role": "reader"}, t1 - t0)
+        _emit("query", {"query": name or "other", "role": "reader", "outcome": _outcome(err)}, time.perf_counter() - t1)
+
+  @contextmanager
+  def writer(self, name: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    held = getattr(self._local, "writer", None)
+    if held is not None:
+      yield held.conn
+      return
+
+    t0 = time.perf_counter()
+    if not self._writer_lock.acquire(blocking=False):
+      self._bump("writer_waits")
+      if not self._writer_lock.acquire(timeout=self.checkout_timeout):
+        raise PoolTimeout("timed out waiting for the writer connection")
+    t1 = time.perf_counter()
+    err: Optional[BaseException] = None
+    try:
+      slot = self._writer
+      if slot is not None and not self._healthy(slot):
+        self._bump("health_check_failures")
+        self._discard(slot)
+        slot = None
+      if slot is None:
+        slot = self._new_slot()
+        self._writer = slot
+      self._bump("writer_checkouts")
+      self._local.writer = slot
+      try:
+        if not slot.conn.in_transaction:
+          slot.conn.execute("BEGIN IMMEDIATE")
+        yield slot.conn
+        if slot.conn.in_transaction:
+          slot.conn.commit()
+      except BaseException as e:
+        err = e
+        try:
+          slot.conn.rollback()
+        except Exception:
+          self._discard(slot)
+          self._writer = None
+        raise
+      finally:
+        self._local.writer = None
+        slot.last_used = time.monotonic()
+    finally:
+      self._writer_lock.release()
+      if _OBSERVERS:
+        _emit("checkout", {"role": "writer"}, t1 - t0)
+        _emit("query", {"query": name or "other", "role": "writer", "outcome": _outcome(err)}, time.perf_counter() - t1)
+
+  def checkpoint(self, mode: str = "passive") -> Dict[str, Any]:
+    """Checkpoint the WAL on the writer connection (serialized with API writes)."""
+    with self.writer("checkpoint") as conn:
+      res = wal_checkpoint(conn, mode)
+    with self._lock:
+      self._stats["checkpoints"] += 1
+      self._last_checkpoint = res
+    return res
+
+  def journal_mode(self) -> str:
+    with self.reader("journal_mode") as conn:
+      row = conn.execute("PRAGMA journal_mode").fetchone()
+    return str(row[0]).lower() if row else ""
+
+  def health_check(self) -> bool:
+    try:
+      with self.reader("health_check") as conn:
+        conn.execute("SELECT 1").fetchone()
+      return True
+    except Exception:
+      return False
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      doc: Dict[str, Any] = dict(self._stats)
+      doc["reader_idle"] = len(self._idle)
+      doc["last_checkpoint"] = dict(self._last_checkpoint) if self._last_checkpoint else None
+    doc["max_readers"] = self.max_readers
+    doc["writer_open"] = self._writer is not None
+    doc["db_path"] = str(self.path)
+    doc["profile"] = self.profile.get("name")
+    doc["wal_bytes"] = wal_size_bytes(self.path)
+    return doc
+
+  def close(self) -> None:
+    with self._lock:
+      idle, self._idle = self._idle, []
+    for slot in idle:
+      self._discard(slot)
+    with self._writer_lock:
+      if self._writer is not None:
+        self._discard(self._writer)
+        self._writer = None
+
+
+_POOLS: Dict[str, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+  """Return the process-wide pool for the current db_path() (created on first use)."""
+  key = str(db_path())
+  pool = _POOLS.get(key)
+  if pool is not None:
+    return pool
+  with _POOLS_LOCK:
+    pool = _POOLS.get(key)
+    if pool is None:
+      pool = ConnectionPool(
+        Path(key),
+        max_readers=_env_int("NEXUS_DB_POOL_MAX_READERS", 8),
+        checkout_timeout=_env_float("NEXUS_DB_POOL_TIMEOUT_SEC", 30.0),
+        health_check_interval=_env_float("NEXUS_DB_POOL_HEALTH_CHECK_SEC", 30.0),
+      )
+      _POOLS[key] = pool
+    return pool
+
+
+@contextmanager
+def reader(name: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+  with get_pool().reader(name) as conn:
+    yield conn
+
+
+@contextmanager
+def writer(name: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+  with get_pool().writer(name) as conn:
+    yield conn
+
+
+@contextmanager
+def stream_reader() -> Iterator[sqlite3.Connection]:
+  """Dedicated read-only connection holding one read transaction (a consistent snapshot).
+
+  For long streaming responses: they may be iterated across threads and outlive a
+  request, so they must not borrow a pooled reader (whose ownership is per-thread).
+  Under WAL the open snapshot does not block writers.
+  """
+  conn = _open(db_path(), check_same_thread=False)
+  try:
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute("BEGIN")
+    yield conn
+  finally:
+    try:
+      conn.rollback()
+    finally:
+      conn.close()
+
+
+def checkpoint(mode: str = "passive") -> Dict[str, Any]:
+  return get_pool().checkpoint(mode)
+
+
+def start_checkpointer() -> Optional[threading.Thread]:
+  """Start a daemon thread that checkpoints the WAL every NEXUS_DB_CHECKPOINT_INTERVAL_SEC.
+
+  Autocheckpoint only runs on commit and gives up while readers hold old
+  snapshots, so a busy API can grow the -wal file; a periodic explicit
+  checkpoint bounds it. Interval <= 0 disables the thread. With several API
+  processes only the holder of the "checkpoint" lease checkpoints.
+  """
+  interval = _env_float("NEXUS_DB_CHECKPOINT_INTERVAL_SEC", 300.0)
+  if interval <= 0:
+    return None
+  mode = (os.environ.get("NEXUS_DB_CHECKPOINT_MODE", "") or "").strip().lower() or "passive"
+  if mode not in CHECKPOINT_MODES:
+    mode = "passive"
+
+  def _loop() -> None:
+    while True:
+      time.sleep(interval)
+      try:
+        if lease("checkpoint"):
+          checkpoint(mode)
+      except Exception:
+        pass
+
+  t = threading.Thread(target=_loop, name="lims-db-checkpoint", daemon=True)
+  t.start()
+  return t
+
+
+def wal_status() -> Dict[str, Any]:
+  """Journal mode, -wal file size and checkpoint counters for the current DB (for /metrics)."""
+  pool = get_pool()
+  st = pool.stats()
+  return {
+    "journal_mode": pool.journal_mode(),
+    "profile": st.get("profile"),
+    "wal_bytes": st.get("wal_bytes", 0),
+    "checkpoints": st.get("checkpoints", 0),
+    "last_checkpoint": st.get("last_checkpoint"),
+  }
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+  with _POOLS_LOCK:
+    pools = list(_POOLS.values())
+  return [p.stats() for p in pools]
+
+
+def close_pools() -> None:
+  with _POOLS_LOCK:
+    pools = list(_POOLS.values())
+    _POOLS.clear()
+  for p in pools:
+    p.close()
+
+
+# -----------------
+# Several API processes on one DB (multi-worker mode)
+# -----------------
+# Workers coordinate through flock()ed files beside the DB (<db>.<name>.lock):
+#   - process_lock(name): held for a block, e.g. migrate_on_startup() so that only
+#     one worker applies migrations and the others then find the schema current;
+#   - lease(name): taken without blocking and kept for the life of the process, so
+#     periodic housekeeping (WAL checkpoints, the session sweep) runs in one worker.
+#     The lease frees when its holder exits and another worker picks it up.
+# Pools, leases and the other per-process state are dropped in a forked child
+# (os.register_at_fork): a SQLite connection must not be used across fork(), and a
+# preloading server (gunicorn --preload) forks its workers after importing the app.
+
+_LEASES: Dict[str, int] = {}
+_LEASES_LOCK = threading.Lock()
+
+
+def lock_path(name: str, path: Optional[Path] = None) -> Path:
+  p = Path(path) if path is not None else db_path()
+  return p.with_name(f"{p.name}.{name}.lock")
+
+
+def _lock_fd(name: str, path: Optional[Path]) -> int:
+  lp = lock_path(name, path)
+  lp.parent.mkdir(parents=True, exist_ok=True)
+  return os.open(lp, os.O_RDWR | os.O_CREAT, 0o644)
+
+
+@contextmanager
+def process_lock(name: str, path: Optional[Path] = None) -> Iterator[None]:
+  """Exclusive across processes (and threads) for the duration of the block."""
+  import fcntl
+
+  fd = _lock_fd(name, path)
+  try:
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    yield
+  finally:
+    os.close(fd)
+
+
+def lease(name: str, path: Optional[Path] = None) -> bool:
+  """True if this process holds the named lease (taking it if free); never blocks."""
+  import fcntl
+
+  key = str(lock_path(name, path))
+  with _LEASES_LOCK:
+    if key in _LEASES:
+      return True
+    fd = _lock_fd(name, path)
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+      os.close(fd)
+      return False
+    _LEASES[key] = fd
+    return True
+
+
+def _after_fork_in_child() -> None:
+  global _POOLS_LOCK, _LEASES_LOCK
+  # Abandon, don't close: closing an inherited connection could checkpoint or unlock
+  # files the parent still uses. The lease fds share the parent's flock, so closing
+  # the child's copies leaves the parent's leases alone.
+  _POOLS.clear()
+  _POOLS_LOCK = threading.Lock()
+  for fd in _LEASES.values():
+    try:
+      os.close(fd)
+    except OSError:
+      pass
+  _LEASES.clear()
+  _LEASES_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
 def migrations_dir() -> Path:
   # repo_root/lims/db.py -> repo_root
   rr = Path(__file__).resolve().parent.parent
@@ -81,6 +741,35 @@ def available_migrations() -> List[Tuple[str, Path]]:
   return out
 
 
+_SCHEMA_FINGERPRINT: Optional[int] = None
+_MIGRATE_LOCK = threading.Lock()
+
+
+def schema_fingerprint() -> int:
+  """Stable positive int identifying the set of migration files (computed once per process).
+
+  Stored in PRAGMA user_version once every migration is applied, so "is this DB
+  current?" is a single header read instead of a schema_migrations scan.
+  """
+  global _SCHEMA_FINGERPRINT
+  if _SCHEMA_FINGERPRINT is None:
+    ids = "\n".join(mid for mid, _ in available_migrations())
+    _SCHEMA_FINGERPRINT = (zlib.crc32(ids.encode("utf-8")) & 0x7FFFFFFF) or 1
+  return _SCHEMA_FINGERPRINT
+
+
+def schema_is_current(conn: sqlite3.Connection) -> bool:
+  row = conn.execute("PRAGMA user_version").fetchone()
+  return bool(row) and int(row[0]) == schema_fingerprint()
+
+
+def _mark_schema_current(conn: sqlite3.Connection) -> None:
+  fp = schema_fingerprint()
+  # PRAGMA does not accept bound parameters; fp is an int we computed.
+  conn.execute(f"PRAGMA user_version = {int(fp)}")
+  conn.commit()
+
+
 def apply_migrations(conn: sqlite3.Connection) -> List[str]:
   ensure_schema_migrations(conn)
   already = applied_migrations(conn)
@@ -98,9 +787,24 @@ def apply_migrations(conn: sqlite3.Connection) -> List[str]:
     conn.commit()
     applied_now.append(mid)
 
+  if not schema_is_current(conn):
+    _mark_schema_current(conn)
   return applied_now
 
 
+def ensure_schema(conn: sqlite3.Connection) -> List[str]:
+  """Apply pending migrations unless PRAGMA user_version says the DB is already current.
+
+  Fast path is read-only (no write lock), so it is safe to call on hot paths.
+  """
+  if schema_is_current(conn):
+    return []
+  with _MIGRATE_LOCK:
+    if schema_is_current(conn):
+      return []
+    return apply_migrations(conn)
+
+
 def migration_status(conn: sqlite3.Connection) -> Tuple[List[str], List[str]]:
   already = sorted(applied_migrations(conn))
   available = [mid for mid, _ in available_migrations()]
@@ -118,3 +822,19 @@ def init_db(conn: Optional[sqlite3.Connection] = None) -> None:
   finally:
     if close_after:
       conn.close()
+
+
+def migrate_on_startup() -> List[str]:
+  """Bring the configured DB to head once, before an API process starts serving.
+
+  Request handlers rely on this (and on the pool's per-connection check) instead
+  of running migrations themselves. Also switches the DB to the profile's
+  journal_mode up front, so the first request doesn't pay for it. Serialized across
+  processes, so workers starting together migrate once.
+  """
+  with process_lock("migrate"):
+    conn = _open(db_path(), set_journal_mode=True)
+    try:
+      return ensure_schema(conn)
+    finally:
+      conn.close()
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Streaming NDJSON dump of samples + their events (`lims.sh export stream`,
+# GET /export/samples.ndjson).
+#
+# Samples are read through one open cursor in index order and pulled in
+# fetchmany() batches; each batch's events come from a single
+# `sample_id IN (...)` query. Memory is bounded by one batch of samples plus
+# their events, however large the store is.
+#
+# Line types, in order:
+#   {"type": "header", "schema": "nexus_sample_stream", "schema_version": 1, "generated_at": ..., "filters": {...}}
+#   {"type": "sample", "sample": {...}}            -- same sample shape as `sample export`
+#   {"type": "event", "sample_id": ..., ...}       -- that sample's events, oldest first
+#   {"type": "end", "samples": N, "events": M}     -- absent if the stream was cut short
+
+SCHEMA = "nexus_sample_stream"
+DEFAULT_BATCH = 500
+CONTENT_TYPE = "application/x-ndjson; charset=utf-8"
+
+_STATUS_ALIASES = {"registered": "received", "testing": "processing", "analysis": "analyzing", "done": "completed"}
+_STATUS_ALLOWED = ("received", "processing", "analyzing", "completed")
+
+
+class ExportFilterError(ValueError):
+  pass
+
+
+def _utc_now_iso() -> str:
+  return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def normalize_status(raw: Optional[str]) -> Optional[str]:
+  if raw is None or not str(raw).strip():
+    return None
+  s = str(raw).strip().lower()
+  s = _STATUS_ALIASES.get(s, s)
+  if s not in _STATUS_ALLOWED:
+    raise ExportFilterError("invalid status. Allowed: " + ", ".join(_STATUS_ALLOWED))
+  return s
+
+
+def normalize_timestamp(raw: Optional[str], field: str) -> Optional[str]:
+  """Parse an ISO8601 bound and render it the way received_at is stored (UTC, +00:00)."""
+  if raw is None or not str(raw).strip():
+    return None
+  s = str(raw).strip()
+  try:
+    dt = datetime.fromisoformat(s[:-1] + "+00:00" if s.endswith(("Z", "z")) else s)
+  except ValueError:
+    raise ExportFilterError(f"{field} must be an ISO8601 timestamp") from None
+  if dt.tzinfo is None:
+    dt = dt.replace(tzinfo=timezone.utc)
+  return dt.astimezone(timezone.utc).isoformat()
+
+
+def filters_from_query(qs: Dict[str, List[str]]) -> Dict[str, Any]:
+  """Validate API query params (parse_qs output). The container stays an identifier;
+  callers resolve it against the DB before starting the response."""
+  def first(k: str) -> Optional[str]:
+    v = qs.get(k)
+    return str(v[0]) if v else None
+
+  container = first("container")
+  if container is not None and not container.strip():
+    raise ExportFilterError("container cannot be empty")
+  events = (first("events") or "1").strip().lower()
+  if events not in ("0", "1", "false", "true", "no", "yes"):
+    raise ExportFilterError("events must be 0|1")
+  try:
+    batch_size = int(first("batch_size") or DEFAULT_BATCH)
+  except ValueError:
+    raise ExportFilterError("batch_size must be an int") from None
+  return {
+    "status": normalize_status(first("status")),
+    "container": container.strip() if container is not None else None,
+    "since": normalize_timestamp(first("since"), "since"),
+    "until": normalize_timestamp(first("until"), "until"),
+    "include_events": events in ("1", "true", "yes"),
+    "batch_size": batch_size,
+  }
+
+
+def iter_chunks(lines: Iterable[str], size: int = 64 * 1024) -> Iterator[bytes]:
+  """Coalesce lines into ~size byte chunks (one socket write each instead of one per line)."""
+  buf: List[bytes] = []
+  n = 0
+  for line in lines:
+    b = line.encode("utf-8")
+    buf.append(b)
+    n += len(b)
+    if n >= size:
+      yield b"".join(buf)
+      buf, n = [], 0
+  if buf:
+    yield b"".join(buf)
+
+
+def sample_obj(row: sqlite3.Row) -> Dict[str, Any]:
+  """Sample row (joined with container_* columns) -> export shape with a nested container."""
+  obj = dict(row)
+  container = None
+  if row["container_id"] is not None:
+    container = {
+      "id": row["container_id"],
+      "barcode": row["container_barcode"],
+      "kind": row["container_kind"],
+      "location": row["container_location"],
+      "is_exclusive": row["container_is_exclusive"],
+    }
+  for k in ("container_barcode", "container_kind", "container_location", "container_is_exclusive"):
+    obj.pop(k, None)
+  obj["container"] = container
+  return obj
+
+
+def event_obj(row: sqlite3.Row) -> Dict[str, Any]:
+  """Event row (joined with from/to container barcodes) -> export shape."""
+  eo = dict(row)
+  eo["from_container"] = (
+    {"id": eo.get("from_container_id"), "barcode": eo.get("from_container_barcode")}
+    if eo.get("from_container_id") is not None
+    else None
+  )
+  eo["to_container"] = (
+    {"id": eo.get("to_container_id"), "barcode": eo.get("to_container_barcode")}
+    if eo.get("to_container_id") is not None
+    else None
+  )
+  eo.pop("from_container_barcode", None)
+  eo.pop("to_container_barcode", None)
+  return eo
+
+
+SAMPLE_SELECT = """
+  SELECT
+    s.*,
+    c.barcode AS container_barcode,
+    c.kind AS container_kind,
+    c.location AS container_location,
+    c.is_exclusive AS container_is_exclusive
+  FROM samples s
+  LEFT JOIN containers c ON c.id = s.container_id
+"""
+
+EVENT_SELECT = """
+  SELECT
+    e.*,
+    fc.barcode AS from_container_barcode,
+    tc.barcode AS to_container_barcode
+  FROM sample_events e
+  LEFT JOIN containers fc ON fc.id = e.from_container_id
+  LEFT JOIN containers tc ON tc.id = e.to_container_id
+"""
+
+
+def sample_with_events(
+  conn: sqlite3.Connection, sample_id: int, *, event_limit: int = 50
+) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+  """(sample_obj, [event_obj...]) for one sample, events newest first; None if it does not exist.
+
+  This is the `sample export` shape, shared with the in-process snapshot sample stage.
+  """
+  row = conn.execute(SAMPLE_SELECT + " WHERE s.id = ?", (sample_id,)).fetchone()
+  if not row:
+    return None
+  events = conn.execute(
+    EVENT_SELECT + " WHERE e.sample_id = ? ORDER BY e.occurred_at DESC, e.id DESC LIMIT ?",
+    (sample_id, event_limit),
+  ).fetchall()
+  return sample_obj(row), [event_obj(e) for e in events]
+
+
+def _line(obj: Dict[str, Any]) -> str:
+  return json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def iter_ndjson(
+  conn: sqlite3.Connection,
+  *,
+  status: Optional[str] = None,
+  container_id: Optional[int] = None,
+  since: Optional[str] = None,
+  until: Optional[str] = None,
+  include_events: bool = True,
+  batch_size: int = DEFAULT_BATCH,
+) -> Iterator[str]:
+  """Yield NDJSON lines for samples matching the filters (received_at in [since, until)).
+
+  `status`, `since` and `until` must already be normalized (normalize_status /
+  normalize_timestamp). Ordered by (received_at, id) so every filter combination
+  walks an index instead of sorting.
+  """
+  batch_size = max(1, min(int(batch_size), 900))
+  where: List[str] = []
+  params: List[Any] = []
+  if status is not None:
+    where.append("s.status = ?")
+    params.append(status)
+  if container_id is not None:
+    where.append("s.container_id = ?")
+    params.append(int(container_id))
+  if since is not None:
+    where.append("s.received_at >= ?")
+    params.append(since)
+  if until is not None:
+    where.append("s.received_at < ?")
+    params.append(until)
+  sql = SAMPLE_SELECT + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY s.received_at ASC, s.id ASC"
+
+  yield _line({
+    "type": "header",
+    "schema": SCHEMA,
+    "schema_version": 1,
+    "generated_at": _utc_now_iso(),
+    "filters": {"status": status, "container_id": container_id, "since": since, "until": until, "events": include_events},
+  })
+
+  n_samples = 0
+  n_events = 0
+  cur = conn.execute(sql, tuple(params))
+  try:
+    while True:
+      batch = cur.fetchmany(batch_size)
+      if not batch:
+        break
+      by_sample: Dict[int, List[Dict[str, Any]]] = {}
+      if include_events:
+        ids = [int(r["id"]) for r in batch]
+        ev_sql = (
+          EVENT_SELECT
+          + " WHERE e.sample_id IN (" + ",".join("?" * len(ids)) + ")"
+          + " ORDER BY e.sample_id ASC, e.occurred_at ASC, e.id ASC"
+        )
+        for e in conn.execute(ev_sql, tuple(ids)):
+          by_sample.setdefault(int(e["sample_id"]), []).append(event_obj(e))
+      for r in batch:
+        n_samples += 1
+        yield _line({"type": "sample", "sample": sample_obj(r)})
+        for eo in by_sample.get(int(r["id"]), ()):
+          n_events += 1
+          yield _line({"type": "event", **eo})
+  finally:
+    cur.close()
+
+  yield _line({"type": "end", "samples": n_samples, "events": n_events})
@@ -0,0 +1,492 @@
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Background jobs for long API operations (POST /snapshot/export, /snapshot/verify).
+#
+# A JobRunner owns a bounded thread pool (NEXUS_API_JOB_WORKERS, default 2) and a job
+# table. submit() returns at once; the caller polls GET /jobs/{id}. At most
+# NEXUS_API_JOB_QUEUE_MAX jobs wait for a worker, beyond that submit() raises QueueFull.
+# Jobs carry a dedup key (kind + normalized parameters): submitting while a job with
+# the same key is queued or running returns that job instead of starting another.
+#
+# Job functions take the Job and report through it: job.report(stage, done, total) is a
+# snapshot ProgressFn ("backup" pages, "tar" bytes), job.phase(name) names other steps.
+# Both raise Cancelled once cancel() was called, so a running export stops at its next
+# backup batch or tar block; run_command() terminates its child process instead.
+# Finished jobs are kept for NEXUS_API_JOB_KEEP_SEC (default 3600) for polling.
+#
+# Several API processes (multi-worker mode) each run their own runner. With a spool
+# dir (NEXUS_API_JOB_SPOOL_DIR; <db dir>/jobs by default when NEXUS_API_WORKERS > 1)
+# every job document is mirrored to <spool>/<id>.json, on each state change and at
+# most every SPOOL_INTERVAL_SEC for progress, so any worker can answer GET /jobs/{id}.
+# Cancelling another worker's job drops <spool>/<id>.cancel, which the owning job's
+# check() picks up. An active spooled job whose worker is gone reads as failed. Dedup
+# and the queue bound stay per worker.
+
+SCHEMA = "nexus_job"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+UNITS = {"backup": "pages", "tar": "bytes"}
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_MAX = 16
+DEFAULT_KEEP_SEC = 3600.0
+# Finished jobs kept at most, whatever their age.
+MAX_FINISHED = 256
+POLL_SEC = 0.2
+SPOOL_INTERVAL_SEC = 0.5
+
+
+class Cancelled(Exception):
+  pass
+
+
+class QueueFull(RuntimeError):
+  pass
+
+
+class JobError(Exception):
+  """Raised by job functions for an operator-facing failure: (error, detail, **extra) like an API error."""
+
+  def __init__(self, error: str, detail: Optional[str] = None, **extra: Any):
+    super().__init__(detail or error)
+    self.error = error
+    self.detail = detail
+    self.extra = extra
+
+
+def _utc_now_iso() -> str:
+  return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def _env_num(name: str, default: float, cast: Callable[[str], Any]) -> Any:
+  try:
+    raw = (os.environ.get(name, "") or "").strip()
+    return cast(raw) if raw else default
+  except ValueError:
+    return default
+
+
+class Job:
+  def __init__(self, kind: str, key: Hashable, spool: Optional["JobSpool"] = None):
+    self.id = secrets.token_hex(8)
+    self.kind = kind
+    self.key = key
+    self.state = QUEUED
+    self.current_phase = QUEUED
+    self.progress: Dict[str, Dict[str, Any]] = {}
+    self.result: Optional[Dict[str, Any]] = None
+    self.error: Optional[Dict[str, Any]] = None
+    self.created_at = _utc_now_iso()
+    self.started_at: Optional[str] = None
+    self.finished_at: Optional[str] = None
+    self.finished_mono: Optional[float] = None
+    self._lock = threading.Lock()
+    self._cancel = threading.Event()
+    self._done = threading.Event()
+    self._spool = spool
+    self._published = 0.0
+    self._cancel_polled = 0.0
+
+  # ---- called from the job function ----
+  def check(self) -> None:
+    if self.cancel_requested:
+      raise Cancelled()
+
+  def phase(self, name: str) -> None:
+    self.check()
+    with self._lock:
+      self.current_phase = name
+    self._publish()
+
+  def report(self, stage: str, done: int, total: int) -> None:
+    self.check()
+    with self._lock:
+      self.current_phase = stage
+      self.progress[stage] = {"done": int(done), "total": int(total), "unit": UNITS.get(stage, "items")}
+    self._publish()
+
+  @property
+  def cancel_requested(self) -> bool:
+    if not self._cancel.is_set() and self._spool is not None:
+      # A cancel sent to another worker, polled at most every POLL_SEC.
+      now = time.monotonic()
+      if now - self._cancel_polled >= POLL_SEC:
+        self._cancel_polled = now
+        if self._spool.cancel_requested(self.id):
+          self._cancel.set()
+    return self._cancel.is_set()
+
+  def _publish(self, *, force: bool = False) -> None:
+    if self._spool is None:
+      return
+    now = time.monotonic()
+    if not force and now - self._published < SPOOL_INTERVAL_SEC:
+      return
+    self._published = now
+    self._spool.publish(self)
+
+  # ---- called by the runner / request handlers ----
+  def wait(self, timeout: Optional[float] = None) -> bool:
+    return self._done.wait(timeout)
+
+  def done(self) -> bool:
+    return self._done.is_set()
+
+  def _finish(self, state: str, *, result: Optional[Dict[str, Any]] = None, error: Optional[Dict[str, Any]] = None) -> None:
+    with self._lock:
+      self.state = state
+      self.current_phase = state
+      self.result = result
+      self.error = error
+      self.finished_at = _utc_now_iso()
+      self.finished_mono = time.monotonic()
+    self._publish(force=True)
+    self._done.set()
+
+  def to_doc(self) -> Dict[str, Any]:
+    with self._lock:
+      progress = {k: dict(v) for k, v in self.progress.items()}
+      for v in progress.values():
+        v["pct"] = int(v["done"] * 100 / v["total"]) if v["total"] else 100
+      return {
+        "schema": SCHEMA,
+        "schema_version": 1,
+        "ok": self.state != FAILED,
+        "id": self.id,
+        "kind": self.kind,
+        "state": self.state,
+        "phase": self.current_phase,
+        "progress": progress,
+        "cancel_requested": self._cancel.is_set(),
+        "created_at": self.created_at,
+        "started_at": self.started_at,
+        "finished_at": self.finished_at,
+        "result": self.result,
+        "error": self.error,
+      }
+
+
+def _pid_alive(pid: Any) -> bool:
+  try:
+    os.kill(int(pid), 0)
+  except (TypeError, ValueError, ProcessLookupError):
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+class JobSpool:
+  """Job documents shared between API processes through a directory (see the top of the file)."""
+
+  def __init__(self, path: Path, *, keep_sec: float = DEFAULT_KEEP_SEC):
+    self.path = Path(path)
+    self.keep_sec = float(keep_sec)
+    self._pruned = 0.0
+
+  def _file(self, job_id: str, suffix: str) -> Path:
+    return self.path / f"{job_id}{suffix}"
+
+  def publish(self, job: Job) -> None:
+    doc = job.to_doc()
+    doc["pid"] = os.getpid()
+    dst = self._file(job.id, ".json")
+    tmp = dst.with_name(f".{job.id}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+      self.path.mkdir(parents=True, exist_ok=True)
+      tmp.write_text(json.dumps(doc, sort_keys=True), encoding="utf-8")
+      os.replace(tmp, dst)
+    except OSError:
+      pass  # best-effort: the owning worker still answers for its job
+
+  def read(self, job_id: str) -> Optional[Dict[str, Any]]:
+    try:
+      doc = json.loads(self._file(job_id, ".json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+      return None
+    if not isinstance(doc, dict):
+      return None
+    pid = doc.pop("pid", None)
+    if doc.get("state") in ACTIVE_STATES and not _pid_alive(pid):
+      doc.update(state=FAILED, phase=FAILED, ok=False, error={"error": "internal_error", "detail": "the API worker running this job exited"})
+    return doc
+
+  def docs(self) -> List[Dict[str, Any]]:
+    out = []
+    for p in self.path.glob("*.json"):
+      doc = self.read(p.stem)
+      if doc is not None:
+        out.append(doc)
+    return out
+
+  def request_cancel(self, job_id: str) -> None:
+    self.path.mkdir(parents=True, exist_ok=True)
+    self._file(job_id, ".cancel").touch()
+
+  def cancel_requested(self, job_id: str) -> bool:
+    return self._file(job_id, ".cancel").exists()
+
+  def prune(self) -> None:
+    """Drop documents (and cancel markers) of jobs finished more than keep_sec ago; at most once a minute."""
+    now = time.monotonic()
+    if now - self._pruned < 60.0:
+      return
+    self._pruned = now
+    cutoff = time.time() - self.keep_sec
+    for p in self.path.glob("*.json"):
+      try:
+        if p.stat().st_mtime >= cutoff:
+          continue
+      except OSError:
+        continue
+      doc = self.read(p.stem)
+      if doc is not None and doc.get("state") in ACTIVE_STATES:
+        continue  # still running, just quiet
+      for f in (p, self._file(p.stem, ".cancel")):
+        try:
+          f.unlink()
+        except OSError:
+          pass
+
+
+class JobRunner:
+  def __init__(
+    self,
+    *,
+    workers: int = DEFAULT_WORKERS,
+    queue_max: int = DEFAULT_QUEUE_MAX,
+    keep_sec: float = DEFAULT_KEEP_SEC,
+    spool: Optional[JobSpool] = None,
+  ):
+    self.workers = max(1, int(workers))
+    self.queue_max = max(0, int(queue_max))
+    self.keep_sec = float(keep_sec)
+    self.spool = spool
+    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="lims-job")
+    self._lock = threading.Lock()
+    self._jobs: Dict[str, Job] = {}
+    self._active: Dict[Tuple[str, Hashable], Job] = {}
+
+  def submit(self, kind: str, key: Hashable, fn: Callable[[Job], Dict[str, Any]]) -> Tuple[Job, bool]:
+    """Queue fn(job); returns (job, created). created is False when an equal job was already active."""
+    with self._lock:
+      self._prune()
+      dup = self._active.get((kind, key))
+      if dup is not None:
+        return dup, False
+      if len(self._active) >= self.workers + self.queue_max:
+        raise QueueFull(f"too many jobs in flight (max {self.workers} running + {self.queue_max} queued)")
+      job = Job(kind, key, self.spool)
+      self._jobs[job.id] = job
+      self._active[(kind, key)] = job
+    job._publish(force=True)
+    self._pool.submit(self._run, job, fn)
+    return job, True
+
+  def get(self, job_id: str) -> Optional[Job]:
+    with self._lock:
+      return self._jobs.get(job_id)
+
+  def spooled(self, job_id: str) -> Optional[Dict[str, Any]]:
+    """Document of a job run by another API process (None without a spool)."""
+    return self.spool.read(job_id) if self.spool is not None else None
+
+  def spooled_docs(self) -> List[Dict[str, Any]]:
+    if self.spool is None:
+      return []
+    with self._lock:
+      mine = set(self._jobs)
+    return [d for d in self.spool.docs() if d.get("id") not in mine]
+
+  def cancel_spooled(self, job_id: str) -> Optional[Dict[str, Any]]:
+    """Ask the process running job_id to cancel it; its document, or None if unknown."""
+    doc = self.spooled(job_id)
+    if doc is not None and doc.get("state") in ACTIVE_STATES:
+      self.spool.request_cancel(job_id)
+      doc["cancel_requested"] = True
+    return doc
+
+  def cancel(self, job_id: str) -> Optional[Job]:
+    """Request cancellation; a queued job is cancelled at once, a running one at its next check."""
+    job = self.get(job_id)
+    if job is None or job.done():
+      return job
+    job._cancel.set()
+    with self._lock:
+      if job.state == QUEUED:
+        self._active.pop((job.kind, job.key), None)
+        job._finish(CANCELLED)
+    return job
+
+  def jobs(self) -> List[Job]:
+    with self._lock:
+      return list(self._jobs.values())
+
+  def shutdown(self, *, cancel: bool = True) -> None:
+    if cancel:
+      for job in self.jobs():
+        self.cancel(job.id)
+    self._pool.shutdown(wait=True)
+
+  def _run(self, job: Job, fn: Callable[[Job], Dict[str, Any]]) -> None:
+    with self._lock:
+      if job.done():  # cancelled while queued
+        return
+      with job._lock:
+        job.state = RUNNING
+        job.current_phase = RUNNING
+        job.started_at = _utc_now_iso()
+    job._publish(force=True)
+    try:
+      job.check()
+      result = fn(job)
+    except Cancelled:
+      job._finish(CANCELLED)
+    except JobError as e:
+      err: Dict[str, Any] = {"error": e.error}
+      if e.detail is not None:
+        err["detail"] = e.detail
+      err.update(e.extra)
+      job._finish(FAILED, error=err)
+    except Exception as e:
+      job._finish(FAILED, error={"error": "internal_error", "detail": f"{type(e).__name__}: {e}"})
+    else:
+      job._finish(SUCCEEDED, result=result)
+    finally:
+      with self._lock:
+        if self._active.get((job.kind, job.key)) is job:
+          del self._active[(job.kind, job.key)]
+
+  def _prune(self) -> None:
+    # Caller holds self._lock.
+    now = time.monotonic()
+    done = [j for j in self._jobs.values() if j.finished_mono is not None]
+    drop = {j.id for j in done if now - j.finished_mono > self.keep_sec}
+    keep = sorted((j for j in done if j.id not in drop), key=lambda j: j.finished_mono)
+    if len(keep) > MAX_FINISHED:
+      drop.update(j.id for j in keep[: len(keep) - MAX_FINISHED])
+    for jid in drop:
+      del self._jobs[jid]
+    if self.spool is not None:
+      self.spool.prune()
+
+
+_RUNNER: Optional[JobRunner] = None
+_RUNNER_LOCK = threading.Lock()
+
+
+def spool_dir() -> Optional[Path]:
+  """NEXUS_API_JOB_SPOOL_DIR, else <db dir>/jobs when NEXUS_API_WORKERS > 1, else None."""
+  raw = (os.environ.get("NEXUS_API_JOB_SPOOL_DIR", "") or "").strip()
+  if raw:
+    return Path(raw).expanduser()
+  if _env_num("NEXUS_API_WORKERS", 1, int) > 1:
+    from . import db
+
+    return db.db_path().parent / "jobs"
+  return None
+
+
+def runner() -> JobRunner:
+  """The process-wide runner (sized from NEXUS_API_JOB_WORKERS / _QUEUE_MAX / _KEEP_SEC on first use)."""
+  global _RUNNER
+  if _RUNNER is not None:
+    return _RUNNER
+  with _RUNNER_LOCK:
+    if _RUNNER is None:
+      keep_sec = _env_num("NEXUS_API_JOB_KEEP_SEC", DEFAULT_KEEP_SEC, float)
+      spool = spool_dir()
+      _RUNNER = JobRunner(
+        workers=_env_num("NEXUS_API_JOB_WORKERS", DEFAULT_WORKERS, int),
+        queue_max=_env_num("NEXUS_API_JOB_QUEUE_MAX", DEFAULT_QUEUE_MAX, int),
+        keep_sec=keep_sec,
+        spool=JobSpool(spool, keep_sec=keep_sec) if spool is not None else None,
+      )
+    return _RUNNER
+
+
+def _after_fork_in_child() -> None:
+  global _RUNNER, _RUNNER_LOCK
+  # The job threads do not survive fork(); a preloaded worker starts its own runner.
+  _RUNNER = None
+  _RUNNER_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def run_command(
+  job: Job,
+  cmd: Sequence[str],
+  *,
+  cwd: Optional[str] = None,
+  env: Optional[Dict[str, str]] = None,
+  timeout: Optional[float] = None,
+) -> Tuple[int, str, str]:
+  """Run cmd as a child of the job: (rc, stdout, stderr), rc 124 on timeout.
+
+  Cancellation terminates the child (its process group, so a bash pipeline goes too)
+  and raises Cancelled.
+  """
+  job.check()
+  p = subprocess.Popen(
+    list(cmd), cwd=cwd, env=env, text=True,
+    stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True,
+  )
+  out: List[str] = []
+  err: List[str] = []
+  readers = [
+    threading.Thread(target=lambda: out.append(p.stdout.read()), daemon=True),
+    threading.Thread(target=lambda: err.append(p.stderr.read()), daemon=True),
+  ]
+  for t in readers:
+    t.start()
+  deadline = None if timeout is None else time.monotonic() + float(timeout)
+  rc: Optional[int] = None
+  try:
+    while rc is None:
+      if job.cancel_requested or (deadline is not None and time.monotonic() >= deadline):
+        break
+      try:
+        rc = p.wait(POLL_SEC)
+      except subprocess.TimeoutExpired:
+        pass
+  finally:
+    if rc is None:
+      _kill_group(p)
+    for t in readers:
+      t.join()
+  job.check()
+  if rc is None:
+    return 124, "".join(out), "".join(err) + f"timeout after {float(timeout):.1f}s: {list(cmd)}\n"
+  return rc, "".join(out), "".join(err)
+
+
+def _kill_group(p: subprocess.Popen) -> None:
+  for sig, grace in ((signal.SIGTERM, 2.0), (signal.SIGKILL, None)):
+    try:
+      os.killpg(p.pid, sig)
+    except (ProcessLookupError, PermissionError):
+      pass
+    try:
+      p.wait(grace)
+      return
+    except subprocess.TimeoutExpired:
+      continue
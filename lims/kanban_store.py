@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from . import db
+
+# Kanban board persistence behind GET/PUT /api/kanban/board (FastAPI server).
+#
+# The board is one JSON document at KANBAN_STORE_PATH (default data/kanban.json).
+# Writers take an flock (db.process_lock, <path>.write.lock) and replace the file
+# through a temp file private to the process and thread, so concurrent PUTs from
+# several API workers never interleave or clobber each other's temp file; the last
+# one wins as a whole. Readers take no lock: os.replace is atomic, so a read sees
+# either the old board or the new one.
+
+
+def store_path() -> Path:
+  env = os.environ.get("KANBAN_STORE_PATH")
+  if env:
+    return Path(env)
+  return Path(__file__).resolve().parents[1] / "data" / "kanban.json"
+
+
+def default_board() -> Dict[str, Any]:
+  return {
+    "columnOrder": ["todo", "doing", "done"],
+    "columns": {
+      "todo": {"id": "todo", "title": "To Do", "cardIds": ["c1"]},
+      "doing": {"id": "doing", "title": "In Progress", "cardIds": []},
+      "done": {"id": "done", "title": "Done", "cardIds": []},
+    },
+    "cards": {
+      "c1": {"id": "c1", "title": "Example card", "subtitle": "Persisted via /api/kanban/board"},
+    },
+    "selectedCardId": None,
+    "updatedAt": time.time(),
+  }
+
+
+def read_board() -> Dict[str, Any]:
+  """The stored board (updatedAt set to now), or the default board if there is none."""
+  path = store_path()
+  try:
+    data = json.loads(path.read_text(encoding="utf-8"))
+  except (OSError, ValueError):
+    return default_board()
+  if not isinstance(data, dict):
+    return default_board()
+  data["updatedAt"] = time.time()
+  return data
+
+
+def write_board(board: Dict[str, Any]) -> Dict[str, Any]:
+  """Replace the stored board; returns what was written."""
+  path = store_path()
+  path.parent.mkdir(parents=True, exist_ok=True)
+  board = dict(board)
+  board["updatedAt"] = time.time()
+  tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+  with db.process_lock("write", path):
+    try:
+      tmp.write_text(json.dumps(board, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+      os.replace(tmp, path)
+    finally:
+      tmp.unlink(missing_ok=True)
+  return board
@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import math
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from . import db
+
+# Prometheus text exposition for GET /metrics (both API servers).
+#
+# A Registry holds metric families: counters and gauges updated in-process (Counter,
+# Gauge) and collectors, callables that produce samples at scrape time. Nothing on the
+# scrape path scans a table or runs a subprocess:
+#   - build info (git rev) is computed once, at import (NEXUS_GIT_REV overrides it, for
+#     deploys without a .git dir);
+#   - row counts come from table_counts, kept by triggers (migrations/014_table_counts.sql);
+#   - collectors that still cost a query are wrapped in a TTL cache
+#     (NEXUS_METRICS_CACHE_TTL_SEC, default 10).
+#
+# Request telemetry (recorded by both servers, see observe_request()):
+#   nexus_http_requests_total{method,route,status}, nexus_http_request_duration_seconds
+#   {method,route}, nexus_http_requests_in_flight, and nexus_http_phase_seconds{route,phase}
+#   for the auth check and JSON serialization inside a request.
+# DB telemetry comes from lims/db.py observers: nexus_db_query_seconds{query,role,outcome}
+# per named reader()/writer() block, nexus_db_busy_total{query} (SQLITE_BUSY that outlasted
+# busy_timeout), nexus_db_pool_wait_seconds{role} (waiting for a pooled connection), and
+# pool gauges/counters read from db.pool_stats() at scrape time.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# (name, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _git_rev_short() -> str:
+  try:
+    p = subprocess.run(
+      ["git", "rev-parse", "--short", "HEAD"],
+      cwd=str(REPO_ROOT), text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False,
+    )
+    return p.stdout.strip() if p.returncode == 0 else ""
+  except Exception:
+    return ""
+
+
+BUILD_INFO: Dict[str, str] = {
+  "git_rev": (os.environ.get("NEXUS_GIT_REV", "") or "").strip() or _git_rev_short(),
+}
+
+
+def _escape(v: str) -> str:
+  return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+  if not labels:
+    return ""
+  return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(v: float) -> str:
+  if math.isinf(v):
+    return "+Inf" if v > 0 else "-Inf"
+  if v == int(v):
+    return str(int(v))
+  return repr(float(v))
+
+
+# Seconds; request latencies from ~1ms to 10s.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Family:
+  def __init__(self, name: str, kind: str, help: str, labelnames: Sequence[str] = ()):
+    self.name = name
+    self.kind = kind
+    self.help = help
+    self.labelnames = tuple(labelnames)
+    self._lock = threading.Lock()
+    self._values: Dict[Tuple[str, ...], float] = {}
+
+  def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+    if set(labels) != set(self.labelnames):
+      raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[k]) for k in self.labelnames)
+
+  def samples(self) -> List[Sample]:
+    with self._lock:
+      items = sorted(self._values.items())
+    return [(self.name, dict(zip(self.labelnames, k)), v) for k, v in items]
+
+
+class Counter(_Family):
+  def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+    super().__init__(name, "counter", help, labelnames)
+
+  def inc(self, n: float = 1, **labels: Any) -> None:
+    k = self._key(labels)
+    with self._lock:
+      self._values[k] = self._values.get(k, 0) + n
+
+
+class Gauge(_Family):
+  def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+    super().__init__(name, "gauge", help, labelnames)
+
+  def set(self, v: float, **labels: Any) -> None:
+    k = self._key(labels)
+    with self._lock:
+      self._values[k] = v
+
+  def inc(self, n: float = 1, **labels: Any) -> None:
+    k = self._key(labels)
+    with self._lock:
+      self._values[k] = self._values.get(k, 0) + n
+
+  def dec(self, n: float = 1, **labels: Any) -> None:
+    self.inc(-n, **labels)
+
+
+class Histogram(_Family):
+  def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+    super().__init__(name, "histogram", help, labelnames)
+    self.buckets = tuple(sorted(float(b) for b in buckets))
+    # label key -> ([per-bucket counts (non-cumulative), overflow], sum)
+    self._hist: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+  def observe(self, v: float, **labels: Any) -> None:
+    k = self._key(labels)
+    i = 0
+    while i < len(self.buckets) and v > self.buckets[i]:
+      i += 1
+    with self._lock:
+      h = self._hist.get(k)
+      if h is None:
+        h = self._hist[k] = ([0] * (len(self.buckets) + 1), [0.0])
+      h[0][i] += 1
+      h[1][0] += v
+
+  @contextmanager
+  def time(self, **labels: Any) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - t0, **labels)
+
+  def samples(self) -> List[Sample]:
+    with self._lock:
+      items = sorted((k, list(c), s[0]) for k, (c, s) in self._hist.items())
+    out: List[Sample] = []
+    for k, counts, total in items:
+      labels = dict(zip(self.labelnames, k))
+      acc = 0
+      for le, n in zip(self.buckets + (math.inf,), counts):
+        acc += n
+        out.append((self.name + "_bucket", dict(labels, le=_fmt_value(le) if math.isinf(le) else repr(le)), acc))
+      out.append((self.name + "_sum", labels, total))
+      out.append((self.name + "_count", labels, acc))
+    return out
+
+
+class Collector:
+  """Families computed at scrape time: fn() -> [(name, type, help, [(labels, value)])]."""
+
+  def __init__(self, fn: Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]], *, ttl: float = 0.0):
+    self.fn = fn
+    self.ttl = float(ttl)
+    self._lock = threading.Lock()
+    self._cached: Optional[Tuple[float, List[Any]]] = None
+
+  def collect(self) -> List[Any]:
+    if self.ttl <= 0:
+      return list(self.fn())
+    with self._lock:
+      now = time.monotonic()
+      if self._cached is not None and now - self._cached[0] < self.ttl:
+        return self._cached[1]
+      out = list(self.fn())
+      self._cached = (now, out)
+      return out
+
+  def invalidate(self) -> None:
+    with self._lock:
+      self._cached = None
+
+
+class Registry:
+  def __init__(self) -> None:
+    self._lock = threading.Lock()
+    self._families: List[Any] = []
+
+  def _add(self, obj: Any) -> Any:
+    with self._lock:
+      self._families.append(obj)
+    return obj
+
+  def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return self._add(Counter(name, help, labelnames))
+
+  def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return self._add(Gauge(name, help, labelnames))
+
+  def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return self._add(Histogram(name, help, labelnames, buckets))
+
+  def register(self, collector: Any) -> Any:
+    """Add a Collector, or any object with .name/.kind/.help/.samples()."""
+    return self._add(collector)
+
+  def render(self) -> str:
+    with self._lock:
+      fams = list(self._families)
+    lines: List[str] = []
+
+    def family(name: str, kind: str, help: str, samples: Iterable[Sample]) -> None:
+      lines.append(f"# HELP {name} {help}")
+      lines.append(f"# TYPE {name} {kind}")
+      for sname, labels, v in samples:
+        lines.append(f"{sname}{_fmt_labels(labels)} {_fmt_value(v)}")
+
+    for f in fams:
+      if isinstance(f, Collector):
+        try:
+          for name, kind, help, samples in f.collect():
+            family(name, kind, help, [(name, labels, v) for labels, v in samples])
+        except Exception:
+          continue  # best-effort: a failing collector never breaks the scrape
+      else:
+        family(f.name, f.kind, f.help, f.samples())
+    return "\n".join(lines) + "\n"
+
+
+def _table_counts(conn) -> Dict[str, int]:
+  try:
+    rows = conn.execute("SELECT name, n FROM table_counts").fetchall()
+    return {r[0]: int(r[1] or 0) for r in rows}
+  except Exception:
+    # DB not migrated to 014 yet (the API migrates at startup; this is a fallback).
+    out = {}
+    for t in ("samples", "containers", "sample_events"):
+      try:
+        out[t] = int((conn.execute(f"SELECT COUNT(1) FROM {t}").fetchone() or [0])[0] or 0)
+      except Exception:
+        out[t] = 0
+    return out
+
+
+def _db_families():
+  db_up = 0
+  counts: Dict[str, int] = {}
+  try:
+    with db.reader("metrics_counts") as conn:
+      counts = _table_counts(conn)
+      db_up = 1
+  except Exception:
+    db_up = 0
+  out = [
+    ("nexus_db_up", "gauge", "1 if DB connect+query ok", [({}, db_up)]),
+    ("nexus_samples_total", "gauge", "Total samples", [({}, counts.get("samples", 0))]),
+    ("nexus_containers_total", "gauge", "Total containers", [({}, counts.get("containers", 0))]),
+    ("nexus_sample_events_total", "gauge", "Total sample events", [({}, counts.get("sample_events", 0))]),
+  ]
+  if not db_up:
+    return out
+  try:
+    wal = db.wal_status()
+  except Exception:
+    return out
+  last = wal.get("last_checkpoint") or {}
+  out += [
+    ("nexus_db_journal_mode", "gauge", "Active SQLite journal mode (label), always 1",
+     [({"mode": wal.get("journal_mode") or "", "profile": wal.get("profile") or ""}, 1)]),
+    ("nexus_db_wal_bytes", "gauge", "Size of the -wal file in bytes", [({}, int(wal.get("wal_bytes") or 0))]),
+    ("nexus_db_checkpoints_total", "counter", "Explicit WAL checkpoints run by this process",
+     [({}, int(wal.get("checkpoints") or 0))]),
+    ("nexus_db_last_checkpoint_frames", "gauge", "WAL frames in the log / checkpointed at the last explicit checkpoint",
+     [({"kind": "log"}, int(last.get("log_frames", 0))), ({"kind": "checkpointed"}, int(last.get("checkpointed_frames", 0)))]),
+  ]
+  return out
+
+
+def _cache_ttl() -> float:
+  raw = (os.environ.get("NEXUS_METRICS_CACHE_TTL_SEC", "") or "").strip()
+  try:
+    return float(raw) if raw else 10.0
+  except ValueError:
+    return 10.0
+
+
+REGISTRY = Registry()
+_up = REGISTRY.gauge("nexus_api_up", "API process up (always 1 if endpoint responds)")
+_up.set(1)
+_build = REGISTRY.gauge("nexus_build_info", "Build info", ("git_rev",))
+_build.set(1, git_rev=BUILD_INFO["git_rev"])
+DB_COLLECTOR = REGISTRY.register(Collector(_db_families, ttl=_cache_ttl()))
+
+HTTP_REQUESTS = REGISTRY.counter("nexus_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("nexus_http_request_duration_seconds", "HTTP request latency (until the response is handed off)", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("nexus_http_requests_in_flight", "HTTP requests being handled")
+HTTP_IN_FLIGHT.set(0)
+HTTP_PHASE = REGISTRY.histogram("nexus_http_phase_seconds", "Time spent in a request phase (auth, serialize)", ("route", "phase"))
+
+DB_QUERY = REGISTRY.histogram("nexus_db_query_seconds", "Time a named DB block held its connection", ("query", "role", "outcome"))
+DB_BUSY = REGISTRY.counter("nexus_db_busy_total", "SQLITE_BUSY/LOCKED errors that outlasted busy_timeout", ("query",))
+DB_POOL_WAIT = REGISTRY.histogram("nexus_db_pool_wait_seconds", "Time waiting to check out a pooled connection", ("role",))
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+  HTTP_REQUESTS.inc(method=method, route=route, status=str(status))
+  HTTP_LATENCY.observe(seconds, method=method, route=route)
+
+
+def phase(route: str, name: str):
+  """Context manager timing one phase of a request (nexus_http_phase_seconds)."""
+  return HTTP_PHASE.time(route=route, phase=name)
+
+
+def _on_db_event(event: str, labels: Dict[str, str], seconds: float) -> None:
+  if event == "checkout":
+    DB_POOL_WAIT.observe(seconds, **labels)
+  elif event == "query":
+    DB_QUERY.observe(seconds, **labels)
+    if labels.get("outcome") == "busy":
+      DB_BUSY.inc(query=labels["query"])
+
+
+db.add_observer(_on_db_event)
+
+
+def _pool_families():
+  st = db.get_pool().stats()
+  return [
+    ("nexus_db_pool_connections", "gauge", "Pooled connections by state",
+     [({"state": "reader_in_use"}, int(st.get("reader_in_use") or 0)),
+      ({"state": "reader_idle"}, int(st.get("reader_idle") or 0)),
+      ({"state": "writer_open"}, int(bool(st.get("writer_open"))))]),
+    ("nexus_db_pool_max_readers", "gauge", "Reader connection limit", [({}, int(st.get("max_readers") or 0))]),
+    ("nexus_db_pool_checkouts_total", "counter", "Connection checkouts",
+     [({"role": "reader"}, int(st.get("reader_checkouts") or 0)), ({"role": "writer"}, int(st.get("writer_checkouts") or 0))]),
+    ("nexus_db_pool_waits_total", "counter", "Checkouts that had to wait for a connection",
+     [({"role": "reader"}, int(st.get("reader_waits") or 0)), ({"role": "writer"}, int(st.get("writer_waits") or 0))]),
+    ("nexus_db_pool_opened_total", "counter", "Connections opened", [({}, int(st.get("opened") or 0))]),
+    ("nexus_db_pool_health_check_failures_total", "counter", "Pooled connections discarded by the health check",
+     [({}, int(st.get("health_check_failures") or 0))]),
+  ]
+
+
+# In-memory stats: cheap, so not cached.
+REGISTRY.register(Collector(_pool_families))
+
+
+def render() -> str:
+  return REGISTRY.render()
@@ -29,6 +29,23 @@ def cmd_up(_: argparse.Namespace) -> int:
   return 0
 
 
+def cmd_checkpoint(args: argparse.Namespace) -> int:
+  conn = db.connect()
+  try:
+    res = db.wal_checkpoint(conn, args.mode)
+    mode = str(conn.execute("PRAGMA journal_mode").fetchone()[0]).lower()
+  finally:
+    conn.close()
+  payload = {
+    "db_path": str(db.db_path()),
+    "journal_mode": mode,
+    "checkpoint": res,
+    "wal_bytes": db.wal_size_bytes(),
+  }
+  print(json.dumps(payload, ensure_ascii=False, indent=2))
+  return 1 if res["busy"] else 0
+
+
 def build_parser() -> argparse.ArgumentParser:
   p = argparse.ArgumentParser(prog="lims-migrate", description="LIMS migration runner (SQLite dev backend)")
   sub = p.add_subparsers(dest="cmd", required=True)
@@ -39,6 +56,11 @@ def build_parser() -> argparse.ArgumentParser:
   sp_up = sub.add_parser("up", help="Apply pending migrations")
   sp_up.set_defaults(fn=cmd_up)
 
+  sp_ckpt = sub.add_parser("checkpoint", help="Checkpoint the WAL into the main DB file")
+  sp_ckpt.add_argument("--mode", default="passive", choices=list(db.CHECKPOINT_MODES),
+                       help="passive (never blocks), full, restart, or truncate (also resets the -wal file)")
+  sp_ckpt.set_defaults(fn=cmd_checkpoint)
+
   return p
 
 
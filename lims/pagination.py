@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+# Keyset (cursor) pagination shared by the CLI and both API servers.
+#
+# A cursor is the sort key of the last row on the previous page, wrapped in an
+# opaque url-safe token. The next page seeks past it with a row-value
+# comparison, so page N costs the same as page 1 (no OFFSET scan) and rows
+# inserted meanwhile never shift or duplicate entries across pages.
+#
+#   samples:    ORDER BY received_at DESC, id DESC   key = (received_at, id)
+#   containers: ORDER BY id DESC                     key = (id,)
+
+SAMPLE_KEY = "samples"
+CONTAINER_KEY = "containers"
+
+_KEY_TYPES = {
+  SAMPLE_KEY: (str, int),
+  CONTAINER_KEY: (int,),
+}
+
+
+class CursorError(ValueError):
+  pass
+
+
+def encode_cursor(kind: str, values: Sequence[Any]) -> str:
+  raw = json.dumps({"k": kind, "v": list(values)}, separators=(",", ":"), ensure_ascii=False)
+  return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(kind: str, token: str) -> Tuple[Any, ...]:
+  """Decode a cursor for `kind`; raises CursorError on anything malformed or foreign."""
+  tok = (token or "").strip()
+  if not tok:
+    raise CursorError("cursor cannot be empty")
+  try:
+    raw = base64.urlsafe_b64decode(tok + "=" * (-len(tok) % 4))
+    doc = json.loads(raw.decode("utf-8"))
+  except Exception:
+    raise CursorError("invalid cursor") from None
+  if not isinstance(doc, dict) or doc.get("k") != kind:
+    raise CursorError("invalid cursor")
+  values = doc.get("v")
+  types = _KEY_TYPES[kind]
+  if not isinstance(values, list) or len(values) != len(types):
+    raise CursorError("invalid cursor")
+  for v, t in zip(values, types):
+    # bool is an int subclass; never a valid key.
+    if not isinstance(v, t) or isinstance(v, bool):
+      raise CursorError("invalid cursor")
+  return tuple(values)
+
+
+def sample_seek(token: Optional[str], alias: str = "") -> Tuple[Optional[str], List[Any]]:
+  """WHERE fragment + params continuing a received_at DESC, id DESC walk (None when no cursor)."""
+  if token is None:
+    return None, []
+  received_at, sid = decode_cursor(SAMPLE_KEY, token)
+  p = f"{alias}." if alias else ""
+  return f"({p}received_at, {p}id) < (?, ?)", [received_at, sid]
+
+
+def container_seek(token: Optional[str], alias: str = "") -> Tuple[Optional[str], List[Any]]:
+  if token is None:
+    return None, []
+  (cid,) = decode_cursor(CONTAINER_KEY, token)
+  p = f"{alias}." if alias else ""
+  return f"{p}id < ?", [cid]
+
+
+def page(rows: Sequence[Any], limit: int, kind: str) -> Tuple[List[Any], Optional[str]]:
+  """Trim a `LIMIT limit + 1` result to `limit` rows and build next_cursor if more remain."""
+  rows = list(rows)
+  if limit <= 0 or len(rows) <= limit:
+    return rows[:max(limit, 0)], None
+  rows = rows[:limit]
+  last = rows[-1]
+  if kind == SAMPLE_KEY:
+    return rows, encode_cursor(kind, [last["received_at"], int(last["id"])])
+  return rows, encode_cursor(kind, [int(last["id"])])
@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# Batch sample intake shared by `lims.sh sample import` and POST /sample/add/batch.
+#
+# One call validates every row, resolves all containers and external_ids with
+# set-based IN (...) queries, and inserts the good rows with a single
+# executemany inside one savepoint, so a 384-well plate manifest costs a handful
+# of statements and one commit instead of hundreds of round trips. Bad rows are
+# reported individually and never abort the rest of the batch.
+
+FORMATS = ("json", "jsonl", "csv")
+
+_STATUS_ALIASES = {"registered": "received", "testing": "processing", "analysis": "analyzing", "done": "completed"}
+_STATUS_ALLOWED = ("received", "processing", "analyzing", "completed")
+_CONTAINER_KEYS = ("container", "container_barcode", "container_id")
+
+# Stay well under SQLITE_MAX_VARIABLE_NUMBER on older builds (999).
+_IN_CHUNK = 500
+
+
+class BatchFormatError(ValueError):
+  pass
+
+
+def _env_int(name: str, default: int) -> int:
+  raw = (os.environ.get(name, "") or "").strip()
+  try:
+    return int(raw) if raw else default
+  except Exception:
+    return default
+
+
+def max_batch_bytes() -> int:
+  """Largest API batch body accepted (NEXUS_API_BATCH_MAX_BYTES, default 8 MiB)."""
+  return max(1024, _env_int("NEXUS_API_BATCH_MAX_BYTES", 8 * 1024 * 1024))
+
+
+def max_batch_rows() -> int:
+  """Most rows accepted in one API batch (NEXUS_API_BATCH_MAX_ROWS, default 10000)."""
+  return max(1, _env_int("NEXUS_API_BATCH_MAX_ROWS", 10000))
+
+
+def _utc_now_iso() -> str:
+  return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def detect_format(content_type: Optional[str] = None, filename: Optional[str] = None) -> Optional[str]:
+  ct = (content_type or "").split(";", 1)[0].strip().lower()
+  if ct in ("text/csv", "application/csv"):
+    return "csv"
+  if ct in ("application/x-ndjson", "application/jsonl", "application/x-jsonlines", "application/ndjson"):
+    return "jsonl"
+  if ct == "application/json":
+    return "json"
+  name = (filename or "").lower()
+  if name.endswith(".csv"):
+    return "csv"
+  if name.endswith((".jsonl", ".ndjson")):
+    return "jsonl"
+  if name.endswith(".json"):
+    return "json"
+  return None
+
+
+def parse_rows(data: Any, fmt: Optional[str] = None) -> List[Any]:
+  """Parse a batch payload into a list of row objects (not yet validated).
+
+  json:  a list of objects, or {"samples": [...]}
+  jsonl: one object per line (blank lines ignored)
+  csv:   header row naming the fields (external_id, specimen_type, status, notes, received_at, container)
+  Without `fmt`, sniffs: leading '[' => json, leading '{' => json if it parses as a
+  single document else jsonl, anything else => csv.
+  """
+  if isinstance(data, (bytes, bytearray)):
+    try:
+      text = bytes(data).decode("utf-8-sig")
+    except UnicodeDecodeError:
+      raise BatchFormatError("batch body must be UTF-8") from None
+  else:
+    text = str(data or "")
+    if text.startswith("\ufeff"):
+      text = text[1:]
+
+  f = (fmt or "").strip().lower() or None
+  if f is not None and f not in FORMATS:
+    raise BatchFormatError(f"invalid format '{fmt}'. Allowed: " + ", ".join(FORMATS))
+  head = text.lstrip()[:1]
+  if f is None:
+    if head == "[":
+      f = "json"
+    elif head == "{":
+      try:
+        return _rows_from_json(json.loads(text))
+      except json.JSONDecodeError:
+        f = "jsonl"
+    else:
+      f = "csv"
+
+  if f == "json":
+    try:
+      doc = json.loads(text)
+    except json.JSONDecodeError as e:
+      raise BatchFormatError(f"invalid JSON: {e}") from None
+    return _rows_from_json(doc)
+
+  if f == "jsonl":
+    rows: List[Any] = []
+    for n, line in enumerate(text.splitlines(), start=1):
+      if not line.strip():
+        continue
+      try:
+        rows.append(json.loads(line))
+      except json.JSONDecodeError as e:
+        raise BatchFormatError(f"invalid JSON on line {n}: {e}") from None
+    return rows
+
+  reader = csv.DictReader(io.StringIO(text))
+  if not reader.fieldnames:
+    return []
+  reader.fieldnames = [(h or "").strip().lower() for h in reader.fieldnames]
+  # Empty cells mean "not provided", same as a missing JSON key.
+  return [{k: (v if v is None or v.strip() else None) for k, v in r.items() if k} for r in reader]
+
+
+def _rows_from_json(doc: Any) -> List[Any]:
+  if isinstance(doc, dict) and isinstance(doc.get("samples"), list):
+    return list(doc["samples"])
+  if isinstance(doc, list):
+    return doc
+  raise BatchFormatError("JSON batch must be a list of objects or {\"samples\": [...]}")
+
+
+def _clean(v: Any, field: str, *, required: bool, max_len: int) -> Optional[str]:
+  if v is None:
+    if required:
+      raise ValueError(f"{field} is required")
+    return None
+  if isinstance(v, bool) or not isinstance(v, (str, int, float)):
+    raise ValueError(f"{field} must be a string")
+  s = str(v).strip()
+  if not s:
+    if required:
+      raise ValueError(f"{field} is required")
+    return None
+  if len(s) > max_len:
+    raise ValueError(f"{field} too long (max {max_len})")
+  return s
+
+
+def _normalize(raw: Any) -> Dict[str, Any]:
+  if not isinstance(raw, dict):
+    raise ValueError("row must be an object")
+  status_raw = _clean(raw.get("status"), "status", required=False, max_len=32)
+  status = _STATUS_ALIASES.get((status_raw or "received").lower(), (status_raw or "received").lower())
+  if status not in _STATUS_ALLOWED:
+    raise ValueError("invalid status. Allowed: " + ", ".join(_STATUS_ALLOWED))
+  container = None
+  for k in _CONTAINER_KEYS:
+    container = _clean(raw.get(k), k, required=False, max_len=64)
+    if container is not None:
+      break
+  return {
+    "external_id": _clean(raw.get("external_id"), "external_id", required=False, max_len=64),
+    "specimen_type": _clean(raw.get("specimen_type"), "specimen_type", required=True, max_len=64),
+    "status": status,
+    "notes": _clean(raw.get("notes"), "notes", required=False, max_len=2000),
+    "received_at": _clean(raw.get("received_at"), "received_at", required=False, max_len=64),
+    "container": container,
+  }
+
+
+def _chunks(items: Sequence[Any]) -> Iterable[Sequence[Any]]:
+  for i in range(0, len(items), _IN_CHUNK):
+    yield items[i:i + _IN_CHUNK]
+
+
+def _select_in(conn: sqlite3.Connection, sql: str, values: Iterable[Any]) -> List[sqlite3.Row]:
+  """Run `sql` (containing a single `IN ({})`) over `values` in bounded chunks."""
+  vals = list(dict.fromkeys(values))
+  out: List[sqlite3.Row] = []
+  for chunk in _chunks(vals):
+    out.extend(conn.execute(sql.format(",".join("?" * len(chunk))), tuple(chunk)).fetchall())
+  return out
+
+
+def _resolve_containers(conn: sqlite3.Connection, idents: Set[str]) -> Dict[str, Tuple[int, int]]:
+  """ident -> (container_id, is_exclusive). Numeric idents match an id first, then a barcode
+  (same rule as cli.resolve_container_id)."""
+  by_id: Dict[int, Tuple[int, int]] = {}
+  numeric = [int(i) for i in idents if i.isdigit()]
+  for r in _select_in(conn, "SELECT id, COALESCE(is_exclusive, 0) FROM containers WHERE id IN ({})", numeric):
+    by_id[int(r[0])] = (int(r[0]), int(r[1]))
+  by_barcode: Dict[str, Tuple[int, int]] = {}
+  barcodes = [i for i in idents if not (i.isdigit() and int(i) in by_id)]
+  for r in _select_in(conn, "SELECT barcode, id, COALESCE(is_exclusive, 0) FROM containers WHERE barcode IN ({})", barcodes):
+    by_barcode[str(r[0])] = (int(r[1]), int(r[2]))
+  out: Dict[str, Tuple[int, int]] = {}
+  for i in idents:
+    if i.isdigit() and int(i) in by_id:
+      out[i] = by_id[int(i)]
+    elif i in by_barcode:
+      out[i] = by_barcode[i]
+  return out
+
+
+def import_samples(conn: sqlite3.Connection, rows: Sequence[Any], *, id_prefix: str = "DEV") -> Dict[str, Any]:
+  """Insert `rows` as samples; returns a report with one result per input row (0-based `row`).
+
+  Does not commit: the caller owns the transaction (CLI commits, API writer() commits on exit).
+  """
+  now = _utc_now_iso()
+  results: List[Dict[str, Any]] = [{"row": i} for i in range(len(rows))]
+  pending: List[Tuple[int, Dict[str, Any]]] = []
+
+  def reject(i: int, error: str, detail: str) -> None:
+    results[i].update({"ok": False, "error": error, "detail": detail})
+
+  for i, raw in enumerate(rows):
+    try:
+      pending.append((i, _normalize(raw)))
+    except ValueError as e:
+      reject(i, "bad_request", str(e))
+
+  # Containers: one resolve for the whole batch.
+  containers = _resolve_containers(conn, {r["container"] for _, r in pending if r["container"] is not None})
+
+  # External ids: explicit ones must be new and unique within the batch; missing ones get
+  # "<prefix>-<utc stamp>-<row>" so a batch never collides with itself.
+  explicit = [r["external_id"] for _, r in pending if r["external_id"] is not None]
+  taken = {str(r[0]) for r in _select_in(conn, "SELECT external_id FROM samples WHERE external_id IN ({})", explicit)}
+  stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+  generated = {i: f"{id_prefix}-{stamp}-{i:05d}" for i, r in pending if r["external_id"] is None}
+  taken |= {str(r[0]) for r in _select_in(conn, "SELECT external_id FROM samples WHERE external_id IN ({})", generated.values())}
+
+  # Exclusive containers that already hold a sample (mirrors trg_samples_bi_exclusive_container).
+  exclusive_ids = {cid for cid, excl in containers.values() if excl}
+  occupied = {int(r[0]) for r in _select_in(conn, "SELECT DISTINCT container_id FROM samples WHERE container_id IN ({})", exclusive_ids)}
+
+  seen: Set[str] = set()
+  good: List[Tuple[int, Tuple[Any, ...]]] = []
+  for i, r in pending:
+    ext = r["external_id"] if r["external_id"] is not None else generated[i]
+    if ext in taken:
+      reject(i, "already_exists", f"sample external_id already exists: '{ext}'")
+      continue
+    if ext in seen:
+      reject(i, "duplicate", f"external_id repeated within batch: '{ext}'")
+      continue
+    cid = None
+    if r["container"] is not None:
+      hit = containers.get(r["container"])
+      if hit is None:
+        reject(i, "not_found", f"container not found: '{r['container']}'")
+        continue
+      cid, excl = hit
+      if excl:
+        if cid in occupied:
+          reject(i, "container_occupied", "container is exclusive and already holds a sample")
+          continue
+        occupied.add(cid)
+    seen.add(ext)
+    results[i]["external_id"] = ext
+    good.append((i, (ext, r["specimen_type"], r["status"], r["notes"], r["received_at"] or now, now, now, cid)))
+
+  insert_sql = (
+    "INSERT INTO samples (external_id, specimen_type, status, notes, received_at, created_at, updated_at, container_id) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+  )
+  if not conn.in_transaction:
+    # Open the transaction here so RELEASE below doesn't commit on the caller's behalf.
+    conn.execute("BEGIN")
+  conn.execute("SAVEPOINT sample_import")
+  try:
+    try:
+      conn.executemany(insert_sql, [params for _, params in good])
+    except sqlite3.DatabaseError:
+      # Something the pre-checks could not see (e.g. a concurrent CLI writer). Redo row by
+      # row so only the offending rows fail.
+      conn.execute("ROLLBACK TO sample_import")
+      kept: List[Tuple[int, Tuple[Any, ...]]] = []
+      for i, params in good:
+        conn.execute("SAVEPOINT sample_import_row")
+        try:
+          conn.execute(insert_sql, params)
+          conn.execute("RELEASE sample_import_row")
+          kept.append((i, params))
+        except sqlite3.DatabaseError as e:
+          conn.execute("ROLLBACK TO sample_import_row")
+          conn.execute("RELEASE sample_import_row")
+          results[i].pop("external_id", None)
+          reject(i, "conflict", str(e))
+      good = kept
+    conn.execute("RELEASE sample_import")
+  except BaseException:
+    conn.execute("ROLLBACK TO sample_import")
+    conn.execute("RELEASE sample_import")
+    raise
+
+  ids = {str(r[0]): int(r[1]) for r in _select_in(
+    conn, "SELECT external_id, id FROM samples WHERE external_id IN ({})", [p[0] for _, p in good])}
+  for i, params in good:
+    results[i].update({"ok": True, "id": ids.get(params[0])})
+
+  inserted = len(good)
+  return {
+    "received": len(rows),
+    "inserted": inserted,
+    "failed": len(rows) - inserted,
+    "results": results,
+  }
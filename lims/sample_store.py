@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional
+
+from . import db
+from .cli import resolve_container_id
+from .pagination import SAMPLE_KEY, CursorError, page, sample_seek
+
+# Sample reads and the status update behind GET /sample/list|show|events and
+# POST /sample/status, shared by the stdlib server (lims/api_sample_read.py,
+# lims/api_sample_status.py) and the FastAPI routes.
+#
+# Each function takes the parsed query (parse_qs dict) or JSON body, does its DB
+# work on a pooled connection (lims.db reader/writer) and returns the response
+# document. Request problems raise SampleRequestError(status, error, detail);
+# the transport turns that into its nexus_api_error envelope. Everything here
+# blocks, so async callers run it off the event loop (lims/api_executor.py).
+
+STATUS_ALLOWED = ("received", "processing", "analyzing", "completed")
+STATUS_ALIASES = {"registered": "received", "testing": "processing", "analysis": "analyzing", "done": "completed"}
+_STATUS_MSG = "invalid status. Allowed: " + ", ".join(STATUS_ALLOWED)
+
+# Columns of sample_events that hold a free-text note (older schemas used other names).
+_NOTE_COLUMNS = ("note", "message", "details", "description", "notes")
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class SampleRequestError(ValueError):
+  def __init__(self, status: int, error: str, detail: str):
+    super().__init__(detail)
+    self.status = status
+    self.error = error
+    self.detail = detail
+
+
+def _bad_request(detail: str) -> SampleRequestError:
+  return SampleRequestError(400, "bad_request", detail)
+
+
+def decode_json_object(raw: bytes, max_bytes: int = MAX_BODY_BYTES) -> Dict[str, Any]:
+  """A request body as a dict ({} when empty); 413 past max_bytes, 400 for anything else."""
+  if len(raw) > max_bytes:
+    raise SampleRequestError(413, "payload_too_large", f"payload too large (max {max_bytes} bytes)")
+  if not raw:
+    return {}
+  try:
+    obj = json.loads(raw.decode("utf-8", errors="replace"))
+  except ValueError:
+    raise _bad_request("invalid json body") from None
+  if obj is None:
+    return {}
+  if not isinstance(obj, dict):
+    raise _bad_request("json body must be an object")
+  return obj
+
+
+def _first(qs: Dict[str, List[str]], *keys: str) -> Optional[str]:
+  for k in keys:
+    if qs.get(k):
+      return str(qs[k][0]).strip()
+  return None
+
+
+def _limit(qs: Dict[str, List[str]], default: int, max_limit: int = 500) -> int:
+  if qs.get("limit"):
+    try:
+      v = int(str(qs["limit"][0]).strip())
+    except ValueError:
+      raise _bad_request("limit must be an int") from None
+  else:
+    v = default
+  if v < 0:
+    raise _bad_request("limit must be >= 0")
+  return min(v, max_limit)
+
+
+def normalize_status(raw: str) -> str:
+  s = (raw or "").strip().lower()
+  s = STATUS_ALIASES.get(s, s)
+  if s not in STATUS_ALLOWED:
+    raise _bad_request(_STATUS_MSG)
+  return s
+
+
+def _identifier(qs: Dict[str, List[str]]) -> str:
+  ident = _first(qs, "identifier", "external_id", "id")
+  if not ident:
+    raise _bad_request("identifier must be provided (identifier|external_id|id)")
+  return ident
+
+
+def resolve_sample_id(conn, ident: str) -> Optional[int]:
+  """Sample id for a numeric id or an external_id."""
+  ident = (ident or "").strip()
+  if not ident:
+    return None
+  if ident.isdigit():
+    row = conn.execute("SELECT id FROM samples WHERE id = ? LIMIT 1", (int(ident),)).fetchone()
+    if row:
+      return int(row[0])
+  row = conn.execute("SELECT id FROM samples WHERE external_id = ? LIMIT 1", (ident,)).fetchone()
+  return int(row[0]) if row else None
+
+
+_SAMPLE_SELECT = (
+  "SELECT s.*, c.barcode AS container_barcode, c.kind AS container_kind, c.location AS container_location "
+  "FROM samples s LEFT JOIN containers c ON s.container_id = c.id"
+)
+
+
+def _sample_doc(row) -> Dict[str, Any]:
+  d = dict(row)
+  cb = d.pop("container_barcode", None)
+  ck = d.pop("container_kind", None)
+  cl = d.pop("container_location", None)
+  if d.get("container_id") is not None and (cb is not None or ck is not None or cl is not None):
+    d["container"] = {"id": d.get("container_id"), "barcode": cb, "kind": ck, "location": cl}
+  return d
+
+
+def list_samples(qs: Dict[str, List[str]]) -> Dict[str, Any]:
+  """GET /sample/list: newest first, keyset-paginated (?limit, ?status, ?container, ?cursor)."""
+  limit = _limit(qs, default=25)
+  status = normalize_status(qs["status"][0]) if qs.get("status") else None
+  try:
+    seek_sql, seek_params = sample_seek(str(qs["cursor"][0]) if qs.get("cursor") else None, alias="s")
+  except CursorError as e:
+    raise _bad_request(str(e)) from None
+
+  container_id = None
+  if qs.get("container"):
+    ident = str(qs["container"][0]).strip()
+    if not ident:
+      raise _bad_request("container cannot be empty")
+    with db.reader("container_resolve") as conn:
+      container_id = resolve_container_id(conn, ident)
+    if container_id is None:
+      raise _bad_request("container not found")
+
+  wh: List[str] = []
+  params: List[Any] = []
+  if status is not None:
+    wh.append("s.status = ?")
+    params.append(status)
+  if container_id is not None:
+    wh.append("s.container_id = ?")
+    params.append(container_id)
+  if seek_sql is not None:
+    wh.append(seek_sql)
+    params.extend(seek_params)
+  where = (" WHERE " + " AND ".join(wh)) if wh else ""
+  # One extra row tells us whether another page exists.
+  params.append(limit + 1)
+  with db.reader("sample_list") as conn:
+    rows = conn.execute(_SAMPLE_SELECT + where + " ORDER BY s.received_at DESC, s.id DESC LIMIT ?", tuple(params)).fetchall()
+  rows, next_cursor = page(rows, limit, SAMPLE_KEY)
+  samples = [_sample_doc(r) for r in rows]
+  return {
+    "schema": "nexus_sample_list",
+    "schema_version": 1,
+    "ok": True,
+    "limit": limit,
+    "filters": {"status": status, "container_id": container_id},
+    "count": len(samples),
+    "samples": samples,
+    "next_cursor": next_cursor,
+  }
+
+
+def show_sample(qs: Dict[str, List[str]]) -> Dict[str, Any]:
+  """GET /sample/show?identifier=|external_id=|id="""
+  ident = _identifier(qs)
+  with db.reader("sample_show") as conn:
+    sample_id = resolve_sample_id(conn, ident)
+    row = conn.execute(_SAMPLE_SELECT + " WHERE s.id = ?", (sample_id,)).fetchone() if sample_id is not None else None
+  if row is None:
+    raise SampleRequestError(404, "not_found", f"sample not found: '{ident}'")
+  return {"schema": "nexus_sample", "schema_version": 1, "ok": True, "sample": _sample_doc(row)}
+
+
+def sample_events(qs: Dict[str, List[str]]) -> Dict[str, Any]:
+  """GET /sample/events?identifier=...&limit=: a sample's events, oldest first."""
+  ident = _identifier(qs)
+  limit = _limit(qs, default=50)
+  with db.reader("sample_events") as conn:
+    sample_id = resolve_sample_id(conn, ident)
+    if sample_id is None:
+      raise SampleRequestError(404, "not_found", f"sample not found: '{ident}'")
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(sample_events)").fetchall()]
+    events: List[Dict[str, Any]] = []
+    if cols:
+      if "occurred_at" in cols:
+        order = "occurred_at ASC, id ASC"
+      elif "created_at" in cols:
+        order = "created_at ASC, id ASC"
+      else:
+        order = "id ASC"
+      rows = conn.execute(f"SELECT * FROM sample_events WHERE sample_id = ? ORDER BY {order} LIMIT ?", (sample_id, limit)).fetchall()
+      events = [dict(r) for r in rows]
+  return {
+    "schema": "nexus_sample_events",
+    "schema_version": 1,
+    "ok": True,
+    "identifier": ident,
+    "sample_id": sample_id,
+    "limit": limit,
+    "count": len(events),
+    "events": events,
+  }
+
+
+def _attach_note(conn, sample_id: int, note: str) -> bool:
+  """Write note onto the sample's latest status_changed event (recorded by the status trigger)."""
+  cols = {r[1] for r in conn.execute("PRAGMA table_info(sample_events)").fetchall()}
+  targets = [c for c in _NOTE_COLUMNS if c in cols]
+  if not targets:
+    return False
+  row = conn.execute(
+    "SELECT id FROM sample_events WHERE sample_id = ? AND event_type = 'status_changed' ORDER BY id DESC LIMIT 1",
+    (sample_id,),
+  ).fetchone()
+  if not row:
+    return False
+  conn.execute(f"UPDATE sample_events SET {', '.join(f'{c} = ?' for c in targets)} WHERE id = ?", [note] * len(targets) + [row[0]])
+  return True
+
+
+def update_status(body: Dict[str, Any]) -> Dict[str, Any]:
+  """POST /sample/status {identifier, status, note?}."""
+  ident = str(body.get("identifier") or body.get("external_id") or body.get("id") or "").strip()
+  if not ident:
+    raise _bad_request("identifier is required")
+  status_raw = str(body.get("status") or "").strip()
+  if not status_raw:
+    raise _bad_request("status is required")
+  status = normalize_status(status_raw)
+  note = str(body.get("note") or body.get("details") or body.get("message") or "").strip()
+
+  with db.writer("sample_status") as conn:
+    sample_id = resolve_sample_id(conn, ident)
+    if sample_id is None:
+      raise SampleRequestError(404, "not_found", "sample not found")
+    prev = conn.execute("SELECT status FROM samples WHERE id = ? LIMIT 1", (sample_id,)).fetchone()
+    from_status = prev[0] if prev else None
+    conn.execute("UPDATE samples SET status = ? WHERE id = ?", (status, sample_id))
+    event_recorded = False
+    if note:
+      try:
+        event_recorded = _attach_note(conn, sample_id, note)
+      except Exception:
+        event_recorded = False  # the note is best-effort; never fail the status change over it
+    row = conn.execute(_SAMPLE_SELECT + " WHERE s.id = ? LIMIT 1", (sample_id,)).fetchone()
+    sample = _sample_doc(row) if row else {"id": sample_id}
+    conn.commit()
+
+  return {
+    "schema": "nexus_sample_status_update",
+    "schema_version": 1,
+    "ok": True,
+    "identifier": ident,
+    "from_status": from_status,
+    "to_status": status,
+    "event_recorded": event_recorded,
+    "sample": sample,
+  }
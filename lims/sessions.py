@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from . import db
+
+# Guest-session checks for the API servers (X-Nexus-Session / Authorization: Bearer).
+#
+# A per-process LRU cache sits in front of guest_sessions so an authenticated request
+# costs no DB transaction:
+#   - a known session is answered from memory until its expires_at, re-read from the DB
+#     at most every NEXUS_SESSION_CACHE_TTL_SEC (60) so rows removed elsewhere drop out;
+#   - unknown tokens are remembered as such for NEXUS_SESSION_NEGATIVE_TTL_SEC (5), so a
+#     client retrying a bad token does not hit the DB each time;
+#   - last_seen_at is written behind: touches are coalesced per session and flushed in
+#     one transaction every NEXUS_SESSION_FLUSH_SEC (15);
+#   - expired rows are deleted by a sweeper every NEXUS_SESSION_SWEEP_SEC (300), not by
+#     each request (expires_at is still checked on every lookup); with several API
+#     processes only the holder of the "session_sweep" lease (lims.db.lease) sweeps.
+# NEXUS_SESSION_CACHE_MAX (10000) bounds both the positive and the negative entries.
+# Lookups read through the reader pool; only the flush and the sweep take the writer.
+# lookup() = lookup_cached() (memory only) + load() on a miss (DB read), so async
+# servers answer hits on the event loop and run only the miss off it.
+
+COLUMNS = ("id", "display_name", "created_at", "expires_at", "last_seen_at")
+
+
+def _utc_now_iso() -> str:
+  return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def _env_float(name: str, default: float) -> float:
+  raw = (os.environ.get(name, "") or "").strip()
+  try:
+    return float(raw) if raw else default
+  except ValueError:
+    return default
+
+
+class SessionCache:
+  def __init__(
+    self,
+    *,
+    max_entries: int = 10000,
+    ttl: float = 60.0,
+    negative_ttl: float = 5.0,
+    flush_interval: float = 15.0,
+    sweep_interval: float = 300.0,
+  ):
+    self.max_entries = max(1, int(max_entries))
+    self.ttl = float(ttl)
+    self.negative_ttl = float(negative_ttl)
+    self.flush_interval = float(flush_interval)
+    self.sweep_interval = float(sweep_interval)
+    self._lock = threading.Lock()
+    # sid -> (row dict, monotonic time it was read)
+    self._hits: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+    # sid -> monotonic time it was found missing
+    self._misses: "OrderedDict[str, float]" = OrderedDict()
+    # sid -> last_seen_at not yet written
+    self._pending: Dict[str, str] = {}
+    self._stats: Dict[str, int] = {
+      "hits": 0,
+      "misses": 0,
+      "negative_hits": 0,
+      "db_reads": 0,
+      "flushes": 0,
+      "touches_flushed": 0,
+      "swept": 0,
+    }
+    self._thread: Optional[threading.Thread] = None
+    self._stop = threading.Event()
+
+  def _bump(self, key: str, n: int = 1) -> None:
+    self._stats[key] = self._stats.get(key, 0) + n
+
+  def lookup(self, sid: str) -> Optional[Dict[str, Any]]:
+    """The live session row for sid (last_seen_at bumped to now), or None."""
+    found, row = self.lookup_cached(sid)
+    return row if found else self.load(sid)
+
+  def lookup_cached(self, sid: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """(True, row or None) when memory answers for sid; (False, None) when load(sid) must read the DB.
+
+    Never touches the DB, so async callers can run it on the event loop.
+    """
+    now = _utc_now_iso()
+    mono = time.monotonic()
+    with self._lock:
+      hit = self._hits.get(sid)
+      if hit is not None:
+        row, read_at = hit
+        if row["expires_at"] <= now:
+          del self._hits[sid]
+          self._pending.pop(sid, None)
+          self._remember_miss(sid, mono)
+          self._bump("misses")
+          return True, None
+        if mono - read_at < self.ttl:
+          self._hits.move_to_end(sid)
+          self._bump("hits")
+          return True, self._touch(sid, row, now)
+      else:
+        missed = self._misses.get(sid)
+        if missed is not None:
+          if mono - missed < self.negative_ttl:
+            self._bump("negative_hits")
+            return True, None
+          del self._misses[sid]
+    return False, None
+
+  def load(self, sid: str) -> Optional[Dict[str, Any]]:
+    """Read sid from the DB into the cache (a lookup_cached() miss); blocks on a pooled reader."""
+    now = _utc_now_iso()
+    mono = time.monotonic()
+    with db.reader("session_lookup") as conn:
+      r = conn.execute(
+        "SELECT id, display_name, created_at, expires_at, last_seen_at FROM guest_sessions WHERE id = ? AND expires_at > ?",
+        (sid, now),
+      ).fetchone()
+    row = {c: r[i] for i, c in enumerate(COLUMNS)} if r else None
+    with self._lock:
+      self._bump("db_reads")
+      if row is None:
+        self._hits.pop(sid, None)
+        self._pending.pop(sid, None)
+        self._remember_miss(sid, mono)
+        self._bump("misses")
+        return None
+      self._bump("hits")
+      self._store(row, mono)
+      return self._touch(sid, row, now)
+
+  def remember(self, session: Dict[str, Any]) -> None:
+    """Cache a session just created (POST /auth/guest)."""
+    with self._lock:
+      self._misses.pop(session["id"], None)
+      self._store({c: session.get(c) for c in COLUMNS}, time.monotonic())
+
+  def _store(self, row: Dict[str, Any], mono: float) -> None:
+    # Caller holds self._lock.
+    self._hits[row["id"]] = (row, mono)
+    self._hits.move_to_end(row["id"])
+    while len(self._hits) > self.max_entries:
+      self._hits.popitem(last=False)
+
+  def _remember_miss(self, sid: str, mono: float) -> None:
+    # Caller holds self._lock.
+    if self.negative_ttl <= 0:
+      return
+    self._misses[sid] = mono
+    self._misses.move_to_end(sid)
+    while len(self._misses) > self.max_entries:
+      self._misses.popitem(last=False)
+
+  def _touch(self, sid: str, row: Dict[str, Any], now: str) -> Dict[str, Any]:
+    # Caller holds self._lock.
+    row["last_seen_at"] = now
+    self._pending[sid] = now
+    return dict(row)
+
+  def flush(self) -> int:
+    """Write pending last_seen_at values in one transaction; returns the number written."""
+    with self._lock:
+      pending, self._pending = self._pending, {}
+    if not pending:
+      return 0
+    try:
+      with db.writer("session_flush") as conn:
+        conn.executemany(
+          "UPDATE guest_sessions SET last_seen_at = ? WHERE id = ? AND (last_seen_at IS NULL OR last_seen_at < ?)",
+          [(ts, sid, ts) for sid, ts in pending.items()],
+        )
+    except Exception:
+      # Keep them for the next flush (newer touches win).
+      with self._lock:
+        for sid, ts in pending.items():
+          self._pending.setdefault(sid, ts)
+      raise
+    with self._lock:
+      self._bump("flushes")
+      self._bump("touches_flushed", len(pending))
+    return len(pending)
+
+  def sweep(self) -> int:
+    """Delete expired sessions; returns the number of rows removed."""
+    now = _utc_now_iso()
+    with db.writer("session_sweep") as conn:
+      n = conn.execute("DELETE FROM guest_sessions WHERE expires_at <= ?", (now,)).rowcount
+    with self._lock:
+      for sid in [s for s, (row, _t) in self._hits.items() if row["expires_at"] <= now]:
+        del self._hits[sid]
+        self._pending.pop(sid, None)
+      self._bump("swept", max(0, n))
+    return max(0, n)
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      st = dict(self._stats)
+      st["cached"] = len(self._hits)
+      st["negative_cached"] = len(self._misses)
+      st["pending_touches"] = len(self._pending)
+    return st
+
+  def start(self) -> Optional[threading.Thread]:
+    """Start the flush/sweep daemon thread (once)."""
+    if self._thread is not None:
+      return self._thread
+    tick = min(x for x in (self.flush_interval, self.sweep_interval, 60.0) if x > 0)
+    next_sweep = [time.monotonic() if self.sweep_interval > 0 else None]
+
+    def _loop() -> None:
+      while not self._stop.wait(tick):
+        try:
+          if self.flush_interval > 0:
+            self.flush()
+          if next_sweep[0] is not None and time.monotonic() >= next_sweep[0]:
+            next_sweep[0] = time.monotonic() + self.sweep_interval
+            if db.lease("session_sweep"):
+              self.sweep()
+        except Exception:
+          pass
+
+    self._thread = threading.Thread(target=_loop, name="lims-session-sweeper", daemon=True)
+    self._thread.start()
+    return self._thread
+
+  def stop(self) -> None:
+    """Stop the thread and write out pending touches (server shutdown)."""
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join(timeout=5)
+    try:
+      self.flush()
+    except Exception:
+      pass
+
+
+_CACHES: Dict[str, SessionCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache() -> SessionCache:
+  """The process-wide cache for the current db_path() (created on first use)."""
+  key = str(db.db_path())
+  cache = _CACHES.get(key)
+  if cache is not None:
+    return cache
+  with _CACHES_LOCK:
+    cache = _CACHES.get(key)
+    if cache is None:
+      cache = SessionCache(
+        max_entries=int(_env_float("NEXUS_SESSION_CACHE_MAX", 10000)),
+        ttl=_env_float("NEXUS_SESSION_CACHE_TTL_SEC", 60.0),
+        negative_ttl=_env_float("NEXUS_SESSION_NEGATIVE_TTL_SEC", 5.0),
+        flush_interval=_env_float("NEXUS_SESSION_FLUSH_SEC", 15.0),
+        sweep_interval=_env_float("NEXUS_SESSION_SWEEP_SEC", 300.0),
+      )
+      _CACHES[key] = cache
+    return cache
+
+
+def _after_fork_in_child() -> None:
+  global _CACHES_LOCK
+  # The sweeper thread does not survive fork(); a child starts its own cache.
+  _CACHES.clear()
+  _CACHES_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def lookup(sid: str) -> Optional[Dict[str, Any]]:
+  return get_cache().lookup(sid)
+
+
+def lookup_cached(sid: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+  return get_cache().lookup_cached(sid)
+
+
+def load(sid: str) -> Optional[Dict[str, Any]]:
+  return get_cache().load(sid)
+
+
+def remember(session: Dict[str, Any]) -> None:
+  get_cache().remember(session)
+
+
+def start_sweeper() -> Optional[threading.Thread]:
+  return get_cache().start()
+
+
+def stop() -> None:
+  with _CACHES_LOCK:
+    caches = list(_CACHES.values())
+  for c in caches:
+    c.stop()
@@ -0,0 +1,992 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tarfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence
+
+from . import db
+from . import snapshot_codec
+from . import snapshot_delta
+from . import snapshot_index
+from . import snapshot_samples
+from . import snapshot_store
+
+# Snapshot export engine (`lims.sh snapshot export`, POST /snapshot/export).
+#
+# Produces the same layout the shell exporter did:
+#   EXPORTS_DIR/snapshot-<UTC>[-N]/      meta.txt, lims.sqlite3, schema.sql, summary.txt,
+#                                        exports/samples/*.json, migrations/, scripts/,
+#                                        [git.txt], manifest.json
+#   EXPORTS_DIR/snapshot-<UTC>[-N].tar.gz      (.tar.zst with SNAPSHOT_CODEC=zstd, see snapshot_codec)
+# without shelling out:
+#   - the DB is copied with the SQLite online backup API in page batches (progress is
+#     reported per batch), then switched to journal_mode=DELETE so the copy is one file;
+#   - the tarball is streamed straight into the compressor and the file, hashing the compressed
+#     bytes and every member as they pass through, so nothing is read twice;
+#   - the tarball is written under a dot-prefixed temp name and renamed into place.
+# Everything is importable, so the API runs exports in-process.
+#
+# --incremental stores only the DB pages that changed since a base snapshot
+# (lims.sqlite3.delta, see snapshot_delta); restore/verify/doctor rebuild the image
+# by walking the chain, and `snapshot gc --compact` turns deltas back into full copies.
+#
+# --store cas hard-links every snapshot file to a content-addressed blob under
+# EXPORTS_DIR/.store (see snapshot_store), so identical files are stored once.
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+SCHEMA_RESULT = "nexus_snapshot_export_result"
+SCHEMA_MANIFEST = "nexus_snapshot_manifest"
+
+DEFAULT_BACKUP_PAGES = 1024
+DEFAULT_GZIP_LEVEL = snapshot_codec.DEFAULT_LEVEL["gzip"]
+DEFAULT_MAX_CHAIN = 24
+
+# progress(stage, done, total): stage is "backup" (pages) or "tar" (bytes of members).
+ProgressFn = Callable[[str, int, int], None]
+
+
+class SnapshotError(RuntimeError):
+  pass
+
+
+def _utc_ts() -> str:
+  return datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%SZ")
+
+
+def exports_dir_default() -> Path:
+  raw = os.environ.get("EXPORTS_DIR") or os.environ.get("EXPORT_DIR") or "exports"
+  p = Path(raw).expanduser()
+  return p if p.is_absolute() else REPO_ROOT / p
+
+
+def git_head(repo: Path = REPO_ROOT) -> Dict[str, str]:
+  """{"head": sha, "branch": name} read from .git without running git; {} if unavailable."""
+  gd = repo / ".git"
+  try:
+    if gd.is_file():
+      line = gd.read_text(encoding="utf-8").strip()
+      if not line.startswith("gitdir:"):
+        return {}
+      gd = (repo / line.split(":", 1)[1].strip()).resolve()
+    head = (gd / "HEAD").read_text(encoding="utf-8").strip()
+  except OSError:
+    return {}
+  if not head.startswith("ref:"):
+    return {"head": head, "branch": "HEAD"}
+  ref = head.split(":", 1)[1].strip()
+  branch = ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else ref
+  common = gd
+  try:
+    cd = (gd / "commondir").read_text(encoding="utf-8").strip()
+    common = (gd / cd).resolve()
+  except OSError:
+    pass
+  for base in (gd, common):
+    try:
+      return {"head": (base / ref).read_text(encoding="utf-8").strip(), "branch": branch}
+    except OSError:
+      pass
+  try:
+    for line in (common / "packed-refs").read_text(encoding="utf-8").splitlines():
+      parts = line.split()
+      if len(parts) == 2 and parts[1] == ref:
+        return {"head": parts[0], "branch": branch}
+  except OSError:
+    pass
+  return {}
+
+
+def _git_state_text(repo: Path) -> Optional[str]:
+  # Working-tree state needs git itself; opt-in (SNAPSHOT_GIT_STATE=1) so exports
+  # don't depend on it.
+  if shutil.which("git") is None:
+    return None
+  out = []
+  for title, cmd in (("git status --porcelain", ["status", "--porcelain"]), ("git diff --stat", ["diff", "--stat"])):
+    try:
+      p = subprocess.run(["git", "-C", str(repo), *cmd], text=True, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+      return None
+    out.append(f"== {title} ==\n{p.stdout}")
+  return "\n".join(out)
+
+
+def make_snapshot_dir(exports_dir: Path, ts: str) -> Path:
+  """Create exports_dir/snapshot-<ts>[-N]; mkdir is the uniqueness check, so concurrent exports can't collide."""
+  exports_dir.mkdir(parents=True, exist_ok=True)
+  base = exports_dir / f"snapshot-{ts}"
+  cand, i = base, 0
+  while True:
+    try:
+      cand.mkdir()
+      return cand
+    except FileExistsError:
+      i += 1
+      cand = Path(f"{base}-{i}")
+
+
+def backup_db(
+  src: Path,
+  dest: Path,
+  *,
+  pages: int = DEFAULT_BACKUP_PAGES,
+  progress: Optional[ProgressFn] = None,
+) -> None:
+  """Online backup of src into dest, `pages` pages per step; dest ends up in journal_mode=DELETE."""
+  sconn = db.connect(src)
+  dconn = sqlite3.connect(str(dest))
+  try:
+    def _cb(status: int, remaining: int, total: int) -> None:
+      if progress is not None:
+        progress("backup", total - remaining, total)
+
+    sconn.backup(dconn, pages=max(1, int(pages)), progress=_cb)
+    # The backup carries the source's journal mode; keep the artifact a self-contained
+    # rollback-journal file so opening it never needs (or leaves) -wal/-shm sidecars.
+    dconn.execute("PRAGMA journal_mode=DELETE")
+  finally:
+    dconn.close()
+    sconn.close()
+
+
+def schema_sql(conn: sqlite3.Connection) -> str:
+  """Equivalent of the sqlite3 shell's `.schema`."""
+  rows = conn.execute(
+    "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_stat%' ORDER BY rowid"
+  ).fetchall()
+  return "".join(f"{r[0]};\n" for r in rows)
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+  return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+
+
+def _columns(headers: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+  cells = [[("" if v is None else str(v)) for v in r] for r in rows]
+  widths = [max([len(h)] + [len(r[i]) for r in cells]) for i, h in enumerate(headers)]
+  lines = ["  ".join(h.ljust(w) for h, w in zip(headers, widths)).rstrip(),
+           "  ".join("-" * w for w in widths)]
+  lines += ["  ".join(c.ljust(w) for c, w in zip(r, widths)).rstrip() for r in cells]
+  return "\n".join(lines) + "\n"
+
+
+def summary_text(conn: sqlite3.Connection) -> str:
+  """Row counts + latest audit events; empty until the audit_events table exists."""
+  if not _table_exists(conn, "audit_events"):
+    return ""
+  counts = [(t, conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0])
+            for t in ("samples", "containers", "audit_events")]
+  recent = conn.execute(
+    "SELECT id, event_type, entity_type, entity_id, occurred_at FROM audit_events "
+    "ORDER BY occurred_at DESC, id DESC LIMIT 20"
+  ).fetchall()
+  return (_columns(("table_name", "rows"), counts) + "\n"
+          + _columns(("id", "event_type", "entity_type", "entity_id", "occurred_at"), [tuple(r) for r in recent]))
+
+
+class _HashingWriter:
+  """Write-through file wrapper that sha256-hashes and counts everything written."""
+
+  def __init__(self, f: BinaryIO):
+    self._f = f
+    self.sha256 = hashlib.sha256()
+    self.bytes = 0
+
+  def write(self, b) -> int:
+    self._f.write(b)
+    self.sha256.update(b)
+    self.bytes += len(b)
+    return len(b)
+
+  def flush(self) -> None:
+    self._f.flush()
+
+
+class _HashingReader:
+  """Read-through wrapper used for tar members: hashes file content as tarfile copies it."""
+
+  def __init__(self, f: BinaryIO, on_read: Optional[Callable[[int], None]] = None):
+    self._f = f
+    self._on_read = on_read
+    self.sha256 = hashlib.sha256()
+
+  def read(self, n: int = -1) -> bytes:
+    b = self._f.read(n)
+    self.sha256.update(b)
+    if b and self._on_read is not None:
+      self._on_read(len(b))
+    return b
+
+
+def _tar_members(snap_dir: Path) -> List[Path]:
+  out: List[Path] = []
+  # Dot-files are work files (the full image behind a delta, temp outputs); never archived.
+  for root, dirs, files in os.walk(snap_dir):
+    dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+    r = Path(root)
+    out += [r / d for d in dirs]
+    out += [r / f for f in sorted(files) if not f.startswith(".")]
+  return out
+
+
+def write_tarball(
+  snap_dir: Path,
+  tar_path: Path,
+  *,
+  codec: str = snapshot_codec.DEFAULT_CODEC,
+  level: int = DEFAULT_GZIP_LEVEL,
+  progress: Optional[ProgressFn] = None,
+) -> Dict[str, Any]:
+  """Stream snap_dir into tar_path (compressed with codec) in one pass.
+
+  Returns {"sha256", "bytes", "members": {relpath: sha256}} where relpath is relative to snap_dir.
+  """
+  members = [snap_dir] + _tar_members(snap_dir)
+  total = sum(p.stat().st_size for p in members if p.is_file())
+  done = [0]
+
+  def _advance(n: int) -> None:
+    done[0] += n
+    if progress is not None:
+      progress("tar", done[0], total)
+
+  tmp = tar_path.with_name(f".{tar_path.name}.partial")
+  hashes: Dict[str, str] = {}
+  try:
+    with open(tmp, "wb") as raw:
+      hw = _HashingWriter(raw)
+      with snapshot_codec.compressor(hw, codec, level) as zf:
+        with tarfile.open(fileobj=zf, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+          for p in members:
+            rel = p.relative_to(snap_dir)
+            arcname = snap_dir.name if p == snap_dir else f"{snap_dir.name}/{rel.as_posix()}"
+            ti = tar.gettarinfo(str(p), arcname=arcname)
+            ti.uid = ti.gid = 0
+            ti.uname = ti.gname = ""
+            if ti.isfile():
+              with open(p, "rb") as f:
+                hr = _HashingReader(f, _advance)
+                tar.addfile(ti, hr)
+              hashes[rel.as_posix()] = hr.sha256.hexdigest()
+            elif ti.isdir():
+              tar.addfile(ti)
+      raw.flush()
+      os.fsync(raw.fileno())
+    os.replace(tmp, tar_path)
+  except BaseException:
+    try:
+      tmp.unlink()
+    except FileNotFoundError:
+      pass
+    raise
+  return {"sha256": hw.sha256.hexdigest(), "bytes": hw.bytes, "members": hashes}
+
+
+def write_manifest(
+  snap_dir: Path,
+  *,
+  created_at_utc: str,
+  git_commit: str,
+  db_entry: Dict[str, Any],
+  tarball: Optional[Dict[str, str]],
+  samples: Sequence[Dict[str, Any]],
+  store: Optional[str] = None,
+) -> Path:
+  """db_entry: {"path": "lims.sqlite3", "sha256"} or, for an incremental snapshot,
+  {"path": "lims.sqlite3.delta", "sha256": <image>, "format": "page_delta", "base", ...}."""
+  doc = {
+    "schema": SCHEMA_MANIFEST,
+    "schema_version": 2,
+    "kind": "incremental" if db_entry.get("format") == "page_delta" else "full",
+    "codec": (tarball or {}).get("codec") or snapshot_codec.DEFAULT_CODEC,
+    "created_at_utc": created_at_utc,
+    "git_commit": git_commit,
+    "snapshot_dir": ".",
+    "db": db_entry,
+    "tarball": tarball,
+    "included_exports": {"samples": list(samples)},
+  }
+  if store:
+    doc["store"] = store
+  path = snap_dir / "manifest.json"
+  tmp = path.with_name(".manifest.json.tmp")
+  tmp.write_text(json.dumps(doc, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+  os.replace(tmp, path)
+  return path
+
+
+def export_snapshot(
+  *,
+  exports_dir: Optional[Path] = None,
+  include_samples: Sequence[str] = (),
+  src_db: Optional[Path] = None,
+  progress: Optional[ProgressFn] = None,
+  backup_pages: int = DEFAULT_BACKUP_PAGES,
+  level: Optional[int] = None,
+  git_state: Optional[bool] = None,
+  incremental: bool = False,
+  base: Optional[str] = None,
+  max_chain: Optional[int] = None,
+  codec: Optional[str] = None,
+  store: Optional[str] = None,
+  index_dir: Optional[Path] = None,
+) -> Dict[str, Any]:
+  """Write a snapshot dir + tarball + manifest; returns the nexus_snapshot_export_result doc.
+
+  incremental: store a page delta against `base` (a snapshot name or path in the same
+  exports dir; default the newest one there). Falls back to a full snapshot when there
+  is no base or the chain would exceed max_chain (SNAPSHOT_MAX_CHAIN, default 24).
+
+  codec / level: artifact compression (SNAPSHOT_CODEC / SNAPSHOT_LEVEL; gzip 6 by default).
+  zstd falls back to gzip when neither the zstandard module nor the zstd binary exists.
+  store: "dir" (default) or "cas" (SNAPSHOT_STORE): deduplicate files into EXPORTS_DIR/.store.
+  index_dir: the dir whose snapshot index lists the tarball (default exports_dir; the API
+  passes exports/api, a nested index over its per-request export dirs).
+
+  Raises SnapshotError for operator errors (missing DB, unknown include sample, bad base).
+  """
+  src = Path(src_db) if src_db is not None else db.db_path()
+  if not src.is_file():
+    raise SnapshotError(f"DB not found at: {src}")
+  out_root = Path(exports_dir) if exports_dir is not None else exports_dir_default()
+  try:
+    codec, level, codec_fallback = snapshot_codec.resolve(codec, level)
+  except snapshot_codec.CodecError as e:
+    raise SnapshotError(str(e)) from None
+  store = (store or os.environ.get("SNAPSHOT_STORE") or "dir").strip().lower()
+  if store not in ("dir", "cas"):
+    raise SnapshotError(f"unknown snapshot store: {store} (expected dir or cas)")
+  if git_state is None:
+    git_state = os.environ.get("SNAPSHOT_GIT_STATE", "").strip().lower() in ("1", "true", "yes")
+  include = snapshot_samples.parse_identifiers("\n".join(include_samples))
+  if max_chain is None:
+    max_chain = int(os.environ.get("SNAPSHOT_MAX_CHAIN", "") or DEFAULT_MAX_CHAIN)
+
+  base_name: Optional[str] = None
+  if incremental:
+    base_name = _snapshot_name(base) if base else latest_snapshot_name(out_root)
+    if base_name is not None and not _exists_in(out_root, base_name):
+      raise SnapshotError(f"base snapshot not found in {out_root}: {base_name}")
+
+  index_root = Path(index_dir) if index_dir is not None else out_root
+  index_fresh = snapshot_index.is_fresh(index_root)
+  ts = _utc_ts()
+  snap_dir = make_snapshot_dir(out_root, ts)
+  git = git_head()
+
+  meta = [f"snapshot_utc={ts}", f"repo_root={REPO_ROOT}", f"db_path={src}", f"db_bytes={src.stat().st_size}"]
+  if git:
+    meta += [f"git_head={git['head']}", f"git_branch={git['branch']}"]
+  (snap_dir / "meta.txt").write_text("\n".join(meta) + "\n", encoding="utf-8")
+  if git_state:
+    text = _git_state_text(REPO_ROOT)
+    if text is not None:
+      (snap_dir / "git.txt").write_text(text, encoding="utf-8")
+
+  base_info = None
+  fallback = None
+  if base_name is not None:
+    work = out_root / f".{snap_dir.name}.base"
+    try:
+      bdir = snapshot_delta.locate(base_name, [out_root], work, with_index=True)
+      ps, digests, base_sha, base_depth = snapshot_delta.base_index(bdir, [out_root], work)
+    except snapshot_delta.DeltaError as e:
+      raise SnapshotError(f"cannot use base {base_name}: {e}") from None
+    finally:
+      shutil.rmtree(work, ignore_errors=True)
+    if base_depth + 1 > max_chain:
+      fallback = f"chain depth {base_depth + 1} > max_chain {max_chain}"
+    else:
+      base_info = {"name": base_name, "index": (ps, digests), "sha256": base_sha, "depth": base_depth + 1}
+  elif incremental:
+    fallback = "no base snapshot"
+
+  # For a delta the full image is only a work file (dot-prefixed: never archived).
+  snap_db = snap_dir / (".lims.sqlite3.full" if base_info else "lims.sqlite3")
+  backup_db(src, snap_db, pages=backup_pages, progress=progress)
+
+  if include:
+    try:
+      snapshot_samples.export_samples(snap_db, snap_dir / "exports" / "samples", include,
+                                      jobs=snapshot_samples.default_jobs())
+    except snapshot_samples.SampleStageError as e:
+      raise SnapshotError(f"failed to export included samples into snapshot: {e}") from None
+
+  conn = sqlite3.connect(str(snap_db))
+  try:
+    (snap_dir / "schema.sql").write_text(schema_sql(conn), encoding="utf-8")
+    (snap_dir / "summary.txt").write_text(summary_text(conn), encoding="utf-8")
+  finally:
+    conn.close()
+
+  delta = None
+  if base_info is not None:
+    try:
+      delta = snapshot_delta.write_delta(
+        snap_db, base_info["index"], snap_dir / snapshot_delta.DELTA_NAME,
+        base=base_info["name"], base_db_sha256=base_info["sha256"], depth=base_info["depth"],
+      )
+      snap_db.unlink()
+    except snapshot_delta.DeltaError as e:
+      # e.g. the page size changed (VACUUM with a new page_size): keep the full image.
+      fallback = str(e)
+      os.replace(snap_db, snap_dir / snapshot_delta.DB_NAME)
+      snap_db = snap_dir / snapshot_delta.DB_NAME
+  if delta is None:
+    ps, digests, _ = snapshot_delta.page_index(snap_db)
+    snapshot_delta.write_index(snap_dir / snapshot_delta.INDEX_NAME, ps, digests)
+
+  # Include migrations and CLI scripts for forensic reproducibility.
+  shutil.copytree(db.migrations_dir(), snap_dir / "migrations")
+  (snap_dir / "scripts").mkdir()
+  for name in ("lims.sh", "migrate.sh"):
+    shutil.copy2(REPO_ROOT / "scripts" / name, snap_dir / "scripts" / name)
+
+  tar_path = out_root / f"{snap_dir.name}{snapshot_codec.EXTENSION[codec]}"
+  tar = write_tarball(snap_dir, tar_path, codec=codec, level=level, progress=progress)
+
+  created_at_utc = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+  samples_dir = snap_dir / "exports" / "samples"
+  entries = []
+  for ident in include:
+    rel = snapshot_samples.sample_path(samples_dir, ident).relative_to(snap_dir).as_posix()
+    sha = tar["members"].get(rel)
+    entry: Dict[str, Any] = {"external_id": ident, "path": rel, "sha256": sha}
+    if sha is None:
+      entry["missing"] = True
+    entries.append(entry)
+  if delta is not None:
+    db_entry = _delta_db_entry(delta, tar["members"][snapshot_delta.DELTA_NAME])
+  else:
+    db_entry = {"path": snapshot_delta.DB_NAME, "sha256": tar["members"][snapshot_delta.DB_NAME]}
+  mpath = write_manifest(
+    snap_dir,
+    created_at_utc=created_at_utc,
+    git_commit=git.get("head", ""),
+    db_entry=db_entry,
+    tarball={"path": str(Path("..") / tar_path.name), "sha256": tar["sha256"], "codec": codec},
+    samples=entries,
+    store="cas" if store == "cas" else None,
+  )
+  store_stats = None
+  if store == "cas":
+    store_stats = _store_snapshot(out_root, snap_dir, mpath, tar["members"])
+  _index_record(index_root, tar_path, fresh=index_fresh, sha256=tar["sha256"], ts=created_at_utc,
+                nested=index_dir is not None)
+
+  return {
+    "schema": SCHEMA_RESULT,
+    "schema_version": 1,
+    "ok": True,
+    "snapshot_dir": str(snap_dir),
+    "tarball": str(tar_path),
+    "tarball_sha256": tar["sha256"],
+    "tarball_bytes": tar["bytes"],
+    "codec": codec,
+    "level": level,
+    "codec_fallback": codec_fallback,
+    "exports_dir": str(out_root),
+    "included_samples": include,
+    "created_at_utc": created_at_utc,
+    "kind": "incremental" if delta is not None else "full",
+    "base": delta["base"] if delta is not None else None,
+    "pages_changed": delta["pages_changed"] if delta is not None else None,
+    "incremental_fallback": fallback,
+    "store": store,
+    "store_stats": store_stats,
+  }
+
+
+def _index_record(index_root: Path, tar_path: Path, **kw: Any) -> None:
+  # The index is derived data: readers rebuild it on drift, so a failed update only costs a rescan.
+  try:
+    snapshot_index.record(index_root, tar_path, **kw)
+  except (OSError, ValueError) as e:
+    print(f"WARN: snapshot index not updated ({index_root}): {e}", file=sys.stderr)
+
+
+def _store_snapshot(exports_dir: Path, snap_dir: Path, manifest: Path, members: Dict[str, str]) -> Dict[str, int]:
+  """Hard-link snap_dir's files to store blobs and record its store manifest."""
+  try:
+    stats = snapshot_store.ingest(snap_dir, exports_dir, members)
+    doc = json.loads(manifest.read_text(encoding="utf-8"))
+    snapshot_store.write_manifest(exports_dir, snap_dir.name, doc, members)
+  except snapshot_store.StoreError as e:
+    raise SnapshotError(str(e)) from None
+  return stats
+
+
+def _delta_db_entry(trailer: Dict[str, Any], delta_sha256: str) -> Dict[str, Any]:
+  return {
+    "path": snapshot_delta.DELTA_NAME,
+    "sha256": trailer["db_sha256"],
+    "format": "page_delta",
+    "delta_sha256": delta_sha256,
+    "base": trailer["base"],
+    "base_db_sha256": trailer["base_db_sha256"],
+    "depth": trailer["depth"],
+    "page_size": trailer["page_size"],
+    "page_count": trailer["page_count"],
+    "pages_changed": trailer["pages_changed"],
+  }
+
+
+def _snapshot_name(ref: str) -> str:
+  """Snapshot name from a name, dir path or tarball path."""
+  name = snapshot_codec.strip_ext(Path(str(ref).rstrip("/")).name)
+  if not name.startswith("snapshot-"):
+    raise SnapshotError(f"not a snapshot name: {ref}")
+  return name
+
+
+def snapshot_names(exports_dir: Path) -> List[str]:
+  """Snapshot names present in exports_dir (as a dir and/or tarball), newest first."""
+  names = set()
+  if exports_dir.is_dir():
+    for p in exports_dir.iterdir():
+      if not p.name.startswith("snapshot-"):
+        continue
+      if p.is_dir():
+        names.add(p.name)
+      elif snapshot_codec.codec_of(p.name) is not None:
+        names.add(_snapshot_name(p.name))
+  return sorted(names, reverse=True)
+
+
+def latest_snapshot_name(exports_dir: Path) -> Optional[str]:
+  for name in snapshot_names(exports_dir):
+    if _exists_in(exports_dir, name):
+      return name
+  return None
+
+
+def _exists_in(exports_dir: Path, name: str) -> bool:
+  d = exports_dir / name
+  if (d / snapshot_delta.DB_NAME).is_file() or (d / snapshot_delta.DELTA_NAME).is_file():
+    return True
+  return snapshot_codec.find_artifact(exports_dir, name) is not None
+
+
+def snapshot_depth(exports_dir: Path, name: str) -> int:
+  """Chain depth of a snapshot (0 = full); -1 if its DB member can't be found."""
+  work = exports_dir / f".{name}.depth"
+  try:
+    sd = snapshot_delta.locate(name, [exports_dir], work)
+    if not snapshot_delta.is_delta_dir(sd):
+      return 0
+    return int(snapshot_delta.read_trailer(sd / snapshot_delta.DELTA_NAME).get("depth", 1))
+  except snapshot_delta.DeltaError:
+    return -1
+  finally:
+    shutil.rmtree(work, ignore_errors=True)
+
+
+def compact_snapshot(exports_dir: Path, name: str, *, level: Optional[int] = None) -> Dict[str, Any]:
+  """Rewrite an incremental snapshot as a full one, in place and under the same name.
+
+  The image (and its sha256) is unchanged, so snapshots built on top of this one
+  stay valid; its own bases are no longer needed by it afterwards. A tarball-only
+  snapshot is unpacked to a work dir first and stays tarball-only. The artifact keeps
+  its codec.
+  """
+  snap_dir = exports_dir / name
+  work = exports_dir / f".{name}.compact"
+  tar_path = snapshot_codec.find_artifact(exports_dir, name)
+  if tar_path is None:
+    tar_path = exports_dir / f"{name}{snapshot_codec.EXTENSION[snapshot_codec.DEFAULT_CODEC]}"
+  codec = snapshot_codec.codec_of(tar_path) or snapshot_codec.DEFAULT_CODEC
+  if level is None:
+    level = snapshot_codec.DEFAULT_LEVEL[codec]
+  index_fresh = snapshot_index.is_fresh(exports_dir)
+  try:
+    if not snap_dir.is_dir():
+      if not tar_path.is_file():
+        raise SnapshotError(f"snapshot not found: {name}")
+      work.mkdir(parents=True, exist_ok=True)
+      with snapshot_codec.open_tar(tar_path) as tf:
+        tf.extractall(work, filter="data")
+      snap_dir = work / name
+    if not snapshot_delta.is_delta_dir(snap_dir):
+      return {"name": name, "compacted": False}
+
+    full = snap_dir / ".lims.sqlite3.full"
+    try:
+      res = snapshot_delta.materialize(snap_dir, full, search_dirs=[exports_dir], work=work / "chain")
+    except snapshot_delta.DeltaError as e:
+      raise SnapshotError(f"cannot compact {name}: {e}") from None
+    os.replace(full, snap_dir / snapshot_delta.DB_NAME)
+    (snap_dir / snapshot_delta.DELTA_NAME).unlink()
+    ps, digests, _ = snapshot_delta.page_index(snap_dir / snapshot_delta.DB_NAME)
+    snapshot_delta.write_index(snap_dir / snapshot_delta.INDEX_NAME, ps, digests)
+
+    mpath = snap_dir / "manifest.json"
+    doc: Dict[str, Any] = {}
+    if mpath.is_file():
+      try:
+        doc = json.loads(mpath.read_text(encoding="utf-8"))
+      except (OSError, ValueError):
+        doc = {}
+    elif snapshot_store.has_manifest(exports_dir, name):
+      try:
+        doc = snapshot_store.read_manifest(exports_dir, name)
+      except snapshot_store.StoreError:
+        doc = {}
+    # The manifest is not archived with its own tarball sha; drop it before re-tarring.
+    mpath.unlink(missing_ok=True)
+    tar = write_tarball(snap_dir, tar_path, codec=codec, level=level)
+    cas = snapshot_store.has_manifest(exports_dir, name)
+    mpath = write_manifest(
+      snap_dir,
+      created_at_utc=str(doc.get("created_at_utc") or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")),
+      git_commit=str(doc.get("git_commit") or ""),
+      db_entry={"path": snapshot_delta.DB_NAME, "sha256": tar["members"][snapshot_delta.DB_NAME]},
+      tarball={"path": str(Path("..") / tar_path.name), "sha256": tar["sha256"], "codec": codec},
+      samples=(doc.get("included_exports") or {}).get("samples") or [],
+      store="cas" if cas else None,
+    )
+    if cas:
+      _store_snapshot(exports_dir, snap_dir, mpath, tar["members"])
+    _index_record(exports_dir, tar_path, fresh=index_fresh, sha256=tar["sha256"])
+    return {"name": name, "compacted": True, "chain": res["chain"], "db_sha256": res["db_sha256"]}
+  finally:
+    shutil.rmtree(work, ignore_errors=True)
+
+
+def _stderr_progress() -> ProgressFn:
+  last: Dict[str, int] = {}
+
+  def _p(stage: str, done: int, total: int) -> None:
+    pct = int(done * 100 / total) if total else 100
+    if last.get(stage) == pct:
+      return
+    last[stage] = pct
+    unit = "pages" if stage == "backup" else "bytes"
+    print(f"{stage}: {done}/{total} {unit} ({pct}%)", file=sys.stderr)
+
+  return _p
+
+
+def cmd_export(args: argparse.Namespace) -> int:
+  include: List[str] = list(args.include_sample or [])
+  include += snapshot_samples.parse_identifiers(os.environ.get("SNAPSHOT_INCLUDE_SAMPLES", ""))
+  json_mode = bool(args.json) or os.environ.get("SNAPSHOT_JSON", "0") == "1"
+  # JSON mode: stdout carries exactly one JSON object; human lines go to stderr.
+  human = sys.stderr if json_mode else sys.stdout
+  try:
+    doc = export_snapshot(
+      exports_dir=Path(args.exports_dir) if args.exports_dir else None,
+      include_samples=include,
+      progress=_stderr_progress() if (args.progress or os.environ.get("SNAPSHOT_PROGRESS") == "1") else None,
+      incremental=bool(args.incremental) or os.environ.get("SNAPSHOT_INCREMENTAL") == "1",
+      base=args.base or os.environ.get("SNAPSHOT_BASE") or None,
+      max_chain=args.max_chain,
+      codec=args.codec,
+      level=args.level,
+      store=args.store,
+    )
+  except SnapshotError as e:
+    print(f"ERROR: {e}", file=sys.stderr)
+    if str(e).startswith("DB not found"):
+      print("HINT: Run ./scripts/lims.sh init (or set DB_PATH) before exporting a snapshot.", file=sys.stderr)
+    return 2
+  print(f"OK: wrote snapshot directory: {doc['snapshot_dir']}", file=human)
+  print(f"OK: wrote artifact:          {doc['tarball']}", file=human)
+  if doc["codec_fallback"]:
+    print(f"WARN: {doc['codec_fallback']}", file=sys.stderr)
+  if doc["kind"] == "incremental":
+    print(f"OK: incremental against {doc['base']} ({doc['pages_changed']} page(s) changed)", file=human)
+  if doc["store_stats"]:
+    st = doc["store_stats"]
+    print(f"OK: stored {st['blobs_new']} new blob(s) ({st['bytes_new']} bytes), deduplicated {st['bytes_deduped']} bytes", file=human)
+  elif doc["incremental_fallback"]:
+    print(f"WARN: wrote a full snapshot: {doc['incremental_fallback']}", file=human)
+  if json_mode:
+    print(json.dumps(doc, sort_keys=True, separators=(",", ":")))
+  return 0
+
+
+def cmd_materialize(args: argparse.Namespace) -> int:
+  snap_dir = Path(args.snapshot_dir)
+  if not snap_dir.is_dir():
+    print(f"ERROR: not a snapshot directory: {snap_dir}", file=sys.stderr)
+    return 2
+  search = [Path(d) for d in (args.search or [])] + [snap_dir.resolve().parent]
+  try:
+    res = snapshot_delta.materialize(snap_dir, Path(args.out), search_dirs=search)
+  except (snapshot_delta.DeltaError, OSError) as e:
+    print(f"ERROR: {e}", file=sys.stderr)
+    return 2
+  print(json.dumps(res, sort_keys=True, separators=(",", ":")))
+  return 0
+
+
+def cmd_bases(args: argparse.Namespace) -> int:
+  exports_dir = Path(args.dir)
+  work = exports_dir / ".bases.work"
+  seen: List[str] = []
+  try:
+    for name in args.names:
+      for b in snapshot_delta.bases_of(_snapshot_name(name), [exports_dir], work):
+        if b not in seen:
+          seen.append(b)
+  except SnapshotError as e:
+    print(f"ERROR: {e}", file=sys.stderr)
+    return 2
+  finally:
+    shutil.rmtree(work, ignore_errors=True)
+  for b in seen:
+    print(b)
+  return 0
+
+
+def cmd_compact(args: argparse.Namespace) -> int:
+  exports_dir = Path(args.dir)
+  # Oldest first: compacting a base never invalidates the snapshots built on it.
+  names = sorted(_snapshot_name(n) for n in args.names) if args.names else sorted(snapshot_names(exports_dir))
+  rc = 0
+  for name in names:
+    depth = snapshot_depth(exports_dir, name)
+    if depth <= args.max_depth:
+      continue
+    if not args.apply:
+      print(f"WOULD COMPACT: {name} (depth {depth})")
+      continue
+    try:
+      res = compact_snapshot(exports_dir, name)
+    except SnapshotError as e:
+      print(f"ERROR: {e}", file=sys.stderr)
+      rc = 2
+      continue
+    if res["compacted"]:
+      print(f"COMPACTED: {name} (was depth {depth})")
+  return rc
+
+
+def _read_pins(path: Optional[str]) -> List[str]:
+  if not path or not os.path.isfile(path):
+    return []
+  out = []
+  with open(path, encoding="utf-8") as f:
+    for line in f:
+      line = line.split("#", 1)[0].strip()
+      if line:
+        out.append(line)
+  return out
+
+
+def cmd_store_gc(args: argparse.Namespace) -> int:
+  exports_dir = Path(args.dir)
+  rep = snapshot_store.gc(exports_dir, pinned=_read_pins(args.pins_file), gone=args.gone or [], apply=args.apply)
+  if not rep["ok"]:
+    print(f"ERROR: {rep['error']}", file=sys.stderr)
+    return 2
+  verb = "DELETE" if args.apply else "WOULD DELETE"
+  for name in rep["manifests_dropped"]:
+    print(f"{verb} store manifest: {name}")
+  for sha in rep["blobs_dropped"]:
+    print(f"{verb} store blob: {sha}")
+  print(
+    f"OK: store gc{'' if args.apply else ' (dry-run)'}: {rep['manifests_kept']} manifest(s) kept, "
+    f"{len(rep['manifests_dropped'])} dropped; {rep['blobs_referenced']} blob(s) referenced, "
+    f"{len(rep['blobs_dropped'])} unreferenced ({rep['bytes_freed']} bytes)"
+  )
+  return 0
+
+
+def cmd_checkout(args: argparse.Namespace) -> int:
+  try:
+    out = snapshot_store.checkout(Path(args.dir), _snapshot_name(args.name), Path(args.out) if args.out else None)
+  except (snapshot_store.StoreError, SnapshotError) as e:
+    print(f"ERROR: {e}", file=sys.stderr)
+    return 2
+  print(f"OK: checked out snapshot directory: {out}")
+  return 0
+
+
+def cmd_latest(args: argparse.Namespace) -> int:
+  exports_dir = Path(args.dir)
+  if args.n < 1:
+    print("ERROR: --n must be a positive integer", file=sys.stderr)
+    return 2
+  ents = snapshot_index.entries(exports_dir)
+  if args.all:
+    for e in ents:
+      print(e["path"])
+    return 0
+  if not ents:
+    print(f"ERROR: no snapshot tarballs found in: {exports_dir}", file=sys.stderr)
+    return 2
+  if args.n > len(ents):
+    print(f"ERROR: --n out of range: requested {args.n} but only {len(ents)} snapshot tarballs found", file=sys.stderr)
+    return 2
+  p = snapshot_index.latest(exports_dir, args.n)
+  if p is None:
+    print(f"ERROR: no snapshot tarballs found in: {exports_dir}", file=sys.stderr)
+    return 2
+  print(p)
+  return 0
+
+
+def cmd_index(args: argparse.Namespace) -> int:
+  exports_dir = Path(args.dir)
+  if not exports_dir.is_dir():
+    print(f"ERROR: exports dir not found: {exports_dir}", file=sys.stderr)
+    return 2
+  try:
+    if args.drop:
+      snapshot_index.drop(exports_dir, args.drop)
+      return 0
+    if args.rebuild:
+      res = snapshot_index.rebuild(exports_dir, nested=True if args.nested else None)
+      print(
+        f"OK: rebuilt snapshot index: {res['entries']} tarball(s) "
+        f"({len(res['added'])} added, {len(res['removed'])} removed, {res['changed']} changed)",
+        file=sys.stderr if args.json else sys.stdout,
+      )
+    ents = snapshot_index.entries(exports_dir, nested=True if args.nested else None)
+  except OSError as e:
+    print(f"ERROR: {e}", file=sys.stderr)
+    return 2
+  if args.json:
+    print(json.dumps({"schema": snapshot_index.SCHEMA, "schema_version": 1, "dir": str(exports_dir), "entries": ents},
+                     sort_keys=True))
+  elif not args.rebuild:
+    for e in ents:
+      flag = " pinned" if e.get("pinned") else ""
+      print(f"{e['path']}\t{e.get('ts') or '-'}\t{e['size']}\t{e.get('codec')}\t{e.get('sha256') or '-'}{flag}")
+  return 0
+
+
+def cmd_extract(args: argparse.Namespace) -> int:
+  """verify/restore's tar step: one checked pass, writing only lims.sqlite3 / lims.sqlite3.delta."""
+  art = Path(args.artifact)
+  if snapshot_codec.codec_of(art.name) is None or not art.is_file():
+    print(f"ERROR: not a snapshot tarball: {art}", file=sys.stderr)
+    return 2
+  out = Path(args.out)
+  out.mkdir(parents=True, exist_ok=True)
+  db_out = Path(args.db_out).resolve() if args.db_out else None
+
+  def want(name: str):
+    base = name.rsplit("/", 1)[-1]
+    if base == snapshot_delta.DB_NAME:
+      return db_out or True
+    return base == snapshot_delta.DELTA_NAME
+
+  try:
+    names = snapshot_codec.extract_selected(
+      art, out, want, max_members=args.max_members or None, max_total_bytes=args.max_total_bytes or None,
+    )
+  except snapshot_codec.CodecError as e:
+    print(f"ERROR: {e} - refusing to extract: {art}", file=sys.stderr)
+    return 2
+  except (OSError, tarfile.TarError) as e:
+    print(f"ERROR: cannot read tarball {art}: {e}", file=sys.stderr)
+    return 2
+  dbs = [n for n in names if n.rsplit("/", 1)[-1] == snapshot_delta.DB_NAME]
+  if len(dbs) > 1:
+    for n in dbs:
+      print(f"FOUND: {n}", file=sys.stderr)
+    print(f"ERROR: expected exactly 1 lims.sqlite3 in tarball, found {len(dbs)}", file=sys.stderr)
+    return 2
+  return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+  p = argparse.ArgumentParser(prog="lims-snapshot", description="LIMS snapshot engine")
+  sub = p.add_subparsers(dest="cmd", required=True)
+
+  sp = sub.add_parser("export", help="Write a snapshot dir + tarball + manifest")
+  sp.add_argument("--exports-dir", default=None, help="Output root (default: EXPORTS_DIR or ./exports)")
+  sp.add_argument("--include-sample", action="append", default=None,
+                  help="Also write exports/samples/sample-<id>.json (repeatable; SNAPSHOT_INCLUDE_SAMPLES is added)")
+  sp.add_argument("--json", action="store_true", help="Print one nexus_snapshot_export_result object on stdout")
+  sp.add_argument("--progress", action="store_true", help="Report backup/tar progress on stderr")
+  sp.add_argument("--incremental", action="store_true",
+                  help="Store only DB pages changed since --base (SNAPSHOT_INCREMENTAL=1)")
+  sp.add_argument("--base", default=None,
+                  help="Base snapshot name or path in the exports dir (default: newest; SNAPSHOT_BASE)")
+  sp.add_argument("--max-chain", type=int, default=None,
+                  help="Take a full snapshot instead once the chain is this deep (SNAPSHOT_MAX_CHAIN, default 24)")
+  sp.add_argument("--codec", choices=snapshot_codec.CODECS, default=None,
+                  help="Tarball codec: gzip (.tar.gz, default) or zstd (.tar.zst, multi-threaded) (SNAPSHOT_CODEC)")
+  sp.add_argument("--level", type=int, default=None,
+                  help="Compression level (gzip 1-9, default 6; zstd 1-19, default 3) (SNAPSHOT_LEVEL)")
+  sp.add_argument("--store", choices=("dir", "cas"), default=None,
+                  help="cas: store files once by sha256 under EXPORTS_DIR/.store, hard-linked into the dir (SNAPSHOT_STORE)")
+  sp.set_defaults(fn=cmd_export)
+
+  sp = sub.add_parser("materialize", help="Write a snapshot's full DB image, applying its delta chain")
+  sp.add_argument("snapshot_dir", help="Snapshot directory (holding lims.sqlite3 or lims.sqlite3.delta)")
+  sp.add_argument("--out", required=True, help="Output DB path")
+  sp.add_argument("--search", action="append", default=None,
+                  help="Extra dir to look for base snapshots in (repeatable; the snapshot's parent is always searched)")
+  sp.set_defaults(fn=cmd_materialize)
+
+  sp = sub.add_parser("bases", help="Print the transitive base snapshots of NAME(s), one per line")
+  sp.add_argument("--dir", required=True, help="Exports dir")
+  sp.add_argument("names", nargs="+")
+  sp.set_defaults(fn=cmd_bases)
+
+  sp = sub.add_parser("compact", help="Rewrite incremental snapshots as full ones (dry-run unless --apply)")
+  sp.add_argument("--dir", required=True, help="Exports dir")
+  sp.add_argument("--max-depth", type=int, default=0, help="Only compact snapshots deeper than this (default 0: all)")
+  sp.add_argument("--apply", action="store_true")
+  sp.add_argument("names", nargs="*", help="Limit to these snapshots")
+  sp.set_defaults(fn=cmd_compact)
+
+  sp = sub.add_parser("latest", help="Print the Nth newest tarball in an exports dir (from its snapshot index)")
+  sp.add_argument("--dir", required=True, help="Exports dir")
+  sp.add_argument("--n", type=int, default=1, help="1 = newest (default)")
+  sp.add_argument("--all", action="store_true", help="Print every indexed tarball (relative path), newest first")
+  sp.set_defaults(fn=cmd_latest)
+
+  sp = sub.add_parser("index", help="List, rebuild or update an exports dir's snapshot index")
+  sp.add_argument("--dir", required=True, help="Exports dir")
+  sp.add_argument("--rebuild", action="store_true", help="Rescan the dir and rewrite the index (fixes drift)")
+  sp.add_argument("--nested", action="store_true", help="Tarballs live one dir down (exports/api layout)")
+  sp.add_argument("--drop", action="append", default=None, help="Record a deleted tarball (repeatable)")
+  sp.add_argument("--json", action="store_true", help="Print one nexus_snapshot_index object")
+  sp.set_defaults(fn=cmd_index)
+
+  sp = sub.add_parser("extract", help="Check every member of a tarball and extract only its DB (or delta)")
+  sp.add_argument("artifact", help="snapshot-*.tar.gz / .tgz / .tar.zst")
+  sp.add_argument("--out", required=True, help="Dir to extract into (members keep their snapshot-*/ prefix)")
+  sp.add_argument("--db-out", default=None, help="Write lims.sqlite3 straight to this path instead")
+  sp.add_argument("--max-members", type=int, default=0, help="Refuse tarballs with more entries (0 = no cap)")
+  sp.add_argument("--max-total-bytes", type=int, default=0, help="Refuse tarballs unpacking to more (0 = no cap)")
+  sp.set_defaults(fn=cmd_extract)
+
+  sp = sub.add_parser("store-gc", help="Drop orphan store manifests and unreferenced blobs (dry-run unless --apply)")
+  sp.add_argument("--dir", required=True, help="Exports dir")
+  sp.add_argument("--pins-file", default=None, help="Pinned snapshots keep their manifests")
+  sp.add_argument("--gone", action="append", default=None, help="Snapshot being deleted in the same run (repeatable)")
+  sp.add_argument("--apply", action="store_true")
+  sp.set_defaults(fn=cmd_store_gc)
+
+  sp = sub.add_parser("checkout", help="Rebuild a snapshot dir from its store manifest")
+  sp.add_argument("name", help="Snapshot name (or artifact path)")
+  sp.add_argument("--dir", required=True, help="Exports dir")
+  sp.add_argument("--out", default=None, help="Target dir (default: <dir>/<name>)")
+  sp.set_defaults(fn=cmd_checkout)
+  return p
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  args = build_parser().parse_args(argv)
+  return int(args.fn(args))
+
+
+if __name__ == "__main__":
+  raise SystemExit(main())
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import contextlib
+import gzip
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple, Union
+
+# Snapshot artifact codecs.
+#
+#   gzip  snapshot-*.tar.gz   stdlib, single-threaded (default; what older snapshots use)
+#   zstd  snapshot-*.tar.zst  multi-threaded: the `zstandard` module if installed, else the
+#                             `zstd` binary (-T0); without either, exports fall back to gzip
+#
+# The codec is recorded in the manifest ("codec", tarball.codec) but readers go by the
+# file extension, so artifacts stay self-describing once copied out of the exports dir.
+#
+# Readers never unpack a whole artifact: extract_selected walks the stream once,
+# checks every member header (paths, types, size caps) and writes only the members a
+# tool asked for -- usually just lims.sqlite3 -- skipping the rest in the stream.
+
+DEFAULT_CODEC = "gzip"
+CODECS = ("gzip", "zstd")
+DEFAULT_LEVEL = {"gzip": 6, "zstd": 3}
+LEVEL_RANGE = {"gzip": (1, 9), "zstd": (1, 19)}
+EXTENSION = {"gzip": ".tar.gz", "zstd": ".tar.zst"}
+# Every artifact extension we read, in lookup preference order.
+ARTIFACT_EXTS = (".tar.gz", ".tgz", ".tar.zst")
+MEDIA_TYPE = {"gzip": "application/gzip", "zstd": "application/zstd"}
+
+try:
+  import zstandard as _zstd  # type: ignore[import-not-found]
+except ImportError:  # optional; the zstd binary is used instead
+  _zstd = None
+
+
+class CodecError(RuntimeError):
+  pass
+
+
+class UnsafeArchive(CodecError):
+  pass
+
+
+def codec_of(path: os.PathLike | str) -> Optional[str]:
+  name = os.fspath(path)
+  if name.endswith((".tar.gz", ".tgz")):
+    return "gzip"
+  if name.endswith(".tar.zst"):
+    return "zstd"
+  return None
+
+
+def strip_ext(name: str) -> str:
+  for ext in ARTIFACT_EXTS:
+    if name.endswith(ext):
+      return name[: -len(ext)]
+  return name
+
+
+def find_artifact(exports_dir: Path, name: str) -> Optional[Path]:
+  """<exports_dir>/<name>.tar.gz|.tgz|.tar.zst, whichever exists first."""
+  for ext in ARTIFACT_EXTS:
+    p = exports_dir / f"{name}{ext}"
+    if p.is_file():
+      return p
+  return None
+
+
+def zstd_backend() -> Optional[str]:
+  """"module", "binary" or None."""
+  if _zstd is not None:
+    return "module"
+  if shutil.which("zstd"):
+    return "binary"
+  return None
+
+
+def resolve(codec: Optional[str] = None, level: Optional[int] = None) -> Tuple[str, int, Optional[str]]:
+  """(codec, level, fallback_note) from arguments, SNAPSHOT_CODEC / SNAPSHOT_LEVEL and defaults.
+
+  SNAPSHOT_GZIP_LEVEL is still honoured for gzip. Raises CodecError on bad values.
+  """
+  codec = (codec or os.environ.get("SNAPSHOT_CODEC") or DEFAULT_CODEC).strip().lower()
+  if codec not in CODECS:
+    raise CodecError(f"unknown snapshot codec: {codec} (expected one of: {', '.join(CODECS)})")
+  note = None
+  if codec == "zstd" and zstd_backend() is None:
+    codec, note = "gzip", "zstd unavailable (no zstandard module or zstd binary); wrote gzip"
+    level = None
+  if level is None:
+    raw = os.environ.get("SNAPSHOT_LEVEL", "") or (os.environ.get("SNAPSHOT_GZIP_LEVEL", "") if codec == "gzip" else "")
+    try:
+      level = int(raw) if raw.strip() else DEFAULT_LEVEL[codec]
+    except ValueError:
+      raise CodecError(f"compression level must be an int: {raw!r}") from None
+  lo, hi = LEVEL_RANGE[codec]
+  if not lo <= int(level) <= hi:
+    raise CodecError(f"{codec} level must be {lo}..{hi}, got {level}")
+  return codec, int(level), note
+
+
+class _Pump(threading.Thread):
+  """Copy a child's stdout into a writer (keeps the pipe drained while we feed stdin)."""
+
+  def __init__(self, src: BinaryIO, dst: BinaryIO) -> None:
+    super().__init__(daemon=True)
+    self.src, self.dst, self.error = src, dst, None
+
+  def run(self) -> None:
+    try:
+      for chunk in iter(lambda: self.src.read(1024 * 1024), b""):
+        self.dst.write(chunk)
+    except BaseException as e:  # re-raised by the caller after join()
+      self.error = e
+
+
+@contextlib.contextmanager
+def compressor(raw: BinaryIO, codec: str, level: int) -> Iterator[BinaryIO]:
+  """Writable stream whose output lands, compressed, in raw (raw is not closed)."""
+  if codec == "gzip":
+    with gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=level) as gz:
+      yield gz  # type: ignore[misc]
+    return
+  if _zstd is not None:
+    cctx = _zstd.ZstdCompressor(level=level, threads=-1)
+    with cctx.stream_writer(raw, closefd=False) as w:
+      yield w
+    return
+  proc = subprocess.Popen(["zstd", "-q", "-c", f"-{level}", "-T0"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+  pump = _Pump(proc.stdout, raw)  # type: ignore[arg-type]
+  pump.start()
+  try:
+    yield proc.stdin  # type: ignore[misc]
+  finally:
+    proc.stdin.close()  # type: ignore[union-attr]
+    pump.join()
+    rc = proc.wait()
+  if pump.error is not None:
+    raise pump.error
+  if rc != 0:
+    raise CodecError(f"zstd exited with rc={rc}")
+
+
+@contextlib.contextmanager
+def decompressed(path: Path) -> Iterator[BinaryIO]:
+  """Readable stream of an artifact's tar bytes."""
+  codec = codec_of(path)
+  if codec == "gzip":
+    with gzip.open(path, "rb") as f:
+      yield f  # type: ignore[misc]
+    return
+  if codec != "zstd":
+    raise CodecError(f"not a snapshot artifact: {path}")
+  if _zstd is not None:
+    with open(path, "rb") as raw, _zstd.ZstdDecompressor().stream_reader(raw) as r:
+      yield r
+    return
+  if not shutil.which("zstd"):
+    raise CodecError(f"cannot read {path.name}: zstd support not available")
+  proc = subprocess.Popen(["zstd", "-q", "-d", "-c", str(path)], stdout=subprocess.PIPE)
+  try:
+    yield proc.stdout  # type: ignore[misc]
+  finally:
+    proc.stdout.close()  # type: ignore[union-attr]
+    proc.kill()
+    proc.wait()
+
+
+@contextlib.contextmanager
+def open_tar(path: Path) -> Iterator[tarfile.TarFile]:
+  """Stream-mode ("r|") TarFile over any artifact codec; members must be read in order."""
+  with decompressed(path) as f, tarfile.open(fileobj=f, mode="r|") as tf:
+    yield tf
+
+
+def check_member(m: tarfile.TarInfo) -> None:
+  """Reject absolute / `..` paths and anything but regular files and dirs (links, devices, fifos)."""
+  name = m.name
+  if name.startswith(("/", "\\")):
+    raise UnsafeArchive(f"unsafe paths in tarball (absolute): {name}")
+  if ".." in Path(name).parts:
+    raise UnsafeArchive(f"unsafe paths in tarball (path traversal): {name}")
+  if not (m.isfile() or m.isdir()):
+    raise UnsafeArchive(f"tarball contains symlinks/hardlinks/devices/pipes/sockets: {name}")
+
+
+def extract_selected(
+  path: Path,
+  dest: Path,
+  want: Callable[[str], Union[bool, Path]],
+  *,
+  stop: Optional[Callable[[List[str]], bool]] = None,
+  max_members: Optional[int] = None,
+  max_total_bytes: Optional[int] = None,
+) -> List[str]:
+  """Walk an artifact once and write only the members want(name) accepts to dest/<name>
+  (or, when want returns a Path, straight to that path, e.g. a restore's staging file).
+
+  Every member read is checked (check_member, plus the optional entry-count and unpacked
+  size caps) before anything of it is written; unwanted members are skipped in the stream,
+  never touching the disk. stop(extracted) ends the walk early once the caller has what
+  it needs (members after that are neither checked nor read); otherwise the stream is
+  read to its end, so the codec's checksum covers skipped members. Returns the extracted
+  member names in archive order (a name appears twice if the archive has it twice).
+  Raises UnsafeArchive or CodecError.
+  """
+  dest_r = dest.resolve()
+  out: List[str] = []
+  count = total = 0
+  try:
+    with decompressed(path) as raw, tarfile.open(fileobj=raw, mode="r|") as tf:
+      for m in tf:
+        count += 1
+        if max_members is not None and count > max_members:
+          raise UnsafeArchive(f"tarball too large (more than {max_members} entries)")
+        total += max(0, m.size)
+        if max_total_bytes is not None and total > max_total_bytes:
+          raise UnsafeArchive(f"tarball uncompressed total too large (> {max_total_bytes} bytes)")
+        check_member(m)
+        to = want(m.name) if m.isfile() else False
+        if not isinstance(to, Path) and not to:
+          continue
+        if isinstance(to, Path):
+          target = to
+        else:
+          target = (dest_r / m.name).resolve()
+          if target == dest_r or dest_r not in target.parents:
+            raise UnsafeArchive(f"unsafe paths in tarball (escapes dest): {m.name}")
+        src = tf.extractfile(m)
+        if src is None:
+          continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with src, open(target, "wb") as f:
+          shutil.copyfileobj(src, f, 1024 * 1024)
+        out.append(m.name)
+        if stop is not None and stop(out):
+          break
+      else:
+        # tarfile stops at the end-of-archive blocks; read on to the end of the stream
+        # so the codec checks its trailer (gzip CRC and length) over skipped members too.
+        while raw.read(1024 * 1024):
+          pass
+  except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+    raise CodecError(f"corrupt artifact: {e}") from None
+  return out
@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import struct
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import snapshot_codec
+
+# Page-level incremental snapshots.
+#
+# A SQLite file is a sequence of fixed-size pages, and the online backup API
+# copies them verbatim, so two backups of the same DB differ only in the pages
+# that were written in between. An incremental snapshot stores just those pages:
+#
+#   lims.sqlite3.delta   MAGIC, then records (u32 page_no, page bytes) for every
+#                        page that differs from the base image, then a JSON
+#                        trailer, u32 trailer length and MAGIC again
+#   pages.idx            per-page digests of this snapshot's full image (every
+#                        snapshot has one, so the next delta is computed
+#                        without reconstructing the base)
+#
+# The trailer names the base snapshot (by dir name, looked up next to the
+# snapshot as a dir or a tarball) and carries the sha256 of both the base and
+# the reconstructed image, so every link in a chain is checked as it is applied.
+
+DB_NAME = "lims.sqlite3"
+DELTA_NAME = "lims.sqlite3.delta"
+INDEX_NAME = "pages.idx"
+
+MAGIC = b"NXPGDLT1"
+_INDEX_MAGIC = b"NXPGIDX1"
+_DIGEST_SIZE = 16
+_REC = struct.Struct(">I")
+_TRAILER_LEN = struct.Struct(">I")
+MAX_CHAIN_DEPTH = 256
+
+
+class DeltaError(RuntimeError):
+  pass
+
+
+def _page_size(path: Path) -> int:
+  with open(path, "rb") as f:
+    hdr = f.read(100)
+  if len(hdr) < 100 or not hdr.startswith(b"SQLite format 3\x00"):
+    raise DeltaError(f"not a SQLite database: {path}")
+  n = struct.unpack(">H", hdr[16:18])[0]
+  return 65536 if n == 1 else n
+
+
+def _pages(path: Path, page_size: int) -> Iterator[bytes]:
+  with open(path, "rb") as f:
+    while True:
+      b = f.read(page_size)
+      if not b:
+        return
+      yield b
+
+
+def _digest(page: bytes) -> bytes:
+  return hashlib.blake2b(page, digest_size=_DIGEST_SIZE).digest()
+
+
+def page_index(db_file: Path) -> Tuple[int, List[bytes], str]:
+  """(page_size, per-page digests, sha256 of the file) in one sequential read."""
+  ps = _page_size(db_file)
+  sha = hashlib.sha256()
+  digests = []
+  for page in _pages(db_file, ps):
+    sha.update(page)
+    digests.append(_digest(page))
+  return ps, digests, sha.hexdigest()
+
+
+def write_index(path: Path, page_size: int, digests: Sequence[bytes]) -> None:
+  tmp = path.with_name(f".{path.name}.tmp")
+  with open(tmp, "wb") as f:
+    f.write(_INDEX_MAGIC + struct.pack(">II", page_size, len(digests)))
+    for d in digests:
+      f.write(d)
+  os.replace(tmp, path)
+
+
+def _parse_index(data: bytes) -> Tuple[int, List[bytes]]:
+  if not data.startswith(_INDEX_MAGIC) or len(data) < 16:
+    raise DeltaError("bad page index")
+  ps, n = struct.unpack(">II", data[8:16])
+  body = data[16:]
+  if len(body) != n * _DIGEST_SIZE:
+    raise DeltaError("truncated page index")
+  return ps, [body[i * _DIGEST_SIZE:(i + 1) * _DIGEST_SIZE] for i in range(n)]
+
+
+def read_index(path: Path) -> Tuple[int, List[bytes]]:
+  return _parse_index(path.read_bytes())
+
+
+def write_delta(
+  full_db: Path,
+  base_index: Tuple[int, Sequence[bytes]],
+  out: Path,
+  *,
+  base: str,
+  base_db_sha256: str,
+  depth: int,
+) -> Dict[str, Any]:
+  """Write out (a delta of full_db against base_index) and out's sibling pages.idx.
+
+  Returns the trailer dict (includes db_sha256 of full_db and pages_changed).
+  """
+  base_ps, base_digests = base_index
+  ps = _page_size(full_db)
+  if ps != base_ps:
+    raise DeltaError(f"page size changed since base ({base_ps} -> {ps}); take a full snapshot")
+  sha = hashlib.sha256()
+  digests: List[bytes] = []
+  changed = 0
+  tmp = out.with_name(f".{out.name}.tmp")
+  with open(tmp, "wb") as f:
+    f.write(MAGIC)
+    for no, page in enumerate(_pages(full_db, ps), start=1):
+      sha.update(page)
+      d = _digest(page)
+      digests.append(d)
+      if no > len(base_digests) or base_digests[no - 1] != d:
+        f.write(_REC.pack(no))
+        f.write(page)
+        changed += 1
+    trailer = {
+      "format": "page_delta",
+      "version": 1,
+      "base": base,
+      "base_db_sha256": base_db_sha256,
+      "db_sha256": sha.hexdigest(),
+      "page_size": ps,
+      "page_count": len(digests),
+      "pages_changed": changed,
+      "depth": depth,
+    }
+    raw = json.dumps(trailer, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    f.write(raw + _TRAILER_LEN.pack(len(raw)) + MAGIC)
+  os.replace(tmp, out)
+  write_index(out.with_name(INDEX_NAME), ps, digests)
+  return trailer
+
+
+def _trailer_from_tail(tail: bytes) -> Dict[str, Any]:
+  if len(tail) < 12 or tail[-8:] != MAGIC:
+    raise DeltaError("not a page delta (bad trailer magic)")
+  n = _TRAILER_LEN.unpack(tail[-12:-8])[0]
+  if n + 12 > len(tail):
+    raise DeltaError("truncated page delta trailer")
+  return json.loads(tail[-12 - n:-12].decode("utf-8"))
+
+
+def read_trailer(path: Path) -> Dict[str, Any]:
+  with open(path, "rb") as f:
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(max(0, size - 65536))
+    tail = f.read()
+  return _trailer_from_tail(tail)
+
+
+def apply_delta(delta: Path, target: Path) -> Dict[str, Any]:
+  """Patch target (holding the base image) in place into the delta's image; checks both sha256s."""
+  trailer = read_trailer(delta)
+  ps = int(trailer["page_size"])
+  h = hashlib.sha256()
+  with open(target, "rb") as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+      h.update(chunk)
+  if h.hexdigest() != trailer["base_db_sha256"]:
+    raise DeltaError(f"base image does not match delta ({trailer['base']})")
+  size = os.path.getsize(delta)
+  raw_len = _TRAILER_LEN.unpack(_read_at(delta, size - 12, 4))[0]
+  end = size - 12 - raw_len
+  with open(delta, "rb") as src, open(target, "r+b") as dst:
+    if src.read(len(MAGIC)) != MAGIC:
+      raise DeltaError("not a page delta (bad magic)")
+    while src.tell() < end:
+      no = _REC.unpack(src.read(_REC.size))[0]
+      page = src.read(ps)
+      if len(page) != ps:
+        raise DeltaError("truncated page record")
+      dst.seek((no - 1) * ps)
+      dst.write(page)
+    dst.truncate(int(trailer["page_count"]) * ps)
+  h = hashlib.sha256()
+  with open(target, "rb") as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+      h.update(chunk)
+  if h.hexdigest() != trailer["db_sha256"]:
+    raise DeltaError("reconstructed image sha256 mismatch")
+  return trailer
+
+
+def _read_at(path: Path, off: int, n: int) -> bytes:
+  with open(path, "rb") as f:
+    f.seek(off)
+    return f.read(n)
+
+
+# -----------------
+# Locating snapshots (dir or tarball) by name
+# -----------------
+
+def _extract_members(tarball: Path, snap: str, wanted: Sequence[str], work: Path) -> List[str]:
+  """Stream-extract <snap>/<w> for w in wanted into work/<snap>/<w>; returns the ones found.
+
+  Stops reading once the DB member (lims.sqlite3 or .delta) and, if wanted, pages.idx
+  are out; the exporter writes top-level files first, so the rest of the stream is skipped.
+  """
+  names = {f"{snap}/{w}": w for w in wanted}
+
+  def done(got: List[str]) -> bool:
+    found = [names[n] for n in got]
+    has_db = DB_NAME in found or DELTA_NAME in found
+    return has_db and (INDEX_NAME in found or INDEX_NAME not in wanted)
+
+  try:
+    got = snapshot_codec.extract_selected(tarball, work, lambda n: n in names, stop=done)
+  except snapshot_codec.CodecError as e:
+    raise DeltaError(f"{tarball.name}: {e}") from None
+  return [names[n] for n in got]
+
+
+def locate(name: str, search_dirs: Sequence[Path], work: Path, *, with_index: bool = False) -> Path:
+  """Dir holding <name>'s lims.sqlite3 or lims.sqlite3.delta (+ pages.idx when asked).
+
+  Prefers an on-disk snapshot dir; otherwise pulls just those members out of
+  its artifact (<name>.tar.gz / .tgz / .tar.zst) into work/<name>/.
+  """
+  if "/" in name or name.startswith("."):
+    raise DeltaError(f"refusing suspicious snapshot name: {name!r}")
+  for d in search_dirs:
+    sd = d / name
+    if (sd / DB_NAME).is_file() or (sd / DELTA_NAME).is_file():
+      return sd
+  for d in search_dirs:
+    tb = snapshot_codec.find_artifact(d, name)
+    if tb is not None:
+      dest = work / name
+      wanted = [DB_NAME, DELTA_NAME] + ([INDEX_NAME] if with_index else [])
+      found = _extract_members(tb, name, wanted, work)
+      if DB_NAME in found or DELTA_NAME in found:
+        return dest
+  raise DeltaError(f"base snapshot not found: {name} (searched {', '.join(str(d) for d in search_dirs)})")
+
+
+def is_delta_dir(snap_dir: Path) -> bool:
+  return (snap_dir / DELTA_NAME).is_file() and not (snap_dir / DB_NAME).is_file()
+
+
+def chain(snap_dir: Path, search_dirs: Sequence[Path], work: Path) -> List[Path]:
+  """[snap_dir, base, base-of-base, ..., full] as located dirs; the last holds a full lims.sqlite3."""
+  out = [snap_dir]
+  cur = snap_dir
+  seen = set()
+  while is_delta_dir(cur):
+    trailer = read_trailer(cur / DELTA_NAME)
+    base = str(trailer["base"])
+    if base in seen or len(out) > MAX_CHAIN_DEPTH:
+      raise DeltaError(f"snapshot chain is cyclic or too deep at {base}")
+    seen.add(base)
+    cur = locate(base, search_dirs, work)
+    out.append(cur)
+  return out
+
+
+def materialize(
+  snap_dir: Path,
+  out: Path,
+  *,
+  search_dirs: Optional[Sequence[Path]] = None,
+  work: Optional[Path] = None,
+) -> Dict[str, Any]:
+  """Write snap_dir's full DB image to out, resolving an incremental chain if needed.
+
+  Bases are looked up by name in search_dirs (default: snap_dir's parent).
+  Returns {"chain": [names, newest first], "db_sha256": ...}.
+  """
+  dirs = list(search_dirs) if search_dirs else [snap_dir.parent]
+  work = work if work is not None else out.parent / f".{out.name}.chain"
+  work.mkdir(parents=True, exist_ok=True)
+  try:
+    links = chain(snap_dir, dirs, work)
+    tmp = out.with_name(f".{out.name}.tmp")
+    shutil.copyfile(links[-1] / DB_NAME, tmp)
+    sha = None
+    try:
+      for link in reversed(links[:-1]):
+        sha = apply_delta(link / DELTA_NAME, tmp)["db_sha256"]
+      os.replace(tmp, out)
+    except BaseException:
+      tmp.unlink(missing_ok=True)
+      raise
+  finally:
+    shutil.rmtree(work, ignore_errors=True)
+  if sha is None:
+    sha = _sha256_file(out)
+  return {"chain": [_name_of(p, snap_dir) for p in links], "db_sha256": sha}
+
+
+def _sha256_file(p: Path) -> str:
+  h = hashlib.sha256()
+  with open(p, "rb") as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+      h.update(chunk)
+  return h.hexdigest()
+
+
+def _name_of(p: Path, snap_dir: Path) -> str:
+  return snap_dir.name if p == snap_dir else p.name
+
+
+def base_index(snap_dir: Path, search_dirs: Sequence[Path], work: Path) -> Tuple[int, List[bytes], str, int]:
+  """(page_size, digests, db_sha256, depth) for a snapshot to be used as a delta base."""
+  if (snap_dir / INDEX_NAME).is_file() and (snap_dir / DB_NAME).is_file():
+    ps, digests = read_index(snap_dir / INDEX_NAME)
+    return ps, digests, _sha256_file(snap_dir / DB_NAME), 0
+  if (snap_dir / INDEX_NAME).is_file() and is_delta_dir(snap_dir):
+    ps, digests = read_index(snap_dir / INDEX_NAME)
+    t = read_trailer(snap_dir / DELTA_NAME)
+    return ps, digests, str(t["db_sha256"]), int(t.get("depth", 1))
+  # Older snapshots have no index: hash the (reconstructed) image once.
+  img = work / f"{snap_dir.name}.base.sqlite3"
+  res = materialize(snap_dir, img, search_dirs=search_dirs, work=work / "chain")
+  ps, digests, sha = page_index(img)
+  img.unlink(missing_ok=True)
+  return ps, digests, sha, len(res["chain"]) - 1
+
+
+def bases_of(name: str, search_dirs: Sequence[Path], work: Path) -> List[str]:
+  """Transitive base names of snapshot `name` ([] for a full snapshot or if it can't be read)."""
+  out: List[str] = []
+  cur = name
+  while len(out) <= MAX_CHAIN_DEPTH:
+    try:
+      sd = locate(cur, search_dirs, work)
+    except DeltaError:
+      break
+    if not is_delta_dir(sd):
+      break
+    try:
+      cur = str(read_trailer(sd / DELTA_NAME)["base"])
+    except (DeltaError, ValueError, KeyError):
+      break
+    if cur in out:
+      break
+    out.append(cur)
+  return out
@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import snapshot_codec
+
+# Snapshot index (EXPORTS_DIR/.snapshot_index.jsonl): what `snapshot latest`, prune,
+# gc and GET /exports/latest read instead of listing and stat()ing the exports dir.
+#
+#   {"schema": "nexus_snapshot_index", "schema_version": 1, "nested": false}   header
+#   {"op": "put", "path": "snapshot-X.tar.gz", "name": "snapshot-X", "ts": "...Z",
+#    "size": N, "mtime_ns": N, "sha256": "...", "codec": "gzip", "pinned": false}
+#   {"op": "del", "path": "snapshot-X.tar.gz"}
+#
+# path is relative to the index's dir; "nested" indexes (exports/api, one export dir per
+# request) hold snapshot-<rand>/snapshot-X.tar.gz paths. Exporters append one line per
+# tarball (a single O_APPEND write); readers fold the lines in order. Rebuilds, and
+# compaction once superseded lines pile up, write a temp file and os.replace it. Writers
+# serialize on an flock of the exports dir.
+#
+# Drift: a tarball copied in or deleted by hand changes the directory's mtime, and
+# editing the pins file changes its own; while the index is at least as new as both
+# it is trusted as-is. Otherwise readers rebuild it from a scan, reusing recorded
+# sha256 values whose size and mtime still match, so only new tarballs are hashed.
+
+INDEX_NAME = ".snapshot_index.jsonl"
+SCHEMA = "nexus_snapshot_index"
+PINS_NAME = ".snapshot_pins"
+
+_cache_lock = threading.Lock()
+# index path -> (freshness key, header, entries); lets a long-running API answer from memory.
+_cache: Dict[str, Tuple[Tuple[int, ...], Dict[str, Any], Dict[str, Dict[str, Any]]]] = {}
+
+
+def index_path(exports_dir: Path) -> Path:
+  return Path(exports_dir) / INDEX_NAME
+
+
+def pins_path(exports_dir: Path) -> Path:
+  env = os.environ.get("SNAPSHOT_PINS_FILE", "").strip()
+  return Path(env) if env else Path(exports_dir) / PINS_NAME
+
+
+def read_pins(path: Path) -> List[str]:
+  try:
+    text = path.read_text(encoding="utf-8")
+  except OSError:
+    return []
+  out = []
+  for line in text.splitlines():
+    line = line.split("#", 1)[0].strip()
+    if line:
+      out.append(line)
+  return out
+
+
+def _sha256_file(p: Path) -> str:
+  h = hashlib.sha256()
+  with p.open("rb") as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+      h.update(chunk)
+  return h.hexdigest()
+
+
+def _mtime_ns(p: Path) -> int:
+  try:
+    return os.stat(p).st_mtime_ns
+  except OSError:
+    return 0
+
+
+@contextlib.contextmanager
+def _locked(exports_dir: Path) -> Iterator[None]:
+  import fcntl
+
+  # flock on the directory itself: rewrites replace the index inode, and a lock file
+  # would be one more thing in the exports dir.
+  fd = os.open(exports_dir, os.O_RDONLY)
+  try:
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    yield
+  finally:
+    os.close(fd)
+
+
+def _parse(path: Path) -> Tuple[Optional[Dict[str, Any]], Dict[str, Dict[str, Any]], int]:
+  """(header or None, entries by path, number of lines)."""
+  header: Optional[Dict[str, Any]] = None
+  entries: Dict[str, Dict[str, Any]] = {}
+  n = 0
+  with path.open(encoding="utf-8") as f:
+    for line in f:
+      n += 1
+      try:
+        rec = json.loads(line)
+      except ValueError:
+        continue  # a torn tail line from a crashed writer
+      if not isinstance(rec, dict):
+        continue
+      if rec.get("schema") == SCHEMA:
+        header = rec
+      elif rec.get("op") == "put" and isinstance(rec.get("path"), str):
+        entries[rec["path"]] = {k: v for k, v in rec.items() if k != "op"}
+      elif rec.get("op") == "del":
+        entries.pop(rec.get("path"), None)
+  return header, entries, n
+
+
+def _write(exports_dir: Path, header: Dict[str, Any], entries: Dict[str, Dict[str, Any]]) -> None:
+  path = index_path(exports_dir)
+  tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+  lines = [json.dumps(header, sort_keys=True)]
+  lines += [json.dumps(dict(op="put", **e), sort_keys=True) for _p, e in sorted(entries.items())]
+  tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+  os.replace(tmp, path)
+  # The rename bumped the dir mtime; the index must not look older than it.
+  os.utime(path)
+
+
+def _append(exports_dir: Path, recs: Iterable[Dict[str, Any]]) -> None:
+  data = "".join(json.dumps(r, sort_keys=True) + "\n" for r in recs).encode("utf-8")
+  fd = os.open(index_path(exports_dir), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+  try:
+    os.write(fd, data)
+  finally:
+    os.close(fd)
+
+
+def _scan(exports_dir: Path, nested: bool) -> List[Tuple[str, Path]]:
+  out: List[Tuple[str, Path]] = []
+  with os.scandir(exports_dir) as it:
+    for de in it:
+      if not de.name.startswith("snapshot-"):
+        continue
+      if de.is_file(follow_symlinks=False) and snapshot_codec.codec_of(de.name) is not None:
+        out.append((de.name, Path(de.path)))
+      elif nested and de.is_dir(follow_symlinks=False):
+        with os.scandir(de.path) as sub:
+          for se in sub:
+            if se.name.startswith("snapshot-") and se.is_file(follow_symlinks=False) \
+                and snapshot_codec.codec_of(se.name) is not None:
+              out.append((f"{de.name}/{se.name}", Path(se.path)))
+  return out
+
+
+def _entry(rel: str, p: Path, *, sha256: Optional[str] = None, ts: Optional[str] = None,
+           pins: Iterable[str] = ()) -> Dict[str, Any]:
+  st = p.stat()
+  name = snapshot_codec.strip_ext(p.name)
+  return {
+    "path": rel,
+    "name": name,
+    "ts": ts or _ts_of(name),
+    "size": st.st_size,
+    "mtime_ns": st.st_mtime_ns,
+    "sha256": sha256 or _sha256_file(p),
+    "codec": snapshot_codec.codec_of(p.name),
+    "pinned": p.name in set(pins),
+  }
+
+
+def _ts_of(name: str) -> Optional[str]:
+  """snapshot-20250101-120000Z[-N] -> 2025-01-01T12:00:00Z (None if the name carries no timestamp)."""
+  parts = name[len("snapshot-"):].split("-")
+  if len(parts) < 2 or len(parts[0]) != 8 or len(parts[1]) != 7 or not parts[1].endswith("Z"):
+    return None
+  d, t = parts[0], parts[1]
+  return f"{d[0:4]}-{d[4:6]}-{d[6:8]}T{t[0:2]}:{t[2:4]}:{t[4:6]}Z"
+
+
+def rebuild(exports_dir: Path, *, nested: Optional[bool] = None) -> Dict[str, Any]:
+  """Rescan exports_dir and rewrite its index. Returns {"entries", "added", "removed", "changed"}."""
+  exports_dir = Path(exports_dir)
+  with _locked(exports_dir):
+    return _rebuild_locked(exports_dir, nested)
+
+
+def _rebuild_locked(exports_dir: Path, nested: Optional[bool]) -> Dict[str, Any]:
+  path = index_path(exports_dir)
+  header: Optional[Dict[str, Any]] = None
+  old: Dict[str, Dict[str, Any]] = {}
+  if path.is_file():
+    header, old, _n = _parse(path)
+  if nested is None:
+    nested = bool((header or {}).get("nested"))
+  header = {"schema": SCHEMA, "schema_version": 1, "nested": nested}
+  pins = read_pins(pins_path(exports_dir))
+  entries: Dict[str, Dict[str, Any]] = {}
+  changed = 0
+  for rel, p in _scan(exports_dir, nested):
+    try:
+      st = p.stat()
+    except OSError:
+      continue
+    prev = old.get(rel)
+    if prev and (prev.get("size"), prev.get("mtime_ns")) == (st.st_size, st.st_mtime_ns) and prev.get("sha256"):
+      e = _entry(rel, p, sha256=prev["sha256"], ts=prev.get("ts"), pins=pins)
+    else:
+      e = _entry(rel, p, pins=pins)
+      if prev:
+        changed += 1
+    entries[rel] = e
+  _write(exports_dir, header, entries)
+  return {
+    "entries": len(entries),
+    "added": sorted(set(entries) - set(old)),
+    "removed": sorted(set(old) - set(entries)),
+    "changed": changed,
+  }
+
+
+def _freshness(exports_dir: Path) -> Tuple[int, ...]:
+  st = os.stat(index_path(exports_dir))
+  return (st.st_mtime_ns, st.st_size, st.st_ino, _mtime_ns(exports_dir), _mtime_ns(pins_path(exports_dir)))
+
+
+def _is_fresh(key: Tuple[int, ...]) -> bool:
+  idx_mtime, _size, _ino, dir_mtime, pins_mtime = key
+  return idx_mtime >= dir_mtime and idx_mtime >= pins_mtime
+
+
+def entries(exports_dir: Path, *, nested: Optional[bool] = None) -> List[Dict[str, Any]]:
+  """Indexed tarballs, newest first (by file name, as `sort -r` orders them).
+
+  Rebuilds the index first when it is missing or has drifted (see above); when the
+  exports dir is not writable the rescan is used without being saved.
+  """
+  exports_dir = Path(exports_dir)
+  if not exports_dir.is_dir():
+    return []
+  path = index_path(exports_dir)
+  key: Optional[Tuple[int, ...]] = None
+  try:
+    key = _freshness(exports_dir)
+  except OSError:
+    pass
+  if key is not None and _is_fresh(key):
+    with _cache_lock:
+      hit = _cache.get(str(path))
+    if hit is not None and hit[0] == key:
+      return _ordered(hit[2])
+    header, ents, _n = _parse(path)
+    if header is not None and (nested is None or bool(header.get("nested")) == nested):
+      with _cache_lock:
+        _cache[str(path)] = (key, header, ents)
+      return _ordered(ents)
+  try:
+    rebuild(exports_dir, nested=nested)
+  except OSError:
+    # Read-only exports dir: answer from a scan (hashing is skipped; nothing is saved).
+    return _ordered({rel: {"path": rel, "name": snapshot_codec.strip_ext(p.name), "ts": _ts_of(snapshot_codec.strip_ext(p.name)),
+                           "size": p.stat().st_size, "sha256": None, "codec": snapshot_codec.codec_of(p.name),
+                           "pinned": p.name in set(read_pins(pins_path(exports_dir)))}
+                     for rel, p in _scan(exports_dir, bool(nested))})
+  header, ents, _n = _parse(path)
+  with _cache_lock:
+    _cache[str(path)] = (_freshness(exports_dir), header or {}, ents)
+  return _ordered(ents)
+
+
+def _ordered(ents: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+  return sorted(ents.values(), key=lambda e: (Path(e["path"]).name, e.get("ts") or "", e.get("mtime_ns") or 0, e["path"]), reverse=True)
+
+
+def latest(exports_dir: Path, n: int = 1, *, nested: Optional[bool] = None) -> Optional[Path]:
+  """Path of the n-th newest tarball (1 = newest), or None."""
+  hit = latest_entry(exports_dir, n, nested=nested)
+  return hit[0] if hit is not None else None
+
+
+def latest_entry(exports_dir: Path, n: int = 1, *, nested: Optional[bool] = None) -> Optional[Tuple[Path, Dict[str, Any]]]:
+  """(path, index entry) of the n-th newest tarball, or None.
+
+  The entry's size and mtime are checked against the file, so its sha256 can stand for
+  the bytes on disk (GET /exports/latest serves it as the ETag). A tarball that went
+  missing or was rewritten without the dir changing (e.g. inside a nested export dir)
+  triggers one rebuild.
+  """
+  for attempt in (0, 1):
+    ents = entries(exports_dir, nested=nested)
+    if len(ents) < n:
+      return None
+    e = ents[n - 1]
+    p = Path(exports_dir) / e["path"]
+    try:
+      st = p.stat()
+    except OSError:
+      st = None
+    if st is not None and (e.get("size"), e.get("mtime_ns")) == (st.st_size, st.st_mtime_ns):
+      return p, e
+    if attempt == 0:
+      try:
+        rebuild(exports_dir, nested=nested)
+      except OSError:
+        pass
+    elif st is not None:
+      # Read-only dir: the scan carries no hash to vouch for the file.
+      return p, dict(e, size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=None)
+  return None
+
+
+def is_fresh(exports_dir: Path) -> bool:
+  """True if the index exists and nothing changed the dir or the pins file since it was written."""
+  try:
+    return _is_fresh(_freshness(Path(exports_dir)))
+  except OSError:
+    return False
+
+
+def record(exports_dir: Path, tarball: Path, *, fresh: bool, sha256: Optional[str] = None,
+           ts: Optional[str] = None, nested: bool = False) -> None:
+  """Add the entry for a tarball just written under exports_dir.
+
+  fresh: is_fresh(exports_dir) as seen *before* the export touched the dir. The export's
+  own files make the dir newer than the index, so an append would also hide any drift
+  from before it; in that case (or without an index) the index is rebuilt instead.
+  """
+  exports_dir = Path(exports_dir)
+  rel = Path(tarball).resolve().relative_to(exports_dir.resolve()).as_posix()
+  with _locked(exports_dir):
+    if not fresh or not index_path(exports_dir).is_file():
+      _rebuild_locked(exports_dir, None if index_path(exports_dir).is_file() else nested)
+      return
+    e = _entry(rel, Path(tarball), sha256=sha256, ts=ts, pins=read_pins(pins_path(exports_dir)))
+    _append(exports_dir, [dict(op="put", **e)])
+    _maybe_compact(exports_dir)
+
+
+def drop(exports_dir: Path, rels: Iterable[str]) -> None:
+  """Record tarballs (paths relative to exports_dir) deleted by prune / gc."""
+  exports_dir = Path(exports_dir)
+  rels = [r for r in rels if r]
+  if not rels or not index_path(exports_dir).is_file():
+    return
+  with _locked(exports_dir):
+    _append(exports_dir, [{"op": "del", "path": r} for r in rels])
+    _maybe_compact(exports_dir)
+
+
+def _maybe_compact(exports_dir: Path) -> None:
+  header, ents, n = _parse(index_path(exports_dir))
+  if n > 2 * len(ents) + 64:
+    _write(exports_dir, header or {"schema": SCHEMA, "schema_version": 1, "nested": False}, ents)
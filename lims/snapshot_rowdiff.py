@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+# Row-level snapshot diff (`snapshot diff A B --rows`).
+#
+# Each table is read from both DBs through one cursor per side in primary-key order
+# and merge-joined, so memory is bounded by a fetchmany() batch per side however big
+# the DBs are. With jobs > 1 a large table is cut into primary-key ranges (bounds taken
+# from A) that worker processes diff into temp files; the parent concatenates them in
+# range order, so the output is the same as a serial run.
+#
+# NDJSON line types, in order:
+#   {"type": "header", "schema": "nexus_snapshot_rowdiff", "schema_version": 1, "a": ..., "b": ..., "tables": [...]}
+#   {"type": "row", "table": T, "op": "insert", "key": {...}, "row": {...}}        -- only in B
+#   {"type": "row", "table": T, "op": "delete", "key": {...}, "row": {...}}        -- only in A
+#   {"type": "row", "table": T, "op": "update", "key": {...}, "changes": {col: [a, b]}}
+#   {"type": "table", "table": T, "inserted": N, "deleted": N, "updated": N, "unchanged": N, ...}
+#   {"type": "end", "inserted": N, "deleted": N, "updated": N}   -- absent if the diff was cut short
+#
+# Columns that exist on one side only (a migration in between) are reported on the
+# table line and compared as null on the other side.
+
+SCHEMA = "nexus_snapshot_rowdiff"
+DEFAULT_TABLES = ("samples", "containers", "sample_events", "container_kind_defaults")
+BATCH = 1000
+# Below this many rows per range a table is not worth splitting across processes.
+MIN_RANGE_ROWS = 20000
+
+
+class RowDiffError(RuntimeError):
+  pass
+
+
+def connect_ro(path: Path) -> sqlite3.Connection:
+  return sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+
+
+def _quote(name: str) -> str:
+  return '"' + name.replace('"', '""') + '"'
+
+
+def _table_info(conn: sqlite3.Connection, table: str) -> Tuple[List[str], List[str]]:
+  """(columns, primary-key columns); ([], []) when the table does not exist."""
+  rows = conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+  cols = [r[1] for r in rows]
+  pk = [r[1] for r in sorted((r for r in rows if r[5]), key=lambda r: r[5])]
+  return cols, pk
+
+
+def _sort_key(v: Any) -> Tuple[int, Any]:
+  # SQLite's ORDER BY across storage classes: NULL < numbers < TEXT < BLOB (BINARY
+  # collation, which orders TEXT like Python's str: by code point).
+  if v is None:
+    return (0, 0)
+  if isinstance(v, (int, float)):
+    return (1, v)
+  if isinstance(v, str):
+    return (2, v)
+  return (3, bytes(v))
+
+
+def _jsonable(v: Any) -> Any:
+  return {"$blob": bytes(v).hex()} if isinstance(v, (bytes, bytearray, memoryview)) else v
+
+
+def _plan(a: sqlite3.Connection, b: sqlite3.Connection, table: str) -> Optional[Dict[str, Any]]:
+  a_cols, a_pk = _table_info(a, table)
+  b_cols, b_pk = _table_info(b, table)
+  if not a_cols and not b_cols:
+    return None
+  if a_cols and b_cols and a_pk != b_pk:
+    raise RowDiffError(f"{table}: primary key differs between snapshots ({a_pk} vs {b_pk})")
+  pk = (a_pk or b_pk) or ["rowid"]
+  cols = list(a_cols) + [c for c in b_cols if c not in a_cols]
+  return {
+    "table": table,
+    "pk": pk,
+    "columns": cols,
+    "a_columns": a_cols,
+    "b_columns": b_cols,
+  }
+
+
+def _select(plan: Dict[str, Any], side_cols: List[str], lo: Any, hi: Any) -> Tuple[str, List[Any]]:
+  pk = plan["pk"]
+  pk_sql = ", ".join(_quote(c) if c != "rowid" else "rowid" for c in pk)
+  cols = ", ".join(_quote(c) for c in side_cols)
+  where, params = [], []
+  if lo is not None:
+    where.append(f"{_quote(pk[0])} >= ?")
+    params.append(lo)
+  if hi is not None:
+    where.append(f"{_quote(pk[0])} < ?")
+    params.append(hi)
+  sql = f"SELECT {pk_sql}, {cols} FROM {_quote(plan['table'])}"
+  if where:
+    sql += " WHERE " + " AND ".join(where)
+  return sql + f" ORDER BY {pk_sql}", params
+
+
+def _rows(conn: sqlite3.Connection, plan: Dict[str, Any], side_cols: List[str], lo: Any, hi: Any) -> Iterator[Tuple[Tuple[Any, ...], Dict[str, Any]]]:
+  if not side_cols:
+    return
+  n = len(plan["pk"])
+  sql, params = _select(plan, side_cols, lo, hi)
+  cur = conn.execute(sql, params)
+  while True:
+    batch = cur.fetchmany(BATCH)
+    if not batch:
+      return
+    for r in batch:
+      yield tuple(r[:n]), dict(zip(side_cols, r[n:]))
+
+
+def _diff_range(a_db: str, b_db: str, plan: Dict[str, Any], lo: Any, hi: Any, out: TextIO) -> Dict[str, int]:
+  """Merge-join one primary-key range of one table, writing row lines to out."""
+  a = connect_ro(Path(a_db))
+  b = connect_ro(Path(b_db))
+  table, pk, cols = plan["table"], plan["pk"], plan["columns"]
+  counts = {"inserted": 0, "deleted": 0, "updated": 0, "unchanged": 0}
+
+  def emit(op: str, key: Tuple[Any, ...], **extra: Any) -> None:
+    doc = {"type": "row", "table": table, "op": op, "key": {c: _jsonable(v) for c, v in zip(pk, key)}}
+    doc.update(extra)
+    out.write(json.dumps(doc, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+  def full(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {c: _jsonable(row[c]) for c in cols if c in row}
+
+  try:
+    ia = _rows(a, plan, plan["a_columns"], lo, hi)
+    ib = _rows(b, plan, plan["b_columns"], lo, hi)
+    ra, rb = next(ia, None), next(ib, None)
+    while ra is not None or rb is not None:
+      ka = tuple(_sort_key(v) for v in ra[0]) if ra is not None else None
+      kb = tuple(_sort_key(v) for v in rb[0]) if rb is not None else None
+      if rb is None or (ra is not None and ka < kb):
+        emit("delete", ra[0], row=full(ra[1]))
+        counts["deleted"] += 1
+        ra = next(ia, None)
+      elif ra is None or kb < ka:
+        emit("insert", rb[0], row=full(rb[1]))
+        counts["inserted"] += 1
+        rb = next(ib, None)
+      else:
+        if ra[1] == rb[1]:
+          counts["unchanged"] += 1
+        else:
+          changes = {
+            c: [_jsonable(ra[1].get(c)), _jsonable(rb[1].get(c))]
+            for c in cols
+            if ra[1].get(c) != rb[1].get(c)
+          }
+          if changes:
+            emit("update", ra[0], changes=changes)
+            counts["updated"] += 1
+          else:  # only a column added/dropped as null
+            counts["unchanged"] += 1
+        ra, rb = next(ia, None), next(ib, None)
+  finally:
+    a.close()
+    b.close()
+  return counts
+
+
+def _diff_range_to_file(a_db: str, b_db: str, plan: Dict[str, Any], lo: Any, hi: Any, path: str) -> Dict[str, int]:
+  with open(path, "w", encoding="utf-8") as f:
+    return _diff_range(a_db, b_db, plan, lo, hi, f)
+
+
+def _ranges(conn: sqlite3.Connection, plan: Dict[str, Any], jobs: int) -> List[Tuple[Any, Any]]:
+  """Primary-key ranges [lo, hi) covering the table, split at evenly spaced keys of A."""
+  if jobs <= 1 or len(plan["pk"]) != 1 or plan["pk"] == ["rowid"] or not plan["a_columns"]:
+    return [(None, None)]
+  col = _quote(plan["pk"][0])
+  table = _quote(plan["table"])
+  n = conn.execute(f"SELECT COUNT(1) FROM {table}").fetchone()[0]
+  parts = min(jobs * 2, n // MIN_RANGE_ROWS)
+  if parts <= 1:
+    return [(None, None)]
+  bounds: List[Any] = []
+  for i in range(1, parts):
+    row = conn.execute(f"SELECT {col} FROM {table} ORDER BY {col} LIMIT 1 OFFSET ?", (n * i // parts,)).fetchone()
+    if row is not None and row[0] is not None and (not bounds or row[0] != bounds[-1]):
+      bounds.append(row[0])
+  edges = [None] + bounds + [None]
+  return list(zip(edges[:-1], edges[1:]))
+
+
+def _line(out: TextIO, doc: Dict[str, Any]) -> None:
+  out.write(json.dumps(doc, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def diff_rows(
+  a_db: Path,
+  b_db: Path,
+  out: TextIO,
+  *,
+  tables: Sequence[str] = DEFAULT_TABLES,
+  jobs: int = 1,
+  labels: Optional[Dict[str, str]] = None,
+) -> Dict[str, int]:
+  """Write the NDJSON row diff of two SQLite files to out; returns the totals."""
+  labels = labels or {"a": str(a_db), "b": str(b_db)}
+  a = connect_ro(a_db)
+  b = connect_ro(b_db)
+  try:
+    plans = [p for p in (_plan(a, b, t) for t in tables) if p is not None]
+    work = [(p, _ranges(a, p, jobs)) for p in plans]
+  except sqlite3.DatabaseError as e:
+    raise RowDiffError(str(e)) from None
+  finally:
+    a.close()
+    b.close()
+
+  _line(out, {
+    "type": "header", "schema": SCHEMA, "schema_version": 1,
+    "a": labels["a"], "b": labels["b"], "tables": [p["table"] for p in plans],
+  })
+  totals = {"inserted": 0, "deleted": 0, "updated": 0}
+
+  def table_done(plan: Dict[str, Any], counts: Dict[str, int]) -> None:
+    doc = {"type": "table", "table": plan["table"], **counts}
+    doc["columns_added"] = [c for c in plan["b_columns"] if c not in plan["a_columns"]] if plan["a_columns"] else []
+    doc["columns_removed"] = [c for c in plan["a_columns"] if c not in plan["b_columns"]] if plan["b_columns"] else []
+    _line(out, doc)
+    for k in totals:
+      totals[k] += counts[k]
+
+  def add(acc: Dict[str, int], c: Dict[str, int]) -> None:
+    for k, v in c.items():
+      acc[k] = acc.get(k, 0) + v
+
+  if sum(len(r) for _p, r in work) <= 1 or jobs <= 1:
+    for plan, ranges in work:
+      counts: Dict[str, int] = {}
+      for lo, hi in ranges:
+        add(counts, _diff_range(str(a_db), str(b_db), plan, lo, hi, out))
+      table_done(plan, counts)
+  else:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-rowdiff."))
+    try:
+      with ProcessPoolExecutor(max_workers=jobs) as ex:
+        futs = [
+          [(ex.submit(_diff_range_to_file, str(a_db), str(b_db), plan, lo, hi, str(tmp / f"{ti}-{ri}.ndjson")), tmp / f"{ti}-{ri}.ndjson")
+           for ri, (lo, hi) in enumerate(ranges)]
+          for ti, (plan, ranges) in enumerate(work)
+        ]
+        for (plan, _ranges_), parts in zip(work, futs):
+          counts = {}
+          for fut, path in parts:
+            add(counts, fut.result())
+            with open(path, encoding="utf-8") as f:
+              shutil.copyfileobj(f, out)
+            os.unlink(path)
+          table_done(plan, counts)
+    finally:
+      shutil.rmtree(tmp, ignore_errors=True)
+
+  _line(out, {"type": "end", **totals})
+  return totals
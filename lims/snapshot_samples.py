@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import db
+from . import export_stream
+from .cli import resolve_sample_id
+
+# Snapshot export stage: write exports/samples/sample-<safe>.json for every
+# SNAPSHOT_INCLUDE_SAMPLES identifier, reading the snapshot's own backup DB.
+#
+# One process for the whole list: the DB is opened and its schema checked once,
+# identifiers are resolved up front (nothing is written if any is missing), and
+# documents are written by a small thread pool (SNAPSHOT_SAMPLE_JOBS), each
+# worker on its own read connection. Files keep the `sample export --format json`
+# shape and are written temp-then-rename, so a partial file never appears under
+# its final name.
+
+DEFAULT_EVENT_LIMIT = 50
+
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9._-]+")
+_UNDERSCORES_RE = re.compile(r"_+")
+
+
+class SampleStageError(RuntimeError):
+  pass
+
+
+def safe_name(ident: str) -> str:
+  """File-name-safe form of an identifier: `tr -cs 'A-Za-z0-9._-' '_'` minus one trailing '_'."""
+  s = _UNDERSCORES_RE.sub("_", _UNSAFE_RE.sub("_", ident))
+  return s[:-1] if s.endswith("_") else s
+
+
+def sample_path(out_dir: Path, ident: str) -> Path:
+  return out_dir / f"sample-{safe_name(ident)}.json"
+
+
+def parse_identifiers(text: str) -> List[str]:
+  """Whitespace-delimited identifiers (newline preferred, CRLF tolerated), order kept, duplicates dropped."""
+  seen = set()
+  out: List[str] = []
+  for ident in text.split():
+    if ident not in seen:
+      seen.add(ident)
+      out.append(ident)
+  return out
+
+
+def default_jobs() -> int:
+  try:
+    n = int(os.environ.get("SNAPSHOT_SAMPLE_JOBS", "") or 0)
+  except ValueError:
+    n = 0
+  if n <= 0:
+    n = min(4, os.cpu_count() or 1)
+  return max(1, n)
+
+
+def _write_atomic(path: Path, text: str) -> None:
+  fd, tmp = tempfile.mkstemp(prefix=path.name + ".tmp.", dir=str(path.parent))
+  try:
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+      f.write(text)
+    os.replace(tmp, path)
+  except BaseException:
+    try:
+      os.unlink(tmp)
+    except FileNotFoundError:
+      pass
+    raise
+
+
+def export_samples(
+  db_file: Path,
+  out_dir: Path,
+  identifiers: Sequence[str],
+  *,
+  jobs: int = 1,
+  event_limit: int = DEFAULT_EVENT_LIMIT,
+) -> List[Dict[str, Any]]:
+  """Write one sample-*.json per identifier into out_dir; returns [{external_id, path, sample_id}].
+
+  Raises SampleStageError (before writing anything) if an identifier does not resolve.
+  """
+  out_dir.mkdir(parents=True, exist_ok=True)
+  conn = db.connect(db_file)
+  try:
+    db.ensure_schema(conn)
+    resolved: List[Tuple[str, int]] = []
+    missing: List[str] = []
+    for ident in identifiers:
+      sid = resolve_sample_id(conn, ident)
+      if sid is None:
+        missing.append(ident)
+      else:
+        resolved.append((ident, sid))
+  finally:
+    conn.close()
+  if missing:
+    raise SampleStageError("sample(s) not found: " + ", ".join(repr(x) for x in missing))
+
+  def _run(chunk: Sequence[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    wconn = db.connect(db_file)
+    try:
+      out = []
+      for ident, sid in chunk:
+        found = export_stream.sample_with_events(wconn, sid, event_limit=event_limit)
+        if found is None:
+          raise SampleStageError(f"sample disappeared during export: {ident!r}")
+        sample, events = found
+        doc = {"generated_at": db.utc_now_iso(), "sample": sample, "events": events}
+        path = sample_path(out_dir, ident)
+        _write_atomic(path, json.dumps(doc, ensure_ascii=False) + "\n")
+        out.append({"external_id": ident, "path": str(path), "sample_id": sid})
+      return out
+    finally:
+      wconn.close()
+
+  jobs = max(1, min(jobs, len(resolved)))
+  if jobs == 1:
+    return _run(resolved)
+  # Contiguous slices, one connection per worker; results come back in input order.
+  size = -(-len(resolved) // jobs)
+  chunks = [resolved[i:i + size] for i in range(0, len(resolved), size)]
+  with ThreadPoolExecutor(max_workers=len(chunks), thread_name_prefix="snap-sample") as ex:
+    return [entry for part in ex.map(_run, chunks) for entry in part]
+
+
+def build_parser() -> argparse.ArgumentParser:
+  p = argparse.ArgumentParser(
+    prog="lims-snapshot-samples",
+    description="Write sample-*.json exports for a snapshot from its backup DB (identifiers on stdin)",
+  )
+  p.add_argument("--db", required=True, help="Snapshot backup DB (lims.sqlite3)")
+  p.add_argument("--out", required=True, help="Output directory (exports/samples)")
+  p.add_argument("--jobs", type=int, default=None, help="Parallel writers (default: SNAPSHOT_SAMPLE_JOBS or min(4, CPUs))")
+  p.add_argument("--event-limit", type=int, default=DEFAULT_EVENT_LIMIT, help="Events per sample (newest first)")
+  return p
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  args = build_parser().parse_args(argv)
+  identifiers = parse_identifiers(sys.stdin.read())
+  if args.event_limit < 0:
+    print("ERROR: --event-limit must be >= 0", file=sys.stderr)
+    return 2
+  try:
+    written = export_samples(
+      Path(args.db),
+      Path(args.out),
+      identifiers,
+      jobs=args.jobs if args.jobs is not None else default_jobs(),
+      event_limit=args.event_limit,
+    )
+  except SampleStageError as e:
+    print(f"ERROR: failed to export samples into snapshot: {e}", file=sys.stderr)
+    return 2
+  print(f"OK: exported {len(written)} sample(s) into snapshot", file=sys.stderr)
+  return 0
+
+
+if __name__ == "__main__":
+  raise SystemExit(main())
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from . import snapshot_codec
+
+# Content-addressed snapshot store (`snapshot export --store cas`, SNAPSHOT_STORE=cas).
+#
+#   EXPORTS_DIR/.store/blobs/<aa>/<sha256>     every distinct file once, read-only
+#   EXPORTS_DIR/.store/manifests/<name>.json   the snapshot manifest plus "files":
+#                                              {relpath: sha256} -- the snapshot itself
+#
+# The snapshot dir stays a normal directory (verify/restore/doctor/diff read it as
+# before) but each of its files is a hard link to the blob, so migrations/, scripts/,
+# schema.sql and unchanged DBs / deltas take disk space once across all snapshots.
+# Blobs are never modified in place: everything that rewrites a snapshot file
+# (compact, sample stage) replaces it with a new inode.
+#
+# `snapshot gc` counts blob references from the store manifests that remain and
+# deletes unreferenced blobs; manifests whose snapshot dir and tarball are both gone
+# are deleted with them unless the snapshot is pinned. A pinned manifest keeps its
+# blobs, and `snapshot checkout` rebuilds the dir from it.
+
+STORE_DIR = ".store"
+
+
+class StoreError(RuntimeError):
+  pass
+
+
+def store_root(exports_dir: Path) -> Path:
+  return exports_dir / STORE_DIR
+
+
+def blob_path(exports_dir: Path, sha256: str) -> Path:
+  if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+    raise StoreError(f"bad blob id: {sha256!r}")
+  return store_root(exports_dir) / "blobs" / sha256[:2] / sha256
+
+
+def manifest_path(exports_dir: Path, name: str) -> Path:
+  if "/" in name or name.startswith("."):
+    raise StoreError(f"refusing suspicious snapshot name: {name!r}")
+  return store_root(exports_dir) / "manifests" / f"{name}.json"
+
+
+def has_manifest(exports_dir: Path, name: str) -> bool:
+  return manifest_path(exports_dir, name).is_file()
+
+
+def read_manifest(exports_dir: Path, name: str) -> Dict[str, Any]:
+  try:
+    return json.loads(manifest_path(exports_dir, name).read_text(encoding="utf-8"))
+  except FileNotFoundError:
+    raise StoreError(f"no store manifest for {name}") from None
+  except ValueError as e:
+    raise StoreError(f"store manifest for {name} is not valid JSON: {e}") from None
+
+
+def _write_json(path: Path, doc: Mapping[str, Any]) -> None:
+  path.parent.mkdir(parents=True, exist_ok=True)
+  tmp = path.with_name(f".{path.name}.tmp")
+  tmp.write_text(json.dumps(doc, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+  os.replace(tmp, path)
+
+
+def ingest(snap_dir: Path, exports_dir: Path, files: Mapping[str, str]) -> Dict[str, int]:
+  """Move snap_dir's files (relpath -> sha256, as hashed by write_tarball) into the store
+  and hard-link them back. Returns {"files", "blobs_new", "bytes_new", "bytes_deduped"}.
+  """
+  stats = {"files": 0, "blobs_new": 0, "bytes_new": 0, "bytes_deduped": 0}
+  for rel, sha in sorted(files.items()):
+    src = snap_dir / rel
+    if not src.is_file() or src.is_symlink():
+      continue
+    blob = blob_path(exports_dir, sha)
+    size = src.stat().st_size
+    stats["files"] += 1
+    if blob.is_file():
+      if os.path.samefile(src, blob):
+        continue
+      tmp = src.with_name(f".{src.name}.link")
+      os.link(blob, tmp)
+      os.replace(tmp, src)
+      stats["bytes_deduped"] += size
+      continue
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    try:
+      os.link(src, blob)
+    except FileExistsError:  # a concurrent export stored the same content
+      tmp = src.with_name(f".{src.name}.link")
+      os.link(blob, tmp)
+      os.replace(tmp, src)
+      stats["bytes_deduped"] += size
+      continue
+    except OSError as e:
+      raise StoreError(f"cannot hard-link into the store ({e}); it must be on the exports filesystem") from None
+    os.chmod(blob, 0o444)
+    stats["blobs_new"] += 1
+    stats["bytes_new"] += size
+  return stats
+
+
+def write_manifest(exports_dir: Path, name: str, manifest: Mapping[str, Any], files: Mapping[str, str]) -> Path:
+  doc = dict(manifest)
+  doc["files"] = dict(sorted(files.items()))
+  path = manifest_path(exports_dir, name)
+  _write_json(path, doc)
+  return path
+
+
+def manifest_names(exports_dir: Path) -> List[str]:
+  d = store_root(exports_dir) / "manifests"
+  if not d.is_dir():
+    return []
+  return sorted(p.name[: -len(".json")] for p in d.glob("snapshot-*.json"))
+
+
+def checkout(exports_dir: Path, name: str, out: Optional[Path] = None) -> Path:
+  """Rebuild a snapshot dir (hard links to blobs, plus manifest.json) from its store manifest."""
+  doc = read_manifest(exports_dir, name)
+  files = doc.pop("files", None) or {}
+  out = out if out is not None else exports_dir / name
+  if out.exists():
+    raise StoreError(f"refusing to overwrite existing path: {out}")
+  work = out.with_name(f".{out.name}.checkout")
+  shutil.rmtree(work, ignore_errors=True)
+  try:
+    for rel, sha in files.items():
+      parts = Path(rel).parts
+      if Path(rel).is_absolute() or ".." in parts:
+        raise StoreError(f"unsafe path in store manifest: {rel}")
+      blob = blob_path(exports_dir, sha)
+      if not blob.is_file():
+        raise StoreError(f"missing blob for {rel}: {sha}")
+      dest = work / rel
+      dest.parent.mkdir(parents=True, exist_ok=True)
+      os.link(blob, dest)
+    _write_json(work / "manifest.json", doc)
+    os.replace(work, out)
+  except BaseException:
+    shutil.rmtree(work, ignore_errors=True)
+    raise
+  return out
+
+
+def _snapshot_present(exports_dir: Path, name: str, gone: Set[str]) -> bool:
+  if name in gone:
+    return False
+  if (exports_dir / name).is_dir():
+    return True
+  return snapshot_codec.find_artifact(exports_dir, name) is not None
+
+
+def gc(exports_dir: Path, *, pinned: Iterable[str] = (), gone: Iterable[str] = (), apply: bool = False) -> Dict[str, Any]:
+  """Reference-counted store cleanup.
+
+  pinned: snapshot names (artifact extensions are stripped) whose manifests are kept.
+  gone:   snapshots the caller is deleting in the same run (treated as absent).
+  """
+  pins = {snapshot_codec.strip_ext(p) for p in pinned}
+  gone_set = {snapshot_codec.strip_ext(g) for g in gone}
+  keep_manifests: List[str] = []
+  drop_manifests: List[str] = []
+  for name in manifest_names(exports_dir):
+    if name in pins or _snapshot_present(exports_dir, name, gone_set):
+      keep_manifests.append(name)
+    else:
+      drop_manifests.append(name)
+
+  refs: Dict[str, int] = {}
+  for name in keep_manifests:
+    try:
+      files = read_manifest(exports_dir, name).get("files") or {}
+    except StoreError:
+      # An unreadable manifest might still reference anything: collect nothing this run.
+      return {"ok": False, "error": f"unreadable store manifest: {name}"}
+    for sha in files.values():
+      refs[sha] = refs.get(sha, 0) + 1
+
+  # Hard links held by dirs that are about to go (dry runs see them still on disk).
+  gone_links: Dict[Tuple[int, int], int] = {}
+  for name in gone_set:
+    for root, _dirs, fnames in os.walk(exports_dir / name):
+      for f in fnames:
+        st = os.lstat(os.path.join(root, f))
+        gone_links[(st.st_dev, st.st_ino)] = gone_links.get((st.st_dev, st.st_ino), 0) + 1
+
+  drop_blobs: List[Dict[str, Any]] = []
+  linked = 0
+  blobs_dir = store_root(exports_dir) / "blobs"
+  total = 0
+  if blobs_dir.is_dir():
+    for blob in sorted(blobs_dir.glob("*/*")):
+      if not blob.is_file() or blob.name.startswith("."):
+        continue
+      total += 1
+      if refs.get(blob.name):
+        continue
+      st = blob.stat()
+      # Still hard-linked from a snapshot dir (e.g. one being written right now): keep.
+      if st.st_nlink - 1 - gone_links.get((st.st_dev, st.st_ino), 0) > 0:
+        linked += 1
+        continue
+      drop_blobs.append({"sha256": blob.name, "bytes": st.st_size, "path": blob})
+
+  if apply:
+    for name in drop_manifests:
+      manifest_path(exports_dir, name).unlink(missing_ok=True)
+    for b in drop_blobs:
+      b["path"].unlink(missing_ok=True)
+      try:
+        b["path"].parent.rmdir()
+      except OSError:
+        pass
+  return {
+    "ok": True,
+    "manifests_kept": len(keep_manifests),
+    "manifests_dropped": drop_manifests,
+    "blobs_total": total,
+    "blobs_referenced": len(refs),
+    "blobs_linked_unreferenced": linked,
+    "blobs_dropped": [b["sha256"] for b in drop_blobs],
+    "bytes_freed": sum(b["bytes"] for b in drop_blobs),
+  }
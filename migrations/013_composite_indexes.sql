@@ -0,0 +1,28 @@
+-- 013_composite_indexes.sql
+-- Composite indexes matching the hot list/report query shapes, so SQLite can
+-- seek + walk in ORDER BY order instead of filtering and sorting in a temp B-tree.
+-- The trailing id in each ORDER BY is the rowid, which every index already ends with.
+-- Checked by scripts/regress_query_plans.py.
+
+-- samples WHERE status = ? ORDER BY received_at DESC, id DESC  (/sample/list, lims.sh sample list)
+CREATE INDEX IF NOT EXISTS idx_samples_status_received_at
+  ON samples(status, received_at);
+
+-- samples WHERE container_id = ? ORDER BY received_at DESC, id DESC
+-- (also serves the exclusivity triggers' EXISTS probe and container occupancy counts)
+CREATE INDEX IF NOT EXISTS idx_samples_container_received_at
+  ON samples(container_id, received_at);
+
+-- sample_events WHERE sample_id = ? ORDER BY occurred_at [DESC], id [DESC]  (events, report, export)
+CREATE INDEX IF NOT EXISTS idx_sample_events_sample_occurred_at
+  ON sample_events(sample_id, occurred_at);
+
+-- containers WHERE lower(trim(kind)) = ?  (kind-defaults apply/apply-all and the 011 trigger backfill)
+CREATE INDEX IF NOT EXISTS idx_containers_kind_norm
+  ON containers(lower(trim(kind)));
+
+-- The single-column indexes above are now prefixes of the composites; drop them
+-- so every write doesn't maintain two copies of the same key.
+DROP INDEX IF EXISTS idx_samples_status;
+DROP INDEX IF EXISTS idx_samples_container_id;
+DROP INDEX IF EXISTS idx_sample_events_sample_id;
@@ -0,0 +1,50 @@
+-- 014_table_counts.sql
+-- Row counts for /metrics kept by triggers, so a scrape reads three rows instead of
+-- running COUNT(1) over samples / containers / sample_events (a full scan each).
+-- A migration that rebuilds one of these tables must recreate its two triggers.
+
+CREATE TABLE IF NOT EXISTS table_counts (
+  name TEXT PRIMARY KEY,
+  n    INTEGER NOT NULL
+);
+
+-- Backfill (one scan per table, here only).
+INSERT OR REPLACE INTO table_counts(name, n) SELECT 'samples', COUNT(1) FROM samples;
+INSERT OR REPLACE INTO table_counts(name, n) SELECT 'containers', COUNT(1) FROM containers;
+INSERT OR REPLACE INTO table_counts(name, n) SELECT 'sample_events', COUNT(1) FROM sample_events;
+
+DROP TRIGGER IF EXISTS trg_samples_count_ai;
+CREATE TRIGGER trg_samples_count_ai AFTER INSERT ON samples
+BEGIN
+  UPDATE table_counts SET n = n + 1 WHERE name = 'samples';
+END;
+
+DROP TRIGGER IF EXISTS trg_samples_count_ad;
+CREATE TRIGGER trg_samples_count_ad AFTER DELETE ON samples
+BEGIN
+  UPDATE table_counts SET n = n - 1 WHERE name = 'samples';
+END;
+
+DROP TRIGGER IF EXISTS trg_containers_count_ai;
+CREATE TRIGGER trg_containers_count_ai AFTER INSERT ON containers
+BEGIN
+  UPDATE table_counts SET n = n + 1 WHERE name = 'containers';
+END;
+
+DROP TRIGGER IF EXISTS trg_containers_count_ad;
+CREATE TRIGGER trg_containers_count_ad AFTER DELETE ON containers
+BEGIN
+  UPDATE table_counts SET n = n - 1 WHERE name = 'containers';
+END;
+
+DROP TRIGGER IF EXISTS trg_sample_events_count_ai;
+CREATE TRIGGER trg_sample_events_count_ai AFTER INSERT ON sample_events
+BEGIN
+  UPDATE table_counts SET n = n + 1 WHERE name = 'sample_events';
+END;
+
+DROP TRIGGER IF EXISTS trg_sample_events_count_ad;
+CREATE TRIGGER trg_sample_events_count_ad AFTER DELETE ON sample_events
+BEGIN
+  UPDATE table_counts SET n = n - 1 WHERE name = 'sample_events';
+END;
@@ -0,0 +1,28 @@
+# gunicorn settings for the FastAPI server in multi-worker mode
+# (NEXUS_API_WORKERS > 1 in scripts/run_fastapi.sh / run_fastapi_systemd.sh):
+#
+#   gunicorn -c ops/gunicorn.conf.py lims.api_fastapi:app
+#
+# preload_app imports the app once in the master and forks the workers from it, so
+# they share its memory and none of them pays the import. Nothing at import time may
+# open the DB or start threads; lims.db, lims.sessions, lims.jobs and
+# lims.api_executor drop their per-process state in a forked child anyway. Each
+# worker runs the app's startup (migrations are serialized across workers by a lock
+# beside the DB, WAL checkpoints and the session sweep run in one worker) and its own
+# event loop and DB pool; SQLite in WAL mode lets their readers run in parallel.
+import os
+
+bind = f"{os.environ.get('HOST', '127.0.0.1')}:{os.environ.get('PORT', '8789')}"
+workers = max(1, int(os.environ.get("NEXUS_API_WORKERS", "") or 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+loglevel = os.environ.get("LOG_LEVEL", "warning")
+
+
+def post_fork(server, worker):
+    # Workers find out they are not alone (e.g. lims.jobs shares job state through a
+    # spool dir) even when the count came from the command line (-w).
+    os.environ["NEXUS_API_WORKERS"] = str(server.cfg.workers)
@@ -24,14 +24,15 @@ if [[ "${1:-}" == "snapshot" ]]; then
           [[ -n "$sid" ]] || continue
           [[ "$sid" =~ ^[A-Za-z0-9][A-Za-z0-9._:-]{0,63}$ ]] || { echo "ERROR: invalid sample id in NEXUS_API_INCLUDE_SAMPLES: $sid" >&2; exit 2; }
           include_samples+=("$sid")
-          (( ${#include_samples[@]} <= 512 )) || { echo "ERROR: too many include samples (max 512)" >&2; exit 2; }
+          # The list travels in an env var (per-variable limit ~128 KiB); 1024 ids of <= 64 chars fit.
+          (( ${#include_samples[@]} <= ${NEXUS_API_INCLUDE_SAMPLES_MAX:-1024} )) || { echo "ERROR: too many include samples (max ${NEXUS_API_INCLUDE_SAMPLES_MAX:-1024})" >&2; exit 2; }
         done <<<"${NEXUS_API_INCLUDE_SAMPLES}"
       fi
       unset NEXUS_API_INCLUDE_SAMPLES || true
 
         json=0
       # Avoid stale state: snapshot includes should be driven ONLY by CLI args.
-      unset SNAPSHOT_INCLUDE_SAMPLES SNAPSHOT_JSON || true
+      unset SNAPSHOT_INCLUDE_SAMPLES SNAPSHOT_JSON SNAPSHOT_PROGRESS SNAPSHOT_INCREMENTAL SNAPSHOT_BASE || true
 
       while [[ $# -gt 0 ]]; do
         case "$1" in
@@ -53,9 +54,37 @@ if [[ "${1:-}" == "snapshot" ]]; then
               json=1
               shift
               ;;
+            --progress)
+              export SNAPSHOT_PROGRESS=1
+              shift
+              ;;
+            --incremental)
+              export SNAPSHOT_INCREMENTAL=1
+              shift
+              ;;
+            --base)
+              [[ $# -ge 2 ]] || { echo "ERROR: $1 requires a value" >&2; exit 2; }
+              export SNAPSHOT_INCREMENTAL=1 SNAPSHOT_BASE="$2"
+              shift 2
+              ;;
+            --codec)
+              [[ $# -ge 2 ]] || { echo "ERROR: $1 requires a value" >&2; exit 2; }
+              export SNAPSHOT_CODEC="$2"
+              shift 2
+              ;;
+            --level)
+              [[ $# -ge 2 ]] || { echo "ERROR: $1 requires a value" >&2; exit 2; }
+              export SNAPSHOT_LEVEL="$2"
+              shift 2
+              ;;
+            --store)
+              [[ $# -ge 2 ]] || { echo "ERROR: $1 requires a value" >&2; exit 2; }
+              export SNAPSHOT_STORE="$2"
+              shift 2
+              ;;
 
           -h|--help)
-            echo "Usage: ./scripts/lims.sh snapshot export [--exports-dir PATH] [--include-sample ID]... [--json]"
+            echo "Usage: ./scripts/lims.sh snapshot export [--exports-dir PATH] [--include-sample ID]... [--json] [--progress] [--incremental [--base SNAPSHOT]] [--codec gzip|zstd] [--level N] [--store dir|cas]"
             exit 0
             ;;
           *)
@@ -110,6 +139,14 @@ if [[ "${1:-}" == "snapshot" ]]; then
 
     verify)
       shift || true
+      # --all: every tarball in the exports dir, in parallel, memoized by sha256.
+      for a in "$@"; do
+        if [[ "$a" == "--all" ]]; then
+          all_args=()
+          for b in "$@"; do [[ "$b" == "--all" ]] || all_args+=("$b"); done
+          exec python3 "$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/snapshot_verify_all.py" "${all_args[@]}"
+        fi
+      done
       artifact=""
       do_migrate=1
       while [[ $# -gt 0 ]]; do
@@ -117,6 +154,10 @@ if [[ "${1:-}" == "snapshot" ]]; then
           --no-migrate) do_migrate=0; shift ;;
           -h|--help)
             echo "Usage: ./scripts/lims.sh snapshot verify <snapshot.tar.gz|snapshot-dir|lims.sqlite3> [--no-migrate]"
+            echo "   or: ./scripts/lims.sh snapshot verify --all [--dir PATH] [--jobs N] [--no-migrate] [--json] [--force] [--trust-mtime] [--timeout SEC]"
+            echo "  --all verifies every tarball in EXPORTS_DIR (SNAPSHOT_VERIFY_JOBS at a time), skips tarballs whose"
+            echo "  sha256 already passed with the current tooling (<dir>/.verify_ledger.json) and prints one JSON report."
+            echo "  Every tarball is hashed on each run; --trust-mtime reuses the hash while size and mtime are unchanged."
             exit 0
             ;;
           *)
@@ -139,7 +180,7 @@ if [[ "${1:-}" == "snapshot" ]]; then
     doctor)
       shift || true
       if [[ "${1:-}" == "-h" || "${1:-}" == "--help" ]]; then
-        echo "Usage: ./scripts/lims.sh snapshot doctor <snapshot.tar.gz|snapshot-dir|lims.sqlite3> [--no-migrate] [--json-only]"
+        echo "Usage: ./scripts/lims.sh snapshot doctor <snapshot.tar.gz|snapshot-dir|lims.sqlite3> [--no-migrate] [--json-only] [--no-cache]"
         exit 0
       fi
       exec python3 "$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/snapshot_doctor.py" "$@"
@@ -148,7 +189,9 @@ if [[ "${1:-}" == "snapshot" ]]; then
     diff)
       shift || true
       if [[ "${1:-}" == "-h" || "${1:-}" == "--help" ]]; then
-        echo "Usage: ./scripts/lims.sh snapshot diff <A> <B> [--no-migrate] [--json-only]"
+        echo "Usage: ./scripts/lims.sh snapshot diff <A> <B> [--no-migrate] [--json-only] [--no-cache]"
+        echo "   or: ./scripts/lims.sh snapshot diff <A> <B> --rows [--tables T1,T2] [--jobs N] [--out FILE]"
+        echo "  --rows streams inserted/deleted/updated rows (merge-join in primary-key order) as NDJSON."
         exit 0
       fi
       exec python3 "$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/snapshot_diff.py" "$@"
@@ -193,6 +236,45 @@ if [[ "${1:-}" == "snapshot" ]]; then
 
       ;;
 
+    index)
+      shift || true
+      if [[ "${1:-}" == "-h" || "${1:-}" == "--help" ]]; then
+        echo "Usage: ./scripts/lims.sh snapshot index [--dir PATH] [--rebuild] [--json]"
+        echo "  Lists the snapshot index (<dir>/.snapshot_index.jsonl: name, ts, size, sha256, codec, pinned)"
+        echo "  that latest / prune / gc / GET /exports/latest read. --rebuild rescans the dir (fixes drift)."
+        exit 0
+      fi
+      cd "$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+      ix_dir="${EXPORTS_DIR:-exports}"
+      ix_args=()
+      while [[ $# -gt 0 ]]; do
+        case "$1" in
+          --dir) [[ $# -ge 2 ]] || { echo "ERROR: --dir requires a value" >&2; exit 2; }; ix_dir="$2"; shift 2 ;;
+          *) ix_args+=("$1"); shift ;;
+        esac
+      done
+      exec python3 -m lims.snapshot index --dir "$ix_dir" "${ix_args[@]}"
+      ;;
+
+    checkout)
+      shift || true
+      if [[ "${1:-}" == "-h" || "${1:-}" == "--help" || $# -lt 1 ]]; then
+        echo "Usage: ./scripts/lims.sh snapshot checkout <snapshot-name> [--dir PATH] [--out PATH]"
+        echo "  Rebuilds a snapshot dir from its content-addressed store manifest (exports made with --store cas)."
+        [[ $# -ge 1 ]] && exit 0 || exit 2
+      fi
+      cd "$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+      co_dir="${EXPORTS_DIR:-exports}"
+      co_args=()
+      while [[ $# -gt 0 ]]; do
+        case "$1" in
+          --dir) [[ $# -ge 2 ]] || { echo "ERROR: --dir requires a value" >&2; exit 2; }; co_dir="$2"; shift 2 ;;
+          *) co_args+=("$1"); shift ;;
+        esac
+      done
+      exec python3 -m lims.snapshot checkout --dir "$co_dir" "${co_args[@]}"
+      ;;
+
     *)
       echo "ERROR: unknown snapshot subcommand: ${sub:-<missing>}" >&2
       echo "HINT: try: ./scripts/lims.sh snapshot export" >&2
@@ -7,6 +7,7 @@ import tempfile
 import subprocess
 import sys
 import shutil
+import time
 import secrets
 from datetime import datetime, timezone, timedelta
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
@@ -17,6 +18,8 @@ REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 UI_ROOT = os.path.join(REPO_ROOT, "web")
 API_EXPORTS_ROOT = os.path.join(REPO_ROOT, "exports", "api")
 CLI_TIMEOUT_SEC = float(os.environ.get("NEXUS_API_CLI_TIMEOUT_SEC", "30"))
+# Background jobs (snapshot export/verify) are not tied to a request, so they get longer.
+JOB_TIMEOUT_SEC = float(os.environ.get("NEXUS_API_JOB_TIMEOUT_SEC", "3600"))
 
 # Allow importing project modules when executed as a script.
 if REPO_ROOT not in sys.path:
@@ -25,6 +28,13 @@ try:
     from lims import db as lims_db
 except Exception:
     lims_db = None
+from lims import api_download, api_jobs, export_stream, sample_import, snapshot_index
+from lims import jobs as lims_jobs
+from lims import metrics as lims_metrics
+from lims import sessions as lims_sessions
+from lims import snapshot as lims_snapshot
+from lims.cli import resolve_container_id
+from lims.pagination import CONTAINER_KEY, CursorError, container_seek, page
 
 _SAMPLE_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._:-]{0,63}$")
 _CONTAINER_BARCODE_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._:-]{0,63}$")
@@ -74,38 +84,9 @@ def _require_session(handler, lims_db):
         handler._err(401, "auth_required", "missing session header (X-Nexus-Session) or Authorization: Bearer")
         return False
 
-    conn = lims_db.connect()
-    try:
-        if hasattr(lims_db, "apply_migrations"):
-            lims_db.apply_migrations(conn)
-        elif hasattr(lims_db, "init_db"):
-            lims_db.init_db(conn)
-
-        now = _utc_now_iso()
-
-        # best-effort cleanup
-        try:
-            conn.execute("DELETE FROM guest_sessions WHERE expires_at <= ?", (now,))
-            conn.commit()
-        except Exception:
-            pass
-
-        row = conn.execute(
-            "SELECT id FROM guest_sessions WHERE id = ? AND expires_at > ?",
-            (sid, now),
-        ).fetchone()
-
-        if row:
-            try:
-                conn.execute("UPDATE guest_sessions SET last_seen_at = ? WHERE id = ?", (now, sid))
-                conn.commit()
-            except Exception:
-                pass
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+    # Cached (lims/sessions.py): no DB transaction per request; last_seen_at is written behind.
+    with lims_metrics.phase(getattr(handler, "_metrics_route", "other"), "auth"):
+        row = lims_sessions.lookup(sid)
 
     if not row:
         handler._err(401, "invalid_session", "session not found or expired")
@@ -136,75 +117,73 @@ def _api_sample_add(payload: dict) -> dict:
       {"generated_at": <iso>, "sample": {...}}
     """
     from lims import db as lims_db
-    from lims.cli import ensure_db, resolve_container_id, generate_external_id, utc_now_iso
+    from lims.cli import resolve_container_id, generate_external_id, utc_now_iso
     if not isinstance(payload, dict):
         raise ValueError("body must be a JSON object")
 
-    conn = lims_db.connect()
-    ensure_db(conn)
-
-    now = utc_now_iso()
-
-    specimen_type = (str(payload.get("specimen_type") or "")).strip()
-    if not specimen_type:
-        raise ValueError("specimen_type is required")
-
-    status_raw = (str(payload.get("status") or "received")).strip().lower()
-    aliases = {"registered": "received", "testing": "processing", "analysis": "analyzing", "done": "completed"}
-    status = aliases.get(status_raw, status_raw)
-    allowed = {"received", "processing", "analyzing", "completed"}
-    if status not in allowed:
-        raise ValueError("invalid status. Allowed: received, processing, analyzing, completed")
-
-    notes = payload.get("notes")
-    notes = (str(notes).strip() if notes is not None else None) or None
-
-    received_at = payload.get("received_at")
-    received_at = (str(received_at).strip() if received_at is not None else now) or now
-
-    provided = payload.get("external_id")
-    if provided is not None:
-        external_id = str(provided).strip()
-        if not external_id:
-            raise ValueError("external_id cannot be empty")
-        if conn.execute("SELECT 1 FROM samples WHERE external_id = ? LIMIT 1", (external_id,)).fetchone():
-            raise ValueError("sample external_id already exists")
-    else:
-        external_id = ""
-        for _ in range(10):
-            candidate = generate_external_id("DEV")
-            if not conn.execute("SELECT 1 FROM samples WHERE external_id = ? LIMIT 1", (candidate,)).fetchone():
-                external_id = candidate
-                break
-        if not external_id:
-            raise ValueError("could not generate a unique external_id; retry")
-
-    container_id = None
-    container = payload.get("container")
-    if container is not None:
-        ident = str(container).strip()
-        if not ident:
-            raise ValueError("container cannot be empty")
-        container_id = resolve_container_id(conn, ident)
-        if container_id is None:
-            raise ValueError("container not found")
-
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO samples (external_id, specimen_type, status, notes, received_at, created_at, updated_at, container_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (external_id, specimen_type, status, notes, received_at, now, now, container_id),
-    )
-    conn.commit()
-
-    row = conn.execute("SELECT * FROM samples WHERE id = ?", (cur.lastrowid,)).fetchone()
-    if not row:
-        raise ValueError("insert succeeded but fetch failed")
+    with lims_db.writer("sample_add") as conn:
+        now = utc_now_iso()
+
+        specimen_type = (str(payload.get("specimen_type") or "")).strip()
+        if not specimen_type:
+            raise ValueError("specimen_type is required")
+
+        status_raw = (str(payload.get("status") or "received")).strip().lower()
+        aliases = {"registered": "received", "testing": "processing", "analysis": "analyzing", "done": "completed"}
+        status = aliases.get(status_raw, status_raw)
+        allowed = {"received", "processing", "analyzing", "completed"}
+        if status not in allowed:
+            raise ValueError("invalid status. Allowed: received, processing, analyzing, completed")
+
+        notes = payload.get("notes")
+        notes = (str(notes).strip() if notes is not None else None) or None
+
+        received_at = payload.get("received_at")
+        received_at = (str(received_at).strip() if received_at is not None else now) or now
+
+        provided = payload.get("external_id")
+        if provided is not None:
+            external_id = str(provided).strip()
+            if not external_id:
+                raise ValueError("external_id cannot be empty")
+            if conn.execute("SELECT 1 FROM samples WHERE external_id = ? LIMIT 1", (external_id,)).fetchone():
+                raise ValueError("sample external_id already exists")
+        else:
+            external_id = ""
+            for _ in range(10):
+                candidate = generate_external_id("DEV")
+                if not conn.execute("SELECT 1 FROM samples WHERE external_id = ? LIMIT 1", (candidate,)).fetchone():
+                    external_id = candidate
+                    break
+            if not external_id:
+                raise ValueError("could not generate a unique external_id; retry")
+
+        container_id = None
+        container = payload.get("container")
+        if container is not None:
+            ident = str(container).strip()
+            if not ident:
+                raise ValueError("container cannot be empty")
+            container_id = resolve_container_id(conn, ident)
+            if container_id is None:
+                raise ValueError("container not found")
+
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO samples (external_id, specimen_type, status, notes, received_at, created_at, updated_at, container_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (external_id, specimen_type, status, notes, received_at, now, now, container_id),
+        )
+        conn.commit()
 
-    sample_obj = dict(row)
-    return {"generated_at": utc_now_iso(), "sample": sample_obj}
+        row = conn.execute("SELECT * FROM samples WHERE id = ?", (cur.lastrowid,)).fetchone()
+        if not row:
+            raise ValueError("insert succeeded but fetch failed")
+
+        sample_obj = dict(row)
+        return {"generated_at": utc_now_iso(), "sample": sample_obj}
 
 
 def _clean_text_field(name: str, v, *, required: bool, max_len: int) -> str | None:
@@ -229,22 +208,17 @@ def _mk_api_exports_dir() -> str:
     return tempfile.mkdtemp(prefix="snapshot-", dir=base)
 
 
-def _find_latest_api_tarball() -> str | None:
-    """Return filesystem path to the most recent API-created snapshot tarball."""
-    root = Path(API_EXPORTS_ROOT).resolve()
-    if not root.exists():
+def _find_latest_api_tarball():
+    """(path, snapshot index entry) of the most recent API-created snapshot tarball (any codec), or None.
+
+    Read from the exports/api snapshot index (kept by the exporter; rescanned only when
+    the dir changed behind its back), not by walking every export dir per request.
+    The entry's sha256 is the download's ETag.
+    """
+    root = Path(API_EXPORTS_ROOT)
+    if not root.is_dir():
         return None
-    best = None
-    for fp in root.rglob("*.tar.gz"):
-        if not fp.is_file():
-            continue
-        try:
-            m = fp.stat().st_mtime
-        except OSError:
-            continue
-        if best is None or m > best[0]:
-            best = (m, fp)
-    return str(best[1]) if best else None
+    return snapshot_index.latest_entry(root, nested=True)
 
 def _read_ui_file(rel_path: str) -> bytes:
     """
@@ -306,31 +280,49 @@ def _run_json(cmd, env=None, timeout_sec=None):
         )
     except subprocess.TimeoutExpired as e:
         return (124, None, f"timeout after {timeout:.1f}s: {cmd}\n{e}")
+    return _json_result(p.returncode, p.stdout, p.stderr)
 
-    out = p.stdout.strip()
-    if p.returncode != 0:
-        return (p.returncode, None, p.stderr)
+def _json_result(rc, stdout, stderr):
+    out = stdout.strip()
+    if rc != 0:
+        return (rc, None, stderr)
 
     try:
-        return (0, json.loads(out) if out else {}, p.stderr)
+        return (0, json.loads(out) if out else {}, stderr)
     except Exception as e:
-        return (2, None, f"stdout was not valid JSON: {e}\nSTDOUT:\n{p.stdout}\nSTDERR:\n{p.stderr}")
+        return (2, None, f"stdout was not valid JSON: {e}\nSTDOUT:\n{stdout}\nSTDERR:\n{stderr}")
 
-def _git_rev_short():
-    try:
-        p = subprocess.run(
-            ["git", "rev-parse", "--short", "HEAD"],
-            cwd=REPO_ROOT,
-            text=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=False,
-            check=False,
-        )
-        return p.stdout.strip() if p.returncode == 0 else ""
-    except Exception:
-        return ""
 
+def _snapshot_export_job(cleaned):
+    def _run(job):
+        # Always write exports to a safe server-side directory (prevents path abuse).
+        exports_dir = _mk_api_exports_dir()
+        # In-process export: no lims.sh/bash/sqlite3 subprocesses; progress feeds GET /jobs/{id}.
+        try:
+            return lims_snapshot.export_snapshot(exports_dir=Path(exports_dir), include_samples=cleaned, index_dir=Path(API_EXPORTS_ROOT), progress=job.report)
+        except lims_snapshot.SnapshotError as e:
+            shutil.rmtree(exports_dir, ignore_errors=True)
+            raise lims_jobs.JobError("command_failed", str(e), rc=2)
+        except BaseException:
+            shutil.rmtree(exports_dir, ignore_errors=True)
+            raise
+    return _run
+
+
+def _snapshot_verify_job(artifact):
+    def _run(job):
+        env = os.environ.copy()
+        env["SNAPSHOT_ARTIFACT"] = artifact
+        cmd = ["bash", "./scripts/snapshot_verify.sh", "--json"]
+        job.phase("verify")
+        rc, out, err = lims_jobs.run_command(job, cmd, cwd=REPO_ROOT, env=env, timeout=JOB_TIMEOUT_SEC)
+        rc, doc, err = _json_result(rc, out, err)
+        if rc == 124:
+            raise lims_jobs.JobError("command_timeout", rc=rc, stderr=err)
+        if rc != 0:
+            raise lims_jobs.JobError("command_failed", rc=rc, stderr=err)
+        return doc
+    return _run
 
 # Sample read endpoints (isolated so failures don't mask lims_db import)
 try:
@@ -347,11 +339,59 @@ except Exception:
     def handle_sample_status_post(*args, **kwargs):
         return False
 
+# Route labels for request metrics: the fixed paths served below, with ids folded so the
+# label set stays bounded; anything else (404s, probes) is "other".
+_METRIC_ROUTES = frozenset((
+    "/", "/index.html", "/ui", "/app.js", "/style.css", "/health", "/version", "/metrics",
+    "/auth/guest", "/auth/me", "/container/add", "/container/list",
+    "/sample/add", "/sample/add/batch", "/sample/list", "/sample/show", "/sample/events",
+    "/sample/status", "/sample/report", "/export/samples.ndjson",
+    "/snapshot/export", "/snapshot/verify", "/exports/latest", "/jobs",
+))
+
+
+def _route_label(path: str) -> str:
+    if path in _METRIC_ROUTES:
+        return path
+    if path.startswith("/jobs/"):
+        return "/jobs/{id}/cancel" if path.endswith("/cancel") else "/jobs/{id}"
+    if path.startswith("/exports/"):
+        return "/exports/{name}"
+    return "other"
+
+
 class Handler(BaseHTTPRequestHandler):
     server_version = "NexusLIMSAPI/0.3"
 
+    # Request metrics (lims/metrics.py): the clock starts once the request line is read,
+    # so idle keep-alive time is not counted, and stops when the response is written.
+    def parse_request(self):
+        self._metrics_t0 = time.perf_counter()
+        self._metrics_status = 0
+        lims_metrics.HTTP_IN_FLIGHT.inc()
+        ok = super().parse_request()
+        self._metrics_route = _route_label(urlparse(self.path).path) if ok else "other"
+        return ok
+
+    def send_response(self, code, message=None):
+        self._metrics_status = code
+        super().send_response(code, message)
+
+    def handle_one_request(self):
+        self._metrics_t0 = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._metrics_t0 is not None:
+                lims_metrics.HTTP_IN_FLIGHT.dec()
+                lims_metrics.observe_request(
+                    self.command or "", getattr(self, "_metrics_route", "other"),
+                    self._metrics_status, time.perf_counter() - self._metrics_t0,
+                )
+
     def _send(self, code, obj):
-        body = json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        with lims_metrics.phase(getattr(self, "_metrics_route", "other"), "serialize"):
+            body = json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("utf-8")
         self.send_response(code)
         self.send_header("Content-Type", "application/json; charset=utf-8")
         self.send_header("Content-Length", str(len(body)))
@@ -388,6 +428,124 @@ class Handler(BaseHTTPRequestHandler):
         except Exception as e:
             raise ValueError(f"invalid JSON body: {e}")
 
+    def _api_sample_add_batch(self, u):
+        if lims_db is None:
+            self._err(500, "internal_error", "lims_db import failed")
+            return
+        try:
+            n = int(self.headers.get("Content-Length", "0") or "0")
+        except Exception:
+            self._err(400, "bad_request", "invalid Content-Length")
+            return
+        max_bytes = sample_import.max_batch_bytes()
+        if n < 0:
+            self._err(400, "bad_request", "invalid Content-Length")
+            return
+        if n > max_bytes:
+            self._err(413, "payload_too_large", f"payload too large (max {max_bytes} bytes)")
+            return
+        raw = self.rfile.read(n) if n > 0 else b""
+
+        qs = parse_qs(u.query or "")
+        fmt = (qs.get("format") or [None])[0] or sample_import.detect_format(self.headers.get("Content-Type"))
+        try:
+            rows = sample_import.parse_rows(raw, fmt)
+        except sample_import.BatchFormatError as e:
+            self._err(400, "bad_request", str(e))
+            return
+        if not rows:
+            self._err(400, "bad_request", "batch contains no rows")
+            return
+        max_rows = sample_import.max_batch_rows()
+        if len(rows) > max_rows:
+            self._err(413, "payload_too_large", f"too many rows (max {max_rows})")
+            return
+
+        with lims_db.writer("sample_add_batch") as conn:
+            report = sample_import.import_samples(conn, rows)
+        doc = {"schema": "nexus_sample_batch", "schema_version": 1, "ok": True}
+        doc.update(report)
+        self._send(200, doc)
+
+    def _api_export_samples_ndjson(self, u):
+        if lims_db is None:
+            self._err(500, "internal_error", "lims_db import failed")
+            return
+        try:
+            f = export_stream.filters_from_query(parse_qs(u.query or ""))
+        except export_stream.ExportFilterError as e:
+            self._err(400, "bad_request", str(e))
+            return
+        container_id = None
+        if f["container"] is not None:
+            with lims_db.reader("container_resolve") as conn:
+                container_id = resolve_container_id(conn, f["container"])
+            if container_id is None:
+                self._err(400, "bad_request", "container not found")
+                return
+
+        # No Content-Length: the body is written as it is produced and ends when the
+        # connection closes (HTTP/1.0). A missing "end" line means the stream was cut short.
+        self.send_response(200)
+        self.send_header("Content-Type", export_stream.CONTENT_TYPE)
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        if self.command == "HEAD":
+            return
+        try:
+            with lims_db.stream_reader() as conn:
+                lines = export_stream.iter_ndjson(
+                    conn,
+                    status=f["status"],
+                    container_id=container_id,
+                    since=f["since"],
+                    until=f["until"],
+                    include_events=f["include_events"],
+                    batch_size=f["batch_size"],
+                )
+                for chunk in export_stream.iter_chunks(lines):
+                    self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            # Headers are already out; an error envelope here would corrupt the stream.
+            sys.stderr.write("export stream aborted: %s: %s\n" % (type(e).__name__, e))
+
+    def _api_exports_latest(self):
+        # GET/HEAD: conditional (ETag = index sha256), single byte ranges, sendfile body.
+        hit = _find_latest_api_tarball()
+        if not hit:
+            if self.command == "HEAD":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            else:
+                self._err(404, "not_found", path="/exports/latest", method="GET")
+            return
+        fp, entry = hit
+        try:
+            status, headers, offset, length = api_download.plan(fp, entry, self.headers)
+        except OSError as e:
+            msg = f"download failed: {type(e).__name__}: {e}\n".encode("utf-8")
+            self._send_bytes(500, msg, "text/plain; charset=utf-8")
+            return
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command == "HEAD" or not length:
+            return
+        try:
+            api_download.sendfile(self.connection, fp, offset, length)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away (a resumable download picks up with Range)
+        except Exception as e:
+            # Headers are already out; an error envelope here would corrupt the body.
+            self.close_connection = True
+            sys.stderr.write("exports/latest download aborted: %s: %s\n" % (type(e).__name__, e))
+
     def log_message(self, fmt, *args):
         sys.stderr.write("%s - - [%s] %s\n" % (self.client_address[0], self.log_date_time_string(), fmt % args))
     def do_HEAD(self):
@@ -396,35 +554,16 @@ class Handler(BaseHTTPRequestHandler):
             if path == "/metrics":
                 # HEAD support for Prometheus scrape probes / header checks
                 self.send_response(200)
-                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Type", lims_metrics.CONTENT_TYPE)
                 self.send_header("Content-Length", "0")
                 self.send_header("Cache-Control", "no-store")
                 self.end_headers()
                 return
 
             if path == "/exports/latest":
-                latest = _find_latest_api_tarball()
-                if not latest:
-                    self.send_response(404)
-                    self.send_header("Content-Length", "0")
-                    self.end_headers()
-                    return
-                fp = Path(latest)
-                try:
-                    st = fp.stat()
-                    self.send_response(200)
-                    self.send_header("Content-Type", "application/gzip")
-                    self.send_header("Content-Length", str(st.st_size))
-                    self.send_header("Content-Disposition", 'attachment; filename="snapshot.tar.gz"')
-                    self.send_header("Cache-Control", "no-store")
-                    self.end_headers()
-                except Exception:
-                    self.send_response(500)
-                    self.send_header("Content-Length", "0")
-                    self.end_headers()
+                self._api_exports_latest()
                 return
 
-
             if path.startswith("/exports/") and path != "/exports/latest":
                 self.send_response(404)
                 self.send_header("Content-Length", "0")
@@ -492,13 +631,20 @@ class Handler(BaseHTTPRequestHandler):
             path = u.path
 
             if os.environ.get("NEXUS_REQUIRE_AUTH_FOR_SAMPLES","").strip().lower() in ("1","true","yes"):
-                if path.startswith("/sample/"):
+                if path.startswith("/sample/") or path == "/export/samples.ndjson":
                     if not _require_session(self, lims_db):
                         return
 
             if handle_sample_read_get(self, path, u, lims_db):
                 return
 
+            if api_jobs.handle_jobs_get(self, path):
+                return
+
+            if path == "/export/samples.ndjson":
+                self._api_export_samples_ndjson(u)
+                return
+
             if path == "/auth/me":
                 if lims_db is None:
                     self._err(500, "internal_error", "lims_db import failed")
@@ -508,69 +654,18 @@ class Handler(BaseHTTPRequestHandler):
                     self._err(401, "auth_required", "missing session header (X-Nexus-Session) or Authorization: Bearer")
                     return
 
-                conn = lims_db.connect()
-                try:
-                    if hasattr(lims_db, "apply_migrations"):
-                        lims_db.apply_migrations(conn)
-                    elif hasattr(lims_db, "init_db"):
-                        lims_db.init_db(conn)
-
-                    now = _utc_now_iso()
-                    # best-effort cleanup
-                    try:
-                        conn.execute("DELETE FROM guest_sessions WHERE expires_at <= ?", (now,))
-                        conn.commit()
-                    except Exception:
-                        pass
-
-                    row = conn.execute(
-                        "SELECT id, display_name, created_at, expires_at, last_seen_at "
-                        "FROM guest_sessions WHERE id = ? AND expires_at > ?",
-                        (sid, now),
-                    ).fetchone()
-                    if row:
-                        try:
-                            conn.execute("UPDATE guest_sessions SET last_seen_at = ? WHERE id = ?", (now, sid))
-                            conn.commit()
-                        except Exception:
-                            pass
-                finally:
-                    try:
-                        conn.close()
-                    except Exception:
-                        pass
+                row = lims_sessions.lookup(sid)
 
                 if not row:
                     self._err(401, "invalid_session", "session not found or expired")
                     return
 
-                self._send(200, {"schema": "nexus_auth_me", "schema_version": 1, "ok": True, "session": dict(row)})
+                self._send(200, {"schema": "nexus_auth_me", "schema_version": 1, "ok": True, "session": row})
                 return
 
             # Download export artifacts (server-controlled dir only).
             if path == "/exports/latest":
-                latest = _find_latest_api_tarball()
-                if not latest:
-                    self._err(404, "not_found", path=path, method="GET")
-                    return
-                fp = Path(latest)
-                try:
-                    st = fp.stat()
-                    self.send_response(200)
-                    self.send_header("Content-Type", "application/gzip")
-                    self.send_header("Content-Length", str(st.st_size))
-                    self.send_header("Content-Disposition", 'attachment; filename="snapshot.tar.gz"')
-                    self.send_header("Cache-Control", "no-store")
-                    self.end_headers()
-                    with fp.open("rb") as f:
-                        while True:
-                            chunk = f.read(1024 * 1024)
-                            if not chunk:
-                                break
-                            self.wfile.write(chunk)
-                except Exception as e:
-                    msg = f"download failed: {type(e).__name__}: {e}\n".encode("utf-8")
-                    self._send_bytes(500, msg, "text/plain; charset=utf-8")
+                self._api_exports_latest()
                 return
 
             if path.startswith("/exports/") and path != "/exports/latest":
@@ -605,7 +700,7 @@ class Handler(BaseHTTPRequestHandler):
                     "schema_version": 1,
                     "ok": True,
                     "db_path": os.environ.get("DB_PATH", ""),
-                    "git_rev": _git_rev_short(),
+                    "git_rev": lims_metrics.BUILD_INFO["git_rev"],
                 })
                 return
 
@@ -614,66 +709,13 @@ class Handler(BaseHTTPRequestHandler):
                     "schema": "nexus_api_version",
                     "schema_version": 1,
                     "ok": True,
-                    "git_rev": _git_rev_short(),
+                    "git_rev": lims_metrics.BUILD_INFO["git_rev"],
                 })
                 return
 
             if path == "/metrics":
-                # Prometheus-style plaintext metrics (best-effort; never raises)
-                rev = _git_rev_short()
-                lines = []
-                lines.append('# HELP nexus_api_up API process up (always 1 if endpoint responds)')
-                lines.append('# TYPE nexus_api_up gauge')
-                lines.append('nexus_api_up 1')
-                lines.append('# HELP nexus_build_info Build info')
-                lines.append('# TYPE nexus_build_info gauge')
-                lines.append('nexus_build_info{git_rev="%s"} 1' % (rev,))
-                db_up = 0
-                samples_total = 0
-                containers_total = 0
-                events_total = 0
-                if lims_db is not None:
-                    try:
-                        conn = lims_db.connect()
-                        try:
-                            if hasattr(lims_db, 'apply_migrations'):
-                                lims_db.apply_migrations(conn)
-                            elif hasattr(lims_db, 'init_db'):
-                                lims_db.init_db(conn)
-                            try:
-                                samples_total = int((conn.execute('SELECT COUNT(1) FROM samples').fetchone() or [0])[0] or 0)
-                            except Exception:
-                                samples_total = 0
-                            try:
-                                containers_total = int((conn.execute('SELECT COUNT(1) FROM containers').fetchone() or [0])[0] or 0)
-                            except Exception:
-                                containers_total = 0
-                            try:
-                                events_total = int((conn.execute('SELECT COUNT(1) FROM sample_events').fetchone() or [0])[0] or 0)
-                            except Exception:
-                                events_total = 0
-                            db_up = 1
-                        finally:
-                            try:
-                                conn.close()
-                            except Exception:
-                                pass
-                    except Exception:
-                        db_up = 0
-                lines.append('# HELP nexus_db_up 1 if DB connect+query ok')
-                lines.append('# TYPE nexus_db_up gauge')
-                lines.append('nexus_db_up %d' % (db_up,))
-                lines.append('# HELP nexus_samples_total Total samples')
-                lines.append('# TYPE nexus_samples_total gauge')
-                lines.append('nexus_samples_total %d' % (samples_total,))
-                lines.append('# HELP nexus_containers_total Total containers')
-                lines.append('# TYPE nexus_containers_total gauge')
-                lines.append('nexus_containers_total %d' % (containers_total,))
-                lines.append('# HELP nexus_sample_events_total Total sample events')
-                lines.append('# TYPE nexus_sample_events_total gauge')
-                lines.append('nexus_sample_events_total %d' % (events_total,))
-                body = ('\n'.join(lines) + '\n').encode('utf-8')
-                self._send_bytes(200, body, 'text/plain; version=0.0.4; charset=utf-8')
+                # Prometheus text; counts come from trigger-maintained table_counts (lims/metrics.py).
+                self._send_bytes(200, lims_metrics.render().encode("utf-8"), lims_metrics.CONTENT_TYPE)
                 return
 
             if path == "/container/list":
@@ -693,22 +735,19 @@ class Handler(BaseHTTPRequestHandler):
                     return
                 if limit > 500:
                     limit = 500
-                conn = lims_db.connect()
                 try:
-                    if hasattr(lims_db, "apply_migrations"):
-                        lims_db.apply_migrations(conn)
-                    elif hasattr(lims_db, "init_db"):
-                        lims_db.init_db(conn)
+                    seek_sql, seek_params = container_seek(qs["cursor"][0] if qs.get("cursor") else None)
+                except CursorError as e:
+                    self._err(400, "bad_request", str(e))
+                    return
+                where = (" WHERE " + seek_sql) if seek_sql else ""
+                with lims_db.reader("container_list") as conn:
                     rows = conn.execute(
-                        "SELECT * FROM containers ORDER BY created_at DESC, id DESC LIMIT ?",
-                        (limit,),
+                        "SELECT * FROM containers" + where + " ORDER BY id DESC LIMIT ?",
+                        (*seek_params, limit + 1),
                     ).fetchall()
+                    rows, next_cursor = page(rows, limit, CONTAINER_KEY)
                     containers = [dict(r) for r in rows]
-                finally:
-                    try:
-                        conn.close()
-                    except Exception:
-                        pass
                 self._send(200, {
                     "schema": "nexus_container_list",
                     "schema_version": 1,
@@ -716,6 +755,7 @@ class Handler(BaseHTTPRequestHandler):
                     "limit": limit,
                     "count": len(containers),
                     "containers": containers,
+                    "next_cursor": next_cursor,
                 })
                 return
 
@@ -740,6 +780,11 @@ class Handler(BaseHTTPRequestHandler):
         try:
             path = urlparse(self.path).path
 
+            # POST /sample/add/batch (JSON, JSONL or CSV body; read before the generic JSON parse)
+            if path == "/sample/add/batch":
+                self._api_sample_add_batch(u)
+                return
+
             try:
                 body = self._read_json()
             except ValueError as e:
@@ -757,25 +802,13 @@ class Handler(BaseHTTPRequestHandler):
                     self._err(400, "bad_request", str(e))
                     return
 
-                conn = lims_db.connect()
-                try:
-                    if hasattr(lims_db, "apply_migrations"):
-                        lims_db.apply_migrations(conn)
-                    elif hasattr(lims_db, "init_db"):
-                        lims_db.init_db(conn)
-
+                with lims_db.writer("auth_guest") as conn:
                     now_dt = datetime.now(timezone.utc).replace(microsecond=0)
                     exp_dt = (now_dt + timedelta(seconds=_guest_ttl_seconds())).replace(microsecond=0)
                     now = now_dt.isoformat()
                     expires_at = exp_dt.isoformat()
 
-                    # best-effort cleanup
-                    try:
-                        conn.execute("DELETE FROM guest_sessions WHERE expires_at <= ?", (now,))
-                        conn.commit()
-                    except Exception:
-                        pass
-
+                    # Expired rows are removed by the session sweeper (lims/sessions.py).
                     sid = secrets.token_urlsafe(24)
                     conn.execute(
                         "INSERT INTO guest_sessions (id, display_name, created_at, expires_at, last_seen_at) "
@@ -791,70 +824,51 @@ class Handler(BaseHTTPRequestHandler):
                         "expires_at": expires_at,
                         "last_seen_at": now,
                     }
-                finally:
-                    try:
-                        conn.close()
-                    except Exception:
-                        pass
+                lims_sessions.remember(sess)
 
                 self._send(200, {"schema": "nexus_auth_guest", "schema_version": 1, "ok": True, "session": sess})
                 return
 
-            # POST /snapshot/export
+            # POST /snapshot/export, /snapshot/verify: background jobs (lims/jobs.py). The request
+            # waits up to NEXUS_API_JOB_SYNC_WAIT_SEC for the result, then answers 202 + job id;
+            # {"async": true} or `Prefer: respond-async` answers 202 at once.
             if path == "/snapshot/export":
-                                                    _ = body.get("exports_dir")  # ignored; server chooses a safe dir
-                                                    include_samples = body.get("include_samples", [])
-
-                                                    if include_samples is None:
-                                                        include_samples = []
-                                                    if not isinstance(include_samples, list) or any(not isinstance(x, str) for x in include_samples):
-                                                        self._err(400, "bad_request", "include_samples must be a list[str]")
-                                                        return
-
-                                                    # Always write exports to a safe server-side directory (prevents path abuse).
-                                                    exports_dir = _mk_api_exports_dir()
-                                                    env = os.environ.copy()
-                                                    env["EXPORTS_DIR"] = exports_dir
-                                                    if include_samples:
-                                                        try:
-                                                            cleaned = [_validate_sample_id(x) for x in include_samples]
-                                                        except ValueError as e:
-                                                            self._err(400, "bad_request", str(e))
-                                                            return
-                                                        # Pass via env var to avoid user input on the subprocess command line.
-                                                        env["NEXUS_API_INCLUDE_SAMPLES"] = "\n".join(cleaned)
-
-                                                    cmd = ["./scripts/lims.sh", "snapshot", "export", "--json"]
-                                                    rc, doc, err = _run_json(cmd, env=env)
-                                                    if rc == 0:
-                                                        # Make exports_dir explicit in the response for clients.
-                                                        if isinstance(doc, dict):
-                                                            doc.setdefault("exports_dir", exports_dir)
-                                                        self._send(200, doc)
-                                                    elif rc == 124:
-                                                        self._err(504, "command_timeout", rc=rc, stderr=err)
-                                                    else:
-                                                        self._err(400, "command_failed", rc=rc, stderr=err)
-                                                    return
-
-            # POST /snapshot/verify
+                _ = body.get("exports_dir")  # ignored; server chooses a safe dir
+                include_samples = body.get("include_samples", [])
+
+                if include_samples is None:
+                    include_samples = []
+                if not isinstance(include_samples, list) or any(not isinstance(x, str) for x in include_samples):
+                    self._err(400, "bad_request", "include_samples must be a list[str]")
+                    return
+
+                cleaned = []
+                if include_samples:
+                    try:
+                        cleaned = [_validate_sample_id(x) for x in include_samples]
+                    except ValueError as e:
+                        self._err(400, "bad_request", str(e))
+                        return
+                    max_inc = int(os.environ.get("NEXUS_API_INCLUDE_SAMPLES_MAX", "1024") or "1024")
+                    if len(cleaned) > max_inc:
+                        self._err(400, "bad_request", f"too many include_samples (max {max_inc})")
+                        return
+
+                wait = 0 if api_jobs.wants_async(self.headers, body) else api_jobs.sync_wait_sec(CLI_TIMEOUT_SEC)
+                self._send(*api_jobs.submit("snapshot_export", tuple(sorted(set(cleaned))), _snapshot_export_job(cleaned), wait_sec=wait))
+                return
+
             if path == "/snapshot/verify":
                 artifact = body.get("artifact")
                 if not artifact or not isinstance(artifact, str):
                     self._err(400, "bad_request", "artifact must be a string")
                     return
 
-                env = os.environ.copy()
-                env["SNAPSHOT_ARTIFACT"] = artifact
-                cmd = ["bash", "./scripts/snapshot_verify.sh", "--json"]
+                wait = 0 if api_jobs.wants_async(self.headers, body) else api_jobs.sync_wait_sec(CLI_TIMEOUT_SEC)
+                self._send(*api_jobs.submit("snapshot_verify", artifact.strip(), _snapshot_verify_job(artifact), wait_sec=wait))
+                return
 
-                rc, doc, err = _run_json(cmd, env=env)
-                if rc == 0:
-                    self._send(200, doc)
-                elif rc == 124:
-                    self._err(504, "command_timeout", rc=rc, stderr=err)
-                else:
-                    self._err(400, "command_failed", rc=rc, stderr=err)
+            if api_jobs.handle_jobs_post(self, path):
                 return
 
             # POST /sample/report
@@ -922,12 +936,7 @@ class Handler(BaseHTTPRequestHandler):
                 except ValueError as e:
                     self._err(400, "bad_request", str(e))
                     return
-                conn = lims_db.connect()
-                try:
-                    if hasattr(lims_db, "apply_migrations"):
-                        lims_db.apply_migrations(conn)
-                    elif hasattr(lims_db, "init_db"):
-                        lims_db.init_db(conn)
+                with lims_db.writer("container_add") as conn:
                     if conn.execute("SELECT 1 FROM containers WHERE barcode = ? LIMIT 1", (barcode,)).fetchone():
                         self._err(400, "bad_request", f"container barcode already exists: \'{barcode}\'")
                         return
@@ -941,11 +950,6 @@ class Handler(BaseHTTPRequestHandler):
                     cid = cur.lastrowid
                     row = conn.execute("SELECT * FROM containers WHERE id = ?", (cid,)).fetchone()
                     container = dict(row) if row else {"id": cid, "barcode": barcode, "kind": kind, "location": location}
-                finally:
-                    try:
-                        conn.close()
-                    except Exception:
-                        pass
                 self._send(200, {
                     "schema": "nexus_container",
                     "schema_version": 1,
@@ -975,6 +979,12 @@ def main():
         sys.stderr.write(f"ERROR: refusing to bind to {args.host}. Use --allow-remote if you intend remote access.\n")
         sys.exit(2)
 
+    # Migrations run once here; request handlers rely on the user_version fast path.
+    if lims_db is not None:
+        lims_db.migrate_on_startup()
+        lims_db.start_checkpointer()
+        lims_sessions.start_sweeper()
+
     httpd = ThreadingHTTPServer((args.host, args.port), Handler)
     httpd.daemon_threads = True
     sys.stderr.write(f"OK: Nexus LIMS API listening on http://{args.host}:{args.port}\n")
@@ -984,6 +994,8 @@ def main():
         sys.stderr.write("OK: shutting down (Ctrl+C)\n")
     finally:
         httpd.server_close()
+        lims_jobs.runner().shutdown()
+        lims_sessions.stop()
 
 if __name__ == "__main__":
     main()
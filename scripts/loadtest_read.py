@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Load test: read-endpoint throughput of the FastAPI server against its worker count.
+
+  scripts/loadtest_read.py --workers 1,2,4,8,16       # start the server at each count
+  scripts/loadtest_read.py --url http://127.0.0.1:8789 # measure a running server
+
+With --workers, a scratch DB is seeded (--samples rows) and each round starts the
+server on it on a free port (gunicorn + ops/gunicorn.conf.py when N > 1 and gunicorn
+is importable, else uvicorn), waits for /health, then runs --clients load processes
+for --duration seconds. Each client keeps one HTTP/1.1 connection open and cycles
+through GET /sample/list and /sample/show + /sample/events for samples the server
+lists. Prints requests/s, p50/p99 latency, speedup over the first round and
+efficiency (speedup / worker ratio); with --min-efficiency, exits 1 if the last round
+falls below it.
+
+The clients share the machine with the server, so scaling only shows when the two run
+on disjoint CPUs. By default, if the host has at least (largest worker count + clients)
+CPUs, the server gets the first ones and the clients the next (sched_setaffinity, as
+taskset would); --server-cpus / --client-cpus (e.g. 0-7 / 8-15) pick them explicitly.
+A round with N workers runs the server on the first N of its CPUs.
+Otherwise the run warns that the CPUs are shared and --min-efficiency refuses to judge.
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_cpus(spec: str) -> List[int]:
+    """"0-3,8" -> [0, 1, 2, 3, 8]."""
+    cpus: List[int] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.extend(range(int(lo), int(hi or lo) + 1))
+    return sorted(set(cpus))
+
+
+def plan_cpus(server_spec: Optional[str], client_spec: Optional[str], workers: int, clients: int) -> Tuple[Optional[List[int]], Optional[List[int]]]:
+    """(server CPUs, client CPUs); None leaves that side unpinned."""
+    if server_spec or client_spec:
+        return (parse_cpus(server_spec) if server_spec else None), (parse_cpus(client_spec) if client_spec else None)
+    avail = sorted(os.sched_getaffinity(0))
+    if len(avail) < workers + clients:
+        return None, None
+    return avail[:workers], avail[workers:workers + clients]
+
+
+def seed(db_path: Path, samples: int) -> None:
+    env = dict(os.environ, DB_PATH=str(db_path))
+    rows = db_path.with_name("seed.jsonl")
+    with rows.open("w", encoding="utf-8") as f:
+        for i in range(samples):
+            f.write(json.dumps({"external_id": f"LT-{i:06d}", "specimen_type": "blood"}) + "\n")
+    for args in (["init"], ["sample", "import", str(rows)]):
+        p = subprocess.run(["./scripts/lims.sh", *args], cwd=str(REPO_ROOT), env=env, text=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if p.returncode != 0:
+            raise SystemExit(f"seed failed: {args}: {p.stdout}{p.stderr}")
+    rows.unlink()
+
+
+def start_server(workers: int, port: int, env: Dict[str, str], log: Path, cpus: Optional[List[int]]) -> subprocess.Popen:
+    env = dict(env, HOST="127.0.0.1", PORT=str(port), NEXUS_API_WORKERS=str(workers), LOG_LEVEL="warning")
+    have_gunicorn = subprocess.run([sys.executable, "-c", "import gunicorn"], stderr=subprocess.DEVNULL).returncode == 0
+    if workers > 1 and have_gunicorn:
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "ops/gunicorn.conf.py", "lims.api_fastapi:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "lims.api_fastapi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning", "--workers", str(workers)]
+    with log.open("ab") as out:
+        return subprocess.Popen(cmd, cwd=str(REPO_ROOT), env=env, stdout=out, stderr=subprocess.STDOUT, start_new_session=True,
+                                preexec_fn=(lambda: os.sched_setaffinity(0, cpus)) if cpus else None)
+
+
+def wait_ready(host: str, port: int, proc: Optional[subprocess.Popen], timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise SystemExit(f"server exited early (rc={proc.returncode})")
+        try:
+            c = http.client.HTTPConnection(host, port, timeout=2)
+            c.request("GET", "/health")
+            if c.getresponse().status == 200:
+                c.close()
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"server on {host}:{port} not ready after {timeout:.0f}s")
+
+
+def read_paths(host: str, port: int) -> List[str]:
+    """The request mix: the list page plus show/events for up to 50 samples the server lists."""
+    c = http.client.HTTPConnection(host, port, timeout=10)
+    c.request("GET", "/sample/list?limit=50")
+    r = c.getresponse()
+    body = r.read()
+    c.close()
+    if r.status != 200:
+        raise SystemExit(f"GET /sample/list: HTTP {r.status} (NEXUS_REQUIRE_AUTH_FOR_SAMPLES set?)")
+    ids = [quote(str(s.get("external_id") or s["id"])) for s in json.loads(body).get("samples", [])]
+    if not ids:
+        raise SystemExit("the server lists no samples; seed some first")
+    paths = ["/sample/list?limit=25"]
+    paths += [f"/sample/show?identifier={i}" for i in ids]
+    paths += [f"/sample/events?identifier={i}" for i in ids]
+    return paths
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    try:
+        os.killpg(proc.pid, 15)
+        proc.wait(20)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        try:
+            os.killpg(proc.pid, 9)
+        except ProcessLookupError:
+            pass
+        proc.wait()
+
+
+def client(host: str, port: int, paths: List[str], start_at: float, stop_at: float, cpus: Optional[List[int]], q) -> None:
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    lat: List[float] = []
+    errors = 0
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    i = os.getpid()
+    while time.time() < start_at:
+        time.sleep(0.001)
+    while time.time() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            r = conn.getresponse()
+            r.read()
+            if r.status != 200:
+                errors += 1
+                continue
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        lat.append(time.perf_counter() - t0)
+    conn.close()
+    q.put((lat, errors))
+
+
+def measure(host: str, port: int, paths: List[str], clients: int, duration: float, warmup: float,
+            cpus: Optional[List[int]]) -> Dict[str, Any]:
+    mp = multiprocessing.get_context("spawn")
+    q = mp.Queue()
+    start_at = time.time() + 1.0 + warmup
+    stop_at = start_at + duration
+    procs = [mp.Process(target=client, args=(host, port, paths, start_at, stop_at, cpus, q)) for _ in range(clients)]
+    for p in procs:
+        p.start()
+    lat: List[float] = []
+    errors = 0
+    for _ in procs:
+        l, e = q.get(timeout=duration + warmup + 120)
+        lat.extend(l)
+        errors += e
+    for p in procs:
+        p.join()
+    lat.sort()
+
+    def pct(p: float) -> float:
+        return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 2) if lat else 0.0
+
+    return {"requests": len(lat), "errors": errors, "rps": round(len(lat) / duration, 1), "p50_ms": pct(0.50), "p99_ms": pct(0.99)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Read-endpoint throughput vs FastAPI worker count")
+    ap.add_argument("--workers", default="1,2,4", help="comma-separated worker counts to start and measure (default 1,2,4)")
+    ap.add_argument("--url", help="measure this running server instead of starting one")
+    ap.add_argument("--clients", type=int, default=0, help="load processes (default: 2 x the largest worker count, at most 16)")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds measured per round (default 10)")
+    ap.add_argument("--warmup", type=float, default=2.0, help="seconds of load before measuring (default 2)")
+    ap.add_argument("--samples", type=int, default=2000, help="samples seeded into the scratch DB (default 2000)")
+    ap.add_argument("--server-cpus", help="CPUs to pin the server to, e.g. 0-7 (default: split the host's CPUs if it has enough)")
+    ap.add_argument("--client-cpus", help="CPUs to pin the load clients to, e.g. 8-15")
+    ap.add_argument("--min-efficiency", type=float, default=0.0,
+                    help="fail if the last round's efficiency is below this (e.g. 0.7); needs disjoint server/client CPUs")
+    ap.add_argument("--json", action="store_true", help="print the result document as JSON")
+    args = ap.parse_args(argv)
+
+    counts = [1] if args.url else [int(x) for x in args.workers.split(",") if x.strip()]
+    if not counts or min(counts) < 1:
+        ap.error("--workers needs positive counts")
+    clients = args.clients or min(16, 2 * max(counts))
+    try:
+        server_cpus, client_cpus = plan_cpus(None if args.url else args.server_cpus, args.client_cpus,
+                                             0 if args.url else max(counts), clients)
+    except ValueError:
+        ap.error("--server-cpus/--client-cpus take lists like 0-3,8")
+    if args.url:
+        server_cpus = None  # not ours to pin
+    shared = args.url is None and (server_cpus is None or client_cpus is None or bool(set(server_cpus) & set(client_cpus)))
+    if shared:
+        print(f"WARNING: server and clients share CPUs ({os.cpu_count()} on this host); these rounds do not show "
+              "how reads scale with workers (see --server-cpus/--client-cpus)", file=sys.stderr)
+        if args.min_efficiency:
+            print("ERROR: --min-efficiency needs the server and the clients on disjoint CPUs", file=sys.stderr)
+            return 2
+    paths: List[str] = []
+
+    rounds: List[Dict[str, Any]] = []
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-loadtest."))
+    try:
+        if args.url:
+            u = urlparse(args.url)
+            host, port = u.hostname or "127.0.0.1", u.port or 80
+            wait_ready(host, port, None)
+            paths = read_paths(host, port)
+            rounds.append(dict(workers=None, **measure(host, port, paths, clients, args.duration, args.warmup, client_cpus)))
+        else:
+            db_path = tmp / "lims.sqlite3"
+            seed(db_path, max(1, args.samples))
+            env = dict(os.environ, DB_PATH=str(db_path), KANBAN_STORE_PATH=str(tmp / "kanban.json"))
+            for n in counts:
+                port = free_port()
+                # N workers get N CPUs, so the 1-worker baseline cannot spread its threads over all of them.
+                cpus = server_cpus[:n] if server_cpus and len(server_cpus) >= n else server_cpus
+                proc = start_server(n, port, env, tmp / "server.log", cpus)
+                try:
+                    try:
+                        wait_ready("127.0.0.1", port, proc)
+                    except SystemExit:
+                        sys.stderr.write((tmp / "server.log").read_text(encoding="utf-8", errors="replace")[-4000:])
+                        raise
+                    paths = paths or read_paths("127.0.0.1", port)
+                    rounds.append(dict(workers=n, **measure("127.0.0.1", port, paths, clients, args.duration, args.warmup, client_cpus)))
+                finally:
+                    stop_server(proc)
+                if not args.json:
+                    r = rounds[-1]
+                    print(f"workers={n:<3} rps={r['rps']:<9} p50={r['p50_ms']}ms p99={r['p99_ms']}ms errors={r['errors']}", flush=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    base = rounds[0]
+    for r in rounds:
+        r["speedup"] = round(r["rps"] / base["rps"], 2) if base["rps"] else 0.0
+        if r["workers"] and base["workers"]:
+            r["efficiency"] = round(r["speedup"] / (r["workers"] / base["workers"]), 2)
+    doc = {"schema": "nexus_loadtest_read", "schema_version": 1, "clients": clients, "duration_sec": args.duration,
+           "paths": len(paths), "cpus": os.cpu_count(), "server_cpus": server_cpus, "client_cpus": client_cpus,
+           "shared_cpus": shared, "rounds": rounds}
+    if args.json:
+        print(json.dumps(doc, indent=2))
+    else:
+        for r in rounds:
+            eff = f" efficiency={r['efficiency']}" if "efficiency" in r else ""
+            print(f"workers={r['workers'] or '-':<3} rps={r['rps']:<9} speedup={r['speedup']}{eff}")
+    last = rounds[-1]
+    if args.min_efficiency and last.get("efficiency", 1.0) < args.min_efficiency:
+        print(f"FAIL: efficiency {last.get('efficiency')} at {last['workers']} workers < {args.min_efficiency}", file=sys.stderr)
+        return 1
+    if any(r["errors"] for r in rounds):
+        print("FAIL: requests failed during the run", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
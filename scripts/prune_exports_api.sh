@@ -21,7 +21,7 @@ ROOT="$REPO_ROOT/exports/api"
 mkdir -p "$ROOT"
 
 # List tarballs newest-first (mtime); keep newest $KEEP, delete the rest.
-mapfile -t TARS < <(find "$ROOT" -maxdepth 1 -type f -name '*.tar.gz' -printf '%T@ %p\n' \
+mapfile -t TARS < <(find "$ROOT" -maxdepth 1 -type f \( -name '*.tar.gz' -o -name '*.tar.zst' \) -printf '%T@ %p\n' \
   | sort -nr | awk '{print $2}')
 
 total="${#TARS[@]}"
@@ -43,7 +43,9 @@ for f in "${to_delete[@]}"; do
     exit 1
   fi
 
-  base="$(basename "$fp" .tar.gz)"
+  base="$(basename "$fp")"
+  base="${base%.tar.gz}"
+  base="${base%.tar.zst}"
   dir="$ROOT/$base"
 
   if (( DRY_RUN == 1 )); then
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import os, socket, subprocess, tempfile, time
+import hashlib, os, socket, subprocess, tempfile, time
 from pathlib import Path
 from urllib.request import Request, urlopen
 from urllib.error import HTTPError
@@ -26,10 +26,17 @@ def free_port():
     s.close()
     return port
 
-def http(method, url):
-    req = Request(url, method=method)
+def http(method, url, headers=None):
+    req = Request(url, method=method, headers=headers or {})
     return urlopen(req, timeout=5)
 
+def status_of(method, url, headers):
+    try:
+        with http(method, url, headers) as r:
+            return r.status, r.headers, r.read()
+    except HTTPError as e:
+        return e.code, e.headers, e.read()
+
 def wait_health(port, tries=60):
     for _ in range(tries):
         try:
@@ -92,7 +99,41 @@ def main():
             if data[:2] != b"\x1f\x8b":
                 raise SystemExit("FAIL: GET /exports/latest not gzip (missing 1f 8b header)")
 
-        print("OK: /exports/latest returns latest tarball (HEAD + GET).")
+            etag = r.headers.get("ETag", "")
+            sha = hashlib.sha256(data).hexdigest()
+            if etag != f'"{sha}"' or r.headers.get("X-Content-SHA256") != sha:
+                raise SystemExit(f"FAIL: ETag/X-Content-SHA256 should be the tarball sha256: {etag} {r.headers.get('X-Content-SHA256')} != {sha}")
+            if r.headers.get("Accept-Ranges") != "bytes" or not r.headers.get("Last-Modified"):
+                raise SystemExit(f"FAIL: Accept-Ranges/Last-Modified missing: {dict(r.headers)}")
+            last_mod = r.headers["Last-Modified"]
+
+        url = f"http://127.0.0.1:{port}/exports/latest"
+        # Conditional GET: unchanged snapshot -> 304, no body.
+        for hdrs in ({"If-None-Match": etag}, {"If-None-Match": f'"other", W/{etag}'}, {"If-Modified-Since": last_mod}):
+            st, h, body = status_of("GET", url, hdrs)
+            if st != 304 or body or h.get("ETag") != etag:
+                raise SystemExit(f"FAIL: {hdrs} should give 304 without a body, got {st} ({len(body)} bytes)")
+        st, _h, body = status_of("GET", url, {"If-None-Match": '"0000"', "If-Modified-Since": last_mod})
+        if st != 200 or body != data:
+            raise SystemExit(f"FAIL: a stale If-None-Match wins over If-Modified-Since: {st}")
+
+        # Byte ranges (resume).
+        cases = (
+            ({"Range": "bytes=10-99"}, 206, data[10:100], f"bytes 10-99/{len(data)}"),
+            ({"Range": "bytes=-50"}, 206, data[-50:], f"bytes {len(data) - 50}-{len(data) - 1}/{len(data)}"),
+            ({"Range": "bytes=100-", "If-Range": etag}, 206, data[100:], f"bytes 100-{len(data) - 1}/{len(data)}"),
+            ({"Range": "bytes=100-", "If-Range": '"changed"'}, 200, data, None),
+            ({"Range": "bytes=0-1,5-6"}, 200, data, None),
+            ({"Range": f"bytes={len(data)}-"}, 416, b"", f"bytes */{len(data)}"),
+        )
+        for hdrs, want_st, want_body, want_cr in cases:
+            st, h, body = status_of("GET", url, hdrs)
+            if st != want_st or body != want_body or h.get("Content-Range") != want_cr:
+                raise SystemExit(f"FAIL: {hdrs}: got {st} {len(body)} bytes Content-Range={h.get('Content-Range')}, want {want_st} {len(want_body)} {want_cr}")
+            if st in (200, 206) and int(h.get("Content-Length", "-1")) != len(body):
+                raise SystemExit(f"FAIL: {hdrs}: Content-Length {h.get('Content-Length')} != {len(body)}")
+
+        print("OK: /exports/latest returns latest tarball (HEAD + GET, ETag/sha256 304s, byte ranges).")
     finally:
         api.terminate()
         try:
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Regression: background jobs for snapshot export/verify (lims/jobs.py, GET /jobs/{id}).
+Checks the runner (dedup of identical active jobs, the in-flight bound, cancelling a
+queued job, a running export and a running child process) in-process, then the API:
+an async export answers 202 and its job reports backup/tar progress and the export
+result, a sync export still answers 200 with the result, verify runs as a job, and
+unknown job ids are 404.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def free_port() -> int:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def http_json(method, url, body=None, headers=None, timeout=30):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = Request(url, data=data, headers=dict(headers or {}, **({"Content-Type": "application/json"} if data else {})), method=method)
+    try:
+        with urlopen(req, timeout=timeout) as r:
+            return r.status, json.loads(r.read().decode("utf-8"))
+    except HTTPError as e:
+        raw = e.read().decode("utf-8") if e.fp else ""
+        return e.code, json.loads(raw) if raw else {}
+
+
+def wait_done(job, timeout=30.0) -> bool:
+    return job.wait(timeout)
+
+
+def runner_checks(tmp: Path) -> str | None:
+    from lims import jobs as lims_jobs
+    from lims import snapshot as lims_snapshot
+
+    r = lims_jobs.JobRunner(workers=1, queue_max=1)
+    gate = threading.Event()
+
+    def blocked(job):
+        while not gate.is_set():
+            job.check()
+            time.sleep(0.01)
+        return {"ok": True}
+
+    a, created_a = r.submit("t", "k1", blocked)
+    b, created_b = r.submit("t", "k1", blocked)
+    if not created_a or created_b or a is not b:
+        return "an identical active job should be joined, not started again"
+    q, _ = r.submit("t", "k2", blocked)
+    try:
+        r.submit("t", "k3", blocked)
+        return "submit beyond workers + queue_max should raise QueueFull"
+    except lims_jobs.QueueFull:
+        pass
+    r.cancel(q.id)
+    if q.state != lims_jobs.CANCELLED or not q.done():
+        return f"a queued job should be cancelled at once: {q.to_doc()}"
+    gate.set()
+    if not wait_done(a) or a.state != lims_jobs.SUCCEEDED or a.result != {"ok": True}:
+        return f"job should succeed: {a.to_doc()}"
+    c, created_c = r.submit("t", "k1", blocked)
+    if not created_c or c is a:
+        return "a finished job should not absorb new submissions"
+    wait_done(c)
+
+    # Cancel a running export at its first backup batch: no tarball is left behind.
+    exports = tmp / "cancel-exports"
+    exports.mkdir()
+
+    def export(job):
+        def progress(stage, done, total):
+            r.cancel(job.id)
+            job.report(stage, done, total)
+        return lims_snapshot.export_snapshot(exports_dir=exports, progress=progress, backup_pages=1)
+
+    e, _ = r.submit("export", (), export)
+    if not wait_done(e) or e.state != lims_jobs.CANCELLED:
+        return f"export should stop when cancelled: {e.to_doc()}"
+    left = [p.name for p in exports.iterdir() if ".tar" in p.name]
+    if left:
+        return f"cancelled export left tarball files: {left}"
+
+    # Cancel a running child process.
+    def child(job):
+        rc, _out, _err = lims_jobs.run_command(job, ["sleep", "30"])
+        return {"rc": rc}
+
+    s, _ = r.submit("sleep", (), child)
+    time.sleep(0.3)
+    t0 = time.monotonic()
+    r.cancel(s.id)
+    if not wait_done(s, 10) or s.state != lims_jobs.CANCELLED or time.monotonic() - t0 > 5:
+        return f"run_command should terminate its child on cancel: {s.to_doc()}"
+
+    def failing(job):
+        raise lims_jobs.JobError("command_failed", "boom", rc=2)
+
+    f, _ = r.submit("fail", (), failing)
+    wait_done(f)
+    if f.state != lims_jobs.FAILED or f.error != {"error": "command_failed", "detail": "boom", "rc": 2} or f.to_doc()["ok"]:
+        return f"JobError should become the job error: {f.to_doc()}"
+    r.shutdown()
+    return None
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-api-jobs."))
+    env = os.environ.copy()
+    env["DB_PATH"] = str(tmp / "lims.sqlite3")
+    for k in ("SNAPSHOT_CODEC", "SNAPSHOT_STORE", "NEXUS_API_JOB_SYNC_WAIT_SEC"):
+        env.pop(k, None)
+
+    p = run(["./scripts/lims.sh", "init"], env)
+    if p.returncode != 0:
+        return fail(f"init: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "sample", "add", "--external-id", "J-001", "--specimen-type", "blood"], env)
+    if p.returncode != 0:
+        return fail(f"sample add: {p.stdout}{p.stderr}")
+
+    os.environ["DB_PATH"] = env["DB_PATH"]
+    msg = runner_checks(tmp)
+    if msg:
+        return fail(msg)
+
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "scripts/lims_api.py", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=str(REPO_ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            if proc.poll() is not None:
+                return fail(f"API exited early: {proc.stderr.read()}")
+            try:
+                if http_json("GET", base + "/health")[0] == 200:
+                    break
+            except Exception:
+                pass
+            time.sleep(0.1)
+        else:
+            return fail("API did not become healthy")
+
+        st, job = http_json("POST", base + "/snapshot/export", {"include_samples": ["J-001"], "async": True})
+        if st != 202 or job.get("schema") != "nexus_job" or job.get("kind") != "snapshot_export" or job.get("href") != f"/jobs/{job.get('id')}":
+            return fail(f"async export should answer 202 with a job: {st} {job}")
+        for _ in range(300):
+            st, job = http_json("GET", base + job["href"])
+            if job.get("state") not in ("queued", "running"):
+                break
+            time.sleep(0.1)
+        if st != 200 or job.get("state") != "succeeded" or (job.get("result") or {}).get("schema") != "nexus_snapshot_export_result":
+            return fail(f"export job should succeed: {job}")
+        prog = job.get("progress") or {}
+        for stage, unit in (("backup", "pages"), ("tar", "bytes")):
+            s = prog.get(stage) or {}
+            if s.get("unit") != unit or not s.get("total") or s.get("done") != s.get("total") or s.get("pct") != 100:
+                return fail(f"{stage} progress unexpected: {prog}")
+        tarball = job["result"]["tarball"]
+
+        st, lst = http_json("GET", base + "/jobs")
+        if st != 200 or job["id"] not in [j["id"] for j in lst.get("jobs", [])]:
+            return fail(f"GET /jobs should list the job: {lst}")
+        st, c = http_json("POST", base + job["href"] + "/cancel")
+        if st != 200 or c.get("state") != "succeeded" or c.get("cancel_requested"):
+            return fail(f"cancelling a finished job should leave it as is: {st} {c}")
+
+        st, doc = http_json("POST", base + "/snapshot/export", {"include_samples": []})
+        if st != 200 or doc.get("schema") != "nexus_snapshot_export_result":
+            return fail(f"sync export should still answer with the result: {st} {doc}")
+
+        st, job = http_json("POST", base + "/snapshot/verify", {"artifact": tarball}, headers={"Prefer": "respond-async"})
+        if st != 202 or job.get("kind") != "snapshot_verify":
+            return fail(f"Prefer: respond-async should answer 202: {st} {job}")
+        for _ in range(300):
+            st, job = http_json("GET", base + job["href"])
+            if job.get("state") not in ("queued", "running"):
+                break
+            time.sleep(0.1)
+        if job.get("state") != "succeeded" or (job.get("result") or {}).get("schema") != "nexus_snapshot_verify_result":
+            return fail(f"verify job should succeed: {job}")
+
+        st, bad = http_json("POST", base + "/snapshot/verify", {"artifact": str(tmp / "missing.tar.gz")})
+        if st != 400 or bad.get("error") != "command_failed" or not bad.get("job_id"):
+            return fail(f"sync verify of a missing artifact should fail like before: {st} {bad}")
+
+        for path in ("/jobs/0123456789abcdef", "/jobs/../etc"):
+            st, nf = http_json("GET", base + path)
+            if st != 404 or nf.get("error") != "not_found":
+                return fail(f"unknown job {path} should be 404: {st} {nf}")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=3)
+        except Exception:
+            proc.kill()
+
+    print("OK: API jobs regression passed (dedup, bound, cancel queued/export/child, async export progress, sync export, verify job, 404).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
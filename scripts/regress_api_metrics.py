@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """
-Regression: GET /metrics returns Prometheus plaintext with key lines.
+Regression: GET /metrics returns Prometheus plaintext with key lines, and counts
+requests per route/status with latency histograms, phase timings and named DB timings.
 Assumes lims_api.py can be started locally on a free port.
 """
 from __future__ import annotations
@@ -11,6 +12,7 @@ import socket
 import subprocess
 import sys
 import time
+import urllib.error
 import urllib.request
 
 REQUIRED_PATTERNS = [
@@ -34,6 +36,19 @@ REQUIRED_PATTERNS = [
     r"^nexus_sample_events_total\s+\d+\s*$",
 ]
 
+# After the requests issued below (the /metrics request itself is in flight).
+REQUEST_PATTERNS = [
+    r'^nexus_http_requests_total\{method="GET",route="/sample/list",status="200"\} [1-9]\d*$',
+    r'^nexus_http_requests_total\{method="GET",route="/jobs/\{id\}",status="404"\} 1$',
+    r'^nexus_http_requests_total\{method="GET",route="other",status="404"\} 1$',
+    r'^nexus_http_request_duration_seconds_bucket\{method="GET",route="/sample/list",le="\+Inf"\} [1-9]\d*$',
+    r'^nexus_http_request_duration_seconds_count\{method="GET",route="/sample/list"\} [1-9]\d*$',
+    r'^nexus_http_requests_in_flight 1$',
+    r'^nexus_http_phase_seconds_count\{route="/sample/list",phase="serialize"\} [1-9]\d*$',
+    r'^nexus_db_query_seconds_count\{query="sample_list",role="reader",outcome="ok"\} [1-9]\d*$',
+    r'^nexus_db_pool_connections\{state="reader_in_use"\} \d+$',
+]
+
 def free_port() -> int:
     s = socket.socket()
     s.bind(("127.0.0.1", 0))
@@ -103,7 +118,24 @@ def main() -> int:
                 print(text)
                 return 2
 
-        print("OK: /metrics Prometheus plaintext regression passed.")
+        http_get(f"http://127.0.0.1:{port}/sample/list?limit=1", timeout=2.0)
+        for path in ("/jobs/0123456789abcdef", "/no/such/route"):
+            try:
+                http_get(f"http://127.0.0.1:{port}{path}", timeout=2.0)
+            except urllib.error.HTTPError as e:
+                if e.code != 404:
+                    print(f"FAIL: {path} status={e.code}")
+                    return 2
+        status, body, headers = http_get(f"http://127.0.0.1:{port}/metrics", timeout=1.5)
+        text = body.decode("utf-8", errors="replace")
+        for pat in REQUEST_PATTERNS:
+            if not re.search(pat, text, flags=re.M):
+                print(f"FAIL: missing pattern: {pat}")
+                print("--- /metrics body ---")
+                print(text)
+                return 2
+
+        print("OK: /metrics Prometheus plaintext regression passed (incl. request/DB telemetry).")
         return 0
     finally:
         try:
@@ -29,36 +29,59 @@ bash ./scripts/regress_web_ui_status_headless.sh
   # 1) Input/CLI contract regressions (cheap, fast)
   run ./scripts/regress_list_container_whitespace_error.py
   run ./scripts/regress_limit_semantics.py
+  run ./scripts/regress_keyset_pagination.py
+  run ./scripts/regress_sample_import.py
+  run ./scripts/regress_export_stream.py
 
-  # 2) Container exclusivity model (database + triggers + CLI)
+  # 2) DB / API infrastructure (pool, migrations, indexes, sessions, metrics, executor, multi-worker)
+  run ./scripts/regress_db_pool.py
+  run ./scripts/regress_schema_fast_path.py
+  run ./scripts/regress_query_plans.py
+  run ./scripts/regress_session_cache.py
+  run ./scripts/regress_metrics_counts.py
+  run ./scripts/regress_sample_store.py
+  run ./scripts/regress_multiworker.py
+
+  # 3) Container exclusivity model (database + triggers + CLI)
   run ./scripts/regress_container_exclusivity.py
   run ./scripts/regress_container_set_exclusive.py
 
-  # 3) Kind defaults model (seed/list/set/apply/apply-all + guardrails)
+  # 4) Kind defaults model (seed/list/set/apply/apply-all + guardrails)
   run ./scripts/regress_container_kind_defaults_cli.py
   run ./scripts/regress_container_kind_defaults_apply_all.py
 
-  # 4) Operator visibility/auditability tools
+  # 5) Operator visibility/auditability tools
   run ./scripts/regress_container_show.py
   run ./scripts/regress_container_audit.py
   run ./scripts/regress_sample_report.py
   run ./scripts/regress_sample_export.py
   run ./scripts/regress_snapshot_include_sample.py
+  run ./scripts/regress_snapshot_include_sample_bulk.py
 
-  # 5) Sample move safety precheck
+  # 6) Sample move safety precheck
   run ./scripts/regress_sample_move_precheck.py
 
-  # 6) Snapshot export + restore (round-trip)
+  # 7) Snapshot export + restore (round-trip)
   run ./scripts/regress_snapshot_export.py
+  run ./scripts/regress_snapshot_engine.py
+  run ./scripts/regress_snapshot_incremental.py
+  run ./scripts/regress_snapshot_codec.py
+  run ./scripts/regress_snapshot_store.py
   run ./scripts/regress_snapshot_manifest.py
   run ./scripts/regress_snapshot_restore.py
   run ./scripts/regress_snapshot_verify.py
   run ./scripts/regress_snapshot_tar_unsafe_entries.py
+  run ./scripts/regress_snapshot_tar_stream.py
+  run ./scripts/regress_snapshot_index.py
   run ./scripts/regress_snapshot_verify_json.py
+  run ./scripts/regress_snapshot_verify_all.py
   run ./scripts/regress_snapshot_doctor.py
   run ./scripts/regress_snapshot_diff.py
   run ./scripts/regress_snapshot_latest.py
   run ./scripts/regress_snapshot_diff_latest.py
+  run ./scripts/regress_snapshot_doctor_cache.py
+  run ./scripts/regress_snapshot_doctor_workdb.py
+  run ./scripts/regress_snapshot_rowdiff.py
   run ./scripts/regress_snapshot_prune.py
   run ./scripts/regress_snapshot_gc.py
 
@@ -79,5 +102,6 @@ python3 scripts/regress_api_sample_status_post.py
 python3 scripts/regress_api_auth_guest.py
 python3 scripts/regress_api_auth_samples_optin.py
 python3 scripts/regress_api_snapshot_export_verify.py
+python3 scripts/regress_api_jobs.py
 python3 scripts/regress_api_metrics.py
 python3 scripts/regress_api_container_workflow.py
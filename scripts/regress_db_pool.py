@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Regression: lims.db connection pool (bounded readers, serialized writer, health checks)
+and the WAL connection profile / checkpoint control.
+Runs in-process against a temp DB_PATH.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO))
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory(prefix="nexus-lims-pool.") as td:
+        db_file = Path(td) / "lims.sqlite3"
+        os.environ["DB_PATH"] = str(db_file)
+        os.environ["NEXUS_DB_POOL_MAX_READERS"] = "2"
+        os.environ["NEXUS_DB_POOL_TIMEOUT_SEC"] = "0.5"
+
+        from lims import db
+
+        with db.writer() as conn:
+            db.apply_migrations(conn)
+            conn.execute(
+                "INSERT INTO containers (barcode, kind, location, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                ("POOL-C1", "rack", None, db.utc_now_iso(), db.utc_now_iso()),
+            )
+        # writer() commits on clean exit; a fresh reader must see the row.
+        with db.reader() as conn:
+            n = conn.execute("SELECT COUNT(1) FROM containers WHERE barcode = 'POOL-C1'").fetchone()[0]
+        if n != 1:
+            return fail("writer() did not commit on clean exit")
+
+        # writer() rolls back on exception.
+        try:
+            with db.writer() as conn:
+                conn.execute(
+                    "INSERT INTO containers (barcode, kind, location, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    ("POOL-C2", "rack", None, db.utc_now_iso(), db.utc_now_iso()),
+                )
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+        with db.reader() as conn:
+            n = conn.execute("SELECT COUNT(1) FROM containers WHERE barcode = 'POOL-C2'").fetchone()[0]
+        if n != 0:
+            return fail("writer() did not roll back on exception")
+
+        # Connections are reused across checkouts, and nested reader() reuses the held one.
+        pool = db.get_pool()
+        before = pool.stats()["opened"]
+        for _ in range(20):
+            with db.reader() as a:
+                with db.reader() as b:
+                    if a is not b:
+                        return fail("nested reader() on one thread should reuse the held connection")
+        if pool.stats()["opened"] != before:
+            return fail(f"reader connections were not reused: {pool.stats()}")
+
+        # Reader count is bounded; a third concurrent reader times out.
+        hold = threading.Event()
+        release = threading.Event()
+
+        def holder() -> None:
+            with db.reader():
+                hold.set()
+                release.wait(5)
+
+        threads = [threading.Thread(target=holder) for _ in range(2)]
+        for t in threads:
+            t.start()
+            hold.wait(2)
+            hold.clear()
+        try:
+            with db.reader():
+                pass
+            release.set()
+            return fail("expected PoolTimeout with all readers checked out")
+        except db.PoolTimeout:
+            pass
+        finally:
+            release.set()
+            for t in threads:
+                t.join(5)
+        if pool.stats()["reader_in_use"] != 0:
+            return fail(f"reader_in_use should return to 0: {pool.stats()}")
+
+        # Pool connections run the default WAL profile.
+        with db.reader() as conn:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            sync = conn.execute("PRAGMA synchronous").fetchone()[0]
+            busy = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+            temp = conn.execute("PRAGMA temp_store").fetchone()[0]
+        if (str(mode).lower(), sync, busy, temp) != ("wal", 1, 5000, 2):
+            return fail(f"WAL profile not applied: journal_mode={mode} synchronous={sync} busy_timeout={busy} temp_store={temp}")
+        ck = db.checkpoint("truncate")
+        if ck["busy"] != 0 or pool.stats()["checkpoints"] != 1 or db.wal_size_bytes() != 0:
+            return fail(f"truncate checkpoint did not reset the WAL: {ck} wal_bytes={db.wal_size_bytes()}")
+        try:
+            db.checkpoint("bogus")
+            return fail("invalid checkpoint mode should raise ValueError")
+        except ValueError:
+            pass
+        wal = db.wal_status()
+        if wal["journal_mode"] != "wal" or wal["profile"] != "wal":
+            return fail(f"wal_status() unexpected: {wal}")
+
+        # The compat profile keeps the rollback journal even where the pool would switch it.
+        other = Path(td) / "cli.sqlite3"
+        os.environ["NEXUS_DB_PROFILE"] = "compat"
+        try:
+            prof = db.connection_profile()
+            c2 = db._open(other, profile=prof, set_journal_mode=True)
+            mode = c2.execute("PRAGMA journal_mode").fetchone()[0]
+            c2.close()
+        finally:
+            os.environ.pop("NEXUS_DB_PROFILE", None)
+        if str(mode).lower() != "delete":
+            return fail(f"compat profile should keep the rollback journal, got {mode}")
+
+        # Replacing the DB file invalidates pooled connections (e.g. snapshot restore).
+        # Fold the WAL in first, as snapshot restore does, so the copy is complete.
+        db.checkpoint("truncate")
+        replacement = Path(td) / "replacement.sqlite3"
+        os.replace(db_file, replacement)
+        db_file.write_bytes(replacement.read_bytes())
+        fails_before = pool.stats()["health_check_failures"]
+        with db.reader() as conn:
+            conn.execute("SELECT COUNT(1) FROM containers").fetchone()
+        if pool.stats()["health_check_failures"] <= fails_before:
+            return fail("replaced DB file was not detected by the pool health check")
+
+        if not pool.health_check():
+            return fail("health_check() should succeed")
+        stats = db.pool_stats()
+        if not stats or stats[0]["max_readers"] != 2:
+            return fail(f"pool_stats() unexpected: {stats}")
+
+        db.close_pools()
+
+    print("OK: db pool regression passed (reuse, bounds, commit/rollback, health check, WAL profile, checkpoint).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Regression: streaming NDJSON export (`lims.sh export stream` + GET /export/samples.ndjson).
+Checks the header/sample/event/end line framing, status/container/time-window filters,
+batching across several fetchmany() rounds, and that bad filters fail before any output.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def free_port() -> int:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def parse_lines(text: str) -> list[dict]:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def summarize(lines: list[dict]) -> tuple[list[str], int]:
+    """(external_ids in stream order, event line count); checks framing on the way."""
+    if not lines or lines[0].get("type") != "header" or lines[0].get("schema") != "nexus_sample_stream":
+        raise AssertionError(f"missing header: {lines[:1]}")
+    if lines[-1].get("type") != "end":
+        raise AssertionError(f"missing end line: {lines[-1:]}")
+    ids = [l["sample"]["external_id"] for l in lines if l["type"] == "sample"]
+    events = sum(1 for l in lines if l["type"] == "event")
+    if lines[-1]["samples"] != len(ids) or lines[-1]["events"] != events:
+        raise AssertionError(f"end counts do not match body: {lines[-1]} vs {len(ids)}/{events}")
+    return ids, events
+
+
+def http_get(url: str):
+    req = Request(url, method="GET")
+    try:
+        with urlopen(req, timeout=10) as r:
+            return r.status, r.headers.get("Content-Type", ""), r.read().decode("utf-8")
+    except HTTPError as e:
+        return e.code, e.headers.get("Content-Type", ""), e.read().decode("utf-8")
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-export-stream-"))
+    db_path = tmp / "lims.sqlite3"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(db_path)
+
+    for cmd in (
+        ["./scripts/lims.sh", "init"],
+        ["./scripts/lims.sh", "container", "add", "--barcode", "STR-RACK", "--kind", "rack"],
+    ):
+        p = run(cmd, env)
+        if p.returncode != 0:
+            return fail(f"{' '.join(cmd)}: {p.stdout}{p.stderr}")
+
+    # Seed directly so received_at is controlled: 30 in January (10 in the rack), 5 in February.
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA foreign_keys = ON")
+    rack_id = conn.execute("SELECT id FROM containers WHERE barcode = 'STR-RACK'").fetchone()[0]
+    for i in range(35):
+        month = 1 if i < 30 else 2
+        conn.execute(
+            "INSERT INTO samples (external_id, specimen_type, status, container_id, received_at, created_at, updated_at) "
+            "VALUES (?, 'blood', ?, ?, ?, ?, ?)",
+            (
+                f"STR-{i:03d}",
+                "completed" if i % 3 == 0 else "received",
+                rack_id if i < 10 else None,
+                f"2026-{month:02d}-{1 + i % 28:02d}T08:00:{i:02d}+00:00",
+                "2026-01-01T00:00:00+00:00",
+                "2026-01-01T00:00:00+00:00",
+            ),
+        )
+    conn.commit()
+    total_events = conn.execute("SELECT COUNT(1) FROM sample_events").fetchone()[0]
+    conn.close()
+
+    # CLI: everything, in small batches so the stream spans several fetchmany() rounds.
+    p = run(["./scripts/lims.sh", "export", "stream", "--batch-size", "4"], env)
+    if p.returncode != 0:
+        return fail(f"export stream failed: {p.stdout}{p.stderr}")
+    try:
+        ids, events = summarize(parse_lines(p.stdout))
+    except AssertionError as e:
+        return fail(str(e))
+    if len(ids) != 35 or events != total_events or total_events == 0:
+        return fail(f"full stream counts: {len(ids)} samples / {events} events (db has {total_events} events)")
+    lines = parse_lines(p.stdout)
+    seen = set()
+    for l in lines[1:-1]:
+        if l["type"] == "sample":
+            seen.add(l["sample"]["id"])
+        elif l["sample_id"] not in seen:
+            return fail(f"event emitted before its sample: {l}")
+
+    # CLI filters: status + window, container, --no-events.
+    p = run(["./scripts/lims.sh", "export", "stream", "--status", "done",
+             "--since", "2026-01-01", "--until", "2026-02-01T00:00:00Z"], env)
+    ids, _ = summarize(parse_lines(p.stdout))
+    want = [f"STR-{i:03d}" for i in range(30) if i % 3 == 0]
+    if sorted(ids) != sorted(want):
+        return fail(f"status+window filter: {ids}")
+    p = run(["./scripts/lims.sh", "export", "stream", "--container", "STR-RACK", "--no-events"], env)
+    ids, events = summarize(parse_lines(p.stdout))
+    if sorted(ids) != [f"STR-{i:03d}" for i in range(10)] or events != 0:
+        return fail(f"container/no-events filter: {ids} events={events}")
+
+    for bad in (["--status", "bogus"], ["--since", "yesterday"], ["--container", "NOPE"]):
+        p = run(["./scripts/lims.sh", "export", "stream", *bad], env)
+        if p.returncode != 2 or p.stdout.strip() or not p.stderr.startswith(("ERROR:", "NOT FOUND:")):
+            return fail(f"bad filter {bad} should be rc=2 with no output: rc={p.returncode} {p.stdout[:200]}{p.stderr}")
+
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "scripts/lims_api.py", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=str(REPO_ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                with urlopen(base + "/health", timeout=0.5) as r:
+                    if r.status == 200:
+                        break
+            except Exception:
+                time.sleep(0.1)
+        else:
+            return fail("API did not become healthy")
+
+        st, ctype, body = http_get(base + "/export/samples.ndjson?batch_size=7")
+        if st != 200 or not ctype.startswith("application/x-ndjson"):
+            return fail(f"GET /export/samples.ndjson: {st} {ctype}")
+        ids, events = summarize(parse_lines(body))
+        if len(ids) != 35 or events != total_events:
+            return fail(f"API full stream counts: {len(ids)}/{events}")
+
+        st, _, body = http_get(base + "/export/samples.ndjson?since=2026-02-01T00:00:00Z&events=0")
+        ids, events = summarize(parse_lines(body))
+        if st != 200 or sorted(ids) != [f"STR-{i:03d}" for i in range(30, 35)] or events != 0:
+            return fail(f"API window filter: {st} {ids} events={events}")
+
+        for q in ("status=bogus", "until=not-a-date", "container=NOPE", "events=maybe"):
+            st, _, body = http_get(base + "/export/samples.ndjson?" + q)
+            if st != 400 or json.loads(body).get("schema") != "nexus_api_error":
+                return fail(f"bad filter {q} should be 400: {st} {body[:200]}")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=2)
+        except Exception:
+            proc.kill()
+
+    print("OK: export stream regression passed (CLI + API framing, filters, batching, bad filters).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
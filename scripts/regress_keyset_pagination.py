@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Regression: keyset (cursor) pagination for `lims.sh sample list`, GET /sample/list and GET /container/list.
+Walks every page with next_cursor and checks the union equals the full ordered set (no gaps, no dupes),
+including received_at ties, and that bad cursors are rejected.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def free_port() -> int:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def http_json(url: str):
+    try:
+        with urlopen(Request(url, headers={"Accept": "application/json"}), timeout=10) as r:
+            return r.status, json.loads(r.read().decode("utf-8"))
+    except HTTPError as e:
+        return e.code, json.loads(e.read().decode("utf-8") or "{}")
+
+
+def seed(db_path: Path) -> None:
+    conn = sqlite3.connect(str(db_path))
+    ts = "2026-01-01T00:00:00+00:00"
+    for i in range(23):
+        conn.execute(
+            "INSERT INTO containers (barcode, kind, location, created_at, updated_at) VALUES (?, 'rack', NULL, ?, ?)",
+            (f"KS-C-{i:03d}", ts, ts),
+        )
+    # Three samples per received_at value so page boundaries land inside ties.
+    for i in range(31):
+        received = f"2026-01-01T00:{i // 3:02d}:00+00:00"
+        conn.execute(
+            "INSERT INTO samples (external_id, specimen_type, status, received_at, created_at, updated_at) "
+            "VALUES (?, 'blood', ?, ?, ?, ?)",
+            (f"KS-S-{i:03d}", "processing" if i % 2 else "received", received, ts, ts),
+        )
+    conn.commit()
+    conn.close()
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-keyset-"))
+    db_path = tmp / "lims.sqlite3"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(db_path)
+
+    p = run(["./scripts/lims.sh", "init"], env)
+    if p.returncode != 0:
+        return fail(f"init failed: {p.stdout}{p.stderr}")
+    seed(db_path)
+
+    conn = sqlite3.connect(str(db_path))
+    want_samples = [r[0] for r in conn.execute("SELECT external_id FROM samples ORDER BY received_at DESC, id DESC")]
+    want_processing = [r[0] for r in conn.execute(
+        "SELECT external_id FROM samples WHERE status = 'processing' ORDER BY received_at DESC, id DESC")]
+    want_containers = [r[0] for r in conn.execute("SELECT barcode FROM containers ORDER BY id DESC")]
+    conn.close()
+
+    # CLI walk: next_cursor on stderr, rows on stdout.
+    got, cursor, pages = [], None, 0
+    while True:
+        cmd = ["./scripts/lims.sh", "sample", "list", "--limit", "4"]
+        if cursor:
+            cmd += ["--cursor", cursor]
+        p = run(cmd, env)
+        if p.returncode != 0:
+            return fail(f"sample list failed: {p.stdout}{p.stderr}")
+        got += [json.loads(line)["external_id"] for line in p.stdout.splitlines() if line.startswith("{")]
+        pages += 1
+        cursor = None
+        for line in p.stderr.splitlines():
+            if line.startswith("next_cursor: "):
+                cursor = line.split(": ", 1)[1].strip()
+        if not cursor or pages > 20:
+            break
+    if got != want_samples:
+        return fail(f"CLI keyset walk mismatch:\n got={got}\nwant={want_samples}")
+
+    p = run(["./scripts/lims.sh", "sample", "list", "--cursor", "not-a-cursor"], env)
+    if p.returncode != 2 or "ERROR:" not in p.stdout:
+        return fail(f"CLI should reject a bad cursor with rc=2: rc={p.returncode} {p.stdout}{p.stderr}")
+
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "scripts/lims_api.py", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=str(REPO_ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                if http_json(base + "/health")[0] == 200:
+                    break
+            except Exception:
+                time.sleep(0.1)
+        else:
+            return fail("API did not become healthy")
+
+        def walk(path: str, key: str, field: str):
+            out, cursor = [], None
+            for _ in range(50):
+                url = base + path + ("&cursor=" + quote(cursor) if cursor else "")
+                st, j = http_json(url)
+                if st != 200:
+                    raise AssertionError(f"{url} -> {st} {j}")
+                out += [x[field] for x in j[key]]
+                cursor = j.get("next_cursor")
+                if not cursor:
+                    return out
+            raise AssertionError("pagination did not terminate")
+
+        try:
+            got = walk("/sample/list?limit=5", "samples", "external_id")
+            if got != want_samples:
+                return fail(f"/sample/list keyset walk mismatch:\n got={got}\nwant={want_samples}")
+            got = walk("/sample/list?limit=2&status=processing", "samples", "external_id")
+            if got != want_processing:
+                return fail(f"/sample/list filtered walk mismatch:\n got={got}\nwant={want_processing}")
+            got = walk("/container/list?limit=7", "containers", "barcode")
+            if got != want_containers:
+                return fail(f"/container/list keyset walk mismatch:\n got={got}\nwant={want_containers}")
+        except AssertionError as e:
+            return fail(str(e))
+
+        st, j = http_json(base + f"/sample/list?limit={len(want_samples)}")
+        if st != 200 or j.get("next_cursor") is not None:
+            return fail(f"last page should have next_cursor=null: {st} {j.get('next_cursor')}")
+
+        # A container cursor is not a sample cursor.
+        st, j = http_json(base + "/container/list?limit=1")
+        st, j = http_json(base + "/sample/list?cursor=" + quote(j["next_cursor"]))
+        if st != 400 or j.get("schema") != "nexus_api_error":
+            return fail(f"/sample/list should reject a foreign cursor: {st} {j}")
+        st, j = http_json(base + "/container/list?cursor=%%%")
+        if st != 400:
+            return fail(f"/container/list should reject a bad cursor: {st} {j}")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=2)
+        except Exception:
+            proc.kill()
+
+    print("OK: keyset pagination regression passed (CLI + /sample/list + /container/list, ties, bad cursors).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Regression: /metrics counters (lims/metrics.py + migrations/014_table_counts.sql).
+Checks that the trigger-maintained table_counts match COUNT(1) after inserts and
+deletes, that a scrape reads table_counts instead of scanning the tables, that the DB
+collector is TTL-cached, that build info is not recomputed (no git subprocess) per
+scrape, and that named DB blocks, SQLITE_BUSY errors and histograms are exported.
+"""
+from __future__ import annotations
+
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+TABLES = ("samples", "containers", "sample_events")
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-metrics."))
+    db_path = tmp / "lims.sqlite3"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(db_path)
+
+    def lims(*args: str) -> subprocess.CompletedProcess:
+        return subprocess.run(["./scripts/lims.sh", *args], cwd=str(REPO_ROOT), env=env, text=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    p = lims("init")
+    if p.returncode != 0:
+        return fail(f"init: {p.stdout}{p.stderr}")
+    for i in range(3):
+        p = lims("sample", "add", "--specimen-type", "blood", "--external-id", f"MC-{i}")
+        if p.returncode != 0:
+            return fail(f"sample add: {p.stdout}{p.stderr}")
+
+    def check_counts(when: str) -> str:
+        conn = sqlite3.connect(str(db_path))
+        try:
+            kept = dict(conn.execute("SELECT name, n FROM table_counts").fetchall())
+            for t in TABLES:
+                actual = conn.execute(f"SELECT COUNT(1) FROM {t}").fetchone()[0]
+                if kept.get(t) != actual:
+                    return f"{when}: table_counts[{t}]={kept.get(t)} but COUNT(1)={actual}"
+        finally:
+            conn.close()
+        return ""
+
+    err = check_counts("after inserts")
+    if err:
+        return fail(err)
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA foreign_keys=ON")
+    sid = conn.execute("SELECT id FROM samples WHERE external_id = 'MC-0'").fetchone()[0]
+    conn.execute("DELETE FROM sample_events WHERE sample_id = ?", (sid,))
+    conn.execute("DELETE FROM samples WHERE id = ?", (sid,))
+    conn.commit()
+    conn.close()
+    err = check_counts("after deletes")
+    if err:
+        return fail(err)
+
+    os.environ["DB_PATH"] = str(db_path)
+    from lims import db, metrics
+
+    # Build info is computed at import: a scrape must not run git.
+    real_run = subprocess.run
+
+    def no_subprocess(*a, **kw):
+        raise AssertionError(f"subprocess during scrape: {a!r}")
+
+    subprocess.run = no_subprocess
+    try:
+        text = metrics.render()
+    finally:
+        subprocess.run = real_run
+    rev = metrics.BUILD_INFO["git_rev"]
+    if f'nexus_build_info{{git_rev="{rev}"}} 1' not in text:
+        return fail(f"build info missing:\n{text}")
+    m = re.search(r"^nexus_samples_total (\d+)$", text, flags=re.M)
+    if not m or int(m.group(1)) != 2:
+        return fail(f"nexus_samples_total should be 2:\n{text}")
+
+    # A scrape reads table_counts; no COUNT(1) over the tables.
+    stmts = []
+    with db.reader() as conn:
+        conn.set_trace_callback(stmts.append)
+        try:
+            metrics._db_families()
+        finally:
+            conn.set_trace_callback(None)
+    if not any("table_counts" in s for s in stmts):
+        return fail(f"scrape should read table_counts: {stmts}")
+    if any("COUNT(" in s.upper() for s in stmts):
+        return fail(f"scrape should not scan tables: {stmts}")
+
+    # TTL cache: within the TTL the collector is not re-run.
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return [("x_total", "gauge", "x", [({}, len(calls))])]
+
+    reg = metrics.Registry()
+    reg.register(metrics.Collector(fn, ttl=60))
+    first = reg.render()
+    if reg.render() != first or len(calls) != 1:
+        return fail(f"collector should be cached within its TTL (calls={len(calls)})")
+    reg0 = metrics.Registry()
+    reg0.register(metrics.Collector(fn, ttl=0))
+    reg0.render()
+    reg0.render()
+    if len(calls) != 3:
+        return fail(f"ttl=0 collector should run every scrape (calls={len(calls)})")
+
+    # Named DB blocks are timed; a write that outlasts busy_timeout counts as busy.
+    with db.reader("regress_named") as conn:
+        conn.execute("SELECT 1").fetchone()
+    pool = db.ConnectionPool(db_path, profile=dict(db.connection_profile(), busy_timeout_ms=0))
+    locker = sqlite3.connect(str(db_path))
+    locker.execute("BEGIN IMMEDIATE")
+    try:
+        with pool.writer("regress_busy") as conn:
+            conn.execute("UPDATE table_counts SET n = n WHERE name = 'samples'")
+        return fail("the write should hit SQLITE_BUSY")
+    except sqlite3.OperationalError as e:
+        if not db.is_busy_error(e):
+            return fail(f"unexpected error: {e}")
+    finally:
+        locker.rollback()
+        locker.close()
+        pool.close()
+    metrics.DB_COLLECTOR.invalidate()
+    text = metrics.render()
+    for pat in (
+        r'^nexus_db_query_seconds_count\{query="regress_named",role="reader",outcome="ok"\} 1$',
+        r'^nexus_db_query_seconds_bucket\{query="regress_named",role="reader",outcome="ok",le="\+Inf"\} 1$',
+        r'^nexus_db_query_seconds_count\{query="regress_busy",role="writer",outcome="busy"\} 1$',
+        r'^nexus_db_busy_total\{query="regress_busy"\} 1$',
+        r'^nexus_db_pool_wait_seconds_count\{role="reader"\} \d+$',
+        r'^nexus_db_pool_connections\{state="reader_in_use"\} 0$',
+        r'^nexus_db_pool_checkouts_total\{role="reader"\} \d+$',
+        r"^# TYPE nexus_http_request_duration_seconds histogram$",
+    ):
+        if not re.search(pat, text, flags=re.M):
+            return fail(f"missing {pat}:\n{text}")
+
+    # Histogram buckets are cumulative.
+    h = metrics.Histogram("x_seconds", "x", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5.0):
+        h.observe(v)
+    got = {(n, l.get("le")): v for n, l, v in h.samples()}
+    if got != {("x_seconds_bucket", "0.1"): 1, ("x_seconds_bucket", "1.0"): 2, ("x_seconds_bucket", "+Inf"): 3,
+               ("x_seconds_sum", None): 5.55, ("x_seconds_count", None): 3}:
+        return fail(f"histogram samples: {got}")
+
+    db.close_pools()
+    print("OK: metrics counters regression passed (trigger counts, no table scan, TTL cache, build info once, "
+          "named query timings, busy errors, pool stats, histograms).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Regression: shared state when several API worker processes use one DB (multi-worker mode).
+Checks that workers starting together migrate once, that writer() blocks are atomic
+read-modify-write transactions across processes, that a forked child drops the parent's
+pools/caches/runners, that leases are held by one process and free when it exits, that
+concurrent kanban writes never leave a torn or partial board, and that jobs are visible
+and cancellable from another worker through the job spool.
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+PROCS = 4
+INCREMENTS = 50
+KANBAN_WRITES = 25
+
+ctx = multiprocessing.get_context("fork")
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run_all(target, n: int = PROCS) -> list:
+    """Run target(i, queue) in n forked processes started together; their queued results."""
+    q = ctx.Queue()
+    procs = [ctx.Process(target=target, args=(i, q)) for i in range(n)]
+    for p in procs:
+        p.start()
+    out = [q.get(timeout=120) for _ in procs]
+    for p in procs:
+        p.join(timeout=30)
+    return out
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-multiworker."))
+    db_path = tmp / "lims.sqlite3"
+    os.environ["DB_PATH"] = str(db_path)
+    os.environ["KANBAN_STORE_PATH"] = str(tmp / "kanban.json")
+
+    from lims import api_executor, api_jobs, db, kanban_store, sessions
+    from lims import jobs as lims_jobs
+
+    # Workers starting together: one applies the migrations, the rest find them done.
+    def migrate(i, q):
+        try:
+            q.put(("ok", db.migrate_on_startup()))
+        except Exception as e:
+            q.put(("error", repr(e)))
+
+    results = run_all(migrate)
+    errors = [r for s, r in results if s != "ok"]
+    if errors:
+        return fail(f"concurrent migrate_on_startup failed: {errors}")
+    applied = [m for _s, r in results for m in r]
+    available = [mid for mid, _ in db.available_migrations()]
+    if sorted(applied) != sorted(available):
+        return fail(f"migrations should be applied exactly once across workers: {applied}")
+    conn = sqlite3.connect(str(db_path))
+    ids = [r[0] for r in conn.execute("SELECT id FROM schema_migrations")]
+    conn.execute("CREATE TABLE regress_counter (id INTEGER PRIMARY KEY, n INTEGER NOT NULL)")
+    conn.execute("INSERT INTO regress_counter (id, n) VALUES (1, 0)")
+    conn.commit()
+    conn.close()
+    if sorted(ids) != sorted(available):
+        return fail(f"schema_migrations: {ids}")
+
+    # Read-modify-write inside writer() from several processes loses no update.
+    def increment(i, q):
+        try:
+            for _ in range(INCREMENTS):
+                with db.writer("regress_incr") as conn:
+                    n = conn.execute("SELECT n FROM regress_counter WHERE id = 1").fetchone()[0]
+                    conn.execute("UPDATE regress_counter SET n = ? WHERE id = 1", (n + 1,))
+            q.put("ok")
+        except Exception as e:
+            q.put(repr(e))
+
+    results = run_all(increment)
+    if any(r != "ok" for r in results):
+        return fail(f"writers failed: {results}")
+    with db.reader() as conn:
+        n = conn.execute("SELECT n FROM regress_counter WHERE id = 1").fetchone()[0]
+    if n != PROCS * INCREMENTS:
+        return fail(f"lost updates: counter={n}, want {PROCS * INCREMENTS}")
+
+    # A forked child starts with its own pool, session cache, job runner and executor.
+    pool = db.get_pool()
+    pool._regress_parent = True
+    sessions.get_cache()
+    lims_jobs.runner()
+    api_executor.executor()
+    if not db.lease("regress_lease"):
+        return fail("the parent should get a free lease")
+
+    def child_state(i, q):
+        try:
+            fresh = not hasattr(db.get_pool(), "_regress_parent")
+            with db.reader() as conn:
+                conn.execute("SELECT 1").fetchone()
+            q.put({
+                "fresh_pool": fresh,
+                "caches": len(sessions._CACHES),
+                "runner": lims_jobs._RUNNER is None,
+                "executor": api_executor._EXECUTOR is None,
+                "lease": db.lease("regress_lease"),
+            })
+        except Exception as e:
+            q.put({"error": repr(e)})
+
+    (state,) = run_all(child_state, 1)
+    if state != {"fresh_pool": True, "caches": 0, "runner": True, "executor": True, "lease": False}:
+        return fail(f"forked child state: {state}")
+    if not db.lease("regress_lease"):
+        return fail("the parent should keep its lease after the child exits")
+
+    def hold_lease(i, q):
+        q.put(db.lease("regress_other"))
+
+    (held,) = run_all(hold_lease, 1)
+    if held is not True or not db.lease("regress_other"):
+        return fail("a lease should free when its holder exits")
+
+    # Kanban: concurrent PUTs; every read sees a whole board, the file ends as one of them.
+    def put_boards(i, q):
+        try:
+            for k in range(KANBAN_WRITES):
+                board = kanban_store.default_board()
+                board["cards"] = {f"w{i}-{k}-{j}": {"id": f"w{i}-{k}-{j}", "title": "x" * 200, "subtitle": ""} for j in range(50)}
+                board["columns"]["todo"]["cardIds"] = sorted(board["cards"])
+                board["selectedCardId"] = f"w{i}-{k}"
+                kanban_store.write_board(board)
+                got = kanban_store.read_board()
+                if len(got["cards"]) != 50 or got["columns"]["todo"]["cardIds"] != sorted(got["cards"]):
+                    q.put(f"torn board read: {got.get('selectedCardId')}")
+                    return
+            q.put("ok")
+        except Exception as e:
+            q.put(repr(e))
+
+    results = run_all(put_boards)
+    if any(r != "ok" for r in results):
+        return fail(f"kanban writers: {results}")
+    final = json.loads((tmp / "kanban.json").read_text(encoding="utf-8"))
+    if len(final["cards"]) != 50 or not str(final["selectedCardId"]).startswith("w"):
+        return fail(f"final board: {final.get('selectedCardId')}")
+    leftovers = [p.name for p in tmp.iterdir() if p.name.endswith(".tmp")]
+    if leftovers:
+        return fail(f"temp files left behind: {leftovers}")
+
+    # Jobs: a job run by worker A is answered and cancelled by worker B via the spool.
+    spool_dir = tmp / "jobs"
+    a = lims_jobs.JobRunner(workers=1, spool=lims_jobs.JobSpool(spool_dir))
+    b = lims_jobs.JobRunner(workers=1, spool=lims_jobs.JobSpool(spool_dir))
+
+    def long_job(job):
+        i = 0
+        while True:
+            i += 1
+            job.report("tar", i, 1000000)
+            time.sleep(0.01)
+
+    job, _created = a.submit("regress_long", ("k",), long_job)
+    deadline = time.monotonic() + 10
+    doc = None
+    while time.monotonic() < deadline:
+        doc = b.spooled(job.id)
+        if doc and doc["state"] == lims_jobs.RUNNING and doc["progress"].get("tar"):
+            break
+        time.sleep(0.05)
+    if not doc or doc["state"] != lims_jobs.RUNNING or doc["progress"]["tar"]["unit"] != "bytes":
+        return fail(f"worker B should see A's running job with progress: {doc}")
+    if [d["id"] for d in b.spooled_docs()] != [job.id] or a.spooled_docs():
+        return fail("spooled_docs should list other workers' jobs only")
+
+    lims_jobs._RUNNER = b
+    status, doc = api_jobs.jobs_get(f"/jobs/{job.id}")
+    if status != 200 or doc["id"] != job.id or doc["href"] != f"/jobs/{job.id}":
+        return fail(f"GET /jobs/{{id}} on another worker: {status} {doc}")
+    status, doc = api_jobs.jobs_cancel(f"/jobs/{job.id}/cancel")
+    if status != 202 or doc["cancel_requested"] is not True:
+        return fail(f"cancel on another worker: {status} {doc}")
+    if not job.wait(10) or job.state != lims_jobs.CANCELLED:
+        return fail(f"the owning worker should cancel the job: {job.state}")
+    status, doc = api_jobs.jobs_get(f"/jobs/{job.id}")
+    if status != 200 or doc["state"] != lims_jobs.CANCELLED:
+        return fail(f"cancelled job via spool: {status} {doc}")
+    status, doc = api_jobs.jobs_get("/jobs/0123456789abcdef")
+    if status != 404:
+        return fail(f"unknown job should be 404: {status}")
+
+    # A spooled job whose worker is gone reads as failed.
+    p = subprocess.Popen(["true"])
+    p.wait()
+    (spool_dir / "00000000000000aa.json").write_text(json.dumps({
+        "id": "00000000000000aa", "state": "running", "phase": "tar", "pid": p.pid, "created_at": "2026-01-01T00:00:00+00:00",
+    }), encoding="utf-8")
+    doc = b.spooled("00000000000000aa")
+    if not doc or doc["state"] != lims_jobs.FAILED or doc["error"]["error"] != "internal_error" or "pid" in doc:
+        return fail(f"orphaned spooled job: {doc}")
+    lims_jobs._RUNNER = None
+    a.shutdown()
+    b.shutdown()
+
+    db.close_pools()
+    print("OK: multi-worker regression passed (migrate once, atomic writers across processes, fork-safe state, "
+          "leases, kanban writes, job spool).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Regression: hot list/report queries must be served by indexes.
+Runs EXPLAIN QUERY PLAN against a freshly migrated temp DB and fails if a hot query
+falls back to a table SCAN or sorts in a temp B-tree (USE TEMP B-TREE FOR ORDER BY).
+"""
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO))
+
+# (name, sql, params, allow_index_scan)
+# allow_index_scan: unfiltered "newest first" walks legitimately SCAN an index in order
+# (LIMIT stops them early); everything filtered must be a SEARCH.
+HOT_QUERIES = [
+    (
+        "sample list by status (api)",
+        "SELECT s.*, c.barcode AS container_barcode, c.kind AS container_kind, c.location AS container_location "
+        "FROM samples s LEFT JOIN containers c ON s.container_id = c.id "
+        "WHERE s.status = ? ORDER BY s.received_at DESC, s.id DESC LIMIT ?",
+        ("received", 25),
+        False,
+    ),
+    (
+        "sample list by status, keyset page (api)",
+        "SELECT s.* FROM samples s WHERE s.status = ? AND (s.received_at, s.id) < (?, ?) "
+        "ORDER BY s.received_at DESC, s.id DESC LIMIT ?",
+        ("received", "2026-01-01T00:00:00+00:00", 10, 25),
+        False,
+    ),
+    (
+        "sample list by container (cli)",
+        "SELECT * FROM samples WHERE container_id = ? ORDER BY received_at DESC, id DESC LIMIT ?",
+        (1, 25),
+        False,
+    ),
+    (
+        "sample list by status + container (cli)",
+        "SELECT * FROM samples WHERE status = ? AND container_id = ? ORDER BY received_at DESC, id DESC LIMIT ?",
+        ("received", 1, 25),
+        False,
+    ),
+    (
+        "sample list, unfiltered",
+        "SELECT * FROM samples ORDER BY received_at DESC, id DESC LIMIT ?",
+        (25,),
+        True,
+    ),
+    (
+        "sample list, unfiltered keyset page",
+        "SELECT * FROM samples WHERE (received_at, id) < (?, ?) ORDER BY received_at DESC, id DESC LIMIT ?",
+        ("2026-01-01T00:00:00+00:00", 10, 25),
+        False,
+    ),
+    (
+        "sample events (api)",
+        "SELECT * FROM sample_events WHERE sample_id = ? ORDER BY occurred_at ASC, id ASC LIMIT ?",
+        (1, 100),
+        False,
+    ),
+    (
+        "sample events newest first (cli events/report)",
+        "SELECT e.*, fc.barcode AS from_container_barcode, tc.barcode AS to_container_barcode "
+        "FROM sample_events e "
+        "LEFT JOIN containers fc ON fc.id = e.from_container_id "
+        "LEFT JOIN containers tc ON tc.id = e.to_container_id "
+        "WHERE e.sample_id = ? ORDER BY e.occurred_at DESC, e.id DESC LIMIT ?",
+        (1, 100),
+        False,
+    ),
+    (
+        "kind-defaults apply",
+        "UPDATE containers SET is_exclusive = ?, updated_at = ? WHERE lower(trim(kind)) = ? AND is_exclusive != ?",
+        (1, "2026-01-01T00:00:00+00:00", "tube", 1),
+        False,
+    ),
+    (
+        "kind-defaults apply guardrail",
+        "SELECT COUNT(1) AS n FROM ("
+        " SELECT c.id FROM containers c JOIN samples s ON s.container_id = c.id"
+        " WHERE lower(trim(c.kind)) = ? GROUP BY c.id HAVING COUNT(s.id) > 1)",
+        ("tube",),
+        False,
+    ),
+    (
+        "kind-defaults trigger lookup (011)",
+        "SELECT d.is_exclusive FROM container_kind_defaults d WHERE d.kind = lower(trim(?))",
+        ("Tube ",),
+        False,
+    ),
+    (
+        "exclusivity trigger occupancy probe (009)",
+        "SELECT 1 FROM samples s WHERE s.container_id = ?",
+        (1,),
+        False,
+    ),
+    (
+        "export stream, status + window",
+        "SELECT s.* FROM samples s LEFT JOIN containers c ON c.id = s.container_id "
+        "WHERE s.status = ? AND s.received_at >= ? AND s.received_at < ? ORDER BY s.received_at ASC, s.id ASC",
+        ("received", "2026-01-01T00:00:00+00:00", "2026-02-01T00:00:00+00:00"),
+        False,
+    ),
+    (
+        "export stream, window only",
+        "SELECT s.* FROM samples s LEFT JOIN containers c ON c.id = s.container_id "
+        "WHERE s.received_at >= ? AND s.received_at < ? ORDER BY s.received_at ASC, s.id ASC",
+        ("2026-01-01T00:00:00+00:00", "2026-02-01T00:00:00+00:00"),
+        False,
+    ),
+    (
+        "export stream, container",
+        "SELECT s.* FROM samples s LEFT JOIN containers c ON c.id = s.container_id "
+        "WHERE s.container_id = ? ORDER BY s.received_at ASC, s.id ASC",
+        (1,),
+        False,
+    ),
+    (
+        "export stream, unfiltered",
+        "SELECT s.* FROM samples s LEFT JOIN containers c ON c.id = s.container_id "
+        "ORDER BY s.received_at ASC, s.id ASC",
+        (),
+        True,
+    ),
+    (
+        "export stream, events for a batch",
+        "SELECT e.*, fc.barcode AS from_container_barcode, tc.barcode AS to_container_barcode "
+        "FROM sample_events e "
+        "LEFT JOIN containers fc ON fc.id = e.from_container_id "
+        "LEFT JOIN containers tc ON tc.id = e.to_container_id "
+        "WHERE e.sample_id IN (?, ?, ?) ORDER BY e.sample_id ASC, e.occurred_at ASC, e.id ASC",
+        (1, 2, 3),
+        False,
+    ),
+    (
+        "container list keyset page",
+        "SELECT * FROM containers WHERE id < ? ORDER BY id DESC LIMIT ?",
+        (100, 25),
+        False,
+    ),
+]
+
+
+def plan_problems(conn, sql: str, params, allow_index_scan: bool) -> list[str]:
+    problems = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall():
+        detail = str(row[3])
+        if "USE TEMP B-TREE" in detail:
+            problems.append(detail)
+        elif detail.startswith("SCAN "):
+            if detail.startswith("SCAN (subquery") or detail.startswith("SCAN CONSTANT ROW"):
+                continue
+            if allow_index_scan and " USING " in detail and "INDEX" in detail:
+                continue
+            problems.append(detail)
+    return problems
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory(prefix="nexus-lims-plans.") as td:
+        os.environ["DB_PATH"] = str(Path(td) / "lims.sqlite3")
+
+        from lims import db
+
+        conn = db.connect()
+        try:
+            db.apply_migrations(conn)
+            failed = 0
+            for name, sql, params, allow_index_scan in HOT_QUERIES:
+                problems = plan_problems(conn, sql, params, allow_index_scan)
+                if problems:
+                    failed += 1
+                    print(f"FAIL: {name}: " + " | ".join(problems))
+        finally:
+            conn.close()
+
+    if failed:
+        return 1
+    print(f"OK: query plan regression passed ({len(HOT_QUERIES)} hot queries use indexes; no SCAN / TEMP B-TREE).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Regression: bulk sample intake (`lims.sh sample import` + POST /sample/add/batch).
+Checks JSON/JSONL/CSV parsing, set-based container + external_id resolution, exclusive
+container rules, and that bad rows are reported per row without aborting the batch.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env, stdin: str | None = None):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True, input=stdin,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def free_port() -> int:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def http_post(url: str, body: bytes, content_type: str):
+    req = Request(url, method="POST", data=body, headers={"Content-Type": content_type, "Accept": "application/json"})
+    try:
+        with urlopen(req, timeout=10) as r:
+            return r.status, json.loads(r.read().decode("utf-8"))
+    except HTTPError as e:
+        return e.code, json.loads(e.read().decode("utf-8") or "{}")
+
+
+def errors_by_row(report: dict) -> dict:
+    return {r["row"]: r.get("error") for r in report["results"] if not r.get("ok")}
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-sample-import-"))
+    db_path = tmp / "lims.sqlite3"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(db_path)
+
+    for cmd in (
+        ["./scripts/lims.sh", "init"],
+        ["./scripts/lims.sh", "container", "add", "--barcode", "IMP-RACK", "--kind", "rack"],
+        ["./scripts/lims.sh", "container", "add", "--barcode", "IMP-TUBE-1", "--kind", "tube"],
+        ["./scripts/lims.sh", "container", "add", "--barcode", "IMP-TUBE-2", "--kind", "tube"],
+    ):
+        p = run(cmd, env)
+        if p.returncode != 0:
+            return fail(f"{' '.join(cmd)}: {p.stdout}{p.stderr}")
+
+    # CLI, CSV from a file: good rows land, bad rows are reported with 1-based row numbers.
+    csv_path = tmp / "plate.csv"
+    csv_path.write_text(
+        "external_id,specimen_type,status,container\n"
+        "IMP-001,blood,,IMP-RACK\n"
+        "IMP-002,blood,done,IMP-RACK\n"
+        "IMP-003,,,\n"                  # missing specimen_type
+        "IMP-004,saliva,,IMP-TUBE-1\n"
+        "IMP-005,saliva,,IMP-TUBE-1\n"  # exclusive tube already claimed in this batch
+        "IMP-001,blood,,\n"             # duplicate within batch
+        "IMP-007,blood,bogus,\n"        # invalid status
+        "IMP-008,blood,,NOPE\n",        # unknown container
+        encoding="utf-8",
+    )
+    p = run(["./scripts/lims.sh", "sample", "import", str(csv_path), "--json"], env)
+    if p.returncode != 2:
+        return fail(f"import with bad rows should exit 2: rc={p.returncode} {p.stdout}{p.stderr}")
+    rep = json.loads(p.stdout)
+    if rep["inserted"] != 3 or rep["failed"] != 5:
+        return fail(f"unexpected CSV import counts: {rep}")
+    want = {2: "bad_request", 4: "container_occupied", 5: "duplicate", 6: "bad_request", 7: "not_found"}
+    if errors_by_row(rep) != want:
+        return fail(f"unexpected per-row errors: {errors_by_row(rep)}")
+
+    conn = sqlite3.connect(str(db_path))
+    rows = dict(conn.execute("SELECT external_id, status FROM samples WHERE external_id LIKE 'IMP-%'").fetchall())
+    events = conn.execute(
+        "SELECT COUNT(1) FROM sample_events e JOIN samples s ON s.id = e.sample_id "
+        "WHERE s.external_id = 'IMP-004' AND e.event_type IN ('received', 'container_assigned')"
+    ).fetchone()[0]
+    conn.close()
+    if rows != {"IMP-001": "received", "IMP-002": "completed", "IMP-004": "received"}:
+        return fail(f"unexpected rows after CSV import: {rows}")
+    if events != 2:
+        return fail(f"insert triggers should record received + container_assigned events, got {events}")
+
+    # CLI, JSONL on stdin: re-importing an existing id fails that row only; missing ids are generated.
+    jsonl = "\n".join(json.dumps(r) for r in [
+        {"external_id": "IMP-001", "specimen_type": "blood"},
+        {"specimen_type": "urine"},
+        {"specimen_type": "urine"},
+        {"specimen_type": "urine", "container": "IMP-TUBE-1"},  # occupied by IMP-004
+    ]) + "\n"
+    p = run(["./scripts/lims.sh", "sample", "import", "-", "--format", "jsonl"], env, stdin=jsonl)
+    if p.returncode != 2 or "OK: imported 2 sample(s), 2 failed" not in p.stdout:
+        return fail(f"JSONL import summary unexpected: rc={p.returncode} {p.stdout}{p.stderr}")
+    if "ERROR: row 1: already_exists" not in p.stdout or "ERROR: row 4: container_occupied" not in p.stdout:
+        return fail(f"JSONL per-row errors missing: {p.stdout}")
+
+    p = run(["./scripts/lims.sh", "sample", "import", "-", "--format", "json"], env, stdin="{not json")
+    if p.returncode != 2 or "ERROR:" not in p.stdout:
+        return fail(f"malformed JSON should be rc=2: {p.stdout}{p.stderr}")
+
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "scripts/lims_api.py", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=str(REPO_ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                with urlopen(base + "/health", timeout=0.5) as r:
+                    if r.status == 200:
+                        break
+            except Exception:
+                time.sleep(0.1)
+        else:
+            return fail("API did not become healthy")
+
+        plate = {"samples": [{"external_id": f"API-IMP-{i:03d}", "specimen_type": "plasma", "container": "IMP-RACK"}
+                             for i in range(96)]}
+        plate["samples"].append({"external_id": "API-IMP-X", "specimen_type": "plasma", "container": "IMP-TUBE-2"})
+        plate["samples"].append({"external_id": "API-IMP-Y", "specimen_type": "plasma", "container": "IMP-TUBE-2"})
+        st, j = http_post(base + "/sample/add/batch", json.dumps(plate).encode("utf-8"), "application/json")
+        if st != 200 or j.get("schema") != "nexus_sample_batch" or j.get("inserted") != 97 or j.get("failed") != 1:
+            return fail(f"/sample/add/batch JSON unexpected: {st} {j if st != 200 else {k: j[k] for k in ('inserted', 'failed')}}")
+        if errors_by_row(j) != {97: "container_occupied"} or not all(isinstance(r.get("id"), int) for r in j["results"][:97]):
+            return fail(f"/sample/add/batch JSON results unexpected: {j['results'][95:]}")
+
+        st, j = http_post(base + "/sample/add/batch", b"external_id,specimen_type\nAPI-CSV-1,swab\nAPI-IMP-000,swab\n", "text/csv")
+        if st != 200 or j.get("inserted") != 1 or errors_by_row(j) != {1: "already_exists"}:
+            return fail(f"/sample/add/batch CSV unexpected: {st} {j}")
+
+        st, j = http_post(base + "/sample/add/batch", b"[]", "application/json")
+        if st != 400 or j.get("schema") != "nexus_api_error":
+            return fail(f"empty batch should be 400: {st} {j}")
+        st, j = http_post(base + "/sample/add/batch?format=json", b"{oops", "application/json")
+        if st != 400:
+            return fail(f"malformed batch should be 400: {st} {j}")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=2)
+        except Exception:
+            proc.kill()
+
+    print("OK: sample import regression passed (CLI CSV/JSONL, API JSON/CSV batch, per-row errors, exclusivity).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
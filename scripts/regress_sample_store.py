@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Regression: shared sample data-access layer (lims/sample_store.py) and the bounded DB
+executor the FastAPI routes run it on (lims/api_executor.py).
+Checks list/show/events/status documents and their 400/404/413 errors without an HTTP
+server, that run_db never runs more than NEXUS_API_DB_THREADS calls at once, that the
+event loop keeps running while blocking calls are in flight, and that json_body encodes
+like JSONResponse and records the route's serialize phase.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def expect_error(fn, arg, status, detail):
+    from lims import sample_store
+    try:
+        fn(arg)
+    except sample_store.SampleRequestError as e:
+        if e.status != status or e.detail != detail:
+            return f"{fn.__name__}({arg!r}): got {e.status} {e.detail!r}, want {status} {detail!r}"
+        return ""
+    return f"{fn.__name__}({arg!r}) should fail with {status}"
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-store."))
+    db_path = tmp / "lims.sqlite3"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(db_path)
+    for args in (["init"], ["container", "add", "--barcode", "BOX-1", "--kind", "box"],
+                 ["sample", "add", "--specimen-type", "blood", "--external-id", "ST-1", "--container", "BOX-1"],
+                 ["sample", "add", "--specimen-type", "saliva", "--external-id", "ST-2"]):
+        p = subprocess.run(["./scripts/lims.sh", *args], cwd=str(REPO_ROOT), env=env, text=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if p.returncode != 0:
+            return fail(f"{args}: {p.stdout}{p.stderr}")
+    os.environ["DB_PATH"] = str(db_path)
+    os.environ["NEXUS_API_DB_THREADS"] = "2"
+
+    from lims import api_executor, db, sample_store
+
+    doc = sample_store.list_samples({"limit": ["1"]})
+    if doc["schema"] != "nexus_sample_list" or doc["count"] != 1 or not doc["next_cursor"]:
+        return fail(f"list page 1: {doc}")
+    doc2 = sample_store.list_samples({"limit": ["1"], "cursor": [doc["next_cursor"]]})
+    if doc2["count"] != 1 or doc2["samples"][0]["id"] == doc["samples"][0]["id"] or doc2["next_cursor"] is not None:
+        return fail(f"list page 2: {doc2}")
+    doc = sample_store.list_samples({"container": ["BOX-1"], "status": ["registered"]})
+    if doc["count"] != 1 or doc["samples"][0]["container"]["barcode"] != "BOX-1" or doc["filters"]["status"] != "received":
+        return fail(f"list filtered: {doc}")
+
+    doc = sample_store.show_sample({"external_id": ["ST-1"]})
+    if doc["sample"]["external_id"] != "ST-1" or doc["sample"]["container"]["barcode"] != "BOX-1":
+        return fail(f"show: {doc}")
+
+    for fn, arg, status, detail in (
+        (sample_store.list_samples, {"limit": ["x"]}, 400, "limit must be an int"),
+        (sample_store.list_samples, {"limit": ["-1"]}, 400, "limit must be >= 0"),
+        (sample_store.list_samples, {"status": ["lost"]}, 400, "invalid status. Allowed: received, processing, analyzing, completed"),
+        (sample_store.list_samples, {"container": ["NOPE"]}, 400, "container not found"),
+        (sample_store.show_sample, {}, 400, "identifier must be provided (identifier|external_id|id)"),
+        (sample_store.show_sample, {"identifier": ["NOPE"]}, 404, "sample not found: 'NOPE'"),
+        (sample_store.sample_events, {"identifier": ["NOPE"]}, 404, "sample not found: 'NOPE'"),
+        (sample_store.update_status, {"identifier": "ST-1"}, 400, "status is required"),
+        (sample_store.update_status, {"identifier": "NOPE", "status": "done"}, 404, "sample not found"),
+    ):
+        err = expect_error(fn, arg, status, detail)
+        if err:
+            return fail(err)
+
+    doc = sample_store.update_status({"identifier": "ST-1", "status": "testing", "note": "on the bench"})
+    if doc["from_status"] != "received" or doc["to_status"] != "processing" or doc["event_recorded"] is not True:
+        return fail(f"status update: {doc}")
+    ev = sample_store.sample_events({"identifier": ["ST-1"]})
+    changed = [e for e in ev["events"] if e["event_type"] == "status_changed"]
+    if len(changed) != 1 or changed[0]["note"] != "on the bench":
+        return fail(f"status event: {ev}")
+
+    for raw, status in ((b"[1]", 400), (b"{", 400), (b"x" * 20, 413)):
+        try:
+            sample_store.decode_json_object(raw, max_bytes=10)
+            return fail(f"decode_json_object({raw!r}) should fail")
+        except sample_store.SampleRequestError as e:
+            if e.status != status:
+                return fail(f"decode_json_object({raw!r}): {e.status}")
+    if sample_store.decode_json_object(b"") != {} or sample_store.decode_json_object(b"null") != {}:
+        return fail("an empty body should decode to {}")
+
+    # Executor: bounded, and the loop keeps ticking while calls block.
+    lock = threading.Lock()
+    active = [0, 0]  # current, max
+
+    def slow(i):
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        time.sleep(0.1)
+        with lock:
+            active[0] -= 1
+        return i
+
+    async def run():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        t = asyncio.ensure_future(ticker())
+        results = await asyncio.gather(*(api_executor.run_db(slow, i) for i in range(6)))
+        doc = await api_executor.run_db(sample_store.show_sample, {"identifier": ["ST-2"]})
+        done.set()
+        await t
+        return results, ticks, doc
+
+    t0 = time.monotonic()
+    results, ticks, doc = asyncio.run(run())
+    elapsed = time.monotonic() - t0
+    api_executor.shutdown()
+    if results != list(range(6)) or doc["sample"]["external_id"] != "ST-2":
+        return fail(f"run_db results: {results} {doc}")
+    if active[1] != 2:
+        return fail(f"at most NEXUS_API_DB_THREADS=2 calls should run at once, saw {active[1]}")
+    if elapsed < 0.29:
+        return fail(f"6 x 0.1s on 2 threads finished in {elapsed:.2f}s")
+    if ticks < 10:
+        return fail(f"the event loop should keep running while DB calls block (ticks={ticks})")
+
+    from lims import metrics as lims_metrics
+    body = api_executor.json_body("/sample/list", {"b": "\u00e9", "a": [1, None]})
+    if body != '{"b":"\u00e9","a":[1,null]}'.encode("utf-8"):
+        return fail(f"json_body encoding: {body!r}")
+    if 'nexus_http_phase_seconds_count{route="/sample/list",phase="serialize"} 1' not in lims_metrics.render():
+        return fail("json_body should record the serialize phase")
+
+    db.close_pools()
+    print("OK: sample store regression passed (list/show/events/status docs + errors, bounded DB executor, loop not blocked, json_body).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
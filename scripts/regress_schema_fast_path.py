@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Regression: schema fast path (PRAGMA user_version fingerprint skips the migration runner).
+Runs in-process against a temp DB_PATH.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO))
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory(prefix="nexus-lims-schema.") as td:
+        db_file = Path(td) / "lims.sqlite3"
+        os.environ["DB_PATH"] = str(db_file)
+
+        from lims import db
+
+        applied = db.migrate_on_startup()
+        if not applied:
+            return fail("migrate_on_startup() applied nothing on a fresh DB")
+        if db.migrate_on_startup():
+            return fail("second migrate_on_startup() should be a no-op")
+
+        fp = db.schema_fingerprint()
+        conn = sqlite3.connect(str(db_file))
+        try:
+            uv = conn.execute("PRAGMA user_version").fetchone()[0]
+            if uv != fp:
+                return fail(f"user_version={uv} expected fingerprint {fp}")
+
+            # Fast path must not touch schema_migrations at all.
+            conn.execute("ALTER TABLE schema_migrations RENAME TO schema_migrations_hidden")
+            conn.commit()
+            conn.row_factory = sqlite3.Row
+            if db.ensure_schema(conn) != []:
+                return fail("ensure_schema() ran migrations on a current DB")
+            conn.execute("ALTER TABLE schema_migrations_hidden RENAME TO schema_migrations")
+            conn.commit()
+
+            # A DB written by an older tree (user_version reset) goes through the runner and is re-marked.
+            conn.execute("PRAGMA user_version = 0")
+            conn.commit()
+            if db.ensure_schema(conn) != []:
+                return fail("ensure_schema() re-applied migrations that were already recorded")
+            uv = conn.execute("PRAGMA user_version").fetchone()[0]
+            if uv != fp:
+                return fail(f"user_version not re-marked after slow path: {uv}")
+        finally:
+            conn.close()
+
+        # Pooled connections come up migrated.
+        with db.reader() as rconn:
+            n = rconn.execute("SELECT COUNT(1) FROM schema_migrations").fetchone()[0]
+        if n != len(applied):
+            return fail(f"schema_migrations has {n} rows, expected {len(applied)}")
+        db.close_pools()
+
+    print("OK: schema fast path regression passed (user_version fingerprint, idempotent startup migrate).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Regression: guest-session cache (lims/sessions.py).
+Checks that a known session is answered from memory without a writer checkout, that
+unknown tokens are negatively cached, that last_seen_at is written behind in one flush,
+that expired sessions are refused and removed by the sweeper, that the cache is LRU
+bounded, that a session deleted in the DB drops out once its entry is re-read, and that
+async routes read the DB only on a miss and never on the event loop thread.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-sessions."))
+    db_path = tmp / "lims.sqlite3"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(db_path)
+    p = subprocess.run(["./scripts/lims.sh", "init"], cwd=str(REPO_ROOT), env=env, text=True,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        return fail(f"init: {p.stdout}{p.stderr}")
+    os.environ["DB_PATH"] = str(db_path)
+
+    from lims import db, sessions
+
+    def insert(sid, expires_at, last_seen="2000-01-01T00:00:00+00:00"):
+        conn = sqlite3.connect(str(db_path))
+        conn.execute("INSERT INTO guest_sessions (id, display_name, created_at, expires_at, last_seen_at) VALUES (?, ?, ?, ?, ?)",
+                     (sid, "t", "2000-01-01T00:00:00+00:00", expires_at, last_seen))
+        conn.commit()
+        conn.close()
+
+    def last_seen(sid):
+        conn = sqlite3.connect(str(db_path))
+        row = conn.execute("SELECT last_seen_at FROM guest_sessions WHERE id = ?", (sid,)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def writer_checkouts():
+        return sum(s.get("writer_checkouts", 0) for s in db.pool_stats())
+
+    future = "2999-01-01T00:00:00+00:00"
+    past = "2000-01-02T00:00:00+00:00"
+    c = sessions.SessionCache(ttl=60, negative_ttl=60, max_entries=3)
+
+    insert("s1", future)
+    w0 = writer_checkouts()
+    for _ in range(5):
+        row = c.lookup("s1")
+        if row is None or row["id"] != "s1" or row["expires_at"] != future:
+            return fail(f"known session not found: {row}")
+    st = c.stats()
+    if st["db_reads"] != 1 or st["hits"] != 5:
+        return fail(f"a known session should be read once, then served from memory: {st}")
+    if writer_checkouts() != w0:
+        return fail("lookups should not take the writer")
+
+    # Write-behind: the DB keeps the old last_seen_at until a flush.
+    if last_seen("s1") != "2000-01-01T00:00:00+00:00":
+        return fail("last_seen_at should not be written per request")
+    if c.flush() != 1 or last_seen("s1") == "2000-01-01T00:00:00+00:00":
+        return fail(f"flush should write last_seen_at: {last_seen('s1')}")
+    if c.flush() != 0:
+        return fail("nothing should be pending after a flush")
+
+    # Negative cache.
+    for _ in range(3):
+        if c.lookup("nope") is not None:
+            return fail("unknown token accepted")
+    st = c.stats()
+    if st["db_reads"] != 2 or st["negative_hits"] != 2:
+        return fail(f"an unknown token should be looked up once: {st}")
+
+    # remember() (POST /auth/guest) primes the cache and clears a negative entry.
+    insert("nope", future)
+    c.remember({"id": "nope", "display_name": None, "created_at": past, "expires_at": future, "last_seen_at": past})
+    if c.lookup("nope") is None or c.stats()["db_reads"] != 2:
+        return fail("a remembered session should be served without a DB read")
+
+    # Expired sessions are refused; the sweeper deletes them.
+    insert("old", past)
+    if c.lookup("old") is not None:
+        return fail("expired session accepted")
+    if c.sweep() != 1 or last_seen("old") is not None:
+        return fail("sweep should delete the expired row")
+    c.remember({"id": "soon", "display_name": None, "created_at": past,
+                "expires_at": "2000-01-03T00:00:00+00:00", "last_seen_at": past})
+    if c.lookup("soon") is not None:
+        return fail("a cached session past its expires_at should be refused")
+
+    # LRU bound.
+    for i in range(5):
+        c.remember({"id": f"lru{i}", "display_name": None, "created_at": past, "expires_at": future, "last_seen_at": past})
+    if c.stats()["cached"] != 3:
+        return fail(f"cache should hold at most max_entries: {c.stats()}")
+
+    # A deleted row drops out once the entry is re-read (ttl 0: every lookup re-reads).
+    c0 = sessions.SessionCache(ttl=0, negative_ttl=0)
+    if c0.lookup("s1") is None:
+        return fail("s1 should be valid")
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("DELETE FROM guest_sessions WHERE id = 's1'")
+    conn.commit()
+    conn.close()
+    if c0.lookup("s1") is not None:
+        return fail("a deleted session should be refused after revalidation")
+
+    # The background thread flushes on its own.
+    insert("bg", future)
+    cb = sessions.SessionCache(flush_interval=0.2, sweep_interval=0)
+    cb.lookup("bg")
+    cb.start()
+    deadline = time.monotonic() + 5
+    while last_seen("bg") == "2000-01-01T00:00:00+00:00" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    cb.stop()
+    if last_seen("bg") == "2000-01-01T00:00:00+00:00":
+        return fail("the sweeper thread should flush last_seen_at")
+
+    # Async routes (api_executor.lookup_session): a hit stays on the loop, a miss reads
+    # the DB on the executor thread, never on the loop thread.
+    from lims import api_executor
+
+    insert("async1", future)
+    lookup_threads = []
+
+    def observe(event, labels, seconds):
+        if event == "query" and labels.get("query") == "session_lookup":
+            lookup_threads.append(threading.get_ident())
+
+    db.add_observer(observe)
+
+    async def check():
+        loop_thread = threading.get_ident()
+        cache = sessions.get_cache()
+        reads0 = cache.stats()["db_reads"]
+        first = await api_executor.lookup_session("async1")
+        reads1 = cache.stats()["db_reads"]
+        again = await api_executor.lookup_session("async1")
+        unknown = await api_executor.lookup_session("async-nope")
+        return loop_thread, first, again, unknown, reads1 - reads0, cache.stats()["db_reads"] - reads1
+
+    loop_thread, first, again, unknown, miss_reads, later_reads = asyncio.run(check())
+    api_executor.shutdown()
+    if not first or first["id"] != "async1" or not again or unknown is not None:
+        return fail(f"lookup_session results: {first} {again} {unknown}")
+    if miss_reads != 1 or later_reads != 1:
+        return fail(f"a miss should read the DB once and a hit not at all (reads: {miss_reads}, {later_reads})")
+    if len(lookup_threads) != 2 or loop_thread in lookup_threads:
+        return fail(f"session misses should read on the executor, not the loop thread ({len(lookup_threads)} reads)")
+
+    db.close_pools()
+    print("OK: session cache regression passed (memory hits, no writer, write-behind, negative cache, expiry + sweep, LRU, "
+          "revalidation, async misses off the loop).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
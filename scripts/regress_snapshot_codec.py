@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Regression: snapshot artifact codecs.
+Checks that `snapshot export --codec zstd` writes a .tar.zst whose manifest records the
+codec, that latest / verify / doctor / restore / gc read it like a .tar.gz, that a bad
+level is rejected, and that zstd falls back to gzip when no zstd backend exists.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def main() -> int:
+    from lims import snapshot_codec
+
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-snap-codec."))
+    exports = tmp / "exports"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(tmp / "lims.sqlite3")
+    env["EXPORTS_DIR"] = str(exports)
+    for k in ("SNAPSHOT_CODEC", "SNAPSHOT_LEVEL", "SNAPSHOT_GZIP_LEVEL", "SNAPSHOT_PINS_FILE"):
+        env.pop(k, None)
+
+    for cmd in (["./scripts/lims.sh", "init"],
+                ["./scripts/lims.sh", "sample", "add", "--specimen-type", "blood", "--external-id", "CODEC-1"]):
+        p = run(cmd, env)
+        if p.returncode != 0:
+            return fail(f"{' '.join(cmd)}: {p.stdout}{p.stderr}")
+
+    p = run(["./scripts/lims.sh", "snapshot", "export", "--codec", "gzip", "--level", "12"], env)
+    if p.returncode != 2 or "level must be 1..9" not in p.stderr:
+        return fail(f"bad gzip level should be rc=2: {p.returncode} {p.stdout}{p.stderr}")
+
+    if snapshot_codec.zstd_backend() is None:
+        print("SKIP: no zstd backend; only the gzip fallback is checked.")
+    else:
+        p = run(["./scripts/lims.sh", "snapshot", "export", "--codec", "zstd", "--json"], env)
+        if p.returncode != 0:
+            return fail(f"zstd export failed: {p.stdout}{p.stderr}")
+        doc = json.loads(p.stdout)
+        tar = Path(doc["tarball"])
+        if doc.get("codec") != "zstd" or not tar.name.endswith(".tar.zst") or doc.get("codec_fallback"):
+            return fail(f"zstd export result unexpected: {doc}")
+        with tar.open("rb") as f:
+            if f.read(4) != b"\x28\xb5\x2f\xfd":
+                return fail("artifact is not a zstd frame")
+        mf = json.loads((Path(doc["snapshot_dir"]) / "manifest.json").read_text(encoding="utf-8"))
+        if mf.get("codec") != "zstd" or mf["tarball"].get("codec") != "zstd":
+            return fail(f"manifest does not record the codec: {mf}")
+
+        p = run(["./scripts/lims.sh", "snapshot", "latest"], env)
+        if p.returncode != 0 or p.stdout.strip() != str(tar):
+            return fail(f"latest should find the .tar.zst: {p.stdout}{p.stderr}")
+        shutil.rmtree(doc["snapshot_dir"])
+        p = run(["./scripts/lims.sh", "snapshot", "verify", str(tar)], env)
+        if p.returncode != 0:
+            return fail(f"verify .tar.zst failed: {p.stdout}{p.stderr}")
+        p = run(["./scripts/lims.sh", "snapshot", "doctor", str(tar), "--json-only"], env)
+        if p.returncode != 0 or json.loads(p.stdout.strip().splitlines()[-1]).get("counts", {}).get("samples") != 1:
+            return fail(f"doctor .tar.zst failed: {p.stdout}{p.stderr}")
+        restore_env = dict(env, DB_PATH=str(tmp / "restored.sqlite3"))
+        p = run(["./scripts/lims.sh", "snapshot", "restore", str(tar), "--force"], restore_env)
+        if p.returncode != 0:
+            return fail(f"restore .tar.zst failed: {p.stdout}{p.stderr}")
+        conn = sqlite3.connect(str(tmp / "restored.sqlite3"))
+        n = conn.execute("SELECT COUNT(1) FROM samples WHERE external_id = 'CODEC-1'").fetchone()[0]
+        conn.close()
+        if n != 1:
+            return fail("restored DB is missing CODEC-1")
+        p = run(["./scripts/lims.sh", "snapshot", "gc"], env)
+        if p.returncode != 0 or "DELETE tarball" not in p.stdout or tar.name not in p.stdout:
+            return fail(f"gc should see the orphan .tar.zst: {p.stdout}{p.stderr}")
+
+    # No zstd module or binary on PATH: the export still succeeds, as gzip.
+    no_zstd = dict(env, PATH="/usr/bin:/bin")
+    if shutil.which("zstd", path=no_zstd["PATH"]) is None and snapshot_codec.zstd_backend() != "module":
+        time.sleep(1.1)
+        p = run([sys.executable, "-m", "lims.snapshot", "export", "--codec", "zstd", "--json"], no_zstd)
+        if p.returncode != 0:
+            return fail(f"zstd export without a backend should fall back: {p.stdout}{p.stderr}")
+        doc = json.loads(p.stdout)
+        if doc.get("codec") != "gzip" or not doc["tarball"].endswith(".tar.gz") or not doc.get("codec_fallback"):
+            return fail(f"fallback result unexpected: {doc}")
+        if "WARN: zstd unavailable" not in p.stderr:
+            return fail(f"fallback should warn: {p.stderr}")
+
+    print("OK: snapshot codec regression passed (zstd export, manifest codec, latest/verify/doctor/restore/gc, gzip fallback).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Regression: doctor report cache.
+Checks that a tarball's doctor report is cached under <exports>/.doctor_cache keyed by the
+tarball sha256 and tool version, that diff-latest reuses it on the second run, that
+--no-cache, changed bytes and a different tool version all miss, and that failing
+reports are not cached.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def doctor(env, artifact, *extra):
+    p = run(["./scripts/lims.sh", "snapshot", "doctor", str(artifact), "--json-only", *extra], env)
+    return p.returncode, json.loads(p.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-doctor-cache."))
+    exports = tmp / "exports"
+    cache = exports / ".doctor_cache"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(tmp / "lims.sqlite3")
+    env["EXPORTS_DIR"] = str(exports)
+    for k in ("SNAPSHOT_DOCTOR_CACHE", "SNAPSHOT_INCREMENTAL", "SNAPSHOT_STORE", "SNAPSHOT_CODEC", "SNAPSHOT_PINS_FILE"):
+        env.pop(k, None)
+
+    tars = []
+    for ext_id in ("DC-1", "DC-2"):
+        for cmd in (["./scripts/lims.sh", "init"] if not tars else ["true"],
+                    ["./scripts/lims.sh", "sample", "add", "--specimen-type", "blood", "--external-id", ext_id]):
+            p = run(cmd, env)
+            if p.returncode != 0:
+                return fail(f"{' '.join(cmd)}: {p.stdout}{p.stderr}")
+        time.sleep(1.1)
+        p = run(["./scripts/lims.sh", "snapshot", "export", "--json"], env)
+        if p.returncode != 0:
+            return fail(f"export: {p.stdout}{p.stderr}")
+        tars.append(Path(json.loads(p.stdout)["tarball"]))
+
+    rc, rep = doctor(env, tars[0])
+    if rc != 0 or rep.get("cache", {}).get("hit") is not False:
+        return fail(f"first doctor run should miss: {rc} {rep.get('cache')}")
+    entries = sorted(cache.glob(f"{tars[0].name[:-len('.tar.gz')]}.*.json"))
+    if len(entries) != 1:
+        return fail(f"expected one cache entry, found {[e.name for e in entries]}")
+    rc, rep2 = doctor(env, tars[0])
+    if rc != 0 or not rep2["cache"]["hit"] or rep2["counts"] != rep["counts"] or rep2["artifact"] != str(tars[0]):
+        return fail(f"second doctor run should hit with the same report: {rep2}")
+    rc, rep3 = doctor(env, tars[0], "--no-cache")
+    if rc != 0 or "cache" in rep3:
+        return fail(f"--no-cache should bypass the cache: {rep3.get('cache')}")
+    rc, rep4 = doctor(dict(env, SNAPSHOT_DOCTOR_CACHE="0"), tars[0])
+    if rc != 0 or "cache" in rep4:
+        return fail(f"SNAPSHOT_DOCTOR_CACHE=0 should bypass the cache: {rep4.get('cache')}")
+
+    # A report from another tool version is ignored.
+    doc = json.loads(entries[0].read_text(encoding="utf-8"))
+    doc["tool_version"] = "0" * 16
+    entries[0].write_text(json.dumps(doc), encoding="utf-8")
+    rc, rep5 = doctor(env, tars[0])
+    if rc != 0 or rep5["cache"]["hit"]:
+        return fail("stale tool version should miss")
+
+    # diff-latest: first run fills B's entry, second run is served entirely from the cache.
+    p = run(["./scripts/lims.sh", "snapshot", "diff-latest", "--json-only"], env)
+    if p.returncode != 0:
+        return fail(f"diff-latest: {p.stdout}{p.stderr}")
+    d1 = json.loads(p.stdout.strip().splitlines()[0])
+    p = run(["./scripts/lims.sh", "snapshot", "diff-latest", "--json-only"], env)
+    d2 = json.loads(p.stdout.strip().splitlines()[0])
+    if p.returncode != 0 or not (d2["a"]["cached"] and d2["b"]["cached"]) or d2["deltas"] != d1["deltas"]:
+        return fail(f"second diff-latest should be fully cached and identical: {d1} / {d2}")
+    if {"metric": "samples", "a": 1, "b": 2, "delta": 1} not in d2["deltas"]["counts"]:
+        return fail(f"diff deltas unexpected: {d2['deltas']['counts']}")
+
+    # Same name, different bytes: the key is the content hash, not the name.
+    shutil.copy2(tars[1], tars[0])
+    rc, rep6 = doctor(env, tars[0])
+    if rc != 0 or rep6["cache"]["hit"] or rep6["counts"]["samples"] != 2:
+        return fail(f"replaced tarball should miss: {rep6.get('cache')} {rep6.get('counts')}")
+
+    # Failing reports are recomputed every time.
+    bad = exports / "snapshot-20000101-000000Z.tar.gz"
+    bad.write_bytes(b"not a tarball")
+    for _ in range(2):
+        rc, rep7 = doctor(env, bad)
+        if rc != 2 or rep7.get("cache", {}).get("hit"):
+            return fail(f"broken tarball should fail uncached: {rc} {rep7.get('cache')}")
+    if list(cache.glob("snapshot-20000101-000000Z.*.json")):
+        return fail("failing report was cached")
+
+    # Entries of deleted snapshots are dropped on the next write.
+    bad.unlink()
+    tars[1].unlink()
+    doctor(env, tars[0], "--no-migrate")
+    if list(cache.glob(f"{tars[1].name[:-len('.tar.gz')]}.*.json")):
+        return fail("cache entry of a deleted snapshot survived")
+
+    print("OK: doctor report cache regression passed (hit/miss, tool version, diff-latest reuse, no failure caching).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
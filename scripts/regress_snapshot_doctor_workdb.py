@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Regression: doctor work DB modes.
+Checks that `snapshot doctor --no-migrate` reads a current snapshot DB in place
+(read-only, no copy), that the migrating path works on an in-memory copy, that DBs
+over SNAPSHOT_DOCTOR_MEMORY_MAX_BYTES go through a temp file, that a DB not at head
+falls back to a copy, and that the snapshot's own DB is never modified.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def doctor(env, artifact, *extra):
+    p = run(["./scripts/lims.sh", "snapshot", "doctor", str(artifact), "--json-only", "--no-cache", *extra], env)
+    return p.returncode, json.loads(p.stdout.strip().splitlines()[-1])
+
+
+def sha(p: Path) -> str:
+    return hashlib.sha256(p.read_bytes()).hexdigest()
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-doctor-workdb."))
+    env = os.environ.copy()
+    env["DB_PATH"] = str(tmp / "lims.sqlite3")
+    env["EXPORTS_DIR"] = str(tmp / "exports")
+    for k in ("SNAPSHOT_DOCTOR_MEMORY_MAX_BYTES", "SNAPSHOT_INCREMENTAL", "SNAPSHOT_STORE", "SNAPSHOT_CODEC"):
+        env.pop(k, None)
+
+    for cmd in (["./scripts/lims.sh", "init"],
+                ["./scripts/lims.sh", "container", "add", "--barcode", "WD-T1", "--kind", "tube"],
+                ["./scripts/lims.sh", "sample", "add", "--specimen-type", "blood", "--external-id", "WD-1", "--container", "WD-T1"]):
+        p = run(cmd, env)
+        if p.returncode != 0:
+            return fail(f"{' '.join(cmd)}: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "export", "--json"], env)
+    if p.returncode != 0:
+        return fail(f"export: {p.stdout}{p.stderr}")
+    doc = json.loads(p.stdout)
+    tar, snap = Path(doc["tarball"]), Path(doc["snapshot_dir"])
+    snap_db = snap / "lims.sqlite3"
+    before = sha(snap_db)
+
+    expect = [
+        ((tar, "--no-migrate"), {}, "readonly"),
+        ((tar,), {}, "memory"),
+        ((tar,), {"SNAPSHOT_DOCTOR_MEMORY_MAX_BYTES": "1"}, "file"),
+        ((snap, "--no-migrate"), {}, "readonly"),
+        ((snap,), {}, "memory"),
+        ((snap,), {"SNAPSHOT_DOCTOR_MEMORY_MAX_BYTES": "1"}, "file"),
+    ]
+    reports = []
+    for args, extra_env, mode in expect:
+        rc, rep = doctor(dict(env, **extra_env), *args)
+        if rc != 0 or rep.get("work_mode") != mode:
+            return fail(f"doctor {args} {extra_env}: want {mode}, got rc={rc} {rep.get('work_mode')} {rep.get('notes')}")
+        reports.append(rep)
+    keys = ("counts", "status_counts", "integrity_ok", "foreign_key_violations", "work_db_sha256", "exclusive_occupied_count")
+    for rep in reports[1:]:
+        if any(rep[k] != reports[0][k] for k in keys) or rep["container_audit"]["excerpt"] != reports[0]["container_audit"]["excerpt"]:
+            return fail(f"reports differ between work modes: {reports[0]} / {rep}")
+    if reports[0]["work_db_sha256"] != before:
+        return fail("work_db_sha256 should be the snapshot DB's hash")
+    if sha(snap_db) != before or any(snap.glob("lims.sqlite3-*")):
+        return fail("doctor modified the snapshot DB (or left -wal/-shm files)")
+
+    # Not at head (user_version unset): --no-migrate cannot audit read-only, so it copies.
+    old = tmp / "old" / "lims.sqlite3"
+    old.parent.mkdir()
+    shutil.copy2(snap_db, old)
+    with sqlite3.connect(str(old)) as c:
+        c.execute("PRAGMA user_version = 0")
+    rc, rep = doctor(env, old, "--no-migrate")
+    if rc != 0 or rep.get("work_mode") != "memory":
+        return fail(f"DB behind head should fall back to a copy: rc={rc} {rep.get('work_mode')} {rep.get('notes')}")
+    with sqlite3.connect(str(old)) as c:
+        if c.execute("PRAGMA user_version").fetchone()[0] != 0:
+            return fail("doctor migrated the source DB")
+
+    print("OK: doctor work DB regression passed (read-only in place, in-memory, temp file, fallback; source untouched).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
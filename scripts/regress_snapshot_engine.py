@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Regression: in-process snapshot engine (lims.snapshot.export_snapshot).
+Checks paged backup progress, that rows still only in the live DB's WAL make it into
+the copy, the copy is a single-file (journal_mode=delete) DB, the streamed tarball's
+sha256 / member hashes match the files, no temp artifacts are left, and git provenance
+is read without running git.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def sha256_file(p: Path) -> str:
+    return hashlib.sha256(p.read_bytes()).hexdigest()
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-snap-engine."))
+    os.environ["DB_PATH"] = str(tmp / "lims.sqlite3")
+    exports = tmp / "exports"
+
+    from lims import db, snapshot
+
+    conn = db._open(db.db_path(), set_journal_mode=True)
+    db.ensure_schema(conn)
+    conn.execute("CREATE TABLE IF NOT EXISTS bulk (id INTEGER PRIMARY KEY, payload BLOB)")
+    conn.executemany("INSERT INTO bulk (payload) VALUES (?)", [(os.urandom(2048),) for _ in range(400)])
+    conn.execute(
+        "INSERT INTO samples (external_id, specimen_type, status, received_at, created_at, updated_at) "
+        "VALUES ('ENG-1', 'blood', 'received', '2026-01-01T00:00:00+00:00', '2026-01-01T00:00:00+00:00', '2026-01-01T00:00:00+00:00')"
+    )
+    conn.commit()
+    # Keep the writer open (no checkpoint on close) so ENG-1 may still live only in the WAL.
+    if str(conn.execute("PRAGMA journal_mode").fetchone()[0]).lower() != "wal":
+        return fail("test DB did not switch to WAL")
+
+    seen = {"backup": [], "tar": []}
+    doc = snapshot.export_snapshot(
+        exports_dir=exports,
+        include_samples=["ENG-1"],
+        backup_pages=16,
+        progress=lambda stage, done, total: seen[stage].append((done, total)),
+    )
+    conn.close()
+
+    if len(seen["backup"]) < 3 or seen["backup"][-1][0] != seen["backup"][-1][1]:
+        return fail(f"backup progress should be paged and reach total: {seen['backup'][:3]}...{seen['backup'][-1:]}")
+    if not seen["tar"] or seen["tar"][-1][0] != seen["tar"][-1][1]:
+        return fail(f"tar progress should reach total: {seen['tar'][-1:]}")
+
+    snap = Path(doc["snapshot_dir"])
+    tar_path = Path(doc["tarball"])
+    sconn = sqlite3.connect(str(snap / "lims.sqlite3"))
+    mode = sconn.execute("PRAGMA journal_mode").fetchone()[0]
+    n = sconn.execute("SELECT COUNT(*) FROM samples WHERE external_id = 'ENG-1'").fetchone()[0]
+    sconn.close()
+    if mode != "delete" or n != 1:
+        return fail(f"snapshot DB: journal_mode={mode} ENG-1 rows={n}")
+    leftovers = [p.name for p in list(exports.iterdir()) + list(snap.iterdir())
+                 if (p.name.startswith(".") and p.name != ".snapshot_index.jsonl") or p.name.endswith(("-wal", "-shm"))]
+    if leftovers:
+        return fail(f"temp/sidecar files left behind: {leftovers}")
+
+    if doc["tarball_sha256"] != sha256_file(tar_path) or doc["tarball_bytes"] != tar_path.stat().st_size:
+        return fail("streamed tarball sha256/bytes do not match the file")
+    manifest = json.loads((snap / "manifest.json").read_text(encoding="utf-8"))
+    if manifest["db"]["sha256"] != sha256_file(snap / "lims.sqlite3"):
+        return fail("manifest db sha256 does not match the snapshot DB")
+    if manifest["tarball"] != {"path": f"../{tar_path.name}", "sha256": doc["tarball_sha256"], "codec": "gzip"}:
+        return fail(f"manifest tarball entry: {manifest['tarball']}")
+    with tarfile.open(tar_path, "r:gz") as tf:
+        names = tf.getnames()
+        db_member = tf.extractfile(f"{snap.name}/lims.sqlite3").read()
+    for want in ("lims.sqlite3", "schema.sql", "meta.txt", "summary.txt", "exports/samples/sample-ENG-1.json",
+                 "scripts/lims.sh", "migrations/001_init.sql"):
+        if f"{snap.name}/{want}" not in names:
+            return fail(f"tarball missing {want}: {names[:10]}")
+    if any(not x.startswith(snap.name) for x in names) or hashlib.sha256(db_member).hexdigest() != manifest["db"]["sha256"]:
+        return fail("tarball members escape the snapshot dir or DB member differs")
+    if "CREATE TABLE samples" not in (snap / "schema.sql").read_text(encoding="utf-8").replace('"', ""):
+        return fail("schema.sql missing samples table")
+
+    p = subprocess.run(["git", "-C", str(REPO_ROOT), "rev-parse", "HEAD"], text=True, stdout=subprocess.PIPE,
+                       stderr=subprocess.DEVNULL)
+    if p.returncode == 0:
+        if snapshot.git_head().get("head") != p.stdout.strip() or manifest["git_commit"] != p.stdout.strip():
+            return fail(f"git provenance mismatch: {snapshot.git_head()} vs {p.stdout.strip()}")
+
+    try:
+        snapshot.export_snapshot(exports_dir=exports, include_samples=["NOPE"])
+    except snapshot.SnapshotError as e:
+        if "NOPE" not in str(e):
+            return fail(f"error should name the unknown sample: {e}")
+    else:
+        return fail("unknown include sample should raise SnapshotError")
+
+    print(f"OK: snapshot engine regression passed ({len(seen['backup'])} backup steps, streamed tar + sha256).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
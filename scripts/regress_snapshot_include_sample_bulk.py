@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Regression: snapshot --include-sample at plate scale goes through the in-process stage.
+Checks that a few hundred samples export in one pass (well past the old 512-process
+loop's practical cost), file names/shape match `sample export`, no *.tmp.* files are
+left behind, the manifest hashes every file, and an unknown id fails the export
+before any sample file is written.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+N = 384  # one 384-well plate
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def snapshot_dirs(exports_dir: Path) -> set:
+    return {d.name for d in exports_dir.iterdir() if d.is_dir() and d.name.startswith("snapshot-")}
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-lims-snap-inc-bulk."))
+    db_path = tmp / "lims.sqlite3"
+    exports_dir = tmp / "exports"
+    exports_dir.mkdir()
+    env = os.environ.copy()
+    env["DB_PATH"] = str(db_path)
+    env["SNAPSHOT_SAMPLE_JOBS"] = "4"
+
+    p = run(["./scripts/lims.sh", "init"], env)
+    if p.returncode != 0:
+        return fail(f"init: {p.stdout}{p.stderr}")
+    ids = [f"PLATE-{i:03d}" for i in range(N)] + ["odd:id.1"]
+    conn = sqlite3.connect(str(db_path))
+    conn.executemany(
+        "INSERT INTO samples (external_id, specimen_type, status, received_at, created_at, updated_at) "
+        "VALUES (?, 'plasma', 'received', '2026-01-01T00:00:00+00:00', '2026-01-01T00:00:00+00:00', '2026-01-01T00:00:00+00:00')",
+        [(x,) for x in ids],
+    )
+    conn.commit()
+    conn.close()
+
+    cmd = ["./scripts/lims.sh", "snapshot", "export", "--exports-dir", str(exports_dir)]
+    for x in ids:
+        cmd += ["--include-sample", x]
+    t0 = time.monotonic()
+    p = run(cmd, env)
+    elapsed = time.monotonic() - t0
+    if p.returncode != 0:
+        return fail(f"bulk include export rc={p.returncode}: {p.stdout}{p.stderr}")
+    snaps = sorted(snapshot_dirs(exports_dir))
+    if len(snaps) != 1:
+        return fail(f"expected one snapshot dir, got {snaps}")
+    snap = exports_dir / snaps[0]
+    samples_dir = snap / "exports" / "samples"
+
+    names = sorted(f.name for f in samples_dir.iterdir())
+    want = sorted([f"sample-{x}.json" for x in ids[:-1]] + ["sample-odd_id.1.json"])
+    if names != want:
+        extra = sorted(set(names) - set(want))
+        return fail(f"unexpected sample files (extra={extra[:5]}, count={len(names)})")
+    doc = json.loads((samples_dir / "sample-PLATE-007.json").read_text(encoding="utf-8"))
+    if set(doc) != {"generated_at", "sample", "events"} or doc["sample"]["external_id"] != "PLATE-007":
+        return fail(f"sample doc shape differs from `sample export`: {sorted(doc)}")
+    if not doc["events"] or doc["events"][0].get("event_type") != "received":
+        return fail(f"sample doc missing events: {doc['events']}")
+
+    manifest = json.loads((snap / "manifest.json").read_text(encoding="utf-8"))
+    entries = manifest["included_exports"]["samples"]
+    if len(entries) != len(ids) or any(e.get("missing") for e in entries):
+        return fail(f"manifest sample entries: {len(entries)} missing={[e for e in entries if e.get('missing')][:3]}")
+    odd = next(e for e in entries if e["external_id"] == "odd:id.1")
+    if odd["path"] != "exports/samples/sample-odd_id.1.json" or \
+            odd["sha256"] != hashlib.sha256((snap / odd["path"]).read_bytes()).hexdigest():
+        return fail(f"manifest entry for odd:id.1 wrong: {odd}")
+
+    # Unknown id: the stage refuses before writing, and the export fails.
+    before = snapshot_dirs(exports_dir)
+    p = run(["./scripts/lims.sh", "snapshot", "export", "--exports-dir", str(exports_dir),
+             "--include-sample", "PLATE-001", "--include-sample", "NOPE-1"], env)
+    if p.returncode != 2 or "NOPE-1" not in p.stderr:
+        return fail(f"unknown include sample should fail rc=2 naming it: rc={p.returncode} {p.stderr}")
+    created = sorted(snapshot_dirs(exports_dir) - before)
+    if len(created) != 1:
+        return fail(f"expected the failed export's dir to remain for inspection, got {created}")
+    partial = exports_dir / created[0] / "exports" / "samples"
+    if partial.exists() and any(partial.iterdir()):
+        return fail(f"failed stage left sample files behind: {sorted(f.name for f in partial.iterdir())}")
+
+    print(f"OK: snapshot bulk include regression passed ({len(ids)} samples in {elapsed:.1f}s, one stage, atomic files).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
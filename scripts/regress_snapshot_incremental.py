@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Regression: incremental (page-delta) snapshots.
+Checks that `snapshot export --incremental` stores only changed pages, that verify /
+doctor / restore rebuild the full DB through a two-link chain (also when the bases are
+tarball-only), that prune keeps the bases of kept snapshots, that gc --compact turns
+deltas back into full snapshots, and that SNAPSHOT_MAX_CHAIN forces a full snapshot.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env, stdin: str | None = None):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True, input=stdin,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def export(env, *extra):
+    time.sleep(1.1)  # distinct second-resolution snapshot names, so newest-first order is unambiguous
+    p = run(["./scripts/lims.sh", "snapshot", "export", "--json", *extra], env)
+    if p.returncode != 0:
+        raise RuntimeError(f"snapshot export {' '.join(extra)}: {p.stdout}{p.stderr}")
+    return json.loads(p.stdout)
+
+
+def add_samples(env, prefix: str, n: int) -> None:
+    rows = "".join(json.dumps({"external_id": f"{prefix}-{i:04d}", "specimen_type": "blood"}) + "\n" for i in range(n))
+    p = run(["./scripts/lims.sh", "sample", "import", "-", "--format", "jsonl"], env, stdin=rows)
+    if p.returncode != 0:
+        raise RuntimeError(f"sample import: {p.stdout}{p.stderr}")
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-snap-incremental."))
+    exports = tmp / "exports"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(tmp / "lims.sqlite3")
+    env["EXPORTS_DIR"] = str(exports)
+    for k in ("SNAPSHOT_INCREMENTAL", "SNAPSHOT_BASE", "SNAPSHOT_MAX_CHAIN", "SNAPSHOT_PINS_FILE"):
+        env.pop(k, None)
+
+    p = run(["./scripts/lims.sh", "init"], env)
+    if p.returncode != 0:
+        return fail(f"init: {p.stdout}{p.stderr}")
+    add_samples(env, "INC-A", 1500)
+
+    full = export(env)
+    if full.get("kind") != "full":
+        return fail(f"first export should be full: {full}")
+    full_dir = Path(full["snapshot_dir"])
+    if not (full_dir / "pages.idx").is_file():
+        return fail("full snapshot has no pages.idx")
+
+    add_samples(env, "INC-B", 3)
+    inc1 = export(env, "--incremental")
+    inc1_dir = Path(inc1["snapshot_dir"])
+    if inc1.get("kind") != "incremental" or inc1.get("base") != full_dir.name:
+        return fail(f"second export should be a delta against the first: {inc1}")
+    delta_size = (inc1_dir / "lims.sqlite3.delta").stat().st_size
+    db_size = (full_dir / "lims.sqlite3").stat().st_size
+    if (inc1_dir / "lims.sqlite3").exists() or delta_size * 4 > db_size:
+        return fail(f"delta should replace the DB and be small: delta={delta_size} db={db_size}")
+    if any(p.name.startswith(".") for p in inc1_dir.iterdir()):
+        return fail(f"work files left in snapshot dir: {sorted(p.name for p in inc1_dir.iterdir())}")
+    mf = json.loads((inc1_dir / "manifest.json").read_text(encoding="utf-8"))
+    if mf.get("kind") != "incremental" or mf["db"].get("format") != "page_delta" or mf["db"].get("depth") != 1:
+        return fail(f"incremental manifest unexpected: {mf}")
+
+    add_samples(env, "INC-C", 2)
+    inc2 = export(env, "--incremental", "--base", str(inc1_dir))
+    inc2_dir = Path(inc2["snapshot_dir"])
+    inc2_tar = Path(inc2["tarball"])
+    if inc2.get("base") != inc1_dir.name:
+        return fail(f"--base not honoured: {inc2}")
+
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(inc2_dir)], env)
+    if p.returncode != 0 or "rebuilt incremental snapshot" not in p.stdout:
+        return fail(f"verify of incremental dir failed: {p.stdout}{p.stderr}")
+
+    # Bases only as tarballs: the chain is pulled out of them.
+    shutil.rmtree(full_dir)
+    shutil.rmtree(inc1_dir)
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(inc2_tar)], env)
+    if p.returncode != 0:
+        return fail(f"verify of incremental tarball with tarball-only bases failed: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "doctor", str(inc2_tar), "--json-only"], env)
+    if p.returncode != 0:
+        return fail(f"doctor of incremental tarball failed: {p.stdout}{p.stderr}")
+    report = json.loads(p.stdout.strip().splitlines()[-1])
+    if report.get("counts", {}).get("samples") != 1505:
+        return fail(f"doctor counts unexpected: {report.get('counts')}")
+
+    restore_env = dict(env, DB_PATH=str(tmp / "restored.sqlite3"))
+    p = run(["./scripts/lims.sh", "snapshot", "restore", str(inc2_tar), "--force"], restore_env)
+    if p.returncode != 0:
+        return fail(f"restore of incremental tarball failed: {p.stdout}{p.stderr}")
+    conn = sqlite3.connect(str(tmp / "restored.sqlite3"))
+    n = conn.execute("SELECT COUNT(1) FROM samples").fetchone()[0]
+    conn.close()
+    if n != 1505:
+        return fail(f"restored DB has {n} samples, want 1505")
+
+    # Retention: the newest snapshot needs both older ones.
+    p = run(["./scripts/lims.sh", "snapshot", "prune", "--keep", "1", "--apply"], env)
+    if p.returncode != 0 or p.stdout.count("KEEP (base of incremental)") != 2:
+        return fail(f"prune should keep the bases: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "gc"], env)
+    if p.returncode != 0 or "KEEP (base of incremental)" not in p.stdout or "DELETE" in p.stdout:
+        return fail(f"gc should keep orphan bases: {p.stdout}{p.stderr}")
+
+    # Once compacted, nothing depends on the orphan tarballs any more and gc drops them.
+    p = run(["./scripts/lims.sh", "snapshot", "gc", "--compact", "--apply"], env)
+    if p.returncode != 0 or f"COMPACTED: {inc2_dir.name}" not in p.stdout or "deleted 2 tarball(s)" not in p.stdout:
+        return fail(f"gc --compact failed: {p.stdout}{p.stderr}")
+    if not (inc2_dir / "lims.sqlite3").is_file() or (inc2_dir / "lims.sqlite3.delta").exists():
+        return fail("compacted snapshot should hold a full lims.sqlite3")
+    if sorted(p.name for p in exports.glob("snapshot-*.tar.gz")) != [inc2_tar.name]:
+        return fail(f"old bases should be gone after gc: {sorted(p.name for p in exports.iterdir())}")
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(inc2_tar)], env)
+    if p.returncode != 0:
+        return fail(f"verify after compact + prune failed: {p.stdout}{p.stderr}")
+
+    capped = export(dict(env, SNAPSHOT_MAX_CHAIN="0"), "--incremental")
+    if capped.get("kind") != "full" or not capped.get("incremental_fallback"):
+        return fail(f"SNAPSHOT_MAX_CHAIN=0 should force a full snapshot: {capped}")
+
+    print("OK: incremental snapshot regression passed (delta export, chain verify/doctor/restore, prune/gc bases, compact).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Regression: snapshot index (EXPORTS_DIR/.snapshot_index.jsonl).
+Checks that exports append entries (name, ts, size, sha256, codec, pinned), that
+`snapshot latest` answers from the index without rewriting it, that tarballs added or
+deleted by hand and pins-file edits are picked up, that prune records its deletions,
+that `snapshot index --rebuild` repairs a damaged index, and that a nested (exports/api
+style) index finds the newest export.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def lines(path: Path):
+    return [json.loads(l) for l in path.read_text(encoding="utf-8").splitlines() if l.strip()]
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-snap-index."))
+    exports = tmp / "exports"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(tmp / "lims.sqlite3")
+    env["EXPORTS_DIR"] = str(exports)
+    for k in ("SNAPSHOT_CODEC", "SNAPSHOT_STORE", "SNAPSHOT_PINS_FILE"):
+        env.pop(k, None)
+
+    p = run(["./scripts/lims.sh", "init"], env)
+    if p.returncode != 0:
+        return fail(f"init: {p.stdout}{p.stderr}")
+    tarballs = []
+    for i in range(3):
+        if i:
+            time.sleep(1.1)
+        p = run(["./scripts/lims.sh", "snapshot", "export", "--json"], env)
+        if p.returncode != 0:
+            return fail(f"export: {p.stdout}{p.stderr}")
+        tarballs.append(Path(json.loads(p.stdout.strip().splitlines()[-1])["tarball"]))
+
+    idx = exports / ".snapshot_index.jsonl"
+    recs = lines(idx)
+    if recs[0].get("schema") != "nexus_snapshot_index" or [r.get("op") for r in recs[1:]] != ["put"] * 3:
+        return fail(f"exports should append one put line each: {recs}")
+    e = recs[-1]
+    want_sha = hashlib.sha256(tarballs[-1].read_bytes()).hexdigest()
+    if (e["path"], e["size"], e["sha256"], e["codec"], e["pinned"]) != (tarballs[-1].name, tarballs[-1].stat().st_size, want_sha, "gzip", False) \
+            or not e.get("ts") or e["name"] != tarballs[-1].name[: -len(".tar.gz")]:
+        return fail(f"index entry unexpected: {e}")
+
+    st = idx.stat()
+    p = run(["./scripts/lims.sh", "snapshot", "latest", "--n", "2"], env)
+    if p.returncode != 0 or p.stdout.strip() != str(tarballs[1]):
+        return fail(f"latest --n 2: {p.stdout}{p.stderr}")
+    if (idx.stat().st_ino, idx.stat().st_mtime_ns) != (st.st_ino, st.st_mtime_ns):
+        return fail("a fresh index should be read, not rewritten")
+
+    # Drift: a tarball copied in by hand, then deleted again.
+    manual = exports / "snapshot-20991231-000000Z.tar.gz"
+    shutil.copy2(tarballs[0], manual)
+    p = run(["./scripts/lims.sh", "snapshot", "latest"], env)
+    if p.stdout.strip() != str(manual):
+        return fail(f"latest should notice a tarball added by hand: {p.stdout}{p.stderr}")
+    manual.unlink()
+    p = run(["./scripts/lims.sh", "snapshot", "latest"], env)
+    if p.stdout.strip() != str(tarballs[-1]):
+        return fail(f"latest should notice a deleted tarball: {p.stdout}{p.stderr}")
+
+    # Pins file edits show up as the pinned flag.
+    p = run(["./scripts/lims.sh", "snapshot", "pin", "--n", "3"], env)
+    if p.returncode != 0:
+        return fail(f"pin --n 3: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "index", "--json"], env)
+    doc = json.loads(p.stdout)
+    pinned = [x["path"] for x in doc["entries"] if x["pinned"]]
+    if pinned != [tarballs[0].name]:
+        return fail(f"pinned flag should follow the pins file: {doc}")
+
+    # Prune deletes the middle snapshot and records it.
+    p = run(["./scripts/lims.sh", "snapshot", "prune", "--keep", "1", "--apply"], env)
+    if p.returncode != 0 or tarballs[1].exists():
+        return fail(f"prune: {p.stdout}{p.stderr}")
+    recs = lines(idx)
+    if {"op": "del", "path": tarballs[1].name} not in recs:
+        return fail(f"prune should append a del line: {recs}")
+    p = run(["./scripts/lims.sh", "snapshot", "latest", "--n", "2"], env)
+    if p.stdout.strip() != str(tarballs[0]):
+        return fail(f"latest --n 2 after prune: {p.stdout}{p.stderr}")
+
+    # A damaged index (torn line, lost entry) is repaired by --rebuild.
+    with idx.open("a", encoding="utf-8") as f:
+        f.write('{"op": "put", "path": "snap')
+    p = run(["./scripts/lims.sh", "snapshot", "latest"], env)
+    if p.stdout.strip() != str(tarballs[-1]):
+        return fail(f"a torn tail line should be skipped: {p.stdout}{p.stderr}")
+    idx.write_text("\n".join(idx.read_text(encoding="utf-8").splitlines()[:1]) + "\n", encoding="utf-8")
+    p = run(["./scripts/lims.sh", "snapshot", "index", "--rebuild"], env)
+    if p.returncode != 0 or "2 tarball(s) (2 added" not in p.stdout:
+        return fail(f"rebuild: {p.stdout}{p.stderr}")
+    doc = json.loads(run(["./scripts/lims.sh", "snapshot", "index", "--json"], env).stdout)
+    if sorted(x["path"] for x in doc["entries"]) != sorted([tarballs[0].name, tarballs[2].name]):
+        return fail(f"rebuilt index unexpected: {doc}")
+
+    # Nested index over per-request export dirs (the exports/api layout).
+    from lims import snapshot as lims_snapshot
+    from lims import snapshot_index
+
+    api_root = tmp / "api"
+    api_root.mkdir()
+    os.environ["DB_PATH"] = env["DB_PATH"]
+    last = None
+    for i in range(2):
+        if i:
+            time.sleep(1.1)
+        d = Path(tempfile.mkdtemp(prefix="snapshot-", dir=api_root))
+        last = lims_snapshot.export_snapshot(exports_dir=d, index_dir=api_root)
+    got = snapshot_index.latest(api_root, nested=True)
+    if got is None or str(got) != last["tarball"]:
+        return fail(f"nested latest: {got} != {last['tarball']}")
+    hdr = lines(api_root / ".snapshot_index.jsonl")[0]
+    if not hdr.get("nested"):
+        return fail(f"API index should be nested: {hdr}")
+
+    print("OK: snapshot index regression passed (append on export, fresh read, drift, pins, prune, rebuild, nested).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Regression: content-addressed snapshot store (`snapshot export --store cas`).
+Checks that two exports share blobs for unchanged files, that verify reads a stored
+snapshot dir, that checkout rebuilds a deleted dir, that a pin keeps a store manifest
+after its dir and tarball are gone, and that gc drops unreferenced blobs (dry-run first).
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def export(env, *extra):
+    time.sleep(1.1)  # distinct second-resolution snapshot names
+    p = run(["./scripts/lims.sh", "snapshot", "export", "--json", "--store", "cas", *extra], env)
+    if p.returncode != 0:
+        raise RuntimeError(f"snapshot export {' '.join(extra)}: {p.stdout}{p.stderr}")
+    return json.loads(p.stdout)
+
+
+def blobs(exports: Path):
+    return sorted(p.name for p in (exports / ".store" / "blobs").glob("*/*"))
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-snap-store."))
+    exports = tmp / "exports"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(tmp / "lims.sqlite3")
+    env["EXPORTS_DIR"] = str(exports)
+    for k in ("SNAPSHOT_STORE", "SNAPSHOT_INCREMENTAL", "SNAPSHOT_BASE", "SNAPSHOT_CODEC", "SNAPSHOT_PINS_FILE"):
+        env.pop(k, None)
+
+    for cmd in (["./scripts/lims.sh", "init"],
+                ["./scripts/lims.sh", "sample", "add", "--specimen-type", "blood", "--external-id", "CAS-1"]):
+        p = run(cmd, env)
+        if p.returncode != 0:
+            return fail(f"{' '.join(cmd)}: {p.stdout}{p.stderr}")
+
+    a = export(env)
+    b = export(env)
+    a_dir, b_dir = Path(a["snapshot_dir"]), Path(b["snapshot_dir"])
+    if a.get("store") != "cas" or not a.get("store_stats") or a["store_stats"]["blobs_new"] == 0:
+        return fail(f"first cas export should store blobs: {a}")
+    if b["store_stats"]["bytes_deduped"] <= 0:
+        return fail(f"second export should deduplicate: {b['store_stats']}")
+    for rel in ("lims.sqlite3", "schema.sql"):
+        if (a_dir / rel).stat().st_ino != (b_dir / rel).stat().st_ino:
+            return fail(f"{rel} should be one inode across both snapshots")
+    mig = sorted(p.relative_to(a_dir) for p in (a_dir / "migrations").rglob("*") if p.is_file())
+    if not mig or any((a_dir / r).stat().st_ino != (b_dir / r).stat().st_ino for r in mig):
+        return fail("migrations should be shared between snapshots")
+    mf = json.loads((a_dir / "manifest.json").read_text(encoding="utf-8"))
+    if mf.get("store") != "cas" or not (exports / ".store" / "manifests" / f"{a_dir.name}.json").is_file():
+        return fail(f"manifest should record the store: {mf.get('store')}")
+
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(b_dir)], env)
+    if p.returncode != 0:
+        return fail(f"verify of stored dir failed: {p.stdout}{p.stderr}")
+
+    # The store manifest is the snapshot: checkout rebuilds the dir.
+    shutil.rmtree(b_dir)
+    p = run(["./scripts/lims.sh", "snapshot", "checkout", b_dir.name], env)
+    if p.returncode != 0 or not (b_dir / "lims.sqlite3").is_file():
+        return fail(f"checkout failed: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(b_dir)], env)
+    if p.returncode != 0:
+        return fail(f"verify after checkout failed: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "checkout", b_dir.name], env)
+    if p.returncode != 2 or "refusing to overwrite" not in p.stderr:
+        return fail(f"checkout over an existing dir should be rc=2: {p.returncode} {p.stderr}")
+
+    # A pinned snapshot keeps its manifest (and blobs) with neither dir nor tarball left.
+    p = run(["./scripts/lims.sh", "snapshot", "pin", Path(a["tarball"]).name], env)
+    if p.returncode != 0:
+        return fail(f"pin failed: {p.stdout}{p.stderr}")
+    shutil.rmtree(a_dir)
+    Path(a["tarball"]).unlink()
+
+    # A third export with a different DB, then prune it: its DB blob becomes unreferenced.
+    p = run(["./scripts/lims.sh", "sample", "add", "--specimen-type", "blood", "--external-id", "CAS-2"], env)
+    if p.returncode != 0:
+        return fail(f"sample add: {p.stdout}{p.stderr}")
+    c = export(env)
+    c_db = json.loads((Path(c["snapshot_dir"]) / "manifest.json").read_text(encoding="utf-8"))["db"]["sha256"]
+    shutil.rmtree(c["snapshot_dir"])
+    Path(c["tarball"]).unlink()
+    before = blobs(exports)
+    if c_db not in before:
+        return fail("new DB content should have its own blob")
+
+    p = run(["./scripts/lims.sh", "snapshot", "gc"], env)
+    if p.returncode != 0 or "WOULD DELETE store blob" not in p.stdout or "(dry-run)" not in p.stdout:
+        return fail(f"gc dry-run should report the orphan blob: {p.stdout}{p.stderr}")
+    if blobs(exports) != before:
+        return fail("gc dry-run deleted blobs")
+
+    p = run(["./scripts/lims.sh", "snapshot", "gc", "--apply"], env)
+    if p.returncode != 0 or "DELETE store manifest" not in p.stdout:
+        return fail(f"gc --apply failed: {p.stdout}{p.stderr}")
+    after = blobs(exports)
+    if c_db in after or len(after) >= len(before):
+        return fail(f"gc should drop the unreferenced DB blob: {len(before)} -> {len(after)}")
+    if not (exports / ".store" / "manifests" / f"{a_dir.name}.json").is_file():
+        return fail("pinned store manifest was dropped")
+    p = run(["./scripts/lims.sh", "snapshot", "checkout", a_dir.name], env)
+    if p.returncode != 0:
+        return fail(f"checkout of pinned snapshot after gc failed: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(a_dir)], env)
+    if p.returncode != 0:
+        return fail(f"verify of pinned snapshot after gc failed: {p.stdout}{p.stderr}")
+
+    print("OK: snapshot store regression passed (shared blobs, verify, checkout, pins, refcounted gc).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
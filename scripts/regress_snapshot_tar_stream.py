@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Regression: single-pass tarball reading.
+Checks that readers extract only the DB member of a snapshot tarball (the included
+sample JSONs are never written), that every member is still checked -- a symlink after
+the DB, a duplicate DB and the size cap are refused by verify / restore / doctor --, that
+the stream is read to its end (a bad gzip CRC fails verify), and that restore writes the
+DB without leaving a staging file behind.
+"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def rewrite(src: Path, dst: Path, extra) -> None:
+    """Copy src's members into dst (gzip), then append the (TarInfo, bytes) pairs in extra."""
+    with tarfile.open(src, "r:gz") as tin, tarfile.open(dst, "w:gz") as tout:
+        for m in tin:
+            tout.addfile(m, tin.extractfile(m) if m.isfile() else None)
+        for info, data in extra:
+            tout.addfile(info, io.BytesIO(data) if data is not None else None)
+
+
+def main() -> int:
+    from lims import snapshot_codec
+
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-snap-tarstream."))
+    exports = tmp / "exports"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(tmp / "lims.sqlite3")
+    env["EXPORTS_DIR"] = str(exports)
+    for k in ("SNAPSHOT_CODEC", "SNAPSHOT_STORE", "SNAPSHOT_INCLUDE_SAMPLES", "NEXUS_SNAPSHOT_TAR_MAX_TOTAL_BYTES"):
+        env.pop(k, None)
+
+    p = run(["./scripts/lims.sh", "init"], env)
+    if p.returncode != 0:
+        return fail(f"init: {p.stdout}{p.stderr}")
+    for i in range(5):
+        p = run(["./scripts/lims.sh", "sample", "add", "--specimen-type", "blood", "--external-id", f"TS-{i}"], env)
+        if p.returncode != 0:
+            return fail(f"sample add: {p.stdout}{p.stderr}")
+    conn = sqlite3.connect(env["DB_PATH"])
+    ids = [r[0] for r in conn.execute("SELECT id FROM samples ORDER BY id")]
+    conn.close()
+    cmd = ["./scripts/lims.sh", "snapshot", "export", "--json"]
+    for sid in ids:
+        cmd += ["--include-sample", str(sid)]
+    p = run(cmd, env)
+    if p.returncode != 0:
+        return fail(f"export: {p.stdout}{p.stderr}")
+    doc = json.loads(p.stdout.strip().splitlines()[-1])
+    tar = Path(doc["tarball"])
+    snap = Path(doc["snapshot_dir"]).name
+    with tarfile.open(tar, "r:gz") as tf:
+        names = tf.getnames()
+    if not any("/samples/" in n or "exports/samples" in n for n in names):
+        return fail(f"export should carry the sample JSONs: {names}")
+
+    # Only the DB member is written.
+    out = tmp / "x"
+    got = snapshot_codec.extract_selected(tar, out, lambda n: n.endswith("/lims.sqlite3"))
+    written = sorted(str(f.relative_to(out)) for f in out.rglob("*") if f.is_file())
+    if got != [f"{snap}/lims.sqlite3"] or written != got:
+        return fail(f"expected only the DB to be extracted: got={got} written={written}")
+
+    p = run([sys.executable, "-m", "lims.snapshot", "extract", str(tar), "--out", str(tmp / "y")], env)
+    written = sorted(str(f.relative_to(tmp / "y")) for f in (tmp / "y").rglob("*") if f.is_file())
+    if p.returncode != 0 or written != [f"{snap}/lims.sqlite3"]:
+        return fail(f"extract CLI should write only the DB: rc={p.returncode} {written} {p.stderr}")
+
+    # A symlink *after* the DB member is still refused (the whole stream is checked).
+    link = tarfile.TarInfo(f"{snap}/zz_link")
+    link.type = tarfile.SYMTYPE
+    link.linkname = "../../etc/passwd"
+    bad_dir = tmp / "bad"
+    bad_dir.mkdir()
+    bad = bad_dir / tar.name
+    rewrite(tar, bad, [(link, None)])
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(bad)], env)
+    if p.returncode != 2 or "symlinks/hardlinks" not in p.stderr:
+        return fail(f"verify should refuse a late symlink: rc={p.returncode} {p.stderr}")
+    restore_env = dict(env, DB_PATH=str(tmp / "restore" / "lims.sqlite3"))
+    p = run(["./scripts/lims.sh", "snapshot", "restore", str(bad)], restore_env)
+    if p.returncode != 2 or (tmp / "restore" / "lims.sqlite3").exists():
+        return fail(f"restore should refuse a late symlink: rc={p.returncode} {p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "doctor", str(bad), "--json-only", "--no-cache"], env)
+    rep = json.loads(p.stdout.strip().splitlines()[-1])
+    if rep.get("ok") or "symlinks/hardlinks" not in json.dumps(rep.get("notes")):
+        return fail(f"doctor should refuse a late symlink: {rep}")
+
+    # Two DB members are ambiguous.
+    with tarfile.open(tar, "r:gz") as tf:
+        m = tf.getmember(f"{snap}/lims.sqlite3")
+        data = tf.extractfile(m).read()
+    dup = tarfile.TarInfo(f"{snap}/nested/lims.sqlite3")
+    dup.size = len(data)
+    rewrite(tar, bad, [(dup, data)])
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(bad)], env)
+    if p.returncode != 2 or "expected exactly 1 lims.sqlite3" not in p.stderr:
+        return fail(f"verify should refuse two DBs: rc={p.returncode} {p.stderr}")
+
+    # The gzip trailer is checked too: only the CRC differs, every member reads fine.
+    raw = bytearray(tar.read_bytes())
+    raw[-8] ^= 0xFF
+    bad.write_bytes(bytes(raw))
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(bad)], env)
+    if p.returncode != 2 or "corrupt artifact" not in p.stderr:
+        return fail(f"verify should refuse a bad gzip CRC: rc={p.returncode} {p.stderr}")
+
+    # Unpacked size cap.
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(tar)], dict(env, NEXUS_SNAPSHOT_TAR_MAX_TOTAL_BYTES="1000"))
+    if p.returncode != 2 or "too large" not in p.stderr:
+        return fail(f"verify should enforce the size cap: rc={p.returncode} {p.stderr}")
+
+    # The good tarball: verify, doctor and restore still work.
+    p = run(["./scripts/lims.sh", "snapshot", "verify", str(tar)], env)
+    if p.returncode != 0:
+        return fail(f"verify failed: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "doctor", str(tar), "--json-only", "--no-cache"], env)
+    rep = json.loads(p.stdout.strip().splitlines()[-1])
+    if p.returncode != 0 or rep.get("counts", {}).get("samples") != len(ids):
+        return fail(f"doctor failed: {p.stdout}{p.stderr}")
+    p = run(["./scripts/lims.sh", "snapshot", "restore", str(tar)], restore_env)
+    if p.returncode != 0:
+        return fail(f"restore failed: {p.stdout}{p.stderr}")
+    left = sorted(f.name for f in (tmp / "restore").iterdir())
+    if any(".restore." in n for n in left):
+        return fail(f"restore left its staging file behind: {left}")
+    conn = sqlite3.connect(str(tmp / "restore" / "lims.sqlite3"))
+    n = conn.execute("SELECT COUNT(1) FROM samples WHERE external_id LIKE 'TS-%'").fetchone()[0]
+    conn.close()
+    if n != len(ids):
+        return fail(f"restored DB has {n} samples, expected {len(ids)}")
+
+    print("OK: snapshot tar stream regression passed (DB-only extraction, late symlink / duplicate DB / bad CRC / size cap refused, verify/doctor/restore).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Regression: `snapshot verify --all`.
+Checks that every tarball in the exports dir is verified (in parallel) into one JSON
+report, that a rerun skips unchanged tarballs via the sha256 ledger (also after a
+touch), that a changed tarball fails without hiding the others (also when its size
+and mtime are kept, unless --trust-mtime), that --force re-verifies, and that ledger
+entries of deleted tarballs are dropped.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def fail(msg: str) -> int:
+    print(f"FAIL: {msg}")
+    return 1
+
+
+def run(cmd, env):
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), env=env, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def verify_all(env, *extra):
+    p = run(["./scripts/lims.sh", "snapshot", "verify", "--all", "--json", "--jobs", "2", *extra], env)
+    lines = p.stdout.strip().splitlines()
+    return p.returncode, (json.loads(lines[-1]) if lines else {}), p
+
+
+def main() -> int:
+    tmp = Path(tempfile.mkdtemp(prefix="nexus-verify-all."))
+    exports = tmp / "exports"
+    env = os.environ.copy()
+    env["DB_PATH"] = str(tmp / "lims.sqlite3")
+    env["EXPORTS_DIR"] = str(exports)
+    for k in ("SNAPSHOT_INCREMENTAL", "SNAPSHOT_STORE", "SNAPSHOT_CODEC", "SNAPSHOT_VERIFY_JOBS"):
+        env.pop(k, None)
+
+    p = run(["./scripts/lims.sh", "init"], env)
+    if p.returncode != 0:
+        return fail(f"init: {p.stdout}{p.stderr}")
+    tars = []
+    for i in range(3):
+        p = run(["./scripts/lims.sh", "sample", "add", "--specimen-type", "blood", "--external-id", f"VA-{i}"], env)
+        if p.returncode != 0:
+            return fail(f"sample add: {p.stdout}{p.stderr}")
+        time.sleep(1.1)
+        p = run(["./scripts/lims.sh", "snapshot", "export", "--json"], env)
+        if p.returncode != 0:
+            return fail(f"export: {p.stdout}{p.stderr}")
+        tars.append(Path(json.loads(p.stdout)["tarball"]))
+
+    rc, rep, p = verify_all(env)
+    if rc != 0 or rep.get("schema") != "nexus_snapshot_verify_all_result" or rep["counts"] != {"total": 3, "verified": 3, "skipped": 0, "failed": 0}:
+        return fail(f"first verify --all: {rc} {rep} {p.stderr}")
+    if [a["artifact"] for a in rep["artifacts"]] != [t.name for t in tars]:
+        return fail(f"report should list artifacts in name order: {rep['artifacts']}")
+    ledger = json.loads((exports / ".verify_ledger.json").read_text(encoding="utf-8"))
+    if sorted(ledger["entries"]) != sorted(t.name for t in tars):
+        return fail(f"ledger entries unexpected: {ledger}")
+
+    os.utime(tars[0])  # new mtime, same bytes: rehashed, still skipped
+    rc, rep, p = verify_all(env)
+    if rc != 0 or rep["counts"]["skipped"] != 3:
+        return fail(f"rerun should skip unchanged tarballs: {rep.get('counts')} {p.stderr}")
+    rc, rep, p = verify_all(env, "--no-migrate")
+    if rc != 0 or rep["counts"]["skipped"] != 3:
+        return fail(f"--no-migrate should accept full passes: {rep.get('counts')}")
+
+    shutil.copy2(tars[2], tmp / "keep.tar.gz")
+    tars[2].write_bytes(b"not a tarball")
+    rc, rep, p = verify_all(env)
+    bad = {a["artifact"]: a for a in rep.get("artifacts", [])}.get(tars[2].name, {})
+    if rc != 2 or rep["ok"] or rep["counts"]["failed"] != 1 or rep["counts"]["skipped"] != 2 or bad.get("status") != "failed" or not bad.get("message"):
+        return fail(f"changed tarball should fail alone: {rc} {rep}")
+    rc, rep, p = verify_all(env)
+    if rc != 2 or rep["counts"]["failed"] != 1:
+        return fail(f"failures must not be memoized: {rep.get('counts')}")
+
+    # Corrupted in place with size and mtime kept: only --trust-mtime misses it.
+    shutil.copy2(tmp / "keep.tar.gz", tars[2])
+    rc, rep, p = verify_all(env, "--force")
+    if rc != 0:
+        return fail(f"restored tarball should verify: {rep.get('counts')} {p.stderr}")
+    st = tars[2].stat()
+    data = bytearray(tars[2].read_bytes())
+    data[:2] = b"\0\0"  # no longer a gzip stream
+    tars[2].write_bytes(bytes(data))
+    os.utime(tars[2], ns=(st.st_atime_ns, st.st_mtime_ns))
+    rc, rep, p = verify_all(env, "--trust-mtime")
+    if rc != 0 or rep["counts"]["skipped"] != 3:
+        return fail(f"--trust-mtime should reuse the ledger hash: {rep.get('counts')}")
+    rc, rep, p = verify_all(env)
+    if rc != 2 or rep["counts"]["failed"] != 1 or rep["counts"]["skipped"] != 2:
+        return fail(f"same-size same-mtime corruption should fail by default: {rc} {rep.get('counts')}")
+
+    shutil.copy2(tmp / "keep.tar.gz", tars[2])
+    rc, rep, p = verify_all(env, "--force")
+    if rc != 0 or rep["counts"]["verified"] != 3:
+        return fail(f"--force should re-verify everything: {rep.get('counts')} {p.stderr}")
+
+    tars[1].unlink()
+    rc, rep, p = verify_all(env)
+    ledger = json.loads((exports / ".verify_ledger.json").read_text(encoding="utf-8"))
+    if rc != 0 or rep["counts"]["total"] != 2 or tars[1].name in ledger["entries"]:
+        return fail(f"deleted tarball should leave the report and ledger: {rep.get('counts')} {sorted(ledger['entries'])}")
+
+    p = run(["./scripts/lims.sh", "snapshot", "verify", "--all", "--jobs", "0"], env)
+    if p.returncode != 2 or "--jobs must be >= 1" not in p.stderr:
+        return fail(f"--jobs 0 should be rc=2: {p.returncode} {p.stderr}")
+
+    print("OK: snapshot verify --all regression passed (parallel verify, ledger skips, failures, rehash by default, --force, pruning).")
+    shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,13 +3,18 @@
 # - Explicitly DISABLE errexit (handles inherited SHELLOPTS from strict interactive shells)
 # - If already running (same app on same port), print status and exit 0
 # - If port is used by something else, print details and exit 1 (no terminal-killing behavior)
+# - WORKERS=N (or NEXUS_API_WORKERS=N) runs N worker processes
 set +o errexit 2>/dev/null || true
 set +o errtrace 2>/dev/null || true
 set -u
 set -o pipefail
 
+REPO_ROOT="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
 VENV="${VENV:-$HOME/.venvs/nexus-lab-tracker}"
 PORT="${PORT:-8789}"
+# >1: multi-worker mode (gunicorn with the app preloaded, see ops/gunicorn.conf.py;
+# plain `uvicorn --workers` when gunicorn is not installed).
+WORKERS="${NEXUS_API_WORKERS:-${WORKERS:-1}}"
 HOST="${HOST:-127.0.0.1}"
 LOG="${LOG:-/tmp/nexus-fastapi-${PORT}-$(date +%Y%m%d-%H%M%S).log}"
 PIDFILE="${PIDFILE:-/tmp/nexus-fastapi-${PORT}.pid}"
@@ -54,7 +59,7 @@ if ss -ltnp 2>/dev/null | rg -q ":${PORT}\b"; then
 
   if [ -n "${cand:-}" ]; then
     cmd="$(ps -p "$cand" -o args= 2>/dev/null || true)"
-    if printf "%s" "$cmd" | rg -q 'uvicorn .*lims\.api_fastapi:app'; then
+    if printf "%s" "$cmd" | rg -q '(uvicorn|gunicorn).*lims\.api_fastapi:app'; then
       echo "ALREADY RUNNING pid=$cand"
       echo "URL: http://${HOST}:${PORT}"
       echo "health:"
@@ -72,14 +77,27 @@ if ss -ltnp 2>/dev/null | rg -q ":${PORT}\b"; then
   exit 1
 fi
 
+if ! [[ "$WORKERS" =~ ^[0-9]+$ ]] || [ "$WORKERS" -lt 1 ]; then
+  echo "invalid WORKERS: $WORKERS"
+  exit 1
+fi
+export NEXUS_API_WORKERS="$WORKERS"
+if [ "$WORKERS" -gt 1 ] && [ -x "$VENV/bin/gunicorn" ]; then
+  server=(env HOST="$HOST" PORT="$PORT" "$VENV/bin/gunicorn" -c "$REPO_ROOT/ops/gunicorn.conf.py" lims.api_fastapi:app)
+elif [ "$WORKERS" -gt 1 ]; then
+  echo "note: gunicorn not in venv; starting uvicorn --workers $WORKERS (no preload)"
+  server=("$VENV/bin/uvicorn" lims.api_fastapi:app --host "$HOST" --port "$PORT" --log-level warning --workers "$WORKERS")
+else
+  server=("$VENV/bin/uvicorn" lims.api_fastapi:app --host "$HOST" --port "$PORT" --log-level warning)
+fi
+
 # Start detached (does not tie lifecycle to your terminal)
-nohup "$VENV/bin/uvicorn" lims.api_fastapi:app \
-  --host "$HOST" --port "$PORT" --log-level warning \
-  >"$LOG" 2>&1 &
+cd "$REPO_ROOT" || exit 1
+nohup "${server[@]}" >"$LOG" 2>&1 &
 pid=$!
 echo "$pid" >"$PIDFILE"
 
-echo "STARTED pid=$pid"
+echo "STARTED pid=$pid workers=$WORKERS"
 echo "LOG=$LOG"
 echo "PIDFILE=$PIDFILE"
 
@@ -6,6 +6,12 @@ REPO_ROOT="${REPO_ROOT:-/mnt/ssd/projects/nexus-lab-tracker}"
 VENV="${VENV:-/home/christopher/.venvs/nexus-lab-tracker}"
 HOST="${HOST:-127.0.0.1}"
 PORT="${PORT:-8789}"
+# >1: multi-worker mode, gunicorn preloading the app (ops/gunicorn.conf.py)
+export NEXUS_API_WORKERS="${NEXUS_API_WORKERS:-1}"
 
 cd "$REPO_ROOT" || exit 1
+if [ "$NEXUS_API_WORKERS" -gt 1 ] 2>/dev/null; then
+  export HOST PORT LOG_LEVEL="${LOG_LEVEL:-info}"
+  exec "$VENV/bin/gunicorn" -c ops/gunicorn.conf.py lims.api_fastapi:app
+fi
 exec "$VENV/bin/uvicorn" lims.api_fastapi:app --host "$HOST" --port "$PORT" --log-level info
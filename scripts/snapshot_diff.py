@@ -1,26 +1,15 @@
 #!/usr/bin/env python3
 import argparse
 import json
-import os
-import subprocess
 import sys
+import tempfile
 from pathlib import Path
 
-REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-def run(cmd, env):
-  r = subprocess.run(
-    cmd, cwd=REPO, env=env, text=True,
-    stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-  )
-  return r.returncode, r.stdout
-
-def parse_first_json_line(out: str):
-  for line in out.splitlines():
-    line = line.strip()
-    if line.startswith("{") and line.endswith("}"):
-      return json.loads(line)
-  raise ValueError("no JSON line found")
+import snapshot_doctor  # noqa: E402
+from lims import snapshot_rowdiff  # noqa: E402
 
 def status_counts_map(rep):
   m = {}
@@ -31,6 +20,9 @@ def status_counts_map(rep):
       m[st] = int(ct)
   return m
 
+def cached(rep) -> bool:
+  return bool((rep.get("cache") or {}).get("hit"))
+
 def diff_maps(a: dict, b: dict):
   keys = sorted(set(a.keys()) | set(b.keys()))
   out = []
@@ -42,24 +34,65 @@ def diff_maps(a: dict, b: dict):
       out.append({"key": k, "a": av, "b": bv, "delta": d})
   return out
 
+def row_diff(args) -> int:
+  """--rows: NDJSON of inserted/deleted/updated rows (raw snapshot DBs, no migrations)."""
+  tables = [t.strip() for t in args.tables.split(",") if t.strip()] if args.tables else list(snapshot_rowdiff.DEFAULT_TABLES)
+  if args.jobs < 1:
+    print("ERROR: --jobs must be >= 1", file=sys.stderr)
+    return 2
+  with tempfile.TemporaryDirectory() as ta, tempfile.TemporaryDirectory() as tb:
+    dbs = []
+    for arg, td in ((args.a, ta), (args.b, tb)):
+      artifact = snapshot_doctor.resolve_artifact(arg)
+      try:
+        src_db, _snap_dir, _tarball = snapshot_doctor.resolve_snapshot_context(artifact, Path(td))
+      except Exception as ex:
+        print(f"ERROR: cannot resolve {arg}: {ex}", file=sys.stderr)
+        return 2
+      dbs.append((artifact, Path(src_db)))
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+      totals = snapshot_rowdiff.diff_rows(
+        dbs[0][1], dbs[1][1], out, tables=tables, jobs=args.jobs,
+        labels={"a": str(dbs[0][0]), "b": str(dbs[1][0])},
+      )
+    except snapshot_rowdiff.RowDiffError as ex:
+      print(f"ERROR: {ex}", file=sys.stderr)
+      return 2
+    finally:
+      if args.out:
+        out.close()
+  if args.out:
+    print(f"OK: row diff written to {args.out} "
+          f"({totals['inserted']} inserted, {totals['deleted']} deleted, {totals['updated']} updated)")
+  return 0
+
 def main():
   ap = argparse.ArgumentParser(prog="snapshot_diff.py")
   ap.add_argument("a", help="artifact A (baseline)")
   ap.add_argument("b", help="artifact B (compare)")
   ap.add_argument("--no-migrate", action="store_true", help="do not apply migrations in temp copies")
   ap.add_argument("--json-only", action="store_true", help="print only JSON diff")
+  ap.add_argument("--no-cache", action="store_true", help="ignore and do not write doctor report caches")
+  ap.add_argument("--rows", action="store_true", help="row-level diff as NDJSON instead of doctor metrics")
+  ap.add_argument("--tables", default=None,
+                  help=f"--rows: comma-separated tables (default: {','.join(snapshot_rowdiff.DEFAULT_TABLES)})")
+  ap.add_argument("--jobs", type=int, default=1, help="--rows: worker processes for large tables (default 1)")
+  ap.add_argument("--out", default=None, help="--rows: write NDJSON here instead of stdout")
   args = ap.parse_args()
 
-  env = os.environ.copy()
+  if args.rows:
+    sys.exit(row_diff(args))
 
-  doctor_cmd = ["./scripts/lims.sh", "snapshot", "doctor", "--json-only"]
-  if args.no_migrate:
-    doctor_cmd.insert(-1, "--no-migrate")
+  # In-process doctor; unchanged tarballs (e.g. diff-latest's baseline) come from the report cache.
+  def doctor(arg):
+    return snapshot_doctor.doctor(
+      snapshot_doctor.resolve_artifact(arg), migrate=not args.no_migrate, use_cache=not args.no_cache
+    )
 
   # Doctor A
-  rc_a, out_a = run(doctor_cmd + [args.a], env)
-  rep_a = parse_first_json_line(out_a)
-  if rc_a != 0 or not rep_a.get("ok", False):
+  rep_a = doctor(args.a)
+  if not rep_a.get("ok", False):
     print(json.dumps({
       "ok": False,
       "error": "doctor_failed",
@@ -70,9 +103,8 @@ def main():
     sys.exit(2)
 
   # Doctor B
-  rc_b, out_b = run(doctor_cmd + [args.b], env)
-  rep_b = parse_first_json_line(out_b)
-  if rc_b != 0 or not rep_b.get("ok", False):
+  rep_b = doctor(args.b)
+  if not rep_b.get("ok", False):
     print(json.dumps({
       "ok": False,
       "error": "doctor_failed",
@@ -116,8 +148,8 @@ def main():
 
   diff = {
     "ok": True,
-    "a": {"artifact": rep_a.get("artifact"), "sha256": rep_a.get("work_db_sha256")},
-    "b": {"artifact": rep_b.get("artifact"), "sha256": rep_b.get("work_db_sha256")},
+    "a": {"artifact": rep_a.get("artifact"), "sha256": rep_a.get("work_db_sha256"), "cached": cached(rep_a)},
+    "b": {"artifact": rep_b.get("artifact"), "sha256": rep_b.get("work_db_sha256"), "cached": cached(rep_b)},
     "deltas": {
       "counts": count_deltas,
       "status_counts": status_deltas,
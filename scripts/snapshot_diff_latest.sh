@@ -10,6 +10,7 @@ n=2
 dir=""
 no_migrate=0
 json_only=0
+no_cache=0
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
@@ -23,9 +24,11 @@ while [[ $# -gt 0 ]]; do
       ;;
     --no-migrate) no_migrate=1; shift ;;
     --json-only)  json_only=1; shift ;;
+    --no-cache)   no_cache=1; shift ;;
     -h|--help)
-      echo "Usage: ./scripts/lims.sh snapshot diff-latest [--n N] [--dir PATH] [--no-migrate] [--json-only]"
+      echo "Usage: ./scripts/lims.sh snapshot diff-latest [--n N] [--dir PATH] [--no-migrate] [--json-only] [--no-cache]"
       echo "  Diffs newest snapshot (N=1) against the Nth newest (default N=2)."
+      echo "  Doctor reports are cached per tarball sha256 in <dir>/.doctor_cache (--no-cache to bypass)."
       echo "  Uses snapshot tarballs found in: --dir, EXPORTS_DIR, or ./exports"
       exit 0
       ;;
@@ -44,5 +47,6 @@ B="$(bash ./scripts/snapshot_latest.sh --n 1   "${latest_args[@]}")"
 flags=()
 (( no_migrate )) && flags+=(--no-migrate)
 (( json_only ))  && flags+=(--json-only)
+(( no_cache ))   && flags+=(--no-cache)
 
 exec python3 "$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/snapshot_diff.py" "$A" "$B" "${flags[@]}"
@@ -1,17 +1,24 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
 import hashlib
+import io
 import json
 import os
 import shutil
 import sqlite3
 import subprocess
 import sys
-import tarfile
 import tempfile
 from pathlib import Path
 
 REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO))
+
+from lims import cli, db, snapshot_codec, snapshot_delta  # noqa: E402
+
+# Larger DBs are checked through a temp file instead of an in-memory copy.
+DEFAULT_MEMORY_MAX_BYTES = 256 * 1024 * 1024
 
 def eprint(*a):
   print(*a, file=sys.stderr)
@@ -23,34 +30,19 @@ def sha256_file(p: Path) -> str:
       h.update(chunk)
   return h.hexdigest()
 
-def parse_multiline_json(text: str):
-  s = text.find("{")
-  e = text.rfind("}")
-  if s == -1 or e == -1 or e < s:
-    return None
-  return json.loads(text[s:e+1])
-
-def _safe_extractall(tf: tarfile.TarFile, dest: Path) -> None:
-  dest_r = dest.resolve()
-  for mem in tf.getmembers():
-    name = mem.name
-    # Basic path traversal guards
-    if name.startswith(("/", "\\")):
-      raise ValueError(f"unsafe tar member path (absolute): {name}")
-    parts = Path(name).parts
-    if ".." in parts:
-      raise ValueError(f"unsafe tar member path (..): {name}")
-    out = (dest_r / name).resolve()
-    try:
-      out.relative_to(dest_r)
-    except Exception:
-      raise ValueError(f"unsafe tar member path (escapes dest): {name}")
-  tf.extractall(path=dest_r)
+def _materialize_delta(snap_dir: Path, tmp: Path, search: Path) -> Path:
+  """Rebuild an incremental snapshot's image into tmp; bases are looked up next to the artifact."""
+  out = tmp / "resolved.sqlite3"
+  try:
+    snapshot_delta.materialize(snap_dir, out, search_dirs=[search, snap_dir.parent])
+  except snapshot_delta.DeltaError as e:
+    raise ValueError(f"cannot rebuild incremental snapshot: {e}") from None
+  return out
 
 def resolve_snapshot_context(artifact: Path, tmp: Path):
   """
   Returns (src_db, snap_dir, tarball_path)
-    - src_db: path to lims.sqlite3
+    - src_db: path to lims.sqlite3 (rebuilt into tmp for incremental snapshots)
     - snap_dir: directory containing lims.sqlite3 (may be None for direct sqlite3 artifacts)
     - tarball_path: original tarball path if artifact is tarball else None
   """
@@ -58,6 +50,8 @@ def resolve_snapshot_context(artifact: Path, tmp: Path):
     direct = artifact / "lims.sqlite3"
     if direct.exists():
       return direct, artifact, None
+    if snapshot_delta.is_delta_dir(artifact):
+      return _materialize_delta(artifact, tmp, artifact.resolve().parent), artifact, None
     found = sorted(artifact.glob("**/lims.sqlite3"))
     found = [pp for pp in found if len(pp.relative_to(artifact).parts) <= 3]
     if len(found) == 1:
@@ -68,12 +62,22 @@ def resolve_snapshot_context(artifact: Path, tmp: Path):
 
   if artifact.is_file():
     name = artifact.name
-    if name.endswith((".tar.gz", ".tgz")):
+    if snapshot_codec.codec_of(name) is not None:
+      # One pass over the stream: every member is checked, only the DB (or delta) is written.
       extract_root = tmp / "snapshot_extract"
       extract_root.mkdir(parents=True, exist_ok=True)
-      with tarfile.open(artifact, "r:gz") as tf:
-        _safe_extractall(tf, extract_root)
-      found = sorted(extract_root.rglob("lims.sqlite3"))
+      try:
+        names = snapshot_codec.extract_selected(
+          artifact, extract_root,
+          lambda n: n.rsplit("/", 1)[-1] in ("lims.sqlite3", snapshot_delta.DELTA_NAME),
+        )
+      except snapshot_codec.CodecError as e:
+        raise ValueError(str(e)) from None
+      found = [extract_root / n for n in names if n.rsplit("/", 1)[-1] == "lims.sqlite3"]
+      deltas = [extract_root / n for n in names if n.rsplit("/", 1)[-1] == snapshot_delta.DELTA_NAME]
+      if not found and len(deltas) == 1:
+        snap_dir = deltas[0].parent.resolve()
+        return _materialize_delta(snap_dir, tmp, artifact.resolve().parent), snap_dir, artifact
       if len(found) != 1:
         raise ValueError(f"expected exactly 1 lims.sqlite3 in tarball, found {len(found)}")
       src_db = found[0].resolve()
@@ -82,7 +86,7 @@ def resolve_snapshot_context(artifact: Path, tmp: Path):
     if name.endswith(".sqlite3") or name == "lims.sqlite3":
       return artifact, None, None
 
-  raise ValueError("unsupported artifact type; pass snapshot dir, snapshot-*.tar.gz, or lims.sqlite3")
+  raise ValueError("unsupported artifact type; pass snapshot dir, snapshot-*.tar.gz|.tar.zst, or lims.sqlite3")
 def table_exists(conn: sqlite3.Connection, table: str) -> bool:
   cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=? LIMIT 1", (table,))
   return cur.fetchone() is not None
@@ -91,37 +95,189 @@ def get_column_names(conn: sqlite3.Connection, table: str):
   cur = conn.execute(f"PRAGMA table_info({table})")
   return [r[1] for r in cur.fetchall()]
 
-def run(cmd, env, expect_rc=None):
-  r = subprocess.run(
-    cmd, cwd=REPO, env=env, text=True,
-    stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-  )
-  if expect_rc is not None and r.returncode != expect_rc:
-    raise RuntimeError(f"rc={r.returncode} expected {expect_rc}\nCMD: {cmd}\nOUTPUT:\n{r.stdout}")
-  return r.returncode, r.stdout
-
-def main():
-  ap = argparse.ArgumentParser(prog="snapshot_doctor.py")
-  ap.add_argument("artifact", help="snapshot dir, snapshot-*.tar.gz, or lims.sqlite3")
-  ap.add_argument("--no-migrate", action="store_true", help="do not apply migrations in temp copy")
-  ap.add_argument("--json-only", action="store_true", help="print only JSON report")
-  ap.add_argument("--max-audit-lines", type=int, default=60, help="max audit lines in report")
-  args = ap.parse_args()
-
-  artifact = Path(args.artifact)
+def _is_within(p: Path, root: Path) -> bool:
+  try:
+    p.resolve().relative_to(root.resolve())
+    return True
+  except ValueError:
+    return False
+
+def memory_max_bytes() -> int:
+  try:
+    return int(os.environ.get("SNAPSHOT_DOCTOR_MEMORY_MAX_BYTES", "") or DEFAULT_MEMORY_MAX_BYTES)
+  except ValueError:
+    return DEFAULT_MEMORY_MAX_BYTES
+
+def open_work_db(src_db: Path, td: Path, *, migrate: bool, immutable: bool):
+  """Returns (conn, work_db, mode) without writing the source DB:
+    readonly  --no-migrate and the schema is already at head: the source opened with
+              mode=ro (plus immutable=1 for snapshot files, which never change), no copy
+    memory    sqlite3 backup into :memory: (DBs up to SNAPSHOT_DOCTOR_MEMORY_MAX_BYTES)
+    file      larger DBs: the private extracted/rebuilt file in place, else a temp copy
+  """
+  uri = f"{src_db.resolve().as_uri()}?mode=ro" + ("&immutable=1" if immutable else "")
+  if not migrate:
+    conn = sqlite3.connect(uri, uri=True)
+    conn.row_factory = sqlite3.Row
+    if db.schema_is_current(conn):
+      return conn, str(src_db), "readonly"
+    conn.close()  # the audit needs the schema at head: fall back to a writable copy
+  if src_db.stat().st_size <= memory_max_bytes():
+    conn = sqlite3.connect(":memory:")
+    with contextlib.closing(sqlite3.connect(uri, uri=True)) as src:
+      src.backup(conn)
+    mode, work_db = "memory", ":memory:"
+  else:
+    if _is_within(src_db, td):
+      work = src_db
+    else:
+      work = td / "doctor.sqlite3"
+      shutil.copy2(src_db, work)
+    try:
+      os.chmod(work, 0o600)
+    except Exception:
+      pass
+    conn = sqlite3.connect(str(work))
+    mode, work_db = "file", str(work)
+  conn.row_factory = sqlite3.Row
+  return conn, work_db, mode
+
+def migration_status(conn: sqlite3.Connection, work_db: str) -> dict:
+  """`migrate.sh status` payload, without creating schema_migrations (works read-only)."""
+  applied = []
+  if table_exists(conn, "schema_migrations"):
+    applied = sorted(r[0] for r in conn.execute("SELECT id FROM schema_migrations"))
+  done = set(applied)
+  pending = [mid for mid, _ in db.available_migrations() if mid not in done]
+  return {"db_path": work_db, "applied": applied, "pending": pending}
+
+# Report cache: snapshot artifacts are immutable once written, so a doctor report for the
+# same bytes (and the same doctor, migrations and CLI) is reused instead of re-extracting,
+# migrating and auditing again. Entries live next to the artifact in .doctor_cache/ and are
+# dropped once their snapshot is gone. Only passing reports are cached: a failure may be
+# environmental (a missing incremental base) and is always recomputed.
+# SNAPSHOT_DOCTOR_CACHE=0 (or --no-cache) disables it.
+CACHE_DIR = ".doctor_cache"
+REPORT_FORMAT = 1
+_TOOL_FILES = (
+  "scripts/snapshot_doctor.py",
+  "scripts/snapshot_validate_manifest.py",
+  "scripts/migrate.sh",
+  "lims/cli.py",
+  "lims/db.py",
+  "lims/migrate.py",
+  "lims/snapshot_delta.py",
+)
+_tool_version = None
+
+def fingerprint(tag: str, rel_paths) -> str:
+  """Short hash over tag, the given repo files and migrations/*.sql (contents and names)."""
+  h = hashlib.sha256(tag.encode())
+  paths = [REPO / rel for rel in rel_paths] + sorted((REPO / "migrations").glob("*.sql"))
+  for p in paths:
+    h.update(str(p.relative_to(REPO)).encode() + b"\0")
+    try:
+      h.update(p.read_bytes())
+    except OSError:
+      h.update(b"<missing>")
+  return h.hexdigest()[:16]
+
+def tool_version() -> str:
+  """Fingerprint of everything that shapes a report: this script, the validator, the
+  migrations it applies and the CLI that runs the container audit."""
+  global _tool_version
+  if _tool_version is None:
+    _tool_version = fingerprint(f"doctor-report-v{REPORT_FORMAT}", _TOOL_FILES)
+  return _tool_version
+
+def cache_enabled() -> bool:
+  return os.environ.get("SNAPSHOT_DOCTOR_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+def _cache_entry(artifact: Path, artifact_sha: str, migrate: bool, max_audit_lines: int) -> Path:
+  key = hashlib.sha256(
+    f"{artifact_sha}:{tool_version()}:{int(migrate)}:{max_audit_lines}".encode()
+  ).hexdigest()[:24]
+  return artifact.parent / CACHE_DIR / f"{snapshot_codec.strip_ext(artifact.name)}.{key}.json"
+
+def _cache_load(entry: Path, artifact_sha: str):
+  try:
+    doc = json.loads(entry.read_text(encoding="utf-8"))
+  except (OSError, ValueError):
+    return None
+  if doc.get("artifact_sha256") != artifact_sha or doc.get("tool_version") != tool_version():
+    return None
+  rep = doc.get("report")
+  return rep if isinstance(rep, dict) and rep.get("ok") is True else None
+
+def _cache_store(entry: Path, artifact_sha: str, migrate: bool, max_audit_lines: int, report: dict) -> None:
+  doc = {
+    "artifact_sha256": artifact_sha,
+    "tool_version": tool_version(),
+    "migrate": migrate,
+    "max_audit_lines": max_audit_lines,
+    "report": report,
+  }
+  try:
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmp = entry.with_name(f".{entry.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(doc, separators=(",", ":")) + "\n", encoding="utf-8")
+    os.replace(tmp, entry)
+    _cache_prune(entry.parent)
+  except OSError:
+    pass  # read-only exports dir: run uncached
+
+def _cache_prune(cache_dir: Path) -> None:
+  """Drop entries whose snapshot artifact no longer exists next to the cache."""
+  for p in cache_dir.glob("snapshot-*.json"):
+    name = p.name.split(".", 1)[0]
+    if snapshot_codec.find_artifact(cache_dir.parent, name) is None:
+      try:
+        p.unlink()
+      except OSError:
+        pass
+
+def resolve_artifact(arg) -> Path:
+  artifact = Path(arg)
   if not artifact.is_absolute():
     artifact = (REPO / artifact).resolve()
+  return artifact
 
+def doctor(artifact: Path, *, migrate: bool = True, max_audit_lines: int = 60, use_cache: bool = True) -> dict:
+  """Doctor report for an artifact (snapshot dir, tarball or lims.sqlite3).
+
+  Tarball reports are served from / stored in the artifact's .doctor_cache when use_cache
+  and SNAPSHOT_DOCTOR_CACHE allow; report["cache"] says whether this one was a hit.
+  """
+  artifact_sha = None
+  entry = None
+  if use_cache and cache_enabled() and artifact.is_file() and snapshot_codec.codec_of(artifact.name):
+    artifact_sha = sha256_file(artifact)
+    entry = _cache_entry(artifact, artifact_sha, migrate, max_audit_lines)
+    cached = _cache_load(entry, artifact_sha)
+    if cached is not None:
+      cached["artifact"] = str(artifact)
+      cached["cache"] = {"hit": True, "artifact_sha256": artifact_sha, "tool_version": tool_version()}
+      return cached
+
+  report = _doctor_uncached(artifact, migrate=migrate, max_audit_lines=max_audit_lines)
+  if entry is not None:
+    if report["ok"]:
+      _cache_store(entry, artifact_sha, migrate, max_audit_lines, report)
+    report["cache"] = {"hit": False, "artifact_sha256": artifact_sha, "tool_version": tool_version()}
+  return report
+
+def _doctor_uncached(artifact: Path, *, migrate: bool, max_audit_lines: int) -> dict:
   report = {
     "ok": False,
     "artifact": str(artifact),
     "resolved_snapshot_db": None,
     "work_db": None,
+    "work_mode": None,
     "work_db_sha256": None,
     "work_db_size_bytes": None,
     "integrity_ok": None,
     "foreign_key_violations": None,
-    "migrate": {"attempted": (not args.no_migrate), "status": None},
+    "migrate": {"attempted": migrate, "status": None},
     "counts": {},
     "status_counts": [],
     "exclusive_occupied_count": None,
@@ -135,17 +291,16 @@ def main():
       src_db, snap_dir, tarball_path = resolve_snapshot_context(artifact, td)
     except Exception as ex:
       report["notes"].append(f"artifact_resolution_error: {ex}")
-      print(json.dumps(report, separators=(",", ":")))
-      sys.exit(2)
+      return report
 
     report["resolved_snapshot_db"] = str(src_db)
 
     report["resolved_snapshot_dir"] = (str(snap_dir) if snap_dir is not None else None)
     report["resolved_tarball"] = (str(tarball_path) if tarball_path is not None else None)
 
-    # Validate manifest (if present). Uses portable validator to support extracted tarballs / moved dirs.
+    # Validate manifest (if present; tarballs do not carry one). Uses portable validator to support moved dirs.
     validator = REPO / "scripts" / "snapshot_validate_manifest.py"
-    if snap_dir is not None and validator.exists():
+    if snap_dir is not None and (snap_dir / "manifest.json").is_file() and validator.exists():
       cmd = [sys.executable, str(validator), "--snap-dir", str(snap_dir), "--check-included"]
       if tarball_path is not None:
         cmd += ["--tarball", str(tarball_path)]
@@ -154,24 +309,19 @@ def main():
         msg = (r.stderr.strip() or r.stdout.strip() or f"rc={r.returncode}")
         raise RuntimeError(f"manifest_validation_failed: {msg}")
 
-    work_db = td / "doctor.sqlite3"
-    shutil.copy2(src_db, work_db)
-    try:
-      os.chmod(work_db, 0o600)
-    except Exception:
-      pass
-
-    report["work_db"] = str(work_db)
-    report["work_db_size_bytes"] = work_db.stat().st_size
-    report["work_db_sha256"] = sha256_file(work_db)
+    report["work_db_size_bytes"] = src_db.stat().st_size
+    report["work_db_sha256"] = sha256_file(src_db)
 
-    # Open DB
+    # Open DB (read-only in place, in-memory copy, or temp file; see open_work_db)
     try:
-      conn = sqlite3.connect(str(work_db))
+      conn, work_db, work_mode = open_work_db(
+        src_db, td, migrate=migrate, immutable=(snap_dir is not None or _is_within(src_db, td))
+      )
     except Exception as ex:
       report["notes"].append(f"sqlite_open_error: {ex}")
-      print(json.dumps(report, separators=(",", ":")))
-      sys.exit(2)
+      return report
+    report["work_db"] = work_db
+    report["work_mode"] = work_mode
 
     # integrity_check
     try:
@@ -189,27 +339,22 @@ def main():
       report["foreign_key_violations"] = len(fk_rows)
       if fk_rows:
         # include a tiny sample in notes (not the whole thing)
-        report["notes"].append(f"foreign_key_violation_sample: {fk_rows[:3]}")
+        report["notes"].append(f"foreign_key_violation_sample: {[tuple(r) for r in fk_rows[:3]]}")
     except Exception as ex:
       report["notes"].append(f"foreign_key_check_error: {ex}")
       report["foreign_key_violations"] = None
 
-    # Optionally migrate forward (temp only)
-    env = os.environ.copy()
-    env["DB_PATH"] = str(work_db)
-
-    if not args.no_migrate:
-      rc_up, out_up = run(["./scripts/migrate.sh", "up"], env)
-      if rc_up != 0:
+    # Optionally migrate forward (work copy only)
+    if migrate:
+      try:
+        db.apply_migrations(conn)
+      except Exception as ex:
         report["notes"].append("migrate_up_failed")
-        report["notes"].append(out_up.strip().splitlines()[-20:])
-      rc_st, out_st = run(["./scripts/migrate.sh", "status"], env)
-      st = parse_multiline_json(out_st) if out_st else None
-      report["migrate"]["status"] = st
-    else:
-      rc_st, out_st = run(["./scripts/migrate.sh", "status"], env)
-      st = parse_multiline_json(out_st) if out_st else None
-      report["migrate"]["status"] = st
+        report["notes"].append(f"{type(ex).__name__}: {ex}")
+    try:
+      report["migrate"]["status"] = migration_status(conn, work_db)
+    except Exception as ex:
+      report["notes"].append(f"migrate_status_error: {ex}")
 
     # Counts + status counts
     try:
@@ -248,11 +393,20 @@ def main():
     except Exception as ex:
       report["notes"].append(f"exclusive_occupied_query_error: {ex}")
 
+    # Container audit (same report as `lims.sh container audit`, run on the open work DB;
+    # like the CLI it needs the schema at head, which a read-only DB already is)
+    buf = io.StringIO()
+    try:
+      with contextlib.redirect_stdout(buf):
+        if work_mode != "readonly":
+          db.ensure_schema(conn)
+        rc_a = cli.container_audit(conn)
+    except Exception as ex:
+      rc_a = 1
+      buf.write(f"ERROR: container audit failed: {type(ex).__name__}: {ex}\n")
     conn.close()
-
-    # Container audit via CLI (uses DB_PATH temp)
-    rc_a, out_a = run(["./scripts/lims.sh", "container", "audit"], env)
-    excerpt = out_a.strip().splitlines()[:max(0, args.max_audit_lines)]
+    out_a = buf.getvalue()
+    excerpt = out_a.strip().splitlines()[:max(0, max_audit_lines)]
     report["container_audit"]["rc"] = rc_a
     report["container_audit"]["ok"] = (rc_a == 0)
     report["container_audit"]["excerpt"] = excerpt
@@ -274,34 +428,54 @@ def main():
       ok = False
 
     report["ok"] = ok
+    return report
 
-    # Print JSON first (machine-friendly)
-    print(json.dumps(report, separators=(",", ":")))
-
-    if not args.json_only:
-      print("\n---- Snapshot Doctor Summary ----")
-      print(f"artifact: {report['artifact']}")
-      print(f"snapshot_db: {report['resolved_snapshot_db']}")
-      print(f"work_db_sha256: {report['work_db_sha256']}")
-      print(f"integrity_ok: {report['integrity_ok']}")
-      print(f"foreign_key_violations: {report['foreign_key_violations']}")
-      if isinstance(st, dict):
-        print(f"migrations_pending: {st.get('pending')}")
-      print(f"container_audit_rc: {report['container_audit']['rc']}")
-      print(f"counts: {report.get('counts', {})}")
-      if report["status_counts"]:
-        print("status_counts:")
-        for row in report["status_counts"]:
-          print(f"  - {row['status']}: {row['count']}")
-      if report["exclusive_occupied_count"] is not None:
-        print(f"exclusive_occupied_count: {report['exclusive_occupied_count']}")
-      if report["notes"]:
-        print("notes:")
-        for n in report["notes"][:10]:
-          print(f"  - {n}")
-      print(f"\nRESULT: {'OK' if report['ok'] else 'FAIL'}")
-
-    sys.exit(0 if report["ok"] else 2)
+def main():
+  ap = argparse.ArgumentParser(prog="snapshot_doctor.py")
+  ap.add_argument("artifact", help="snapshot dir, snapshot-*.tar.gz|.tar.zst, or lims.sqlite3")
+  ap.add_argument("--no-migrate", action="store_true", help="do not apply migrations in temp copy")
+  ap.add_argument("--json-only", action="store_true", help="print only JSON report")
+  ap.add_argument("--max-audit-lines", type=int, default=60, help="max audit lines in report")
+  ap.add_argument("--no-cache", action="store_true", help="ignore and do not write the report cache")
+  args = ap.parse_args()
+
+  report = doctor(
+    resolve_artifact(args.artifact),
+    migrate=not args.no_migrate,
+    max_audit_lines=args.max_audit_lines,
+    use_cache=not args.no_cache,
+  )
+  st = report["migrate"]["status"]
+
+  # Print JSON first (machine-friendly)
+  print(json.dumps(report, separators=(",", ":")))
+
+  if not args.json_only:
+    print("\n---- Snapshot Doctor Summary ----")
+    print(f"artifact: {report['artifact']}")
+    print(f"snapshot_db: {report['resolved_snapshot_db']}")
+    print(f"work_db_sha256: {report['work_db_sha256']}")
+    if report.get("cache"):
+      print(f"cache: {'hit' if report['cache']['hit'] else 'miss'} (tool {report['cache']['tool_version']})")
+    print(f"integrity_ok: {report['integrity_ok']}")
+    print(f"foreign_key_violations: {report['foreign_key_violations']}")
+    if isinstance(st, dict):
+      print(f"migrations_pending: {st.get('pending')}")
+    print(f"container_audit_rc: {report['container_audit']['rc']}")
+    print(f"counts: {report.get('counts', {})}")
+    if report["status_counts"]:
+      print("status_counts:")
+      for row in report["status_counts"]:
+        print(f"  - {row['status']}: {row['count']}")
+    if report["exclusive_occupied_count"] is not None:
+      print(f"exclusive_occupied_count: {report['exclusive_occupied_count']}")
+    if report["notes"]:
+      print("notes:")
+      for n in report["notes"][:10]:
+        print(f"  - {n}")
+    print(f"\nRESULT: {'OK' if report['ok'] else 'FAIL'}")
+
+  sys.exit(0 if report["ok"] else 2)
 
 if __name__ == "__main__":
   main()
@@ -9,21 +9,29 @@ dir="${EXPORTS_DIR:-}"
 pins_file=""
 apply=0
 verbose=0
+compact=0
+max_depth=0
 
 while [[ $# -gt 0 ]]; do
   case "$1" in
     --dir) [[ $# -ge 2 ]] || fail "--dir requires a value"; dir="$2"; shift 2 ;;
     --file) [[ $# -ge 2 ]] || fail "--file requires a value"; pins_file="$2"; shift 2 ;;
+    --compact) compact=1; shift ;;
+    --max-depth) [[ $# -ge 2 ]] || fail "--max-depth requires a value"; max_depth="$2"; shift 2 ;;
     --apply) apply=1; shift ;;
     --dry-run) apply=0; shift ;;
     -v|--verbose) verbose=1; shift ;;
     -h|--help)
-      echo "Usage: ./scripts/lims.sh snapshot gc [--dir PATH] [--file PINS_FILE] [--apply] [--dry-run] [-v]"
+      echo "Usage: ./scripts/lims.sh snapshot gc [--dir PATH] [--file PINS_FILE] [--compact [--max-depth N]] [--apply] [--dry-run] [-v]"
       echo "  Finds orphan snapshot artifacts in exports dir:"
-      echo "    - orphan tarball: snapshot-*.tar.gz/tgz with no matching snapshot dir"
+      echo "    - orphan tarball: snapshot-*.tar.gz/tgz/tar.zst with no matching snapshot dir"
       echo "    - orphan dir:     snapshot-* dir with no matching tarball"
       echo "  Default is dry-run. Use --apply to delete orphans."
-      echo "  Pinned tarballs are never deleted (even if orphan)."
+      echo "  Pinned tarballs are never deleted (even if orphan), nor are bases of incremental snapshots."
+      echo "  With a content-addressed store (.store/), also drops manifests of deleted unpinned snapshots"
+      echo "  and blobs no manifest references."
+      echo "  --compact rewrites incremental snapshots deeper than --max-depth (default 0: all)"
+      echo "  as full ones first, so their bases can be pruned."
       exit 0 ;;
     *) fail "unknown arg: $1" ;;
   esac
@@ -36,6 +44,7 @@ if [[ -z "$dir" ]]; then
 fi
 [[ "$dir" == /* ]] || dir="$REPO_ROOT/$dir"
 [[ -d "$dir" ]] || fail "exports dir not found: $dir"
+[[ "$max_depth" =~ ^[0-9]+$ ]] || fail "--max-depth must be a non-negative integer"
 
 # Resolve pins file
 if [[ -z "$pins_file" ]]; then
@@ -54,10 +63,16 @@ if [[ -f "$pins_file" ]]; then
   done < "$pins_file"
 fi
 
+if (( compact )); then
+  compact_args=(--dir "$dir" --max-depth "$max_depth")
+  (( apply )) && compact_args+=(--apply)
+  python3 -m lims.snapshot compact "${compact_args[@]}" || fail "compact failed"
+fi
+
 # Collect tarballs + dirs
-mapfile -t tars < <(
-  find "$dir" -maxdepth 1 -type f \( -name 'snapshot-*.tar.gz' -o -name 'snapshot-*.tgz' \) -printf '%f\n' 2>/dev/null | sort -r
-)
+# Tarballs newest first, from the snapshot index (rebuilt first if the dir drifted).
+indexed="$(python3 -m lims.snapshot latest --dir "$dir" --all)" || fail "cannot read snapshot index: $dir"
+mapfile -t tars < <(printf '%s\n' "$indexed" | grep .)
 mapfile -t dirs < <(
   find "$dir" -maxdepth 1 -type d -name 'snapshot-*' -printf '%f\n' 2>/dev/null | sort -r
 )
@@ -68,10 +83,20 @@ declare -A dir_set=()
 for f in "${tars[@]}"; do tar_set["$f"]=1; done
 for d in "${dirs[@]}"; do dir_set["$d"]=1; done
 
+# Snapshots an incremental snapshot is built on are needed even when orphaned.
+declare -A base_set=()
+mapfile -t names < <(printf '%s\n' "${tars[@]}" "${dirs[@]}" | sed -e 's/\.tar\.gz$//' -e 's/\.tgz$//' -e 's/\.tar\.zst$//' | grep . | sort -u)
+if [[ ${#names[@]} -gt 0 ]]; then
+  while IFS= read -r b; do
+    [[ -n "$b" ]] && base_set["$b"]=1
+  done < <(python3 -m lims.snapshot bases --dir "$dir" "${names[@]}")
+fi
+
 # Orphans
 orphan_tar=()
 pinned_orphan_tar=()
 orphan_dir=()
+base_keep=()
 
 # Orphan tarballs: tar exists but matching dir missing
 for f in "${tars[@]}"; do
@@ -79,8 +104,11 @@ for f in "${tars[@]}"; do
   base="$f"
   d="${base%.tar.gz}"
   d="${d%.tgz}"
+  d="${d%.tar.zst}"
   if [[ -z "${dir_set[$d]:-}" ]]; then
-    if [[ -n "${pinned[$base]:-}" ]]; then
+    if [[ -n "${base_set[$d]:-}" ]]; then
+      base_keep+=("$base")
+    elif [[ -n "${pinned[$base]:-}" ]]; then
       pinned_orphan_tar+=("$base")
     else
       orphan_tar+=("$base")
@@ -93,17 +121,38 @@ for d in "${dirs[@]}"; do
   [[ "$d" != *"/"* ]] || fail "refusing suspicious dir name (contains '/'): $d"
   tgz="$d.tgz"
   tgz2="$d.tar.gz"
-  if [[ -z "${tar_set[$tgz]:-}" && -z "${tar_set[$tgz2]:-}" ]]; then
-    orphan_dir+=("$d")
+  tzst="$d.tar.zst"
+  if [[ -z "${tar_set[$tgz]:-}" && -z "${tar_set[$tgz2]:-}" && -z "${tar_set[$tzst]:-}" ]]; then
+    if [[ -n "${base_set[$d]:-}" ]]; then
+      base_keep+=("$d")
+    else
+      orphan_dir+=("$d")
+    fi
   fi
 done
 
 tar_del=${#orphan_tar[@]}
 dir_del=${#orphan_dir[@]}
 pin_orph=${#pinned_orphan_tar[@]}
+base_orph=${#base_keep[@]}
+
+# Content-addressed store (exports made with --store cas): drop manifests of snapshots
+# that are gone (unless pinned) and blobs no remaining manifest references.
+store_gc() {
+  [[ -d "$dir/.store" ]] || return 0
+  local args=(--dir "$dir" --pins-file "$pins_file")
+  if (( apply )); then
+    args+=(--apply)
+  else
+    for f in "${orphan_tar[@]}" "${orphan_dir[@]}"; do args+=(--gone "$f"); done
+  fi
+  echo ""
+  python3 -m lims.snapshot store-gc "${args[@]}" || fail "store gc failed"
+}
 
-if (( tar_del == 0 && dir_del == 0 && pin_orph == 0 )); then
+if (( tar_del == 0 && dir_del == 0 && pin_orph == 0 && base_orph == 0 )); then
   echo "OK: gc clean (no orphans found) in: $dir"
+  store_gc
   exit 0
 fi
 
@@ -114,6 +163,7 @@ echo "mode: $([[ $apply -eq 1 ]] && echo APPLY || echo DRY-RUN)"
 echo "orphan_tarballs: $tar_del"
 echo "orphan_dirs:     $dir_del"
 echo "pinned_orphans:  $pin_orph"
+echo "base_orphans:    $base_orph"
 
 if (( pin_orph > 0 )); then
   echo ""
@@ -123,6 +173,14 @@ if (( pin_orph > 0 )); then
   done
 fi
 
+if (( base_orph > 0 )); then
+  echo ""
+  echo "Orphans that incremental snapshots are built on (kept):"
+  for f in "${base_keep[@]}"; do
+    echo "KEEP (base of incremental): $dir/$f"
+  done
+fi
+
 if (( tar_del > 0 )); then
   echo ""
   echo "Orphan tarballs:"
@@ -142,6 +200,7 @@ fi
 if (( apply == 0 )); then
   echo ""
   echo "DRY-RUN: no files deleted."
+  store_gc
   exit 0
 fi
 
@@ -154,5 +213,12 @@ for d in "${orphan_dir[@]}"; do
   rm -rf -- "$dir/$d"
 done
 
+if (( tar_del > 0 )); then
+  drop_args=()
+  for f in "${orphan_tar[@]}"; do drop_args+=(--drop "$f"); done
+  python3 -m lims.snapshot index --dir "$dir" "${drop_args[@]}" || echo "WARN: snapshot index not updated (rebuilt on next read)" >&2
+fi
+
 echo ""
-echo "OK: gc applied (deleted $tar_del tarball(s), $dir_del dir(s); kept $pin_orph pinned orphan(s))."
+echo "OK: gc applied (deleted $tar_del tarball(s), $dir_del dir(s); kept $pin_orph pinned orphan(s), $base_orph base(s))."
+store_gc
@@ -23,7 +23,7 @@ while [[ $# -gt 0 ]]; do
       ;;
     -h|--help)
       echo "Usage: ./scripts/lims.sh snapshot latest [--n N] [--dir PATH]"
-      echo "  Prints the Nth newest snapshot tarball path (default N=1)."
+      echo "  Prints the Nth newest snapshot tarball path (default N=1), from the snapshot index."
       echo "  Directory resolution order: --dir, EXPORTS_DIR, ./exports"
       exit 0
       ;;
@@ -45,12 +45,6 @@ fi
 
 [[ "$dir" == /* ]] || dir="$REPO_ROOT/$dir"
 
-mapfile -t files < <(
-  find "$dir" -maxdepth 1 -type f \( -name 'snapshot-*.tar.gz' -o -name 'snapshot-*.tgz' \) -printf '%f\n' 2>/dev/null | sort -r
-)
-
-[[ ${#files[@]} -gt 0 ]] || fail "no snapshot tarballs found in: $dir"
-(( n <= ${#files[@]} )) || fail "--n out of range: requested $n but only ${#files[@]} snapshot tarballs found"
-
-pick="${files[$((n-1))]}"
-echo "$dir/$pick"
+# Read from the exports dir's snapshot index (lims/snapshot_index.py), which is rebuilt
+# automatically if tarballs were added or removed behind its back.
+exec python3 -m lims.snapshot latest --dir "$dir" --n "$n"
@@ -41,14 +41,14 @@ fi
 
 if [[ -n "$n" ]]; then
   [[ "$n" =~ ^[1-9][0-9]*$ ]] || fail "--n must be a positive integer"
-  artifact="$(./scripts/snapshot_latest.sh --n "$n" --dir "$dir")"
+  artifact="$(python3 -m lims.snapshot latest --dir "$dir" --n "$n")" || exit 2
 fi
 
 [[ -n "$artifact" ]] || fail "missing artifact (pass tarball/basename or use --n N)"
 
 base="$(basename "$artifact")"
 case "$base" in
-  snapshot-*.tar.gz|snapshot-*.tgz) ;;
+  snapshot-*.tar.gz|snapshot-*.tgz|snapshot-*.tar.zst) ;;
   *) fail "not a snapshot tarball name: $base" ;;
 esac
 
@@ -22,7 +22,8 @@ while [[ $# -gt 0 ]]; do
     -h|--help)
       echo "Usage: ./scripts/lims.sh snapshot prune [--keep N] [--dir PATH] [--file PINS_FILE] [--apply] [--dry-run] [-v]"
       echo "  Default is dry-run (no deletion). Use --apply to actually delete."
-      echo "  Always preserves pinned snapshots (pins file) plus newest --keep N."
+      echo "  Always preserves pinned snapshots (pins file) plus newest --keep N,"
+      echo "  and every snapshot those are built on (bases of incremental snapshots)."
       exit 0 ;;
     *) fail "unknown arg: $1" ;;
   esac
@@ -53,9 +54,9 @@ if [[ -f "$pins_file" ]]; then
   done < "$pins_file"
 fi
 
-mapfile -t files < <(
-  find "$dir" -maxdepth 1 -type f \( -name 'snapshot-*.tar.gz' -o -name 'snapshot-*.tgz' \) -printf '%f\n' 2>/dev/null | sort -r
-)
+# Tarballs newest first, from the snapshot index (rebuilt first if the dir drifted).
+indexed="$(python3 -m lims.snapshot latest --dir "$dir" --all)" || fail "cannot read snapshot index: $dir"
+mapfile -t files < <(printf '%s\n' "$indexed" | grep .)
 
 [[ ${#files[@]} -gt 0 ]] || { echo "OK: nothing to prune (no snapshots found in $dir)"; exit 0; }
 
@@ -71,6 +72,22 @@ for k in "${!pinned[@]}"; do
   keepers["$k"]=1
 done
 
+# keep whatever the keepers' delta chains need
+if [[ ${#keepers[@]} -gt 0 ]]; then
+  mapfile -t keep_names < <(printf '%s\n' "${!keepers[@]}" | sed -e 's/\.tar\.gz$//' -e 's/\.tgz$//' -e 's/\.tar\.zst$//' | grep '^snapshot-' | sort -u)
+  if [[ ${#keep_names[@]} -gt 0 ]]; then
+    while IFS= read -r b; do
+      [[ -n "$b" ]] || continue
+      for f in "$b.tar.gz" "$b.tgz" "$b.tar.zst"; do
+        if [[ -f "$dir/$f" && -z "${keepers[$f]:-}" ]]; then
+          keepers["$f"]=1
+          echo "KEEP (base of incremental): $dir/$f"
+        fi
+      done
+    done < <(python3 -m lims.snapshot bases --dir "$dir" "${keep_names[@]}")
+  fi
+fi
+
 # deletion candidates
 to_delete=()
 for f in "${files[@]}"; do
@@ -101,6 +118,7 @@ for f in "${to_delete[@]}"; do
 
   d="${f%.tar.gz}"
   d="${d%.tgz}"
+  d="${d%.tar.zst}"
   if [[ -d "$dir/$d" ]]; then
     echo "DELETE dir:     $dir/$d"
     dir_del=$((dir_del+1))
@@ -119,7 +137,15 @@ for f in "${to_delete[@]}"; do
   rm -f -- "$dir/$f"
   d="${f%.tar.gz}"
   d="${d%.tgz}"
+  d="${d%.tar.zst}"
   [[ -d "$dir/$d" ]] && rm -rf -- "$dir/$d" || true
+  # Content-addressed store: the manifest goes with the snapshot; blobs are left to `snapshot gc`.
+  rm -f -- "$dir/.store/manifests/$d.json"
+  rm -f -- "$dir/.doctor_cache/$d".*.json
 done
 
+drop_args=()
+for f in "${to_delete[@]}"; do drop_args+=(--drop "$f"); done
+python3 -m lims.snapshot index --dir "$dir" "${drop_args[@]}" || echo "WARN: snapshot index not updated (rebuilt on next read)" >&2
+
 echo "OK: pruned $tar_del tarball(s), $dir_del dir(s)."
@@ -44,54 +44,13 @@ fi
 
 safe_extract_tgz() {
   local art="$1" dest="$2"
-  command -v tar >/dev/null 2>&1 || { echo "ERROR: tar is required to extract tar.gz snapshots" >&2; exit 2; }
-  local list count
-  list="$(tar -tzf "$art")" || { echo "ERROR: tar -tzf failed: $art" >&2; exit 2; }
-  count="$(printf "%s\n" "$list" | sed "/^$/d" | wc -l | tr -d " ")"
-  if [[ "${count:-0}" -gt 2000 ]]; then
-    echo "ERROR: tarball too large ($count entries): $art" >&2
-    exit 2
-  fi
-  if printf "%s\n" "$list" | grep -Eq "(^/|(^|/)\.\.(/|$))"; then
-    printf "%s\n" "$list" | grep -E "(^/|(^|/)\.\.(/|$))" | sed "s/^/UNSAFE: /" >&2
-    echo "ERROR: unsafe paths in tarball (path traversal) - refusing to extract" >&2
-    exit 2
-  fi
-  
-  # Extra hardening: reject symlinks/hardlinks/devices/pipes/sockets, and cap total unpacked bytes.
-  local tlist total max_total
-  max_total="${NEXUS_SNAPSHOT_TAR_MAX_TOTAL_BYTES:-200000000}"   # 200MB default
-
-  tlist="$(tar -tvzf "$art")" || { echo "ERROR: tar -tvzf failed: $art" >&2; exit 2; }
-
-  # File type is first char of perms (e.g. -, d, l, b, c, p, s, h). Reject l/h/b/c/p/s.
-  if printf "%s\n" "$tlist" | awk '{print $1}' | grep -Eq '^[lhbcps]'; then
-    printf "%s\n" "$tlist" | awk '$1 ~ /^[lhbcps]/ {print "UNSAFE-TYPE: " $0}' >&2
-    echo "ERROR: tarball contains symlinks/hardlinks/devices/pipes/sockets - refusing to extract" >&2
-    exit 2
-  fi
-
-  # Zip-bomb guard: sum sizes in a tar listing (GNU tar vs bsdtar formats).
-  total="$(printf "%s\n" "$tlist" | awk '
-    BEGIN{sum=0}
-    {
-      # GNU tar: perms owner/group size YYYY-MM-DD HH:MM name
-      if ($4 ~ /^[0-9]{4}-[0-9]{2}-[0-9]{2}$/) {
-        if ($3 ~ /^[0-9]+$/) sum += $3
-      }
-      # bsdtar: perms links user group size Mon DD HH:MM name
-      else if ($6 ~ /^(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)$/) {
-        if ($5 ~ /^[0-9]+$/) sum += $5
-      }
-    }
-    END{print sum+0}
-  ')"
-  if [[ "${total:-0}" -gt "${max_total:-0}" ]]; then
-    echo "ERROR: tarball uncompressed total too large (${total} bytes > ${max_total}) - refusing to extract" >&2
-    exit 2
-  fi
-
-  tar -xzf "$art" -C "$dest" --no-same-owner --no-same-permissions
+  local db_out="${3:-}"
+  # One streaming pass over the tarball (lims/snapshot_codec.py extract_selected): every
+  # member is checked (absolute/.. paths; symlinks, hardlinks, devices, pipes, sockets;
+  # at most 2000 entries; unpacked total capped by NEXUS_SNAPSHOT_TAR_MAX_TOTAL_BYTES,
+  # 200MB default) and only lims.sqlite3 / lims.sqlite3.delta are written.
+  python3 -m lims.snapshot extract "$art" --out "$dest" ${db_out:+--db-out "$db_out"} \
+    --max-members 2000 --max-total-bytes "${NEXUS_SNAPSHOT_TAR_MAX_TOTAL_BYTES:-200000000}" || exit 2
 }
 
 
@@ -113,6 +72,8 @@ if [[ -f "$DB" ]]; then
     echo "      optionally add --backup to keep a copy" >&2
     exit 2
   fi
+  # Fold any WAL content into the main file before copying it or replacing it.
+  sqlite3 "$DB" "PRAGMA wal_checkpoint(TRUNCATE);" >/dev/null 2>&1 || true
   if [[ "$BACKUP" == "1" ]]; then
     cp -a "$DB" "${DB}.bak-${TS_UTC}"
     echo "OK: backed up existing DB to: ${DB}.bak-${TS_UTC}"
@@ -121,10 +82,14 @@ fi
 
 # Determine source lims.sqlite3 from artifact
 tmpdir=""
+# Tarball DBs and rebuilt delta chains are written straight to this file next to the
+# target (same filesystem), then renamed into place: no extra full-size copy.
+STAGE_DB="$DB_DIR/.$(basename "$DB").restore.$$"
 cleanup() {
   if [[ -n "${tmpdir:-}" && -d "$tmpdir" ]]; then
     rm -rf "$tmpdir"
   fi
+  rm -f "$STAGE_DB"
 }
 trap cleanup EXIT
 
@@ -146,11 +111,14 @@ if [[ -d "$ART" ]]; then
   fi
 elif [[ -f "$ART" ]]; then
   case "$ART" in
-    *.tar.gz|*.tgz)
+    *.tar.gz|*.tgz|*.tar.zst)
       tmpdir="$(mktemp -d)"
-      safe_extract_tgz "$ART" "$tmpdir"
-      mapfile -t found < <(find "$tmpdir" -type f -name 'lims.sqlite3' | sort)
-      if [[ ${#found[@]} -ne 1 ]]; then
+      safe_extract_tgz "$ART" "$tmpdir" "$STAGE_DB"
+      found=()
+      [[ -f "$STAGE_DB" ]] && found=( "$STAGE_DB" )
+      if [[ ${#found[@]} -eq 0 ]] && find "$tmpdir" -type f -name 'lims.sqlite3.delta' | grep -q .; then
+        found=( "" )  # incremental snapshot; rebuilt below
+      elif [[ ${#found[@]} -ne 1 ]]; then
         echo "ERROR: expected exactly 1 lims.sqlite3 in tarball, found ${#found[@]}" >&2
         if [[ ${#found[@]} -gt 0 ]]; then
           printf 'FOUND: %s\n' "${found[@]}" >&2
@@ -171,6 +139,27 @@ elif [[ -f "$ART" ]]; then
   esac
 fi
 
+# Incremental snapshot: rebuild the full image from its delta chain. Bases are looked
+# up by name next to the artifact (as dirs or tarballs).
+if [[ -z "$SRC_DB" ]]; then
+  delta=""
+  if [[ -d "$ART" && -f "$ART/lims.sqlite3.delta" ]]; then
+    delta="$ART/lims.sqlite3.delta"
+  elif [[ -f "$ART" && -n "$tmpdir" ]]; then
+    mapfile -t found < <(find "$tmpdir" -type f -name 'lims.sqlite3.delta' | sort)
+    [[ ${#found[@]} -eq 1 ]] && delta="${found[0]}"
+  fi
+  if [[ -n "$delta" ]]; then
+    if ! python3 -m lims.snapshot materialize "$(dirname "$delta")" --out "$STAGE_DB" \
+        --search "$(dirname "$ART")" >/dev/null; then
+      echo "ERROR: could not rebuild incremental snapshot: $ART" >&2
+      exit 2
+    fi
+    SRC_DB="$STAGE_DB"
+    echo "OK: rebuilt incremental snapshot from its delta chain"
+  fi
+fi
+
 if [[ -z "$SRC_DB" || ! -f "$SRC_DB" ]]; then
   echo "ERROR: could not locate lims.sqlite3 inside artifact: $ART" >&2
   echo "HINT: pass either:" >&2
@@ -180,7 +169,13 @@ if [[ -z "$SRC_DB" || ! -f "$SRC_DB" ]]; then
 fi
 
 # Restore
-cp -a "$SRC_DB" "$DB"
+# Stale -wal/-shm sidecars from the old DB must not be replayed onto the restored file.
+rm -f "${DB}-wal" "${DB}-shm"
+if [[ "$SRC_DB" == "$STAGE_DB" ]]; then
+  mv -f "$STAGE_DB" "$DB"
+else
+  cp -a "$SRC_DB" "$DB"
+fi
 chmod 600 "$DB" || true
 echo "OK: restored DB to: $DB"
 
@@ -55,7 +55,7 @@ def resolve_under_snap(snap: Path, raw: str) -> Path:
 def main():
     ap = argparse.ArgumentParser(description="Validate snapshot manifest.json against snapshot contents.")
     ap.add_argument("--snap-dir", required=True, help="Path to snapshot directory (snapshot-*)")
-    ap.add_argument("--tarball", default="", help="Optional tarball path; if empty, checks sibling ${snap_dir}.tar.gz if present.")
+    ap.add_argument("--tarball", default="", help="Optional tarball path; if empty, checks sibling ${snap_dir}.tar.gz/.tgz/.tar.zst if present.")
     ap.add_argument("--check-included", action="store_true", help="Verify included export file hashes listed in manifest.")
     args = ap.parse_args()
 
@@ -74,21 +74,42 @@ def main():
         fail(f"manifest.json is not valid JSON: {e}")
 
     # DB hash: validate db inside snap dir
-    dbp = snap / "lims.sqlite3"
-    if not dbp.exists():
-        fail(f"snapshot db missing: {dbp}")
+    db = doc.get("db") or {}
+    if db.get("format") == "page_delta" and not (snap / "lims.sqlite3").exists():
+        # Incremental snapshot: db.sha256 is the reconstructed image (checked when the
+        # chain is applied); here we can only check the delta file itself.
+        dp = snap / "lims.sqlite3.delta"
+        if not dp.exists():
+            fail(f"snapshot delta missing: {dp}")
+        want_delta = sha256_file(dp)
+        got_delta = db.get("delta_sha256")
+        if got_delta != want_delta:
+            fail(f"manifest delta sha256 mismatch (got {got_delta}, want {want_delta})")
+    else:
+        dbp = snap / "lims.sqlite3"
+        if not dbp.exists():
+            fail(f"snapshot db missing: {dbp}")
 
-    want_db = sha256_file(dbp)
-    got_db = (doc.get("db") or {}).get("sha256")
-    if got_db != want_db:
-        fail(f"manifest db sha256 mismatch (got {got_db}, want {want_db})")
+        want_db = sha256_file(dbp)
+        got_db = db.get("sha256")
+        if got_db != want_db:
+            fail(f"manifest db sha256 mismatch (got {got_db}, want {want_db})")
 
     # Tarball hash (if tar exists, require manifest entry)
-    tar_path = Path(args.tarball) if args.tarball else Path(str(snap) + ".tar.gz")
+    if args.tarball:
+        tar_path = Path(args.tarball)
+    else:
+        sibs = [Path(str(snap) + ext) for ext in (".tar.gz", ".tgz", ".tar.zst")]
+        tar_path = next((p for p in sibs if p.exists()), sibs[0])
     if tar_path.exists():
         t = doc.get("tarball")
         if not isinstance(t, dict) or not t.get("sha256"):
             fail(f"tarball exists but manifest.tarball missing/invalid ({tar_path})")
+        # Manifests without a codec predate zstd support and are gzip.
+        codec = t.get("codec") or "gzip"
+        ext_codec = "zstd" if tar_path.name.endswith(".tar.zst") else "gzip"
+        if codec != ext_codec:
+            fail(f"manifest tarball codec {codec} does not match {tar_path.name}")
         want_tar = sha256_file(tar_path)
         got_tar = t.get("sha256")
         if got_tar != want_tar:
@@ -164,51 +164,12 @@ have() { command -v "$1" >/dev/null 2>&1; }
 
 safe_extract_tgz() {
   local art="$1" dest="$2"
-  local list count
-  list="$(tar -tzf "$art")" || fail "tar -tzf failed: $art"
-  count="$(printf "%s\n" "$list" | sed "/^$/d" | wc -l | tr -d " ")"
-  if [[ "${count:-0}" -gt 2000 ]]; then
-    fail "tarball too large ($count entries): $art"
-  fi
-  if printf "%s\n" "$list" | grep -Eq "(^/|(^|/)\.\.(/|$))"; then
-    printf "%s\n" "$list" | grep -E "(^/|(^|/)\.\.(/|$))" | sed "s/^/UNSAFE: /" >&2
-    fail "unsafe paths in tarball (path traversal) - refusing to extract"
-  fi
-  
-  # Extra hardening: reject symlinks/hardlinks/devices/pipes/sockets, and cap total unpacked bytes.
-  local tlist total max_total
-  max_total="${NEXUS_SNAPSHOT_TAR_MAX_TOTAL_BYTES:-200000000}"   # 200MB default
-
-  tlist="$(tar -tvzf "$art")" || { echo "ERROR: tar -tvzf failed: $art" >&2; exit 2; }
-
-  # File type is first char of perms (e.g. -, d, l, b, c, p, s, h). Reject l/h/b/c/p/s.
-  if printf "%s\n" "$tlist" | awk '{print $1}' | grep -Eq '^[lhbcps]'; then
-    printf "%s\n" "$tlist" | awk '$1 ~ /^[lhbcps]/ {print "UNSAFE-TYPE: " $0}' >&2
-    echo "ERROR: tarball contains symlinks/hardlinks/devices/pipes/sockets - refusing to extract" >&2
-    exit 2
-  fi
-
-  # Zip-bomb guard: sum sizes in a tar listing (GNU tar vs bsdtar formats).
-  total="$(printf "%s\n" "$tlist" | awk '
-    BEGIN{sum=0}
-    {
-      # GNU tar: perms owner/group size YYYY-MM-DD HH:MM name
-      if ($4 ~ /^[0-9]{4}-[0-9]{2}-[0-9]{2}$/) {
-        if ($3 ~ /^[0-9]+$/) sum += $3
-      }
-      # bsdtar: perms links user group size Mon DD HH:MM name
-      else if ($6 ~ /^(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)$/) {
-        if ($5 ~ /^[0-9]+$/) sum += $5
-      }
-    }
-    END{print sum+0}
-  ')"
-  if [[ "${total:-0}" -gt "${max_total:-0}" ]]; then
-    echo "ERROR: tarball uncompressed total too large (${total} bytes > ${max_total}) - refusing to extract" >&2
-    exit 2
-  fi
-
-  tar -xzf "$art" -C "$dest" --no-same-owner --no-same-permissions
+  # One streaming pass over the tarball (lims/snapshot_codec.py extract_selected): every
+  # member is checked (absolute/.. paths; symlinks, hardlinks, devices, pipes, sockets;
+  # at most 2000 entries; unpacked total capped by NEXUS_SNAPSHOT_TAR_MAX_TOTAL_BYTES,
+  # 200MB default) and only lims.sqlite3 / lims.sqlite3.delta are written.
+  python3 -m lims.snapshot extract "$art" --out "$dest" \
+    --max-members 2000 --max-total-bytes "${NEXUS_SNAPSHOT_TAR_MAX_TOTAL_BYTES:-200000000}" || exit 2
 }
 
 
@@ -223,7 +184,6 @@ DO_MIGRATE="${SNAPSHOT_DO_MIGRATE:-1}"
 [[ -e "$ART" ]] || fail "snapshot artifact not found: $ART"
 
 have sqlite3 || fail "sqlite3 is required"
-have tar || true
 
 tmpdir="$(mktemp -d)"
 cleanup() { rm -rf "$tmpdir"; }
@@ -244,12 +204,15 @@ if [[ -d "$ART" ]]; then
   fi
 else
   case "$ART" in
-    *.tar.gz|*.tgz)
-      have tar || fail "tar is required to verify tar.gz snapshots"
+    *.tar.gz|*.tgz|*.tar.zst)
       safe_extract_tgz "$ART" "$tmpdir"
       mapfile -t found < <(find "$tmpdir" -type f -name 'lims.sqlite3' | sort)
-      [[ ${#found[@]} -eq 1 ]] || { printf 'FOUND: %s\n' "${found[@]:-}" >&2; fail "expected exactly 1 lims.sqlite3 in tarball"; }
-      SRC_DB="${found[0]}"
+      if [[ ${#found[@]} -eq 0 ]] && find "$tmpdir" -type f -name 'lims.sqlite3.delta' | grep -q .; then
+        :  # incremental snapshot; rebuilt below
+      else
+        [[ ${#found[@]} -eq 1 ]] || { printf 'FOUND: %s\n' "${found[@]:-}" >&2; fail "expected exactly 1 lims.sqlite3 in tarball"; }
+        SRC_DB="${found[0]}"
+      fi
       ;;
     *.sqlite3)
       SRC_DB="$ART"
@@ -260,14 +223,40 @@ else
   esac
 fi
 
-[[ -n "$SRC_DB" && -f "$SRC_DB" ]] || fail "could not locate lims.sqlite3 inside artifact: $ART"
+# Incremental snapshot: rebuild the full image from its delta chain. Bases are looked
+# up by name next to the artifact (as dirs or tarballs).
+if [[ -z "$SRC_DB" ]]; then
+  delta=""
+  if [[ -d "$ART" && -f "$ART/lims.sqlite3.delta" ]]; then
+    delta="$ART/lims.sqlite3.delta"
+  elif [[ -f "$ART" ]]; then
+    mapfile -t found < <(find "$tmpdir" -type f -name 'lims.sqlite3.delta' | sort)
+    [[ ${#found[@]} -eq 1 ]] && delta="${found[0]}"
+  fi
+  if [[ -n "$delta" ]]; then
+    python3 -m lims.snapshot materialize "$(dirname "$delta")" --out "$tmpdir/resolved.sqlite3" \
+      --search "$(dirname "$ART")" >/dev/null || fail "could not rebuild incremental snapshot: $ART"
+    SRC_DB="$tmpdir/resolved.sqlite3"
+    echo "OK: rebuilt incremental snapshot from its delta chain"
+  fi
+fi
 
-WORK_DB="$tmpdir/verify.sqlite3"
-cp -a "$SRC_DB" "$WORK_DB"
-chmod 600 "$WORK_DB" || true
+[[ -n "$SRC_DB" && -f "$SRC_DB" ]] || fail "could not locate lims.sqlite3 inside artifact: $ART"
 
 echo "OK: located snapshot db: $SRC_DB"
-echo "OK: copied to temp db:    $WORK_DB"
+
+# A DB extracted from a tarball (or rebuilt from a delta chain) is already a private temp
+# file, so it is checked in place; snapshot dirs and plain DB files are copied first.
+if [[ "$SRC_DB" == "$tmpdir"/* ]]; then
+  WORK_DB="$SRC_DB"
+  chmod 600 "$WORK_DB" || true
+  echo "OK: checking extracted db in place: $WORK_DB"
+else
+  WORK_DB="$tmpdir/verify.sqlite3"
+  cp -a "$SRC_DB" "$WORK_DB"
+  chmod 600 "$WORK_DB" || true
+  echo "OK: copied to temp db:    $WORK_DB"
+fi
 
 # 1) integrity_check
 integrity_out="$(sqlite3 "$WORK_DB" "PRAGMA integrity_check;" 2>&1)" || { echo "$integrity_out" >&2; fail "sqlite integrity_check failed"; }
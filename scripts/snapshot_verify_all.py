@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import snapshot_doctor  # noqa: E402
+from lims import snapshot_index  # noqa: E402
+
+# `snapshot verify --all`: run snapshot_verify.sh over every tarball in an exports dir,
+# at most --jobs at a time (each verify is its own process), and print one aggregated
+# JSON report.
+#
+# Passing results are memoized in <dir>/.verify_ledger.json, keyed by the tarball's
+# sha256 and a fingerprint of the verify tooling (script, migrations, CLI). Every run
+# hashes every tarball, so silent corruption that keeps size and mtime is still caught;
+# only snapshot_verify.sh (integrity_check, migrations, invariants) is skipped for a
+# tarball whose sha256 already passed with the current tooling. --trust-mtime reuses
+# the hash while size, mtime and inode match the ledger (or size and mtime match the
+# snapshot index) and reads no bytes of an untouched tarball. Failures are never
+# memoized. Entries for tarballs that are gone are dropped at the end of each run.
+
+LEDGER_NAME = ".verify_ledger.json"
+LEDGER_SCHEMA = "nexus_snapshot_verify_ledger"
+_TOOL_FILES = (
+  "scripts/snapshot_verify.sh",
+  "scripts/migrate.sh",
+  "lims/cli.py",
+  "lims/db.py",
+  "lims/migrate.py",
+  "lims/snapshot.py",
+  "lims/snapshot_delta.py",
+)
+
+def utc_now() -> str:
+  return datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+
+def default_jobs() -> int:
+  try:
+    n = int(os.environ.get("SNAPSHOT_VERIFY_JOBS", "") or 0)
+  except ValueError:
+    n = 0
+  return n if n > 0 else min(4, os.cpu_count() or 1)
+
+def list_artifacts(exports_dir: Path):
+  """(tarball, snapshot index entry) pairs, oldest first."""
+  ents = snapshot_index.entries(exports_dir)
+  return sorted(((exports_dir / e["path"], e) for e in ents), key=lambda pe: pe[0].name)
+
+class Ledger:
+  """<dir>/.verify_ledger.json: {"entries": {name: {sha256, size, mtime_ns, ino, tool_version, migrate, ...}}}."""
+
+  def __init__(self, path: Path):
+    self.path = path
+    self.lock = threading.Lock()
+    self.entries = {}
+    try:
+      doc = json.loads(path.read_text(encoding="utf-8"))
+      if doc.get("schema") == LEDGER_SCHEMA and isinstance(doc.get("entries"), dict):
+        self.entries = doc["entries"]
+    except (OSError, ValueError):
+      pass
+
+  def cached_sha(self, art: Path, st: os.stat_result):
+    e = self.entries.get(art.name)
+    if e and (e.get("size"), e.get("mtime_ns"), e.get("ino")) == (st.st_size, st.st_mtime_ns, st.st_ino):
+      return e.get("sha256")
+    return None
+
+  def passed(self, name: str, sha: str, tool: str, migrate: bool):
+    e = self.entries.get(name)
+    if not e or e.get("sha256") != sha or e.get("tool_version") != tool or not e.get("ok"):
+      return None
+    if migrate and not e.get("migrate"):
+      return None  # a --no-migrate pass does not stand in for a full verify
+    return e
+
+  def record(self, name: str, entry: dict, keep) -> None:
+    with self.lock:
+      self.entries[name] = entry
+      self._save(keep)
+
+  def prune(self, keep) -> None:
+    with self.lock:
+      if set(self.entries) - set(keep):
+        self._save(keep)
+
+  def _save(self, keep) -> None:
+    self.entries = {k: v for k, v in self.entries.items() if k in keep}
+    doc = {"schema": LEDGER_SCHEMA, "schema_version": 1, "entries": self.entries}
+    tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+    try:
+      tmp.write_text(json.dumps(doc, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+      os.replace(tmp, self.path)
+    except OSError:
+      pass  # read-only exports dir: nothing is memoized
+
+def verify_one(art: Path, migrate: bool, timeout: int):
+  env = os.environ.copy()
+  env.update(SNAPSHOT_ARTIFACT=str(art), SNAPSHOT_DO_MIGRATE="1" if migrate else "0", SNAPSHOT_JSON="1")
+  t0 = time.monotonic()
+  try:
+    r = subprocess.run(
+      ["bash", str(REPO / "scripts" / "snapshot_verify.sh")], cwd=REPO, env=env, text=True,
+      stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout or None,
+    )
+    rc, out, err = r.returncode, r.stdout, r.stderr
+  except subprocess.TimeoutExpired:
+    rc, out, err = 2, "", f"timed out after {timeout}s"
+  elapsed_ms = int((time.monotonic() - t0) * 1000)
+  doc = None
+  for line in reversed(out.strip().splitlines()):
+    if line.startswith("{"):
+      try:
+        doc = json.loads(line)
+      except ValueError:
+        pass
+      break
+  msg = (doc or {}).get("message")
+  if rc != 0 and not msg:
+    msg = next((l for l in reversed(err.strip().splitlines()) if l.startswith("ERROR:")), None) or f"rc={rc}"
+  return rc, msg, elapsed_ms
+
+def main():
+  ap = argparse.ArgumentParser(prog="snapshot_verify_all.py")
+  ap.add_argument("--dir", default=None, help="exports dir (default: EXPORTS_DIR or ./exports)")
+  ap.add_argument("--jobs", type=int, default=None, help="concurrent verifies (default: SNAPSHOT_VERIFY_JOBS or min(4, CPUs))")
+  ap.add_argument("--no-migrate", action="store_true", help="do not apply migrations in temp copies")
+  ap.add_argument("--trust-mtime", action="store_true",
+                  help="reuse the ledger/index sha256 while size and mtime match instead of hashing")
+  ap.add_argument("--rehash", action="store_true", help="hash every tarball (the default; overrides --trust-mtime)")
+  ap.add_argument("--force", action="store_true", help="verify every tarball, ignoring (but updating) the ledger")
+  ap.add_argument("--timeout", type=int, default=0, help="per-artifact timeout in seconds (0 = none)")
+  ap.add_argument("--json", action="store_true", help="print only the JSON report on stdout")
+  args = ap.parse_args()
+
+  dir_arg = args.dir or os.environ.get("EXPORTS_DIR") or "exports"
+  exports_dir = Path(dir_arg)
+  if not exports_dir.is_absolute():
+    exports_dir = (REPO / exports_dir).resolve()
+  if not exports_dir.is_dir():
+    print(f"ERROR: exports dir not found: {exports_dir}", file=sys.stderr)
+    return 2
+  jobs = args.jobs if args.jobs is not None else default_jobs()
+  if jobs < 1:
+    print("ERROR: --jobs must be >= 1", file=sys.stderr)
+    return 2
+
+  human = sys.stderr if args.json else sys.stdout
+  migrate = not args.no_migrate
+  trust_mtime = args.trust_mtime and not args.rehash
+  tool = snapshot_doctor.fingerprint("verify-v1", _TOOL_FILES)
+  ledger = Ledger(exports_dir / LEDGER_NAME)
+  indexed = list_artifacts(exports_dir)
+  artifacts = [a for a, _e in indexed]
+  index_sha = {a.name: e for a, e in indexed}
+  keep = {a.name for a in artifacts}
+  t0 = time.monotonic()
+
+  def check(art: Path):
+    st = art.stat()
+    sha = ledger.cached_sha(art, st) if trust_mtime else None
+    ie = index_sha.get(art.name) or {}
+    if sha is None and trust_mtime and (ie.get("size"), ie.get("mtime_ns")) == (st.st_size, st.st_mtime_ns):
+      sha = ie.get("sha256")
+    if sha is None:
+      sha = snapshot_doctor.sha256_file(art)
+    prev = None if args.force else ledger.passed(art.name, sha, tool, migrate)
+    if prev is not None:
+      if (prev.get("size"), prev.get("mtime_ns"), prev.get("ino")) != (st.st_size, st.st_mtime_ns, st.st_ino):
+        ledger.record(art.name, dict(prev, size=st.st_size, mtime_ns=st.st_mtime_ns, ino=st.st_ino), keep)
+      return {"artifact": art.name, "sha256": sha, "status": "skipped", "rc": 0,
+              "message": "unchanged since last verify", "verified_at": prev.get("verified_at"), "elapsed_ms": 0}
+    rc, msg, elapsed_ms = verify_one(art, migrate, args.timeout)
+    now = utc_now()
+    ok = rc == 0
+    ledger.record(art.name, {
+      "sha256": sha, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "ino": st.st_ino,
+      "tool_version": tool, "migrate": migrate, "ok": ok, "rc": rc,
+      "message": None if ok else msg, "verified_at": now,
+    }, keep)
+    return {"artifact": art.name, "sha256": sha, "status": "ok" if ok else "failed", "rc": rc,
+            "message": "OK" if ok else msg, "verified_at": now, "elapsed_ms": elapsed_ms}
+
+  results = {}
+  with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="snap-verify") as ex:
+    futs = {ex.submit(check, a): a for a in artifacts}
+    for fut in as_completed(futs):
+      art = futs[fut]
+      try:
+        res = fut.result()
+      except Exception as e:  # e.g. the tarball vanished mid-run
+        res = {"artifact": art.name, "sha256": None, "status": "failed", "rc": 2,
+               "message": f"{type(e).__name__}: {e}", "verified_at": None, "elapsed_ms": 0}
+      results[art.name] = res
+      tag = {"ok": "OK", "skipped": "SKIP", "failed": "FAIL"}[res["status"]]
+      detail = f" ({res['elapsed_ms']} ms)" if res["status"] == "ok" else f": {res['message']}"
+      print(f"{tag}: {res['artifact']}{detail}", file=human, flush=True)
+
+  ledger.prune(keep)
+  rows = [results[a.name] for a in artifacts]
+  counts = {
+    "total": len(rows),
+    "verified": sum(1 for r in rows if r["status"] == "ok"),
+    "skipped": sum(1 for r in rows if r["status"] == "skipped"),
+    "failed": sum(1 for r in rows if r["status"] == "failed"),
+  }
+  report = {
+    "schema": "nexus_snapshot_verify_all_result",
+    "schema_version": 1,
+    "ok": counts["failed"] == 0,
+    "dir": str(exports_dir),
+    "jobs": jobs,
+    "migrate": migrate,
+    "tool_version": tool,
+    "counts": counts,
+    "elapsed_ms": int((time.monotonic() - t0) * 1000),
+    "artifacts": rows,
+    "ts_utc": utc_now(),
+  }
+  if not args.json:
+    print(f"{'OK' if report['ok'] else 'ERROR'}: verified {counts['verified']}, skipped {counts['skipped']} unchanged, "
+          f"failed {counts['failed']} of {counts['total']} artifact(s)", file=human)
+  print(json.dumps(report, sort_keys=True))
+  return 0 if report["ok"] else 2
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -10,14 +10,14 @@ class TestCodeQLCommandLineRegression(unittest.TestCase):
         self.assertTrue(p.exists(), f"missing file: {rel}")
         return p.read_text(encoding="utf-8", errors="replace")
 
-    def test_lims_api_snapshot_export_cmd_constant(self):
+    def test_lims_api_snapshot_export_in_process(self):
         s = self._read("scripts/lims_api.py")
 
-        # Must keep argv constant for snapshot export (no --exports-dir on argv).
+        # Snapshot export runs in-process; nothing request-derived reaches an argv.
         self.assertIn(
-            'cmd = ["./scripts/lims.sh", "snapshot", "export", "--json"]',
+            "lims_snapshot.export_snapshot(exports_dir=Path(exports_dir), include_samples=cleaned, index_dir=Path(API_EXPORTS_ROOT), progress=job.report)",
             s,
-            "snapshot export cmd must remain constant and not include request-derived values",
+            "snapshot export must call the in-process engine with the server-chosen dir and validated ids",
         )
 
         # Defensive: do not allow reintroduction of exports_dir on argv.
@@ -27,11 +27,11 @@ class TestCodeQLCommandLineRegression(unittest.TestCase):
             "snapshot export must not pass --exports-dir on argv",
         )
 
-        # Ensure exports_dir is still passed via environment.
+        # The output dir is always chosen server-side, never taken from the request.
         self.assertRegex(
             s,
-            r'env\["EXPORTS_DIR"\]\s*=\s*exports_dir',
-            "EXPORTS_DIR must be set in env for snapshot export",
+            r'exports_dir\s*=\s*_mk_api_exports_dir\(\)',
+            "snapshot export must write under a server-chosen exports dir",
         )
 
     def test_lims_api_sample_report_not_appending_identifier_to_cmd(self):